@@ -36,17 +36,21 @@
     throw std::invalid_argument(err_msg.str());                 \
   }
 
-#define DISPATCH_CAUSAL(is_causal, IS_CAUSAL, ...)              \
-  if (is_causal == 1) {                                         \
-    constexpr bool IS_CAUSAL = true;                            \
-    __VA_ARGS__                                                 \
-  } else if (is_causal == 0) {                                  \
-    constexpr bool IS_CAUSAL = false;                           \
-    __VA_ARGS__                                                 \
-  }  else {                                                     \
-    std::ostringstream err_msg;                                 \
-    err_msg << "Unsupported causal mode: " << int(is_causal);   \
-    throw std::invalid_argument(err_msg.str());                 \
+// is_causal is 0 for no mask, 1 for causal and the number of tokens per frame (> 1) for block-causal
+#define DISPATCH_MASK_MODE(is_causal, MASK_MODE, ...)                \
+  if (is_causal == 1) {                                             \
+    constexpr MaskMode MASK_MODE = MaskMode::kCausal;               \
+    __VA_ARGS__                                                     \
+  } else if (is_causal == 0) {                                      \
+    constexpr MaskMode MASK_MODE = MaskMode::kNone;                 \
+    __VA_ARGS__                                                     \
+  } else if (is_causal > 1) {                                       \
+    constexpr MaskMode MASK_MODE = MaskMode::kBlockCausal;          \
+    __VA_ARGS__                                                     \
+  }  else {                                                         \
+    std::ostringstream err_msg;                                     \
+    err_msg << "Unsupported causal mode: " << int(is_causal);       \
+    throw std::invalid_argument(err_msg.str());                     \
   }
 
 #define DISPATCH_QK_QUANT_GRAN(qk_quant_gran, QK_QUANT_GRAN, ...)              \
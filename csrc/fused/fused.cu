@@ -313,8 +313,8 @@ __global__ void TransposePadPermuteKernel(T *__restrict__ input, T *__restrict__
 }
 
 
-template<uint32_t pad_size, bool sub_mean = false, typename T>
-__global__ void MeanScaleKernel(T *__restrict__ input, int8_t *__restrict__ output, float *__restrict__ mean, float *__restrict__ scale, const float scale_max, const uint32_t num_tokens,
+template<bool sub_mean = false, typename T>
+__global__ void MeanScaleKernel(T *__restrict__ input, int8_t *__restrict__ output, float *__restrict__ mean, float *__restrict__ scale, const float scale_max, const uint32_t num_tokens, const uint32_t padded_num_tokens,
                             const uint32_t stride_bz_input, const uint32_t stride_d_input, const uint32_t stride_h_input,
                             const uint32_t stride_bz_output, const uint32_t stride_d_output, const uint32_t stride_h_output,
                             const uint32_t stride_bz_mean, const uint32_t stride_h_mean,
@@ -399,7 +399,6 @@ __global__ void MeanScaleKernel(T *__restrict__ input, int8_t *__restrict__ outp
   float recp_scale = scale_max / s_amax_val;
 
   // recalculate num_iters to cover all fp8 output tokens to prevent nan in random initialization
-  uint32_t padded_num_tokens = (num_tokens + pad_size - 1) / pad_size * pad_size;
   num_iters = padded_num_tokens / gmem_stride + ((padded_num_tokens % gmem_stride) > thread_id * pack_size);
 
   for (int i = 0; i < num_iters; i++)
@@ -891,9 +890,7 @@ void transpose_pad_permute_cuda(
     stride_d_output = output.stride(1);
     stride_h_output = output.stride(2);
 
-    padded_num_tokens = (num_tokens + CTA_SIZE_HOST - 1) / CTA_SIZE_HOST * CTA_SIZE_HOST;
-
-    CHECK_SHAPE(output, batch_size, head_dim, num_heads, padded_num_tokens);
+    CHECK_SHAPE(output, batch_size, head_dim, num_heads, output.size(3));
   }
   else
   {
@@ -904,10 +901,14 @@ void transpose_pad_permute_cuda(
     stride_d_output = output.stride(2);
     stride_h_output = output.stride(1);
 
-    padded_num_tokens = (num_tokens + CTA_SIZE_HOST - 1) / CTA_SIZE_HOST * CTA_SIZE_HOST;
-    CHECK_SHAPE(output, batch_size, num_heads, head_dim, padded_num_tokens);
+    CHECK_SHAPE(output, batch_size, num_heads, head_dim, output.size(3));
   }
 
+  // the output may be padded beyond the next multiple of CTA_SIZE_HOST, the tail is filled with zeros
+  padded_num_tokens = output.size(3);
+  TORCH_CHECK(padded_num_tokens >= num_tokens && padded_num_tokens % CTA_SIZE_HOST == 0,
+              "The last dim of output must be at least num_tokens and a multiple of ", CTA_SIZE_HOST);
+
   auto input_dtype = input.scalar_type();
   auto output_dtype = output.scalar_type();
 
@@ -1001,13 +1002,13 @@ void scale_fuse_quant_cuda(
     const auto device_guard = make_device_guard(input);
     const auto stream = get_current_cuda_stream(input);
 
-    MeanScaleKernel<64, false, c_type><<<grid, block, 0, stream>>>(
+    MeanScaleKernel<false, c_type><<<grid, block, 0, stream>>>(
       reinterpret_cast<c_type*>(input.data_ptr()),
       reinterpret_cast<int8_t*>(output.data_ptr()),
       nullptr,
       reinterpret_cast<float*>(scale.data_ptr()),
       scale_max,
-      num_tokens,
+      num_tokens, num_tokens_padded,
       stride_bz_input, stride_d_input, stride_h_input,
       stride_bz_output, stride_d_output, stride_h_output,
       0, 0,
@@ -1087,13 +1088,13 @@ void mean_scale_fuse_quant_cuda(
     const auto device_guard = make_device_guard(input);
     const auto stream = get_current_cuda_stream(input);
 
-    MeanScaleKernel<64, true, c_type><<<grid, block, 0, stream>>>(
+    MeanScaleKernel<true, c_type><<<grid, block, 0, stream>>>(
       reinterpret_cast<c_type*>(input.data_ptr()),
       reinterpret_cast<int8_t*>(output.data_ptr()),
       reinterpret_cast<float*>(mean.data_ptr()),
       reinterpret_cast<float*>(scale.data_ptr()),
       scale_max,
-      num_tokens,
+      num_tokens, num_tokens_padded,
       stride_bz_input, stride_d_input, stride_h_input,
       stride_bz_output, stride_d_output, stride_h_output,
       mean.stride(0), mean.stride(1),
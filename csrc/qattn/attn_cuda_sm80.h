@@ -26,7 +26,9 @@ torch::Tensor qk_int8_sv_f16_accum_f32_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f16_accum_f16_attn(torch::Tensor query,
                     torch::Tensor key,
@@ -38,7 +40,9 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f16_accum_f16_attn_inst_buf(torch::Tensor query,
                     torch::Tensor key,
@@ -50,7 +54,9 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn_inst_buf(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(torch::Tensor query,
                     torch::Tensor key,
@@ -63,4 +69,6 @@ torch::Tensor qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
\ No newline at end of file
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
\ No newline at end of file
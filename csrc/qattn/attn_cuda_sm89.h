@@ -26,7 +26,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn(torch::Tensor query,
                     torch::Tensor key,
@@ -39,7 +41,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_fuse_v_mean_attn(torch::Tensor query,
                     torch::Tensor key,
@@ -53,7 +57,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_fuse_v_mean_attn(torch::Tenso
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f8_accum_f32_attn_inst_buf(torch::Tensor query,
                     torch::Tensor key,
@@ -65,7 +71,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn_inst_buf(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f8_accum_f16_attn_inst_buf(torch::Tensor query,
                     torch::Tensor key,
@@ -77,7 +85,9 @@ torch::Tensor qk_int8_sv_f8_accum_f16_attn_inst_buf(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(torch::Tensor query,
                     torch::Tensor key,
@@ -90,7 +100,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(torch::Tensor q
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 torch::Tensor qk_int8_sv_f8_accum_f16_fuse_v_scale_attn_inst_buf(torch::Tensor query,
                     torch::Tensor key,
                     torch::Tensor value,
@@ -102,4 +114,6 @@ torch::Tensor qk_int8_sv_f8_accum_f16_fuse_v_scale_attn_inst_buf(torch::Tensor q
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
\ No newline at end of file
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
\ No newline at end of file
@@ -27,7 +27,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn_inst_buf(
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
 
 torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
                     torch::Tensor query,
@@ -41,4 +43,6 @@ torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse);
\ No newline at end of file
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths);
\ No newline at end of file
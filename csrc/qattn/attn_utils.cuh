@@ -36,6 +36,7 @@
 enum class MaskMode {
     kNone = 0,
     kCausal = 1,
+    kBlockCausal = 2,
 };
 
 enum class DataType {
@@ -322,6 +323,36 @@ __device__ __forceinline__ void apply_causal_mask(const uint32_t &Q_idx_lane_bas
   }
 }
 
+// tokens attend bidirectionally within a frame of frame_tokens tokens and causally across frames
+template <uint32_t num_tiles_q, uint32_t num_tiles_k, typename DTypeQKAccum>
+__device__ __forceinline__ void apply_block_causal_mask(const uint32_t &Q_idx_lane_base, const uint32_t &K_idx_lane_base, DTypeQKAccum RS[][num_tiles_k][8], const uint32_t &frame_tokens)
+{
+#pragma unroll
+  for (uint32_t fq = 0; fq < num_tiles_q; fq++)
+  {
+#pragma unroll
+    for (uint32_t fk = 0; fk < num_tiles_k; fk++)
+    {
+#pragma unroll
+      for (uint32_t k = 0; k < 8; k++)
+      {
+        const uint32_t q_idx = Q_idx_lane_base + fq * 16 + 8 * ((k % 4) / 2);
+        const uint32_t kv_idx = K_idx_lane_base + fk * 16 + 8 * (k / 4) + k % 2;
+        const bool out_of_boundary = (kv_idx / frame_tokens > q_idx / frame_tokens);
+
+        if constexpr (std::is_same<DTypeQKAccum, float>::value)
+        {
+          RS[fq][fk][k] = (out_of_boundary ? -5000000.0f : RS[fq][fk][k]);
+        }
+        else if constexpr (std::is_same<DTypeQKAccum, half>::value)
+        {
+          RS[fq][fk][k] = (out_of_boundary ? __float2half_rn(-50000.0f) : RS[fq][fk][k]);
+        }
+      }
+    }
+  }
+}
+
 template <uint32_t num_tiles_q, uint32_t num_tiles_k, typename DTypeQKAccum>
 __device__ __forceinline__ void apply_out_of_bound_mask(const uint32_t &K_idx_lane_base, DTypeQKAccum RS[][num_tiles_k][8], const uint32_t &kv_len)
 {
@@ -45,7 +45,8 @@ template<uint32_t CTA_Q, uint32_t CTA_K, uint32_t WARP_Q, uint32_t WARP_K, uint3
         typename DTypeSVAccum = float, bool use_inst_buffer = false, typename DTypeOut = half, ComputeUnit DenominatorAccumUnit, MaskMode mask_mode = MaskMode::kNone, bool return_lse = false, bool fuse_v_mean=false>
 __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__restrict__ K, half *__restrict__ V, DTypeOut *__restrict__ O, float *__restrict__ Lse,
                       float *__restrict__ Q_scale, float *__restrict__ K_scale, DTypeOut *__restrict__ V_mean,
-                      const uint32_t qo_len, const uint32_t kv_len, const uint32_t num_kv_groups,
+                      const int32_t *__restrict__ Q_lengths, const int32_t *__restrict__ KV_lengths,
+                      const uint32_t max_qo_len, const uint32_t max_kv_len, const uint32_t num_kv_groups, const uint32_t frame_tokens,
                       const uint32_t stride_bz_q, const uint32_t stride_seq_q, const uint32_t stride_h_q,
                       const uint32_t stride_bz_k, const uint32_t stride_seq_k, const uint32_t stride_h_k,
                       const uint32_t stride_bz_v, const uint32_t stride_seq_v, const uint32_t stride_h_v,
@@ -88,6 +89,14 @@ __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__rest
   const uint32_t num_qo_heads = gridDim.y;
   const uint32_t head_id = blockIdx.y;
 
+  // tokens beyond the per-batch lengths are padding and are skipped
+  const uint32_t qo_len = (Q_lengths != nullptr) ? min(static_cast<uint32_t>(Q_lengths[batch_id]), max_qo_len) : max_qo_len;
+  const uint32_t kv_len = (KV_lengths != nullptr) ? min(static_cast<uint32_t>(KV_lengths[batch_id]), max_kv_len) : max_kv_len;
+  if (bx * CTA_Q >= qo_len)
+  {
+    return;
+  }
+
   // transfer to base 2 instead of base e with better numerical efficiency
   sm_scale *= math::log2e;
 
@@ -117,17 +126,17 @@ __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__rest
 
   if constexpr (K_GRAN == QuantGranularity::kPerBlock)
   {
-    const uint32_t num_block_k = div_ceil(kv_len, CTA_K);
+    const uint32_t num_block_k = div_ceil(max_kv_len, CTA_K);
     k_scale_idx = batch_id * (num_qo_heads / num_kv_groups) * num_block_k + (head_id / num_kv_groups) * num_block_k;
   }
   else if constexpr (K_GRAN == QuantGranularity::kPerWarp)
   {
-    const uint32_t num_warp_block_k = div_ceil(kv_len, CTA_K) * (CTA_K / WARP_K);
+    const uint32_t num_warp_block_k = div_ceil(max_kv_len, CTA_K) * (CTA_K / WARP_K);
     k_scale_idx = batch_id * (num_qo_heads / num_kv_groups) * num_warp_block_k + (head_id / num_kv_groups) * num_warp_block_k + get_warp_idx_k<num_warps_q, num_warps_k>();
   }
   else if constexpr (K_GRAN == QuantGranularity::kPerThread)
   {
-    const uint32_t num_warp_block_k = div_ceil(kv_len, CTA_K) * (CTA_K / WARP_K);
+    const uint32_t num_warp_block_k = div_ceil(max_kv_len, CTA_K) * (CTA_K / WARP_K);
     k_scale_idx = batch_id * (num_qo_heads / num_kv_groups) * (num_warp_block_k * 4) + (head_id / num_kv_groups) * (num_warp_block_k * 4) + get_warp_idx_k<num_warps_q, num_warps_k>() * 4 + lane_id % 4;
   }
 
@@ -206,8 +215,10 @@ __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__rest
   uint32_t K_smem_offset_mma = smem_K.get_permuted_offset(get_warp_idx_k<num_warps_q, num_warps_k>() * WARP_K + lane_id % 8 + (lane_id / 16) * 8, (lane_id / 8) % 2);
   uint32_t V_smem_offset_mma = smem_V.get_permuted_offset(get_warp_idx_k<num_warps_q, num_warps_k>() * WARP_K + lane_id % 16, lane_id / 16);
 
-  // for causal masking
-  uint32_t Q_idx_lane_base = bx * CTA_Q + get_warp_idx_q<num_warps_q, num_warps_k>() * WARP_Q + lane_id / 4;
+  // for causal masking, the mask is aligned to the bottom-right corner when qo_len < kv_len
+  // and to the top-left corner when the valid keys of a batch are fewer than its valid queries, as in the triton kernels
+  const uint32_t causal_offset = (mask_mode != MaskMode::kNone && kv_len > qo_len) ? kv_len - qo_len : 0;
+  uint32_t Q_idx_lane_base = bx * CTA_Q + causal_offset + get_warp_idx_q<num_warps_q, num_warps_k>() * WARP_Q + lane_id / 4;
   uint32_t K_idx_lane_base = get_warp_idx_k<num_warps_q, num_warps_k>() * WARP_K + 2 * (lane_id % 4);
 
   // for loading
@@ -215,12 +226,20 @@ __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__rest
   uint32_t K_load_idx_lane_base = CTA_K / num_warps * warp_id + lane_id / global_to_shared_line_lanes_QK;
   uint32_t V_load_idx_lane_base = CTA_K / num_warps * warp_id + lane_id / global_to_shared_line_lanes_V;
 
+  // for block-causal masking, the last query of this block sees keys up to the end of its frame
   const uint32_t num_iterations = div_ceil(
       mask_mode == MaskMode::kCausal
-          ? min(kv_len, (bx + 1) * CTA_Q)
-          : kv_len,
+          ? min(kv_len, (bx + 1) * CTA_Q + causal_offset)
+          : mask_mode == MaskMode::kBlockCausal
+              ? min(kv_len, ((bx + 1) * CTA_Q - 1 + causal_offset) / frame_tokens * frame_tokens + frame_tokens)
+              : kv_len,
       CTA_K);
 
+  // tiles before this one lie fully below the diagonal and need no causal mask
+  const uint32_t num_unmasked_iterations = (mask_mode == MaskMode::kCausal) ? (bx * CTA_Q + causal_offset + 1) / CTA_K
+                                         : (mask_mode == MaskMode::kBlockCausal) ? ((bx * CTA_Q + causal_offset) / frame_tokens * frame_tokens + frame_tokens) / CTA_K
+                                         : num_iterations;
+
   // load Q with predicate
   load_global_to_share<global_to_shared_line_lanes_QK, global_to_shared_copy_lines_per_warp_QK, QK_smem_iters_row, Q_smem_iters_col, swizzle_mode_QK, QK_SMEM_STRIDE / PACK_SIZE_QK, CTA_Q>(
     &Q_lane_base_ptr, Q_smem_offset_load, stride_seq_q, smem_Q, Q_load_idx_lane_base, qo_len);
@@ -295,16 +314,47 @@ __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__rest
       }
     }
 
-    // do not apply causal mask and out of bound mask for these iterations
+    // with a causal offset or block-causal mask the diagonal may cross more than the last two tiles
+    float iter_sm_scale = sm_scale;
+    if constexpr (mask_mode != MaskMode::kNone)
+    {
+      if (iter > num_unmasked_iterations)
+      {
+#pragma unroll
+        for (uint32_t fq = 0; fq < num_tiles_q; fq++)
+        {
+#pragma unroll
+          for (uint32_t fk = 0; fk < num_tiles_k; fk++)
+          {
+#pragma unroll
+            for (uint32_t k = 0; k < 8; k++)
+            {
+              RS_f32[fq][fk][k] *= dequant_scale;
+            }
+          }
+        }
+        if constexpr (mask_mode == MaskMode::kCausal)
+        {
+          apply_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32);
+        }
+        else
+        {
+          apply_block_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32, frame_tokens);
+        }
+        iter_sm_scale = original_sm_scale;
+      }
+    }
+
+    // do not apply out of bound mask for these iterations
     K_idx_lane_base += CTA_K;
 
     if constexpr (std::is_same<DTypeSVAccum, float>::value)
     {
-      update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, false, false, false>(RS_f32, RO, m, d, sm_scale);
+      update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, false, false, false>(RS_f32, RO, m, d, iter_sm_scale);
     }
     else if constexpr (std::is_same<DTypeSVAccum, half>::value)
     {
-      update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, true, false, false>(RS_f32, RO, m, d, sm_scale);
+      update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, true, false, false>(RS_f32, RO, m, d, iter_sm_scale);
     }
 
     if constexpr (DenominatorAccumUnit == ComputeUnit::kCudaCore)
@@ -393,6 +443,10 @@ __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__rest
     {
       apply_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32);
     }
+    else if constexpr (mask_mode == MaskMode::kBlockCausal)
+    {
+      apply_block_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32, frame_tokens);
+    }
     // apply_out_of_bound_mask<num_tiles_q, num_tiles_k>(K_idx_lane_base, RS_f32, kv_len);
     K_idx_lane_base += CTA_K;
 
@@ -490,6 +544,10 @@ __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__rest
     {
       apply_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32);
     }
+    else if constexpr (mask_mode == MaskMode::kBlockCausal)
+    {
+      apply_block_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32, frame_tokens);
+    }
     // check out of bound in the last iter
     apply_out_of_bound_mask<num_tiles_q, num_tiles_k>(K_idx_lane_base, RS_f32, kv_len);
     K_idx_lane_base += CTA_K;
@@ -657,7 +715,7 @@ __global__ void qk_int_sv_f16_attn_kernel(int8_t *__restrict__ Q, int8_t *__rest
   if constexpr (return_lse)
   { 
     uint32_t lse_idx = bx * CTA_Q + lane_id / 4 + 8 * (lane_id % 4) + WARP_Q * get_warp_idx_q<num_warps_q, num_warps_k>();
-    float *lse_lane_ptr = Lse + batch_id * (qo_len * num_qo_heads) + head_id * qo_len + lse_idx;
+    float *lse_lane_ptr = Lse + batch_id * (max_qo_len * num_qo_heads) + head_id * max_qo_len + lse_idx;
     uint32_t fq = (lane_id % 4) / 2;
     uint32_t k = (lane_id % 4) % 2;
 
@@ -681,7 +739,9 @@ torch::Tensor qk_int8_sv_f16_accum_f32_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse)
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths)
 {
   CHECK_CUDA(query);
   CHECK_CUDA(key);
@@ -773,6 +833,9 @@ torch::Tensor qk_int8_sv_f16_accum_f32_attn(torch::Tensor query,
 
   const int num_kv_groups = num_qo_heads / num_kv_heads;
 
+  int32_t* q_lengths_ptr = get_seq_lengths_ptr(q_lengths, batch_size);
+  int32_t* kv_lengths_ptr = get_seq_lengths_ptr(kv_lengths, batch_size);
+
   torch::Tensor lse = torch::empty({0});
   if (return_lse)
   {
@@ -782,7 +845,7 @@ torch::Tensor qk_int8_sv_f16_accum_f32_attn(torch::Tensor query,
   auto output_dtype = output.scalar_type();
 
   DISPATCH_HEAD_DIM(head_dim, HEAD_DIM, {
-    DISPATCH_CAUSAL(is_causal, IS_CAUSAL, {
+    DISPATCH_MASK_MODE(is_causal, MASK_MODE, {
       DISPATCH_QK_QUANT_GRAN(qk_quant_gran, QK_QUANT_GRAN, {
         DISPATCH_RETURN_LSE(return_lse, RETURN_LSE, {
           DISPATCH_PYTORCH_DTYPE_TO_CTYPE_FP16(output_dtype, DTypeOut, {
@@ -791,7 +854,7 @@ torch::Tensor qk_int8_sv_f16_accum_f32_attn(torch::Tensor query,
             constexpr int WARP_Q = (HEAD_DIM == 256) ? 16 : 32;
             constexpr int WARP_K = 64;
 
-            constexpr MaskMode mask_mode = IS_CAUSAL ? MaskMode::kCausal : MaskMode::kNone;
+            constexpr MaskMode mask_mode = MASK_MODE;
 
             if constexpr (QK_QUANT_GRAN == static_cast<int>(QuantGranularity::kPerWarp))
             {
@@ -830,9 +893,12 @@ torch::Tensor qk_int8_sv_f16_accum_f32_attn(torch::Tensor query,
               reinterpret_cast<float*>(query_scale.data_ptr()),
               reinterpret_cast<float*>(key_scale.data_ptr()),
               nullptr,
+              q_lengths_ptr,
+              kv_lengths_ptr,
               qo_len,
               kv_len,
               num_kv_groups,
+              is_causal,
               stride_bz_q, stride_seq_q, stride_h_q,
               stride_bz_k, stride_seq_k, stride_h_k,
               stride_bz_v, stride_seq_v, stride_h_v,
@@ -857,7 +923,9 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse)
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths)
 {
   CHECK_CUDA(query);
   CHECK_CUDA(key);
@@ -955,10 +1023,13 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn(torch::Tensor query,
 
   const int num_kv_groups = num_qo_heads / num_kv_heads;
 
+  int32_t* q_lengths_ptr = get_seq_lengths_ptr(q_lengths, batch_size);
+  int32_t* kv_lengths_ptr = get_seq_lengths_ptr(kv_lengths, batch_size);
+
   auto output_dtype = output.scalar_type();
 
   DISPATCH_HEAD_DIM(head_dim, HEAD_DIM, {
-    DISPATCH_CAUSAL(is_causal, IS_CAUSAL, {
+    DISPATCH_MASK_MODE(is_causal, MASK_MODE, {
       DISPATCH_QK_QUANT_GRAN(qk_quant_gran, QK_QUANT_GRAN, {
         DISPATCH_RETURN_LSE(return_lse, RETURN_LSE, {
           DISPATCH_PYTORCH_DTYPE_TO_CTYPE_FP16(output_dtype, DTypeOut, {
@@ -968,7 +1039,7 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn(torch::Tensor query,
             constexpr int WARP_Q = (HEAD_DIM == 256) ? 16 : 32;
             constexpr int WARP_K = 64;
 
-            constexpr MaskMode mask_mode = IS_CAUSAL ? MaskMode::kCausal : MaskMode::kNone;
+            constexpr MaskMode mask_mode = MASK_MODE;
 
             if constexpr (QK_QUANT_GRAN == static_cast<int>(QuantGranularity::kPerWarp))
             {
@@ -1007,9 +1078,12 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn(torch::Tensor query,
               reinterpret_cast<float*>(query_scale.data_ptr()),
               reinterpret_cast<float*>(key_scale.data_ptr()),
               nullptr,
+              q_lengths_ptr,
+              kv_lengths_ptr,
               qo_len,
               kv_len,
               num_kv_groups,
+              is_causal,
               stride_bz_q, stride_seq_q, stride_h_q,
               stride_bz_k, stride_seq_k, stride_h_k,
               stride_bz_v, stride_seq_v, stride_h_v,
@@ -1034,7 +1108,9 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn_inst_buf(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse)
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths)
 {
   CHECK_CUDA(query);
   CHECK_CUDA(key);
@@ -1132,21 +1208,24 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn_inst_buf(torch::Tensor query,
 
   const int num_kv_groups = num_qo_heads / num_kv_heads;
 
+  int32_t* q_lengths_ptr = get_seq_lengths_ptr(q_lengths, batch_size);
+  int32_t* kv_lengths_ptr = get_seq_lengths_ptr(kv_lengths, batch_size);
+
   auto output_dtype = output.scalar_type();
 
   DISPATCH_HEAD_DIM(head_dim, HEAD_DIM, {
-    DISPATCH_CAUSAL(is_causal, IS_CAUSAL, {
+    DISPATCH_MASK_MODE(is_causal, MASK_MODE, {
       DISPATCH_QK_QUANT_GRAN(qk_quant_gran, QK_QUANT_GRAN, {
         DISPATCH_RETURN_LSE(return_lse, RETURN_LSE, {
           DISPATCH_PYTORCH_DTYPE_TO_CTYPE_FP16(output_dtype, DTypeOut, {
               
             constexpr int CTA_Q = 128;
-            constexpr bool USE_NON_CAUSAL_HD128_TILE = !IS_CAUSAL && HEAD_DIM == 128;
+            constexpr bool USE_NON_CAUSAL_HD128_TILE = MASK_MODE == MaskMode::kNone && HEAD_DIM == 128;
             constexpr int CTA_K = USE_NON_CAUSAL_HD128_TILE ? 32 : 64;
             constexpr int WARP_Q = (HEAD_DIM == 64 || USE_NON_CAUSAL_HD128_TILE) ? 32 : 16;
             constexpr int WARP_K = USE_NON_CAUSAL_HD128_TILE ? 32 : 64;
 
-            constexpr MaskMode mask_mode = IS_CAUSAL ? MaskMode::kCausal : MaskMode::kNone;
+            constexpr MaskMode mask_mode = MASK_MODE;
 
             if constexpr (QK_QUANT_GRAN == static_cast<int>(QuantGranularity::kPerWarp))
             {
@@ -1185,9 +1264,12 @@ torch::Tensor qk_int8_sv_f16_accum_f16_attn_inst_buf(torch::Tensor query,
               reinterpret_cast<float*>(query_scale.data_ptr()),
               reinterpret_cast<float*>(key_scale.data_ptr()),
               nullptr,
+              q_lengths_ptr,
+              kv_lengths_ptr,
               qo_len,
               kv_len,
               num_kv_groups,
+              is_causal,
               stride_bz_q, stride_seq_q, stride_h_q,
               stride_bz_k, stride_seq_k, stride_h_k,
               stride_bz_v, stride_seq_v, stride_h_v,
@@ -1213,7 +1295,9 @@ torch::Tensor qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse)
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths)
 {
   CHECK_CUDA(query);
   CHECK_CUDA(key);
@@ -1314,13 +1398,16 @@ torch::Tensor qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(torch::Tensor query,
 
   const int num_kv_groups = num_qo_heads / num_kv_heads;
 
+  int32_t* q_lengths_ptr = get_seq_lengths_ptr(q_lengths, batch_size);
+  int32_t* kv_lengths_ptr = get_seq_lengths_ptr(kv_lengths, batch_size);
+
   auto output_dtype = output.scalar_type();
   auto value_mean_dtype = value_mean.scalar_type();
 
   TORCH_CHECK(value_mean_dtype == output_dtype, "value_mean and output must have the same dtype");
 
   DISPATCH_HEAD_DIM(head_dim, HEAD_DIM, {
-    DISPATCH_CAUSAL(is_causal, IS_CAUSAL, {
+    DISPATCH_MASK_MODE(is_causal, MASK_MODE, {
       DISPATCH_QK_QUANT_GRAN(qk_quant_gran, QK_QUANT_GRAN, {
         DISPATCH_RETURN_LSE(return_lse, RETURN_LSE, {
           DISPATCH_PYTORCH_DTYPE_TO_CTYPE_FP16(output_dtype, DTypeOut, {
@@ -1330,7 +1417,7 @@ torch::Tensor qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(torch::Tensor query,
             constexpr int WARP_Q = (HEAD_DIM == 256) ? 16 : 32;
             constexpr int WARP_K = 64;
 
-            constexpr MaskMode mask_mode = IS_CAUSAL ? MaskMode::kCausal : MaskMode::kNone;
+            constexpr MaskMode mask_mode = MASK_MODE;
 
             if constexpr (QK_QUANT_GRAN == static_cast<int>(QuantGranularity::kPerWarp))
             {
@@ -1371,9 +1458,12 @@ torch::Tensor qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(torch::Tensor query,
               reinterpret_cast<float*>(query_scale.data_ptr()),
               reinterpret_cast<float*>(key_scale.data_ptr()),
               reinterpret_cast<DTypeOut*>(value_mean.data_ptr()),
+              q_lengths_ptr,
+              kv_lengths_ptr,
               qo_len,
               kv_len,
               num_kv_groups,
+              is_causal,
               stride_bz_q, stride_seq_q, stride_h_q,
               stride_bz_k, stride_seq_k, stride_h_k,
               stride_bz_v, stride_seq_v, stride_h_v,
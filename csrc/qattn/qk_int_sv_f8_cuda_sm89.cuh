@@ -45,7 +45,8 @@ template<uint32_t CTA_Q, uint32_t CTA_K, uint32_t WARP_Q, uint32_t WARP_K, uint3
         typename DTypeSVAccum = float, bool use_inst_buffer = false, typename DTypeOut = half, ComputeUnit DenominatorAccumUnit, MaskMode mask_mode = MaskMode::kNone, bool return_lse = false, bool fuse_v_scale=false, bool fuse_v_mean=false, bool use_pv_fp16_accu=false>
 __global__ void qk_int_sv_f8_attn_kernel(int8_t *__restrict__ Q, int8_t *__restrict__ K, int8_t *__restrict__ V, DTypeOut *__restrict__ O, float *__restrict__ Lse,
                       float *__restrict__ Q_scale, float *__restrict__ K_scale, float *__restrict__ V_scale, float *__restrict__ V_mean,
-                      const uint32_t qo_len, const uint32_t kv_len, const uint32_t num_kv_groups,
+                      const int32_t *__restrict__ Q_lengths, const int32_t *__restrict__ KV_lengths,
+                      const uint32_t max_qo_len, const uint32_t max_kv_len, const uint32_t num_kv_groups, const uint32_t frame_tokens,
                       const uint32_t stride_bz_q, const uint32_t stride_seq_q, const uint32_t stride_h_q, 
                       const uint32_t stride_bz_k, const uint32_t stride_seq_k, const uint32_t stride_h_k,
                       const uint32_t stride_bz_v, const uint32_t stride_h_v, const uint32_t stride_d_v,
@@ -86,6 +87,14 @@ __global__ void qk_int_sv_f8_attn_kernel(int8_t *__restrict__ Q, int8_t *__restr
   const uint32_t num_qo_heads = gridDim.y;
   const uint32_t head_id = blockIdx.y;
 
+  // tokens beyond the per-batch lengths are padding and are skipped
+  const uint32_t qo_len = (Q_lengths != nullptr) ? min(static_cast<uint32_t>(Q_lengths[batch_id]), max_qo_len) : max_qo_len;
+  const uint32_t kv_len = (KV_lengths != nullptr) ? min(static_cast<uint32_t>(KV_lengths[batch_id]), max_kv_len) : max_kv_len;
+  if (bx * CTA_Q >= qo_len)
+  {
+    return;
+  }
+
   // transfer to base 2 instead of base e with better numerical efficiency
   sm_scale *= math::log2e;
 
@@ -115,17 +124,17 @@ __global__ void qk_int_sv_f8_attn_kernel(int8_t *__restrict__ Q, int8_t *__restr
 
   if constexpr (K_GRAN == QuantGranularity::kPerBlock)
   {
-    const uint32_t num_block_k = div_ceil(kv_len, CTA_K);
+    const uint32_t num_block_k = div_ceil(max_kv_len, CTA_K);
     k_scale_idx = batch_id * (num_qo_heads / num_kv_groups) * num_block_k + (head_id / num_kv_groups) * num_block_k;
   }
   else if constexpr (K_GRAN == QuantGranularity::kPerWarp)
   {
-    const uint32_t num_warp_block_k = div_ceil(kv_len, CTA_K) * (CTA_K / WARP_K);
+    const uint32_t num_warp_block_k = div_ceil(max_kv_len, CTA_K) * (CTA_K / WARP_K);
     k_scale_idx = batch_id * (num_qo_heads / num_kv_groups) * num_warp_block_k + (head_id / num_kv_groups) * num_warp_block_k + get_warp_idx_k<num_warps_q, num_warps_k>();
   }
   else if constexpr (K_GRAN == QuantGranularity::kPerThread)
   {
-    const uint32_t num_warp_block_k = div_ceil(kv_len, CTA_K) * (CTA_K / WARP_K);
+    const uint32_t num_warp_block_k = div_ceil(max_kv_len, CTA_K) * (CTA_K / WARP_K);
     k_scale_idx = batch_id * (num_qo_heads / num_kv_groups) * (num_warp_block_k * 4) + (head_id / num_kv_groups) * (num_warp_block_k * 4) + get_warp_idx_k<num_warps_q, num_warps_k>() * 4 + lane_id % 4;
   }
 
@@ -211,20 +220,30 @@ __global__ void qk_int_sv_f8_attn_kernel(int8_t *__restrict__ Q, int8_t *__restr
   // uint32_t V_smem_offset_mma = smem_V.get_permuted_offset(get_warp_idx_k<num_warps_q, num_warps_k>() * WARP_K + lane_id % 16, lane_id / 16);
   uint32_t V_smem_offset_mma = smem_V.get_permuted_offset(lane_id % 8 + (lane_id / 16) * 8, get_warp_idx_k<num_warps_q, num_warps_k>() * WARP_K / PACK_SIZE_V + (lane_id / 8) % 2);
 
-  // for causal masking
-  uint32_t Q_idx_lane_base = bx * CTA_Q + get_warp_idx_q<num_warps_q, num_warps_k>() * WARP_Q + lane_id / 4;
+  // for causal masking, the mask is aligned to the bottom-right corner when qo_len < kv_len
+  // and to the top-left corner when the valid keys of a batch are fewer than its valid queries, as in the triton kernels
+  const uint32_t causal_offset = (mask_mode != MaskMode::kNone && kv_len > qo_len) ? kv_len - qo_len : 0;
+  uint32_t Q_idx_lane_base = bx * CTA_Q + causal_offset + get_warp_idx_q<num_warps_q, num_warps_k>() * WARP_Q + lane_id / 4;
   uint32_t K_idx_lane_base = get_warp_idx_k<num_warps_q, num_warps_k>() * WARP_K + 2 * (lane_id % 4);
 
   // for loading
   uint32_t Q_load_idx_lane_base = bx * CTA_Q + CTA_Q / num_warps * warp_id + lane_id / global_to_shared_line_lanes_QK;
   uint32_t K_load_idx_lane_base = CTA_K / num_warps * warp_id + lane_id / global_to_shared_line_lanes_QK;
 
+  // for block-causal masking, the last query of this block sees keys up to the end of its frame
   const uint32_t num_iterations = div_ceil(
       mask_mode == MaskMode::kCausal
-          ? min(kv_len, (bx + 1) * CTA_Q)
-          : kv_len,
+          ? min(kv_len, (bx + 1) * CTA_Q + causal_offset)
+          : mask_mode == MaskMode::kBlockCausal
+              ? min(kv_len, ((bx + 1) * CTA_Q - 1 + causal_offset) / frame_tokens * frame_tokens + frame_tokens)
+              : kv_len,
       CTA_K);
 
+  // tiles before this one lie fully below the diagonal and need no causal mask
+  const uint32_t num_unmasked_iterations = (mask_mode == MaskMode::kCausal) ? (bx * CTA_Q + causal_offset + 1) / CTA_K
+                                         : (mask_mode == MaskMode::kBlockCausal) ? ((bx * CTA_Q + causal_offset) / frame_tokens * frame_tokens + frame_tokens) / CTA_K
+                                         : num_iterations;
+
   // load Q with predicate
   load_global_to_share<global_to_shared_line_lanes_QK, global_to_shared_copy_lines_per_warp_QK, QK_smem_iters_row, Q_smem_iters_col, swizzle_mode_QK, QK_SMEM_STRIDE / PACK_SIZE_QK, CTA_Q>(
     &Q_lane_base_ptr, Q_smem_offset_load, stride_seq_q, smem_Q, Q_load_idx_lane_base, qo_len);
@@ -300,15 +319,47 @@ __global__ void qk_int_sv_f8_attn_kernel(int8_t *__restrict__ Q, int8_t *__restr
       }
     }
 
+    // with a causal offset or block-causal mask the diagonal may cross more than the last two tiles
+    float iter_sm_scale = sm_scale;
+    if constexpr (mask_mode != MaskMode::kNone)
+    {
+      if (iter > num_unmasked_iterations)
+      {
+#pragma unroll
+        for (uint32_t fq = 0; fq < num_tiles_q; fq++)
+        {
+#pragma unroll
+          for (uint32_t fk = 0; fk < num_tiles_k; fk++)
+          {
+#pragma unroll
+            for (uint32_t k = 0; k < 8; k++)
+            {
+              RS_f32[fq][fk][k] *= dequant_scale;
+            }
+          }
+        }
+        if constexpr (mask_mode == MaskMode::kCausal)
+        {
+          apply_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32);
+        }
+        else
+        {
+          apply_block_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32, frame_tokens);
+        }
+        iter_sm_scale = original_sm_scale;
+      }
+    }
+
+    // do not apply out of bound mask for these iterations
     K_idx_lane_base += CTA_K;
 
     if constexpr (std::is_same<DTypeSVAccum, float>::value)
     {
-      update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, false, true, false>(RS_f32, RO, m, d, sm_scale);
+      update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, false, true, false>(RS_f32, RO, m, d, iter_sm_scale);
     }
     else if constexpr (std::is_same<DTypeSVAccum, half>::value)
     {
-      update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, true, true, false>(RS_f32, RO, m, d, sm_scale);
+      update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, true, true, false>(RS_f32, RO, m, d, iter_sm_scale);
     }
 
     if constexpr (DenominatorAccumUnit == ComputeUnit::kCudaCore)
@@ -407,6 +458,10 @@ __global__ void qk_int_sv_f8_attn_kernel(int8_t *__restrict__ Q, int8_t *__restr
     {
       apply_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32);
     }
+    else if constexpr (mask_mode == MaskMode::kBlockCausal)
+    {
+      apply_block_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32, frame_tokens);
+    }
     // apply_out_of_bound_mask<num_tiles_q, num_tiles_k>(K_idx_lane_base, RS_f32, kv_len);
     K_idx_lane_base += CTA_K;
 
@@ -514,6 +569,10 @@ __global__ void qk_int_sv_f8_attn_kernel(int8_t *__restrict__ Q, int8_t *__restr
     {
       apply_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32);
     }
+    else if constexpr (mask_mode == MaskMode::kBlockCausal)
+    {
+      apply_block_causal_mask<num_tiles_q, num_tiles_k>(Q_idx_lane_base, K_idx_lane_base, RS_f32, frame_tokens);
+    }
     apply_out_of_bound_mask<num_tiles_q, num_tiles_k>(K_idx_lane_base, RS_f32, kv_len);
     K_idx_lane_base += CTA_K;
 
@@ -692,7 +751,7 @@ __global__ void qk_int_sv_f8_attn_kernel(int8_t *__restrict__ Q, int8_t *__restr
   { 
     // ! this only works for num_tiles_q = 2
     uint32_t lse_idx = bx * CTA_Q + lane_id / 4 + 8 * (lane_id % 4) + WARP_Q * get_warp_idx_q<num_warps_q, num_warps_k>();
-    float *lse_lane_ptr = Lse + batch_id * (qo_len * num_qo_heads) + head_id * qo_len + lse_idx;
+    float *lse_lane_ptr = Lse + batch_id * (max_qo_len * num_qo_heads) + head_id * max_qo_len + lse_idx;
     uint32_t fq = (lane_id % 4) / 2;
     uint32_t k = (lane_id % 4) % 2;
 
@@ -144,7 +144,8 @@ __global__ void qk_int8_sv_f8_attn_kernel(const __grid_constant__ CUtensorMap te
                                         const __grid_constant__ CUtensorMap tensorMapV,
                                         float *__restrict__ Q_scale, float *__restrict__ K_scale, float *__restrict__ V_scale,
                                         DTypeOut* O, float *__restrict__ Lse, uint32_t stride_bz_o, uint32_t stride_h_o, uint32_t stride_seq_o,
-                                        const uint32_t qo_len, const uint32_t kv_len, const uint32_t num_kv_groups,
+                                        const int32_t *__restrict__ Q_lengths, const int32_t *__restrict__ KV_lengths,
+                                        const uint32_t max_qo_len, const uint32_t max_kv_len, const uint32_t num_kv_groups, const uint32_t frame_tokens,
                                         float sm_scale)
 {
   static_assert(NUM_THREADS == 128);
@@ -165,6 +166,14 @@ __global__ void qk_int8_sv_f8_attn_kernel(const __grid_constant__ CUtensorMap te
   const uint32_t num_qo_heads = gridDim.y;
   const uint32_t kv_head_id = head_id / num_kv_groups;
 
+  // tokens beyond the per-batch lengths are padding and are skipped
+  const uint32_t qo_len = (Q_lengths != nullptr) ? min(static_cast<uint32_t>(Q_lengths[batch_id]), max_qo_len) : max_qo_len;
+  const uint32_t kv_len = (KV_lengths != nullptr) ? min(static_cast<uint32_t>(KV_lengths[batch_id]), max_kv_len) : max_kv_len;
+  if (bx * CTA_Q >= qo_len)
+  {
+    return;
+  }
+
   sm_scale *= math::log2e;
 
   extern __shared__ __align__(128) int8_t smem_[];
@@ -199,17 +208,20 @@ __global__ void qk_int8_sv_f8_attn_kernel(const __grid_constant__ CUtensorMap te
 
   if constexpr (K_GRAN == QuantGranularity::kPerBlock || K_GRAN == QuantGranularity::kPerWarp)
   {
-    const uint32_t num_block_k = div_ceil(kv_len, CTA_K);
+    const uint32_t num_block_k = div_ceil(max_kv_len, CTA_K);
     k_scale_idx = batch_id * (num_qo_heads / num_kv_groups) * num_block_k + (head_id / num_kv_groups) * num_block_k;
   }
   else if constexpr (K_GRAN == QuantGranularity::kPerThread)
   {
-    const uint32_t num_block_k = div_ceil(kv_len, CTA_K);
+    const uint32_t num_block_k = div_ceil(max_kv_len, CTA_K);
     k_scale_idx = batch_id * (num_qo_heads / num_kv_groups) * (num_block_k * 4) + (head_id / num_kv_groups) * (num_block_k * 4) + lane_id % 4;
   }
 
   constexpr uint32_t k_scale_advance_offset = (K_GRAN == QuantGranularity::kPerBlock || K_GRAN == QuantGranularity::kPerWarp) ? 1 : 4;
 
+  // for causal masking, the mask is aligned to the bottom-right corner when qo_len < kv_len
+  // and to the top-left corner when the valid keys of a batch are fewer than its valid queries, as in the triton kernels
+  const uint32_t causal_offset = (mask_mode != MaskMode::kNone && kv_len > qo_len) ? kv_len - qo_len : 0;
   uint32_t Q_idx_lane_base = bx * CTA_Q + warp_idx * 16 + lane_id / 4;
 
 #pragma unroll
@@ -264,12 +276,20 @@ __global__ void qk_int8_sv_f8_attn_kernel(const __grid_constant__ CUtensorMap te
   // wait for Q
   wait(&barrier_Q, 0);
 
+  // for block-causal masking, the last query of this block sees keys up to the end of its frame
   const uint32_t num_iterations = div_ceil(
       mask_mode == MaskMode::kCausal
-          ? min(kv_len, (bx + 1) * CTA_Q)
-          : kv_len,
+          ? min(kv_len, (bx + 1) * CTA_Q + causal_offset)
+          : mask_mode == MaskMode::kBlockCausal
+              ? min(kv_len, ((bx + 1) * CTA_Q - 1 + causal_offset) / frame_tokens * frame_tokens + frame_tokens)
+              : kv_len,
       CTA_K);
 
+  // tiles before this one lie fully below the diagonal and need no causal mask
+  const uint32_t num_unmasked_iterations = (mask_mode == MaskMode::kCausal) ? (bx * CTA_Q + causal_offset + 1) / CTA_K
+                                         : (mask_mode == MaskMode::kBlockCausal) ? ((bx * CTA_Q + causal_offset) / frame_tokens * frame_tokens + frame_tokens) / CTA_K
+                                         : num_iterations;
+
   int p = 1;
   for (uint32_t iter = 1; iter < num_iterations; iter++)
   { 
@@ -320,6 +340,31 @@ __global__ void qk_int8_sv_f8_attn_kernel(const __grid_constant__ CUtensorMap te
       }
     }
 
+    // with a causal offset or block-causal mask the diagonal may cross more than the last tile
+    if constexpr (mask_mode != MaskMode::kNone)
+    {
+      if (iter > num_unmasked_iterations)
+      {
+#pragma unroll
+        for (uint32_t fq = 0; fq < num_tiles_q; fq++)
+        {
+#pragma unroll
+          for (uint32_t fk = 0; fk < num_tiles_k; fk++)
+          {
+#pragma unroll
+            for (uint32_t k = 0; k < 8; k++)
+            {
+              const uint32_t q_idx = Q_idx_lane_base + causal_offset + fq * 64 + 8 * ((k % 4) / 2);
+              const uint32_t k_idx = (iter - 1) * CTA_K + fk * 16 + 2 * (lane_id % 4) + 8 * (k / 4) + k % 2;
+              const bool is_masked = (mask_mode == MaskMode::kCausal) ? (k_idx > q_idx) : (k_idx / frame_tokens > q_idx / frame_tokens);
+              RS_f32[fq][fk][k] = is_masked ? -5000000.0f : RS_f32[fq][fk][k] * dequant_scale;
+            }
+          }
+        }
+        sm_scale = original_sm_scale;
+      }
+    }
+
     update_mdo<num_tiles_q, num_tiles_k, num_tiles_v, false, true, false>(RS_f32, RO, m, d, sm_scale);
 
     // accumulate d on thread basis
@@ -429,7 +474,7 @@ __global__ void qk_int8_sv_f8_attn_kernel(const __grid_constant__ CUtensorMap te
 #pragma unroll
         for (uint32_t k = 0; k < 8; k++)
         {
-          const uint32_t q_idx = Q_idx_lane_base + fq * 64 + 8 * ((k % 4) / 2);
+          const uint32_t q_idx = Q_idx_lane_base + causal_offset + fq * 64 + 8 * ((k % 4) / 2);
           const uint32_t k_idx = (num_iterations - 1) * CTA_K + fk * 16 + 2 * (lane_id % 4) + 8 * (k / 4) + k % 2;
 
           bool is_out_of_bounds;
@@ -438,6 +483,10 @@ __global__ void qk_int8_sv_f8_attn_kernel(const __grid_constant__ CUtensorMap te
           {
             is_out_of_bounds = (k_idx > q_idx) || (k_idx >= kv_len);
           }
+          else if constexpr (mask_mode == MaskMode::kBlockCausal)
+          {
+            is_out_of_bounds = (k_idx / frame_tokens > q_idx / frame_tokens) || (k_idx >= kv_len);
+          }
           else
           {
             is_out_of_bounds = (k_idx >= kv_len);
@@ -569,7 +618,7 @@ __global__ void qk_int8_sv_f8_attn_kernel(const __grid_constant__ CUtensorMap te
     {
       // only works for CTA_Q = 64
       uint32_t lse_idx = bx * CTA_Q + lane_id / 4 + 8 * (lane_id % 4) + 16 * warp_idx;
-      float *lse_lane_ptr = Lse + batch_id * (qo_len * num_qo_heads) + head_id * qo_len + lse_idx;
+      float *lse_lane_ptr = Lse + batch_id * (max_qo_len * num_qo_heads) + head_id * max_qo_len + lse_idx;
       uint32_t fq = (lane_id % 4) / 2;
       uint32_t k = (lane_id % 4) % 2;
 
@@ -592,7 +641,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn_inst_buf(
                   int is_causal,
                   int qk_quant_gran,
                   float sm_scale,
-                  int return_lse)
+                  int return_lse,
+                  c10::optional<torch::Tensor> kv_lengths,
+                  c10::optional<torch::Tensor> q_lengths)
 {
   CHECK_CUDA(query);
   CHECK_CUDA(key);
@@ -691,10 +742,13 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn_inst_buf(
 
   const int num_kv_groups = num_qo_heads / num_kv_heads;
 
+  int32_t* q_lengths_ptr = get_seq_lengths_ptr(q_lengths, batch_size);
+  int32_t* kv_lengths_ptr = get_seq_lengths_ptr(kv_lengths, batch_size);
+
   auto output_type = output.scalar_type();
 
   DISPATCH_HEAD_DIM_SM90(head_dim, HEAD_DIM, {
-    DISPATCH_CAUSAL(is_causal, IS_CAUSAL, {
+    DISPATCH_MASK_MODE(is_causal, MASK_MODE, {
       DISPATCH_QK_QUANT_GRAN(qk_quant_gran, QK_QUANT_GRAN, {
         DISPATCH_RETURN_LSE(return_lse, RETURN_LSE, {
           DISPATCH_PYTORCH_DTYPE_TO_CTYPE_FP16(output_type, DTypeOut, {
@@ -702,7 +756,7 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn_inst_buf(
             constexpr int CTA_K = 128;
             constexpr int NUM_THREADS = 128;
 
-            constexpr MaskMode mask_mode = IS_CAUSAL ? MaskMode::kCausal : MaskMode::kNone;
+            constexpr MaskMode mask_mode = MASK_MODE;
 
             assert(value.size(3) >= div_ceil(kv_len, CTA_K) * CTA_K);
 
@@ -744,7 +798,8 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn_inst_buf(
               reinterpret_cast<DTypeOut*>(output.data_ptr()),
               (RETURN_LSE) ? reinterpret_cast<float*>(lse.data_ptr()) : nullptr,
               stride_bz_o, stride_h_o, stride_seq_o,
-              qo_len, kv_len, num_kv_groups, sm_scale);
+              q_lengths_ptr, kv_lengths_ptr,
+              qo_len, kv_len, num_kv_groups, is_causal, sm_scale);
           });
         });
       });
@@ -766,7 +821,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse)
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths)
 {
   CHECK_CUDA(query);
   CHECK_CUDA(key);
@@ -869,10 +926,13 @@ torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
 
   const int num_kv_groups = num_qo_heads / num_kv_heads;
 
+  int32_t* q_lengths_ptr = get_seq_lengths_ptr(q_lengths, batch_size);
+  int32_t* kv_lengths_ptr = get_seq_lengths_ptr(kv_lengths, batch_size);
+
   auto output_dtype = output.scalar_type();
 
   DISPATCH_HEAD_DIM_SM90(head_dim, HEAD_DIM, {
-    DISPATCH_CAUSAL(is_causal, IS_CAUSAL, {
+    DISPATCH_MASK_MODE(is_causal, MASK_MODE, {
       DISPATCH_QK_QUANT_GRAN(qk_quant_gran, QK_QUANT_GRAN, {
         DISPATCH_RETURN_LSE(return_lse, RETURN_LSE, {
           DISPATCH_PYTORCH_DTYPE_TO_CTYPE_FP16(output_dtype, DTypeOut, {
@@ -880,7 +940,7 @@ torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
             constexpr int CTA_K = 128;
             constexpr int NUM_THREADS = 128;
 
-            constexpr MaskMode mask_mode = IS_CAUSAL ? MaskMode::kCausal : MaskMode::kNone;
+            constexpr MaskMode mask_mode = MASK_MODE;
 
             assert(value.size(3) >= div_ceil(kv_len, CTA_K) * CTA_K);
 
@@ -924,7 +984,8 @@ torch::Tensor qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
               reinterpret_cast<DTypeOut*>(output.data_ptr()),
               (RETURN_LSE) ? reinterpret_cast<float*>(lse.data_ptr()) : nullptr,
               stride_bz_o, stride_h_o, stride_seq_o,
-              qo_len, kv_len, num_kv_groups, sm_scale);
+              q_lengths_ptr, kv_lengths_ptr,
+              qo_len, kv_len, num_kv_groups, is_causal, sm_scale);
           });
         });
       });
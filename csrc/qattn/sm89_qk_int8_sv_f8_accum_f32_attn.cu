@@ -11,7 +11,9 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn(torch::Tensor query,
                     int is_causal,
                     int qk_quant_gran,
                     float sm_scale,
-                    int return_lse)
+                    int return_lse,
+                    c10::optional<torch::Tensor> kv_lengths,
+                    c10::optional<torch::Tensor> q_lengths)
 {
   CHECK_CUDA(query);
   CHECK_CUDA(key);
@@ -109,10 +111,13 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn(torch::Tensor query,
 
   const int num_kv_groups = num_qo_heads / num_kv_heads;
 
+  int32_t* q_lengths_ptr = get_seq_lengths_ptr(q_lengths, batch_size);
+  int32_t* kv_lengths_ptr = get_seq_lengths_ptr(kv_lengths, batch_size);
+
   auto output_dtype = output.scalar_type();
 
   DISPATCH_HEAD_DIM(head_dim, HEAD_DIM, {
-    DISPATCH_CAUSAL(is_causal, IS_CAUSAL, {
+    DISPATCH_MASK_MODE(is_causal, MASK_MODE, {
       DISPATCH_QK_QUANT_GRAN(qk_quant_gran, QK_QUANT_GRAN, {
         DISPATCH_RETURN_LSE(return_lse, RETURN_LSE, {
           DISPATCH_PYTORCH_DTYPE_TO_CTYPE_FP16(output_dtype, DTypeOut, {
@@ -124,7 +129,7 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn(torch::Tensor query,
             assert(value.size(0) == batch_size);
             assert(value.size(3) >= div_ceil(kv_len, CTA_K) * CTA_K);
 
-            constexpr MaskMode mask_mode = IS_CAUSAL ? MaskMode::kCausal : MaskMode::kNone;
+            constexpr MaskMode mask_mode = MASK_MODE;
 
             if constexpr (QK_QUANT_GRAN == static_cast<int>(QuantGranularity::kPerWarp))
             {
@@ -164,9 +169,12 @@ torch::Tensor qk_int8_sv_f8_accum_f32_attn(torch::Tensor query,
               reinterpret_cast<float*>(key_scale.data_ptr()),
               nullptr,
               nullptr,
+              q_lengths_ptr,
+              kv_lengths_ptr,
               qo_len,
               kv_len,
               num_kv_groups,
+              is_causal,
               stride_bz_q, stride_seq_q, stride_h_q,
               stride_bz_k, stride_seq_k, stride_h_k,
               stride_bz_v, stride_h_v, stride_d_v,
@@ -50,3 +50,16 @@ inline cudaStream_t get_current_cuda_stream(const torch::Tensor &tensor) {
 #define CHECK_LASTDIM_CONTIGUOUS(x) \
   TORCH_CHECK(x.stride(-1) == 1,    \
               "Tensor " #x " must be contiguous at the last dimension")
+
+// returns the data pointer of an optional int32 tensor of per-batch sequence lengths, or nullptr if it is not given
+inline int32_t* get_seq_lengths_ptr(const c10::optional<torch::Tensor> &seq_lengths, int batch_size) {
+  if (!seq_lengths.has_value()) {
+    return nullptr;
+  }
+  const torch::Tensor &lengths = seq_lengths.value();
+  CHECK_CUDA(lengths);
+  CHECK_DTYPE(lengths, torch::kInt32);
+  CHECK_CONTIGUOUS(lengths);
+  CHECK_SHAPE(lengths, batch_size);
+  return lengths.data_ptr<int32_t>();
+}
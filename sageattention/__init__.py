@@ -1,5 +1,16 @@
-from .core import sageattn, sageattn_varlen
+from .core import sageattn, sageattn_varlen, sageattn_padded, sageattn_packed_qkv, sageattn_spatial
 from .core import sageattn_qk_int8_pv_fp16_triton
 from .core import sageattn_qk_int8_pv_fp16_cuda 
 from .core import sageattn_qk_int8_pv_fp8_cuda
-from .core import sageattn_qk_int8_pv_fp8_cuda_sm90
\ No newline at end of file
+from .core import sageattn_qk_int8_pv_fp8_cuda_sm90
+from .kv_cache import QuantizedKVCache, sageattn_kv_cache
+from .joint import sageattn_joint, sageattn_multi_kv
+from .mask import pack_bool_mask
+from .autograd import sageattn_trainable
+from .prologue import apply_rms_norm, apply_rope
+from .scale_cache import ScaleCache
+from .calibration import CalibrationRecorder, StaticScales
+from .cache import StepCache
+from .capture import ActivationCapture, ActivationStore
+from .trace import CallTracer
+from .precompile import warmup
@@ -0,0 +1,286 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Accuracy suite for the attention entry points, against an fp32 reference.
+
+The inputs come from synthetic generators that reproduce the activations the quantization struggles with,
+or from recorded activations. Every case reports the cosine similarity, the relative L1 error and the RMSE of the output.
+
+Usage::
+
+    # sweep the distributions and write the results
+    python -m sageattention.accuracy run --backends triton fp8_cuda --distributions normal outliers k_bias v_bias --out accuracy.json
+
+    # recorded activations, a capture directory of sageattention.capture or a .pt or .safetensors file with the tensors "q", "k" and "v" in HND
+    python -m sageattention.accuracy run --backends triton --activations layer12.safetensors --out accuracy.json
+
+    # join with a speed report of `python -m sageattention.bench run` and mark the Pareto-optimal backends
+    python -m sageattention.accuracy pareto accuracy.json speed.json
+
+Without a GPU, set ``TRITON_INTERPRET=1`` and use small shapes, as for :mod:`sageattention.bench`.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import torch
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .bench import BACKENDS, CASE_KEYS, DTYPES, Unsupported, environment, make_inputs, _sdpa
+
+# the fields that identify an accuracy case
+ACCURACY_KEYS = CASE_KEYS + ["distribution"]
+
+
+def _channel_outliers(generator, head_dim, num, scale):
+    # a few channels of every head are `scale` times larger, as after the attention projections of large models
+    factor = torch.ones(head_dim)
+    factor[torch.randperm(head_dim, generator=generator)[:num]] = scale
+    return factor
+
+
+def _normal(q, k, v, generator):
+    return q, k, v
+
+
+def _outliers(q, k, v, generator):
+    head_dim = q.size(-1)
+    q = q * _channel_outliers(generator, head_dim, max(1, head_dim // 32), 10.0).to(q)
+    k = k * _channel_outliers(generator, head_dim, max(1, head_dim // 32), 10.0).to(k)
+    # and rare token spikes
+    spikes = (torch.rand(k.shape, generator=generator) < 1e-3).to(k) * 50.0
+    return q, k + spikes, v
+
+
+def _k_bias(q, k, v, generator):
+    # a large bias of every channel of k shared by all tokens, the case of smooth_k
+    bias = torch.randn(k.size(-1), generator=generator) * 8.0
+    return q, k + bias.to(k), v
+
+
+def _v_bias(q, k, v, generator):
+    # a large mean of v, the case of smooth_v in CogVideoX
+    bias = torch.randn(v.size(-1), generator=generator) * 2.0 + 16.0
+    return q, k, v + bias.to(v)
+
+
+# name -> f(q, k, v, generator) -> (q, k, v), applied to standard normal inputs
+DISTRIBUTIONS: Dict[str, Callable] = {
+    "normal": _normal,
+    "outliers": _outliers,
+    "k_bias": _k_bias,
+    "v_bias": _v_bias,
+}
+
+
+def load_activations(path: str) -> Iterator[Tuple[str, Dict[str, torch.Tensor]]]:
+    """
+    Stream recorded activations as ``(name, {"q", "k", "v"})`` with tensors of shape ``[batch_size, num_heads, seq_len, head_dim]``.
+    `path` is a directory written by :class:`sageattention.capture.ActivationCapture`, or a ``.pt`` or ``.safetensors`` file
+    with the tensors ``"q"``, ``"k"`` and ``"v"`` in that shape.
+    """
+    name = os.path.basename(os.path.normpath(path))
+    if os.path.isdir(path):
+        from .capture import ActivationStore
+        for i, sample in enumerate(ActivationStore(path).samples()):
+            tensors = {x: sample[x].transpose(1, 2) if sample["tensor_layout"] == "NHD" else sample[x] for x in ("q", "k", "v")}
+            yield f"{name}:{sample['layer_tag']}:{sample['step']}:{i}", tensors
+        return
+    if path.endswith(".safetensors"):
+        from .calibration import _load_safetensors
+        tensors = _load_safetensors().load_file(path)
+    else:
+        tensors = torch.load(path, map_location="cpu")
+    missing = {"q", "k", "v"} - set(tensors)
+    if missing:
+        raise KeyError(f"{path} has no tensors {sorted(missing)}.")
+    yield name, {x: tensors[x] for x in ("q", "k", "v")}
+
+
+def metrics(actual: torch.Tensor, expect: torch.Tensor) -> Dict[str, float]:
+    """
+    The cosine similarity, the relative L1 error and the RMSE of `actual` against `expect`, over all elements.
+    """
+    actual, expect = actual.double().flatten(), expect.double().flatten()
+    diff = actual - expect
+    return {
+        "cos_sim": torch.nn.functional.cosine_similarity(actual, expect, dim=0).item(),
+        "rel_l1": (diff.abs().sum() / expect.abs().sum().clamp_min(1e-12)).item(),
+        "rmse": diff.pow(2).mean().sqrt().item(),
+    }
+
+
+def make_accuracy_inputs(case, device, seed=0):
+    """
+    The deterministic ``(q, k, v, attn_mask)`` of a case, drawn from its distribution.
+    """
+    q, k, v, attn_mask = make_inputs(dict(case, dtype="fp32"), torch.device("cpu"), seed=seed)
+    generator = torch.Generator(device="cpu").manual_seed(seed + 1)
+    q, k, v = DISTRIBUTIONS[case["distribution"]](q, k, v, generator)
+    dtype = DTYPES[case["dtype"]]
+    q, k, v = (x.to(device=device, dtype=dtype) for x in (q, k, v))
+    return q, k, v, attn_mask.to(device) if attn_mask is not None else None
+
+
+def evaluate(case, q, k, v, attn_mask) -> Dict[str, Any]:
+    """
+    Run the backend of a case and return its record with the errors against the fp32 reference.
+    Unsupported cases are recorded with a ``skipped`` reason, failures with an ``error``.
+    """
+    record = dict(case)
+    try:
+        o = BACKENDS[case["backend"]](case, q, k, v, attn_mask)
+    except Unsupported as e:
+        record["skipped"] = str(e)
+        return record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        return record
+    # the reference sees the same rounded inputs as the backend
+    o_ref = _sdpa(case, q.float(), k.float(), v.float(), attn_mask)
+    record.update(metrics(o, o_ref))
+    return record
+
+
+def sweep(args) -> List[Dict[str, Any]]:
+    """
+    The synthetic cases of the sweep, in a fixed order.
+    """
+    from .bench import sweep as bench_sweep
+    bench_args = argparse.Namespace(**vars(args), varlen=[0], masks=["none"])
+    cases = []
+    for case, distribution in itertools.product(bench_sweep(bench_args), args.distributions):
+        cases.append(dict(case, distribution=distribution))
+    return cases
+
+
+def cmd_run(args):
+    device = torch.device(args.device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    results = []
+    for case in sweep(args):
+        results.append(evaluate(case, *make_accuracy_inputs(case, device, seed=args.seed)))
+        _report(results[-1])
+
+    for name, tensors in itertools.chain.from_iterable(load_activations(path) for path in args.activations):
+        q, k, v = (tensors[x].to(device) for x in ("q", "k", "v"))
+        for backend, causal in itertools.product(args.backends, args.causal):
+            dtype = "bf16" if q.dtype == torch.bfloat16 else "fp16"
+            case = {
+                "backend": backend, "layout": "HND", "dtype": dtype, "head_dim": q.size(3), "batch_size": q.size(0),
+                "num_heads": q.size(1), "num_kv_heads": k.size(1), "seq_len": k.size(2), "causal": bool(causal),
+                "varlen": False, "mask": "none", "distribution": f"file:{name}",
+            }
+            results.append(evaluate(case, *(x.to(DTYPES[dtype]) for x in (q, k, v)), None))
+            _report(results[-1])
+
+    report = {"environment": environment(device), "results": results}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+def _case_name(record):
+    return " ".join(f"{key}={record[key]}" for key in ACCURACY_KEYS)
+
+
+def _report(record):
+    if "skipped" in record:
+        print(f"{_case_name(record)}: skipped ({record['skipped']})", file=sys.stderr)
+    elif "error" in record:
+        print(f"{_case_name(record)}: error ({record['error']})", file=sys.stderr)
+    else:
+        print(f"{_case_name(record)}: cos_sim {record['cos_sim']:.6f}, rel_l1 {record['rel_l1']:.4g}, rmse {record['rmse']:.4g}", file=sys.stderr)
+
+
+def pareto(accuracy: Dict[str, Any], speed: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Join the records of an accuracy report and a speed report of :mod:`sageattention.bench` on their case,
+    and mark the backends of every case and distribution that no other backend beats in both cosine similarity and median time.
+    """
+    times = {tuple(r[key] for key in CASE_KEYS): r["median_ms"] for r in speed["results"] if "median_ms" in r}
+    rows = []
+    for r in accuracy["results"]:
+        key = tuple(r[key] for key in CASE_KEYS)
+        if "cos_sim" not in r or key not in times:
+            continue
+        rows.append({"case": {key: r[key] for key in ACCURACY_KEYS}, "cos_sim": r["cos_sim"], "rel_l1": r["rel_l1"], "median_ms": times[key]})
+
+    def group(row):
+        return tuple(value for key, value in row["case"].items() if key != "backend")
+
+    for row in rows:
+        row["pareto"] = not any(
+            group(other) == group(row)
+            and other["cos_sim"] >= row["cos_sim"] and other["median_ms"] <= row["median_ms"]
+            and (other["cos_sim"] > row["cos_sim"] or other["median_ms"] < row["median_ms"])
+            for other in rows
+        )
+    return rows
+
+
+def cmd_pareto(args):
+    with open(args.accuracy) as f:
+        accuracy = json.load(f)
+    with open(args.speed) as f:
+        speed = json.load(f)
+    rows = pareto(accuracy, speed)
+    print("| case | backend | cos_sim | rel_l1 | median_ms | pareto |")
+    print("|---|---|---|---|---|---|")
+    for row in sorted(rows, key=lambda row: (str(sorted(row["case"].items())), row["median_ms"])):
+        case = " ".join(f"{key}={value}" for key, value in row["case"].items() if key != "backend")
+        print(f"| {case} | {row['case']['backend']} | {row['cos_sim']:.6f} | {row['rel_l1']:.4g} | {row['median_ms']:.4f} | {'*' if row['pareto'] else ''} |")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sageattention.accuracy", description="Measure the accuracy of the SageAttention kernels.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Sweep the cases and write a JSON report.")
+    run.add_argument("--backends", nargs="+", default=["triton"], choices=sorted(BACKENDS))
+    run.add_argument("--distributions", nargs="+", default=sorted(DISTRIBUTIONS), choices=sorted(DISTRIBUTIONS))
+    run.add_argument("--activations", nargs="*", default=[], help="Capture directories or .pt/.safetensors files of recorded activations, evaluated in addition to the synthetic cases.")
+    run.add_argument("--layouts", nargs="+", default=["HND"], choices=["HND", "NHD"])
+    run.add_argument("--dtypes", nargs="+", default=["fp16"], choices=["fp16", "bf16"])
+    run.add_argument("--head-dims", nargs="+", type=int, default=[128])
+    run.add_argument("--batch-sizes", nargs="+", type=int, default=[1])
+    run.add_argument("--num-heads", nargs="+", type=int, default=[8])
+    run.add_argument("--num-kv-heads", nargs="+", type=int, default=[8], help="Fewer than --num-heads for GQA.")
+    run.add_argument("--seq-lens", nargs="+", type=int, default=[1024, 8192, 32768])
+    run.add_argument("--causal", nargs="+", type=int, default=[0], choices=[0, 1])
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--device", default=None, help="Default: cuda if available, else cpu.")
+    run.add_argument("--out", default=None, help="The JSON report. Default: stdout.")
+    run.set_defaults(func=cmd_run)
+
+    par = subparsers.add_parser("pareto", help="Print the accuracy-versus-time table of an accuracy report and a speed report.")
+    par.add_argument("accuracy")
+    par.add_argument("speed")
+    par.set_defaults(func=cmd_pareto)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+
+from .core import pad_qkv
+from .triton.quant_per_block import per_block_int8 as per_block_int8_triton
+from .triton.quant_per_block import quant_per_block_fp8_kernel
+from .triton.attn_qk_int8_per_block import forward as attn_false
+from .triton.attn_qk_int8_per_block_causal import forward as attn_true
+from .triton.attn_bwd import backward as attn_bwd
+
+from typing import Any, Optional
+
+BLKQ = 128
+BLKK = 64
+
+
+def _per_block_fp8(v):
+    v_fp8 = torch.empty(v.shape, dtype=torch.float8_e4m3fn, device=v.device)
+    b, h_kv, kv_len, head_dim = v.shape
+    v_scale = torch.empty((b, h_kv, (kv_len + BLKK - 1) // BLKK), dtype=torch.float32, device=v.device)
+    grid = ((kv_len + BLKK - 1) // BLKK, h_kv, b)
+    quant_per_block_fp8_kernel[grid](
+        v, v_fp8, v_scale, kv_len,
+        v.stride(0), v.stride(1), v.stride(2),
+        v_fp8.stride(0), v_fp8.stride(1), v_fp8.stride(2),
+        v_scale.stride(0), v_scale.stride(1),
+        C=head_dim, BLK=BLKK
+    )
+    return v_fp8, v_scale
+
+
+def _dequant_per_block(x, scale, blk, dtype):
+    scale = scale.repeat_interleave(blk, dim=2)[:, :, :x.size(2), None]
+    return (x.to(torch.float32) * scale).to(dtype)
+
+
+class SageAttentionFunction(torch.autograd.Function):
+    """
+    Autograd function of the Triton SageAttention kernels in "HND" layout with a head dimension of 64 or 128.
+
+    The forward pass is :func:`sageattn_qk_int8_pv_fp16_triton` with `smooth_k`. The backward pass recomputes the attention
+    probabilities from the saved log-sum-exp in the FlashAttention-2 way, in the precision of the saved activations.
+    Smoothing the keys does not change the gradients, as every row of ``dS`` sums to zero.
+    """
+
+    @staticmethod
+    def forward(ctx, q, k, v, is_causal, sm_scale, save_quantized):
+        dtype = q.dtype
+
+        km = k.mean(dim=2, keepdim=True)
+        k = k - km
+
+        q_int8, q_scale, k_int8, k_scale = per_block_int8_triton(q, k, sm_scale=sm_scale, tensor_layout="HND")
+
+        if is_causal:
+            o, lse = attn_true(q_int8, k_int8, v, q_scale, k_scale, tensor_layout="HND", output_dtype=dtype, return_lse=True)
+        else:
+            o, lse = attn_false(q_int8, k_int8, v, q_scale, k_scale, tensor_layout="HND", output_dtype=dtype, return_lse=True)
+
+        if save_quantized:
+            v_fp8, v_scale = _per_block_fp8(v)
+            ctx.save_for_backward(q_int8, q_scale, k_int8, k_scale, v_fp8, v_scale, o, lse)
+        else:
+            ctx.save_for_backward(q, k, v, o, lse)
+        ctx.is_causal = is_causal
+        ctx.sm_scale = sm_scale
+        ctx.save_quantized = save_quantized
+        ctx.dtype = dtype
+
+        return o
+
+    @staticmethod
+    def backward(ctx, do):
+        if ctx.save_quantized:
+            q_int8, q_scale, k_int8, k_scale, v_fp8, v_scale, o, lse = ctx.saved_tensors
+            # the query scales include sm_scale * log2(e)
+            q = _dequant_per_block(q_int8, q_scale / (ctx.sm_scale * 1.44269504), BLKQ, ctx.dtype)
+            k = _dequant_per_block(k_int8, k_scale, BLKK, ctx.dtype)
+            v = _dequant_per_block(v_fp8, v_scale, BLKK, ctx.dtype)
+        else:
+            q, k, v, o, lse = ctx.saved_tensors
+
+        dq, dk, dv = attn_bwd(do.contiguous(), q, k, v, o, lse, ctx.sm_scale, is_causal=ctx.is_causal)
+
+        return dq, dk, dv, None, None, None
+
+
+def sageattn_trainable(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    tensor_layout: str = "HND",
+    is_causal: bool = False,
+    sm_scale: Optional[float] = None,
+    save_quantized: bool = False,
+    **kwargs: Any,
+) -> torch.Tensor:
+    """
+    SageAttention with per-block INT8 quantization for Q and K and FP16 PV in the forward pass, implemented using Triton,
+    and a Triton backward pass, so that it can be used for training.
+
+    Parameters
+    ----------
+    q : torch.Tensor
+        The query tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_qo_heads, qo_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, qo_len, num_qo_heads, head_dim]``.
+
+    k : torch.Tensor
+        The key tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_kv_heads, kv_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, kv_len, num_kv_heads, head_dim]``.
+
+    v : torch.Tensor
+        The value tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_kv_heads, kv_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, kv_len, num_kv_heads, head_dim]``.
+
+    tensor_layout : str
+        The tensor layout, either "HND" or "NHD".
+        Default: "HND".
+
+    is_causal : bool
+        Whether to apply causal mask to the attention matrix, aligned to the bottom-right corner. Requires qo_len <= kv_len.
+        Default: False.
+
+    sm_scale : Optional[float]
+        The scale used in softmax, if not provided, will be set to ``1.0 / sqrt(head_dim)``.
+
+    save_quantized : bool
+        Whether to save only the INT8 Q and K, the FP8 (e4m3) V and their per-block scales for the backward pass,
+        instead of Q, K and V in the input dtype. This cuts the saved activations of Q, K and V by about 2x,
+        and the gradients are computed from the dequantized tensors.
+        Default: False.
+
+    Returns
+    -------
+    torch.Tensor
+        The output tensor with the same shape as `q`.
+
+    Note
+    ----
+    - ``num_qo_heads`` must be divisible by ``num_kv_heads``.
+    - The tensors `q`, `k`, and `v` must have the dtype ``torch.float16``, ``torch.bfloat16`` or ``torch.float32``.
+    - The kernels only use Triton, so this also runs on CPU tensors under the Triton interpreter (``TRITON_INTERPRET=1``).
+    """
+
+    assert q.device == k.device == v.device, "All tensors must be on the same device."
+    assert q.dtype == k.dtype == v.dtype, "All tensors must have the same dtype."
+
+    if tensor_layout == "NHD":
+        q, k, v = q.transpose(1, 2), k.transpose(1, 2), v.transpose(1, 2)
+    elif tensor_layout != "HND":
+        raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+    if is_causal:
+        assert q.size(2) <= k.size(2), "qo_len must not be larger than kv_len for causal attention."
+
+    head_dim_og, q, k, v = pad_qkv(q, k, v)
+    if q.size(-1) > 128:
+        raise ValueError(f"Unsupported head_dim: {head_dim_og}")
+
+    assert q.stride(-1) == 1 and k.stride(-1) == 1 and v.stride(-1) == 1, "Last dim of qkv must be contiguous."
+
+    if sm_scale is None:
+        sm_scale = 1.0 / (head_dim_og ** 0.5)
+
+    o = SageAttentionFunction.apply(q, k, v, is_causal, sm_scale, save_quantized)
+    o = o[..., :head_dim_og]
+
+    if tensor_layout == "NHD":
+        o = o.transpose(1, 2)
+    return o
@@ -0,0 +1,564 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark harness for the attention entry points, with machine-readable output.
+
+Usage::
+
+    # sweep the default cases on the current device and write the results
+    python -m sageattention.bench run --backends triton sdpa --seq-lens 1024 4096 --out base.json
+
+    # flag the cases of new.json more than 5% slower than in base.json
+    python -m sageattention.bench compare base.json new.json --threshold 0.05
+
+Without a GPU, run the Triton kernels in the Triton interpreter and ``sdpa`` on the CPU, so that the harness itself
+can be tested anywhere with small shapes::
+
+    TRITON_INTERPRET=1 python -m sageattention.bench run --seq-lens 128 --batch-sizes 1 --num-heads 2 --num-kv-heads 2 --repeats 3
+
+``overhead`` measures the host work of the entry points alone, with the quantization and attention kernels replaced by stubs
+and the inputs on the ``meta`` device, so it runs on any machine::
+
+    python -m sageattention.bench overhead --entry-points sageattn sageattn_qk_int8_pv_fp8_cuda --out overhead.json
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+from unittest import mock
+
+import torch
+import torch.nn.functional as F
+
+from typing import Any, Callable, Dict, List, Optional
+
+DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}
+
+# the fields that identify a case, in the order of the sweep
+CASE_KEYS = ["backend", "layout", "dtype", "head_dim", "batch_size", "num_heads", "num_kv_heads", "seq_len", "causal", "varlen", "mask"]
+
+
+class Unsupported(Exception):
+    """
+    Raised by a backend for a case it does not support. The case is recorded as skipped.
+    """
+
+
+def _to_hnd(x, layout):
+    return x.transpose(1, 2) if layout == "NHD" else x
+
+
+def _from_hnd(x, layout):
+    return x.transpose(1, 2) if layout == "NHD" else x
+
+
+def _varlen_lengths(case):
+    # a fixed spread of lengths, the longest being seq_len
+    seq_len = case["seq_len"]
+    return [max(1, seq_len * (case["batch_size"] - i) // case["batch_size"]) for i in range(case["batch_size"])]
+
+
+def _sdpa(case, q, k, v, attn_mask):
+    layout = case["layout"]
+    group = case["num_heads"] // case["num_kv_heads"]
+    if case["varlen"]:
+        # q, k and v are packed [total_len, num_heads, head_dim]
+        outs = []
+        lengths = _varlen_lengths(case)
+        starts = [0] + list(itertools.accumulate(lengths))
+        for start, end in zip(starts[:-1], starts[1:]):
+            q_i, k_i, v_i = (x[start:end].transpose(0, 1).unsqueeze(0) for x in (q, k, v))
+            k_i, v_i = (x.repeat_interleave(group, dim=1) for x in (k_i, v_i))
+            outs.append(F.scaled_dot_product_attention(q_i, k_i, v_i, is_causal=case["causal"]).squeeze(0).transpose(0, 1))
+        return torch.cat(outs)
+    q, k, v = (_to_hnd(x, layout) for x in (q, k, v))
+    k, v = (x.repeat_interleave(group, dim=1) for x in (k, v))
+    o = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask, is_causal=case["causal"])
+    return _from_hnd(o, layout)
+
+
+def _triton(case, q, k, v, attn_mask):
+    if q.is_cuda:
+        if case["varlen"]:
+            from .core import sageattn_varlen
+            if attn_mask is not None:
+                raise Unsupported("masks are not supported with varlen")
+            cu_seqlens = torch.tensor([0] + list(itertools.accumulate(_varlen_lengths(case))), dtype=torch.int32, device=q.device)
+            max_seqlen = max(_varlen_lengths(case))
+            return sageattn_varlen(q, k, v, cu_seqlens, cu_seqlens, max_seqlen, max_seqlen, is_causal=case["causal"])
+        from .core import sageattn_qk_int8_pv_fp16_triton
+        return sageattn_qk_int8_pv_fp16_triton(q, k, v, tensor_layout=case["layout"], is_causal=case["causal"], attn_mask=attn_mask)
+
+    # the same kernels as sageattn_qk_int8_pv_fp16_triton, in the Triton interpreter
+    if case["varlen"]:
+        raise Unsupported("varlen is only benchmarked on cuda")
+    from .triton.quant_per_block import per_block_int8
+    from .triton.attn_qk_int8_per_block import forward as attn_false
+    from .triton.attn_qk_int8_per_block_causal import forward as attn_true
+    seq_dim = 1 if case["layout"] == "NHD" else 2
+    km = k.mean(dim=seq_dim, keepdim=True)
+    q_int8, q_scale, k_int8, k_scale = per_block_int8(q, k, km=km, tensor_layout=case["layout"])
+    if case["causal"]:
+        o, _ = attn_true(q_int8, k_int8, v, q_scale, k_scale, tensor_layout=case["layout"], output_dtype=q.dtype)
+    else:
+        if attn_mask is not None:
+            q_hnd, k_hnd = _to_hnd(q, case["layout"]), _to_hnd(k, case["layout"])
+            attn_mask = attn_mask.expand(q_hnd.size(0), q_hnd.size(1), q_hnd.size(2), k_hnd.size(2))
+        o, _ = attn_false(q_int8, k_int8, v, q_scale, k_scale, tensor_layout=case["layout"], output_dtype=q.dtype, attn_mask=attn_mask)
+    return o
+
+
+def _cuda_backend(name):
+    def run(case, q, k, v, attn_mask):
+        if not q.is_cuda:
+            raise Unsupported("cuda only")
+        if case["varlen"] or attn_mask is not None:
+            raise Unsupported("varlen and masks are not supported")
+        from . import core
+        return getattr(core, name)(q, k, v, tensor_layout=case["layout"], is_causal=case["causal"])
+    return run
+
+
+BACKENDS: Dict[str, Callable] = {
+    "sdpa": _sdpa,
+    "triton": _triton,
+    "auto": _cuda_backend("sageattn"),
+    "fp16_cuda": _cuda_backend("sageattn_qk_int8_pv_fp16_cuda"),
+    "fp8_cuda": _cuda_backend("sageattn_qk_int8_pv_fp8_cuda"),
+    "fp8_cuda_sm90": _cuda_backend("sageattn_qk_int8_pv_fp8_cuda_sm90"),
+}
+
+
+def make_inputs(case, device, seed=0):
+    """
+    The deterministic ``(q, k, v, attn_mask)`` of a case.
+    """
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    dtype = DTYPES[case["dtype"]]
+    b, h_qo, h_kv, seq_len, head_dim = case["batch_size"], case["num_heads"], case["num_kv_heads"], case["seq_len"], case["head_dim"]
+
+    def randn(*shape):
+        return torch.randn(*shape, generator=generator).to(device=device, dtype=dtype)
+
+    if case["varlen"]:
+        total = sum(_varlen_lengths(case))
+        q, k, v = randn(total, h_qo, head_dim), randn(total, h_kv, head_dim), randn(total, h_kv, head_dim)
+    elif case["layout"] == "HND":
+        q, k, v = randn(b, h_qo, seq_len, head_dim), randn(b, h_kv, seq_len, head_dim), randn(b, h_kv, seq_len, head_dim)
+    else:
+        q, k, v = randn(b, seq_len, h_qo, head_dim), randn(b, seq_len, h_kv, head_dim), randn(b, seq_len, h_kv, head_dim)
+
+    attn_mask = None
+    if case["mask"] == "bool":
+        # every query keeps itself, so that no row is fully masked
+        attn_mask = torch.rand(b, 1, seq_len, seq_len, generator=generator) < 0.5
+        attn_mask |= torch.eye(seq_len, dtype=torch.bool)
+        attn_mask = attn_mask.to(device)
+    elif case["mask"] != "none":
+        raise ValueError(f"Unsupported mask: {case['mask']}")
+    return q, k, v, attn_mask
+
+
+def flops(case):
+    """
+    The FLOPs of the two matmuls of a case, halved for causal attention.
+    """
+    lengths = _varlen_lengths(case) if case["varlen"] else [case["seq_len"]] * case["batch_size"]
+    total = sum(4 * case["num_heads"] * case["head_dim"] * n * n for n in lengths)
+    return total // 2 if case["causal"] else total
+
+
+def measure(fn, device, warmups=3, repeats=10):
+    """
+    The time of each of `repeats` calls of `fn` in milliseconds, after `warmups` calls.
+    """
+    for _ in range(warmups):
+        fn()
+    times = []
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        for _ in range(repeats):
+            start, end = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+            start.record()
+            fn()
+            end.record()
+            end.synchronize()
+            times.append(start.elapsed_time(end))
+    else:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1e3)
+    return times
+
+
+def percentile(values, p):
+    """
+    The `p`-th percentile of `values`, interpolated linearly.
+    """
+    values = sorted(values)
+    pos = (len(values) - 1) * p / 100
+    lo, hi = int(pos), min(int(pos) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def run_case(case, device, warmups=3, repeats=10, seed=0):
+    """
+    Benchmark one case and return its record. Unsupported cases are recorded with a ``skipped`` reason,
+    failures with an ``error``.
+    """
+    record = dict(case)
+    try:
+        q, k, v, attn_mask = make_inputs(case, device, seed=seed)
+        backend = BACKENDS[case["backend"]]
+        times = measure(lambda: backend(case, q, k, v, attn_mask), device, warmups=warmups, repeats=repeats)
+    except Unsupported as e:
+        record["skipped"] = str(e)
+        return record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        return record
+
+    median = percentile(times, 50)
+    record.update({
+        "median_ms": median,
+        "p10_ms": percentile(times, 10),
+        "p90_ms": percentile(times, 90),
+        "min_ms": min(times),
+        "repeats": len(times),
+        "tflops": flops(case) / (median * 1e-3) * 1e-12,
+    })
+    return record
+
+
+def sweep(args) -> List[Dict[str, Any]]:
+    """
+    The cases of the sweep, in a fixed order.
+    """
+    cases = []
+    for values in itertools.product(args.backends, args.layouts, args.dtypes, args.head_dims, args.batch_sizes,
+                                    args.num_heads, args.num_kv_heads, args.seq_lens, args.causal, args.varlen, args.masks):
+        case = dict(zip(CASE_KEYS, values))
+        case["causal"], case["varlen"] = bool(case["causal"]), bool(case["varlen"])
+        if case["num_heads"] % case["num_kv_heads"] != 0:
+            continue
+        if case["varlen"]:
+            # varlen tensors are packed [total_len, num_heads, head_dim], the layout and the mask do not apply
+            if case["layout"] != args.layouts[0] or case["mask"] != "none":
+                continue
+            case["layout"] = "packed"
+        if case["causal"] and case["mask"] != "none":
+            continue
+        cases.append(case)
+    return cases
+
+
+def environment(device) -> Dict[str, Any]:
+    env = {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "device": str(device),
+        "triton_interpret": os.environ.get("TRITON_INTERPRET", "0"),
+    }
+    if device.type == "cuda":
+        env["gpu"] = torch.cuda.get_device_name(device)
+        env["cuda"] = torch.version.cuda
+    try:
+        import triton
+        env["triton"] = triton.__version__
+    except ImportError:
+        pass
+    return env
+
+
+def cmd_run(args):
+    device = torch.device(args.device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    torch.manual_seed(args.seed)
+    results = []
+    for case in sweep(args):
+        record = run_case(case, device, warmups=args.warmups, repeats=args.repeats, seed=args.seed)
+        results.append(record)
+        if "skipped" in record:
+            print(f"{_case_name(record)}: skipped ({record['skipped']})", file=sys.stderr)
+        elif "error" in record:
+            print(f"{_case_name(record)}: error ({record['error']})", file=sys.stderr)
+        else:
+            print(f"{_case_name(record)}: median {record['median_ms']:.4f} ms, {record['tflops']:.2f} TFLOPs", file=sys.stderr)
+
+    report = {"environment": environment(device), "results": results}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+def _case_name(record):
+    return " ".join(f"{key}={record[key]}" for key in CASE_KEYS)
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    Match the cases of two reports and return one row per case measured in `base`,
+    with the relative change of the median time and whether it exceeds `threshold`.
+    A case measured in `base` but missing, skipped or failed in `new` is a regression, with a ``missing`` reason
+    and no new time.
+    """
+    def index(report):
+        return {tuple(r[key] for key in CASE_KEYS): r for r in report["results"]}
+
+    base_results, new_results = index(base), index(new)
+    rows = []
+    for key, base_record in base_results.items():
+        if "median_ms" not in base_record:
+            continue
+        new_record = new_results.get(key)
+        if new_record is None or "median_ms" not in new_record:
+            if new_record is None:
+                reason = "not in the new report"
+            else:
+                reason = new_record.get("error") or f"skipped: {new_record.get('skipped')}"
+            rows.append({
+                "case": dict(zip(CASE_KEYS, key)),
+                "base_ms": base_record["median_ms"],
+                "new_ms": None,
+                "change": None,
+                "regression": True,
+                "missing": reason,
+            })
+            continue
+        change = new_record["median_ms"] / base_record["median_ms"] - 1
+        rows.append({
+            "case": dict(zip(CASE_KEYS, key)),
+            "base_ms": base_record["median_ms"],
+            "new_ms": new_record["median_ms"],
+            "change": change,
+            "regression": change > threshold,
+        })
+    return rows
+
+
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows = compare(base, new, threshold=args.threshold)
+    for row in rows:
+        if "missing" in row:
+            print(f"{_case_name(row['case'])}: {row['base_ms']:.4f} ms -> {row['missing']} REGRESSION")
+            continue
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{_case_name(row['case'])}: {row['base_ms']:.4f} -> {row['new_ms']:.4f} ms ({row['change'] * 100:+.1f}%) {flag}")
+    regressions = sum(row["regression"] for row in rows)
+    print(f"{len(rows)} cases compared, {regressions} regressions above {args.threshold * 100:.1f}%")
+    return 1 if regressions else 0
+
+
+# the entry points measured by `overhead`
+OVERHEAD_ENTRY_POINTS = [
+    "sageattn",
+    "sageattn_qk_int8_pv_fp16_triton",
+    "sageattn_qk_int8_pv_fp16_cuda",
+    "sageattn_qk_int8_pv_fp8_cuda",
+    "sageattn_qk_int8_pv_fp8_cuda_sm90",
+]
+
+# the budget of the median host time of one call of every entry point with stubbed kernels, in microseconds,
+# raised with SAGEATTN_OVERHEAD_BUDGET_US on machines with a slower host
+OVERHEAD_BUDGET_US = float(os.environ.get("SAGEATTN_OVERHEAD_BUDGET_US", 200.0))
+
+
+class _StubModule:
+    """
+    Stands in for a compiled extension: every kernel returns immediately.
+    """
+
+    def __getattr__(self, name):
+        return _stub_kernel
+
+
+def _stub_kernel(*args, **kwargs):
+    return None
+
+
+def _stub_quant_qk(q, k, *args, **kwargs):
+    return q, None, k, None
+
+
+def _stub_quant_v(v, *args, **kwargs):
+    return v, None, None
+
+
+def _stub_attn(q, k, v, *args, **kwargs):
+    return q, None
+
+
+def _stub_mean_prologue(k, *args, tensor_layout="HND", **kwargs):
+    return k.mean(dim=1 if tensor_layout == "NHD" else 2, keepdim=True)
+
+
+@contextlib.contextmanager
+def stub_kernels(arch="sm89"):
+    """
+    Replace the kernels called by :mod:`sageattention.core` with stubs that return without computing, and make
+    every tensor pass the device checks, so that only the host work of the entry points remains.
+    `arch` is the architecture :func:`sageattention.sageattn` dispatches for.
+    """
+    from . import core
+    with contextlib.ExitStack() as stack:
+        def patch(name, value):
+            stack.enter_context(mock.patch.object(core, name, value, create=True))
+
+        for name in ["per_block_int8_triton", "per_thread_int8_triton", "per_block_int8_cuda", "per_warp_int8_cuda"]:
+            patch(name, _stub_quant_qk)
+        patch("per_channel_fp8", _stub_quant_v)
+        patch("attn_false", _stub_attn)
+        patch("attn_true", _stub_attn)
+        patch("mean_prologue", _stub_mean_prologue)
+        for name in ["sm80_compile", "sm89_compile", "sm90_compile"]:
+            patch(name, _StubModule())
+        for name in ["SM80_ENABLED", "SM89_ENABLED", "SM90_ENABLED"]:
+            patch(name, True)
+        # tensors off cuda have no device index
+        patch("_cuda_archs", {None: arch})
+        patch("get_cuda_version", lambda: (12, 8))
+        stack.enter_context(mock.patch.object(torch.Tensor, "is_cuda", property(lambda self: True)))
+        yield
+
+
+def measure_overhead(entry_point, args, rounds=20, calls=50, arch="sm89", **kwargs):
+    """
+    The host time of one call of the core function `entry_point` on `args` with stubbed kernels, in microseconds,
+    for each of `rounds` rounds of `calls` calls.
+    """
+    from . import core
+    fn = getattr(core, entry_point)
+    times = []
+    with stub_kernels(arch):
+        fn(*args, **kwargs)
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(calls):
+                fn(*args, **kwargs)
+            times.append((time.perf_counter() - start) / calls * 1e6)
+    return times
+
+
+def cmd_overhead(args):
+    device = torch.device(args.device)
+    dtype = DTYPES[args.dtype]
+    if args.layout == "HND":
+        q_shape = (args.batch_size, args.num_heads, args.seq_len, args.head_dim)
+        kv_shape = (args.batch_size, args.num_kv_heads, args.seq_len, args.head_dim)
+    else:
+        q_shape = (args.batch_size, args.seq_len, args.num_heads, args.head_dim)
+        kv_shape = (args.batch_size, args.seq_len, args.num_kv_heads, args.head_dim)
+    q = torch.empty(q_shape, dtype=dtype, device=device)
+    k, v = torch.empty(kv_shape, dtype=dtype, device=device), torch.empty(kv_shape, dtype=dtype, device=device)
+
+    results = []
+    for entry_point in args.entry_points:
+        times = measure_overhead(entry_point, (q, k, v), rounds=args.rounds, calls=args.calls, arch=args.arch,
+                                 tensor_layout=args.layout, is_causal=args.causal)
+        median = percentile(times, 50)
+        results.append({
+            "entry_point": entry_point,
+            "median_us": median,
+            "p10_us": percentile(times, 10),
+            "p90_us": percentile(times, 90),
+            "over_budget": median > args.budget,
+        })
+        print(f"{entry_point}: median {median:.1f} us per call", file=sys.stderr)
+
+    report = {
+        "environment": environment(device),
+        "shape": {"layout": args.layout, "dtype": args.dtype, "q": list(q_shape), "kv": list(kv_shape), "causal": args.causal, "arch": args.arch},
+        "budget_us": args.budget,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    over = [r["entry_point"] for r in results if r["over_budget"]]
+    if over:
+        print(f"over the budget of {args.budget:.0f} us per call: {', '.join(over)}", file=sys.stderr)
+    return 1 if over else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sageattention.bench", description="Benchmark the SageAttention kernels.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Sweep the cases and write a JSON report.")
+    run.add_argument("--backends", nargs="+", default=["triton", "sdpa"], choices=sorted(BACKENDS))
+    run.add_argument("--layouts", nargs="+", default=["HND"], choices=["HND", "NHD"])
+    run.add_argument("--dtypes", nargs="+", default=["fp16"], choices=sorted(DTYPES))
+    run.add_argument("--head-dims", nargs="+", type=int, default=[128])
+    run.add_argument("--batch-sizes", nargs="+", type=int, default=[4])
+    run.add_argument("--num-heads", nargs="+", type=int, default=[32])
+    run.add_argument("--num-kv-heads", nargs="+", type=int, default=[32], help="Fewer than --num-heads for GQA.")
+    run.add_argument("--seq-lens", nargs="+", type=int, default=[1024, 2048, 4096, 8192])
+    run.add_argument("--causal", nargs="+", type=int, default=[0, 1], choices=[0, 1])
+    run.add_argument("--varlen", nargs="+", type=int, default=[0], choices=[0, 1])
+    run.add_argument("--masks", nargs="+", default=["none"], choices=["none", "bool"])
+    run.add_argument("--warmups", type=int, default=5)
+    run.add_argument("--repeats", type=int, default=50)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--device", default=None, help="Default: cuda if available, else cpu.")
+    run.add_argument("--out", default=None, help="The JSON report. Default: stdout.")
+    run.set_defaults(func=cmd_run)
+
+    cmp = subparsers.add_parser("compare", help="Flag regressions of the median time between two reports.")
+    cmp.add_argument("base")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.05, help="The relative slowdown reported as a regression. Default: 0.05.")
+    cmp.set_defaults(func=cmd_compare)
+
+    ovh = subparsers.add_parser("overhead", help="Measure the host time of the entry points with stubbed kernels.")
+    ovh.add_argument("--entry-points", nargs="+", default=OVERHEAD_ENTRY_POINTS, choices=OVERHEAD_ENTRY_POINTS)
+    ovh.add_argument("--arch", default="sm89", help="The architecture sageattn dispatches for. Default: sm89.")
+    ovh.add_argument("--layout", default="HND", choices=["HND", "NHD"])
+    ovh.add_argument("--dtype", default="fp16", choices=["fp16", "bf16"])
+    ovh.add_argument("--head-dim", type=int, default=64)
+    ovh.add_argument("--batch-size", type=int, default=1)
+    ovh.add_argument("--num-heads", type=int, default=8)
+    ovh.add_argument("--num-kv-heads", type=int, default=8)
+    ovh.add_argument("--seq-len", type=int, default=256)
+    ovh.add_argument("--causal", action="store_true")
+    ovh.add_argument("--rounds", type=int, default=20)
+    ovh.add_argument("--calls", type=int, default=50, help="The calls timed together in each round.")
+    ovh.add_argument("--budget", type=float, default=OVERHEAD_BUDGET_US, help=f"The median time per call in microseconds above which the command fails. Default: SAGEATTN_OVERHEAD_BUDGET_US or 200, currently {OVERHEAD_BUDGET_US:.0f}.")
+    ovh.add_argument("--device", default="meta", help="The device of the inputs. Default: meta, which allocates nothing.")
+    ovh.add_argument("--out", default=None, help="The JSON report. Default: stdout.")
+    ovh.set_defaults(func=cmd_overhead)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
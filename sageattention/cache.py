@@ -0,0 +1,155 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class StepCache:
+    """
+    Reuse the attention output of the previous denoising step when the queries barely changed, skipping the kernel.
+
+    Each call with a `layer_tag` computes a fingerprint of `q`, its mean over the sequence in fp32, which costs one read of `q`.
+    The relative L1 change of the fingerprint from one step to the next is accumulated since the last computed step;
+    while it stays below `threshold`, the cached output of the layer is returned instead of calling `attn_fn`.
+
+    Parameters
+    ----------
+    attn_fn : Optional[Callable]
+        The attention callable, called as ``attn_fn(q, k, v, tensor_layout=tensor_layout, **kwargs)``.
+        Default: :func:`sageattention.sageattn`.
+
+    threshold : float
+        The accumulated relative L1 change of the fingerprint below which the cached output is reused.
+        Default: 0.05.
+
+    max_skip : int
+        The maximum number of consecutive steps a layer reuses its output for.
+        Default: 3.
+
+    extrapolate : bool
+        Instead of returning the cached output, extrapolate linearly from the outputs of the last two computed steps.
+        Keeps two outputs per layer.
+        Default: False.
+
+    max_bytes : Optional[int]
+        The memory budget of the cached outputs of all layers. The least recently used layers are evicted first.
+        Default: None (unbounded).
+
+    Note
+    ----
+    - Each call with a given `layer_tag` counts as one step of that layer. Calls without a `layer_tag` are never cached.
+    - The decision reads the fingerprint change on the host, which synchronizes with the device once per call.
+    - A reused output is the cached tensor itself, do not modify it in place.
+    - Call :meth:`reset` between generations.
+    """
+
+    def __init__(
+        self,
+        attn_fn: Optional[Callable] = None,
+        threshold: float = 0.05,
+        max_skip: int = 3,
+        extrapolate: bool = False,
+        max_bytes: Optional[int] = None,
+    ):
+        if attn_fn is None:
+            from .core import sageattn
+            attn_fn = sageattn
+        assert max_skip >= 0, "max_skip must not be negative."
+        self.attn_fn = attn_fn
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.extrapolate = extrapolate
+        self.max_bytes = max_bytes
+        # layer_tag -> {"fingerprint", "delta", "skipped", "outputs", "gap"}, the most recently used last
+        self._entries: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def reset(self):
+        """
+        Drop all cached outputs and counters.
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def nbytes(self) -> int:
+        """
+        The memory held by the cached outputs.
+        """
+        return sum(_nbytes(o) for entry in self._entries.values() for o in entry["outputs"])
+
+    def __call__(self, q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, tensor_layout: str = "HND", layer_tag: Optional[Hashable] = None, **kwargs: Any):
+        if layer_tag is None:
+            return self.attn_fn(q, k, v, tensor_layout=tensor_layout, **kwargs)
+
+        seq_dim = 1 if tensor_layout == "NHD" else 2
+        fingerprint = q.mean(dim=seq_dim, dtype=torch.float32)
+
+        entry = self._entries.get(layer_tag)
+        if entry is not None and entry["fingerprint"].shape == fingerprint.shape and entry["skipped"] < self.max_skip:
+            previous = entry["fingerprint"]
+            delta = entry["delta"] + ((fingerprint - previous).abs().mean() / previous.abs().mean().clamp_min(1e-6)).item()
+            if delta < self.threshold:
+                # the next change is measured from this step, so that a slow drift is counted once
+                entry["fingerprint"] = fingerprint
+                entry["delta"] = delta
+                entry["skipped"] += 1
+                self._entries.move_to_end(layer_tag)
+                self.hits += 1
+                return self._reuse(entry)
+
+        self.misses += 1
+        o = self.attn_fn(q, k, v, tensor_layout=tensor_layout, **kwargs)
+
+        outputs, gap = [o], 1
+        if self.extrapolate and entry is not None and isinstance(o, torch.Tensor) and entry["outputs"][-1].shape == o.shape:
+            # the two outputs are apart by the steps skipped in between
+            outputs, gap = [entry["outputs"][-1], o], entry["skipped"] + 1
+        # the accumulated change restarts from the computed step
+        self._entries[layer_tag] = {"fingerprint": fingerprint, "delta": 0.0, "skipped": 0, "outputs": outputs, "gap": gap}
+        self._entries.move_to_end(layer_tag)
+        self._evict()
+        return o
+
+    def _reuse(self, entry):
+        outputs = entry["outputs"]
+        if len(outputs) == 1:
+            return outputs[0]
+        # continue the trend of the last two computed steps, per step
+        o_prev, o_last = outputs
+        return o_last + (o_last - o_prev) * (entry["skipped"] / entry["gap"])
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        total = self.nbytes()
+        # never evict the layer that was just stored
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= sum(_nbytes(o) for o in entry["outputs"])
+
+
+def _nbytes(o) -> int:
+    if isinstance(o, torch.Tensor):
+        return o.numel() * o.element_size()
+    return sum(_nbytes(x) for x in o)
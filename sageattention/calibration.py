@@ -0,0 +1,241 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+import torch.nn.functional as F
+
+from .prologue import apply_rms_norm, apply_rope
+
+from typing import Dict, Hashable, Optional, Tuple
+
+# the recorder of the innermost active `with CalibrationRecorder()` block
+_active_recorder = None
+
+# the largest int32, a saturation threshold that never triggers a refresh
+_NEVER = 2 ** 31 - 1
+
+
+def _load_safetensors():
+    try:
+        import safetensors.torch
+    except ImportError:
+        raise ImportError("Calibration files are stored with safetensors, please install it with `pip install safetensors`.")
+    return safetensors.torch
+
+
+class CalibrationRecorder:
+    """
+    Record the per-head statistics of Q, K and V of every attention call with a `layer_tag`, while inside a ``with`` block.
+
+    For each layer the recorder keeps the per-head maxima of ``|q|`` and ``|v|``, the per-channel minima and maxima of `k`
+    and the mean of `k` over all recorded tokens. Q and K are recorded after the RMSNorm and rotation of `qk_norm` and `rope`,
+    as the quantization sees them. :meth:`save` writes the statistics for :class:`StaticScales`.
+
+    Example
+    -------
+    >>> recorder = CalibrationRecorder()
+    >>> with recorder:
+    ...     for prompt in sample_prompts:
+    ...         pipeline(prompt)  # calls sageattn(..., layer_tag=name) in every attention layer
+    >>> recorder.save("calibration.safetensors")
+
+    Note
+    ----
+    - Recording reads the full tensors in fp32 on every call and is meant for offline calibration runs only.
+    - The batch dimension is reduced, so a calibration holds for any batch size.
+    """
+
+    def __init__(self):
+        # layer_tag -> {"q_amax": [h_qo], "v_amax": [h_kv], "k_min": [h_kv, d], "k_max": [h_kv, d], "k_sum": [h_kv, d], "k_count": int}
+        self._stats: Dict[Hashable, dict] = {}
+        self._outer = None
+
+    def __enter__(self):
+        global _active_recorder
+        self._outer, _active_recorder = _active_recorder, self
+        return self
+
+    def __exit__(self, *exc):
+        global _active_recorder
+        _active_recorder, self._outer = self._outer, None
+        return False
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+    def record(self, layer_tag: Hashable, q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, tensor_layout: str = "HND"):
+        """
+        Add the statistics of one call of `layer_tag`.
+        """
+        # [batch_size, num_heads, seq_len, head_dim] in fp32
+        if tensor_layout == "NHD":
+            q, k, v = (x.transpose(1, 2) for x in (q, k, v))
+        q, k, v = q.float(), k.float(), v.float()
+
+        stats = self._stats.get(layer_tag)
+        if stats is None:
+            h_qo, h_kv, head_dim = q.size(1), k.size(1), k.size(3)
+            stats = {
+                "q_amax": torch.zeros(h_qo, device=q.device),
+                "v_amax": torch.zeros(h_kv, device=q.device),
+                "k_min": torch.full((h_kv, head_dim), float("inf"), device=q.device),
+                "k_max": torch.full((h_kv, head_dim), float("-inf"), device=q.device),
+                "k_sum": torch.zeros((h_kv, head_dim), dtype=torch.float64, device=q.device),
+                "k_count": 0,
+            }
+            self._stats[layer_tag] = stats
+
+        stats["q_amax"] = torch.maximum(stats["q_amax"], q.abs().amax(dim=(0, 2, 3)))
+        stats["v_amax"] = torch.maximum(stats["v_amax"], v.abs().amax(dim=(0, 2, 3)))
+        stats["k_min"] = torch.minimum(stats["k_min"], k.amin(dim=(0, 2)))
+        stats["k_max"] = torch.maximum(stats["k_max"], k.amax(dim=(0, 2)))
+        stats["k_sum"] += k.sum(dim=(0, 2), dtype=torch.float64)
+        stats["k_count"] += k.size(0) * k.size(2)
+
+    def state_dict(self) -> Dict[str, torch.Tensor]:
+        """
+        The calibration as flat ``"{layer_tag}.{name}"`` tensors: ``q_amax`` and ``v_amax`` of shape ``[num_heads]``,
+        ``k_mean`` of shape ``[num_kv_heads, head_dim]`` and ``k_amax``, the per-head maximum of ``|k - k_mean|``.
+        """
+        tensors = {}
+        for layer_tag, stats in self._stats.items():
+            k_mean = (stats["k_sum"] / stats["k_count"]).float()
+            # the extremes of every channel bound |k - k_mean| exactly, whatever the final mean
+            k_amax = torch.maximum(stats["k_max"] - k_mean, k_mean - stats["k_min"]).amax(dim=1)
+            tensors[f"{layer_tag}.q_amax"] = stats["q_amax"].cpu()
+            tensors[f"{layer_tag}.k_amax"] = k_amax.cpu()
+            tensors[f"{layer_tag}.k_mean"] = k_mean.cpu()
+            tensors[f"{layer_tag}.v_amax"] = stats["v_amax"].cpu()
+        return tensors
+
+    def save(self, path: str):
+        """
+        Write the calibration to a safetensors file at `path`.
+        """
+        _load_safetensors().save_file(self.state_dict(), path)
+
+
+def is_recording(layer_tag) -> bool:
+    """
+    Whether a call of `layer_tag` is recorded by an active :class:`CalibrationRecorder`.
+    """
+    return _active_recorder is not None and layer_tag is not None
+
+
+def record_qkv(layer_tag, q, k, v, tensor_layout="HND", rope=None, rope_style="interleaved", qk_norm=None, qk_norm_eps=1e-6):
+    """
+    Record a call of an attention entry point with the active :class:`CalibrationRecorder`, if any.
+    """
+    if not is_recording(layer_tag):
+        return
+    if qk_norm is not None:
+        q = apply_rms_norm(q, qk_norm[0].reshape(-1, q.size(-1)), qk_norm_eps, tensor_layout=tensor_layout)
+        k = apply_rms_norm(k, qk_norm[1].reshape(-1, k.size(-1)), qk_norm_eps, tensor_layout=tensor_layout)
+    if rope is not None:
+        q = apply_rope(q, rope, rope_style, tensor_layout=tensor_layout)
+        k = apply_rope(k, rope, rope_style, tensor_layout=tensor_layout)
+    _active_recorder.record(layer_tag, q, k, v, tensor_layout=tensor_layout)
+
+
+class StaticScales:
+    """
+    Fixed per-head quantization scales of Q and K and smoothing means of K, from a calibration recorded by :class:`CalibrationRecorder`.
+
+    Passed as ``static_scales=`` together with a `layer_tag`, the Triton quantization kernels only scale and cast Q and K,
+    and `k` is smoothed with the recorded mean, so the quantization runs no reductions.
+
+    Parameters
+    ----------
+    tensors : Dict[str, torch.Tensor]
+        The calibration, as returned by :meth:`CalibrationRecorder.state_dict`.
+
+    headroom : float
+        The factor the recorded maxima are enlarged by. Values beyond the enlarged range are clipped.
+        Default: 1.0.
+
+    Note
+    ----
+    - Only the Triton quantization kernels use the static scales, see :class:`ScaleCache`. V is still quantized with dynamic scales.
+    - The tensors are moved to the device of the first call of each layer and kept there.
+    """
+
+    def __init__(self, tensors: Dict[str, torch.Tensor], headroom: float = 1.0):
+        assert headroom >= 1.0, "headroom must be at least 1."
+        self._tensors = tensors
+        self.headroom = headroom
+        # (layer_tag, name, shape, x_scale) -> (scale, saturation)
+        self._scales: Dict[Tuple, Tuple[torch.Tensor, torch.Tensor]] = {}
+        self._means: Dict[Tuple, torch.Tensor] = {}
+
+    @classmethod
+    def load(cls, path: str, headroom: float = 1.0) -> "StaticScales":
+        """
+        Read a calibration written by :meth:`CalibrationRecorder.save`.
+        """
+        return cls(_load_safetensors().load_file(path), headroom=headroom)
+
+    def _get(self, layer_tag, name, device):
+        key = f"{layer_tag}.{name}"
+        if key not in self._tensors:
+            raise KeyError(f"No calibration recorded for layer {layer_tag!r}.")
+        t = self._tensors[key]
+        if t.device != device:
+            t = self._tensors[key] = t.to(device)
+        return t
+
+    def lookup(self, layer_tag: Hashable, name: str, shape: Tuple[int, ...], x: torch.Tensor, x_scale: float = 1.0):
+        """
+        Return the scale tensor of `shape` of `name` ("q" or "k") of `layer_tag`, with the kernel multiplying `x` by `x_scale`,
+        in the form of :meth:`ScaleCache.lookup`, with a threshold that never triggers a refresh.
+        """
+        assert layer_tag is not None, "layer_tag must be provided together with static_scales."
+        key = (layer_tag, name, shape, x_scale, x.device)
+        if key not in self._scales:
+            amax = self._get(layer_tag, f"{name}_amax", x.device)
+            assert amax.numel() == shape[1], f"The calibration of layer {layer_tag!r} has {amax.numel()} heads for {name}, got {shape[1]}."
+            scale = (amax * (x_scale * self.headroom / 127.)).clamp_min(1e-7)
+            # one scale per head, repeated for every block of the quantization
+            scale = scale.view(1, -1, 1).expand(shape).contiguous()
+            self._scales[key] = (scale, torch.zeros(2, dtype=torch.int32, device=x.device))
+        scale, saturation = self._scales[key]
+        return scale, saturation, 0, _NEVER
+
+    def mean(self, layer_tag: Hashable, k: torch.Tensor, tensor_layout: str = "HND") -> torch.Tensor:
+        """
+        The recorded mean of the keys of `layer_tag`, padded to the head dim of `k` and broadcast to the shape of ``k.mean(dim=seq_dim, keepdim=True)``.
+        """
+        key = (layer_tag, k.shape, k.dtype, k.device, tensor_layout)
+        if key not in self._means:
+            km = self._get(layer_tag, "k_mean", k.device)
+            km = F.pad(km, (0, k.size(-1) - km.size(-1))).to(k.dtype)
+            if tensor_layout == "HND":
+                km = km.unsqueeze(1).unsqueeze(0).expand(k.size(0), -1, 1, -1)
+            else:
+                km = km.unsqueeze(0).unsqueeze(0).expand(k.size(0), 1, -1, -1)
+            # materialized once, the CUDA quantization kernels need a contiguous mean
+            self._means[key] = km.contiguous()
+        return self._means[key]
+
+    def saturation(self, layer_tag: Hashable, name: str) -> int:
+        """
+        The number of values of `name` ("q" or "k") of `layer_tag` clipped by the static scales since the last read. Reads the counter on the host.
+        """
+        clipped = 0
+        for key, (_, saturation) in self._scales.items():
+            if key[:2] == (layer_tag, name):
+                clipped += int(saturation[0].item())
+                saturation.zero_()
+        return clipped
@@ -0,0 +1,271 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import os
+
+import torch
+
+from typing import Any, Callable, Container, Dict, Hashable, Iterator, List, Optional
+
+_INDEX = "index.json"
+
+_DTYPES = {str(dtype): dtype for dtype in (torch.float16, torch.bfloat16, torch.float32)}
+
+
+class ActivationStore:
+    """
+    An on-disk store of Q/K/V samples: raw tensors appended to chunk files, and a JSON index of their shapes and metadata.
+
+    Opened for reading, the chunks are memory-mapped and the samples are views of the mapped files, nothing is copied.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the store.
+
+    mode : str
+        ``"r"`` to read an existing store, ``"w"`` to create or overwrite one, ``"a"`` to append to one.
+        Default: "r".
+
+    chunk_bytes : int
+        The size after which a new chunk file is started. Default: 1 GiB.
+
+    Example
+    -------
+    >>> store = ActivationStore("captures")
+    >>> for sample in store.samples(layer_tag="blocks.10.attn"):
+    ...     q, k, v = sample["q"], sample["k"], sample["v"]
+    """
+
+    def __init__(self, path: str, mode: str = "r", chunk_bytes: int = 1 << 30):
+        assert mode in ["r", "w", "a"], "mode must be 'r', 'w' or 'a'."
+        self.path = path
+        self.mode = mode
+        self.chunk_bytes = chunk_bytes
+        self.entries: List[Dict[str, Any]] = []
+        self._maps: Dict[str, torch.Tensor] = {}
+        self._chunk = None
+        self._chunk_size = 0
+
+        index = os.path.join(path, _INDEX)
+        if mode == "w":
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                if name == _INDEX or name.startswith("chunk_"):
+                    os.remove(os.path.join(path, name))
+        elif os.path.exists(index):
+            with open(index) as f:
+                self.entries = json.load(f)["entries"]
+        elif mode == "r":
+            raise FileNotFoundError(f"No activation store at {path}.")
+        else:
+            os.makedirs(path, exist_ok=True)
+        self._num_chunks = len({t["chunk"] for entry in self.entries for t in entry["tensors"].values()})
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def write(self, tensors: Dict[str, torch.Tensor], **metadata: Any):
+        """
+        Append one sample, the `tensors` by name and JSON-serializable `metadata`.
+        """
+        assert self.mode != "r", "The store is opened for reading."
+        entry = dict(metadata, tensors={})
+        for name, x in tensors.items():
+            assert str(x.dtype) in _DTYPES, f"Unsupported dtype {x.dtype}."
+            data = x.detach().contiguous().cpu().view(-1).view(torch.uint8)
+            if self._chunk is None or (self._chunk_size > 0 and self._chunk_size + data.numel() > self.chunk_bytes):
+                self._next_chunk()
+            entry["tensors"][name] = {
+                "chunk": os.path.basename(self._chunk.name),
+                "offset": self._chunk_size,
+                "shape": list(x.shape),
+                "dtype": str(x.dtype),
+            }
+            data.numpy().tofile(self._chunk)
+            self._chunk_size += data.numel()
+        self.entries.append(entry)
+
+    def _next_chunk(self):
+        if self._chunk is not None:
+            self._chunk.close()
+        self._chunk = open(os.path.join(self.path, f"chunk_{self._num_chunks:05d}.bin"), "wb")
+        self._num_chunks += 1
+        self._chunk_size = 0
+
+    def flush(self):
+        """
+        Write the index, making the samples written so far visible to readers.
+        """
+        if self.mode == "r":
+            return
+        if self._chunk is not None:
+            self._chunk.flush()
+        with open(os.path.join(self.path, _INDEX), "w") as f:
+            json.dump({"entries": self.entries}, f)
+
+    def close(self):
+        self.flush()
+        if self._chunk is not None:
+            self._chunk.close()
+            self._chunk = None
+
+    def _map(self, chunk: str) -> torch.Tensor:
+        if chunk not in self._maps:
+            filename = os.path.join(self.path, chunk)
+            self._maps[chunk] = torch.from_file(filename, shared=False, size=os.path.getsize(filename), dtype=torch.uint8)
+        return self._maps[chunk]
+
+    def load(self, i: int) -> Dict[str, Any]:
+        """
+        The `i`-th sample: its metadata, with its tensors by name as views of the memory-mapped chunks.
+        """
+        entry = self.entries[i]
+        sample = {key: value for key, value in entry.items() if key != "tensors"}
+        for name, t in entry["tensors"].items():
+            dtype = _DTYPES[t["dtype"]]
+            numel = 1
+            for size in t["shape"]:
+                numel *= size
+            nbytes = numel * torch.empty((), dtype=dtype).element_size()
+            sample[name] = self._map(t["chunk"])[t["offset"]:t["offset"] + nbytes].view(dtype).view(t["shape"])
+        return sample
+
+    def samples(self, **where: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the samples whose metadata equals `where`, e.g. ``samples(layer_tag="blocks.3.attn", step=0)``.
+        """
+        for i, entry in enumerate(self.entries):
+            if all(entry.get(key) == value for key, value in where.items()):
+                yield self.load(i)
+
+
+class ActivationCapture:
+    """
+    Record the Q, K and V of attention calls into an :class:`ActivationStore`, then call the attention.
+
+    Each call with a given `layer_tag` counts as one step of that layer. The calls of the selected layers and steps are written
+    in their layout, optionally keeping only every `seq_stride`-th token, with the entry point, layer, step and layout as metadata.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the store. Existing captures there are overwritten.
+
+    attn_fn : Optional[Callable]
+        The attention callable, called as ``attn_fn(q, k, v, tensor_layout=tensor_layout, layer_tag=layer_tag, **kwargs)``.
+        Default: :func:`sageattention.sageattn`.
+
+    layers : Optional[Container[Hashable]]
+        The layer tags to capture. Default: None (all layers).
+
+    steps : Optional[Container[int]]
+        The steps to capture, counted per layer from 0. Default: None (all steps).
+
+    seq_stride : int
+        Keep every `seq_stride`-th token along the sequence. Default: 1.
+
+    max_samples : Optional[int]
+        Stop capturing after this many samples. Default: None (unbounded).
+
+    entry_point : Optional[str]
+        The name recorded for the calls. Default: the name of `attn_fn`.
+
+    Example
+    -------
+    >>> capture = ActivationCapture("captures", layers={"blocks.10.attn"}, steps=range(0, 50, 10))
+    >>> with capture:
+    ...     pipeline(prompt)  # calls capture(q, k, v, layer_tag=name) in every attention layer
+    >>> ActivationStore("captures").samples(step=0)
+
+    Note
+    ----
+    - Calls without a `layer_tag` are never captured.
+    - Capturing copies the selected tensors to the host, which synchronizes with the device.
+    - Layer tags are stored in the JSON index as they are if they are strings or integers, else as their ``str``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        attn_fn: Optional[Callable] = None,
+        layers: Optional[Container[Hashable]] = None,
+        steps: Optional[Container[int]] = None,
+        seq_stride: int = 1,
+        max_samples: Optional[int] = None,
+        entry_point: Optional[str] = None,
+    ):
+        if attn_fn is None:
+            from .core import sageattn
+            attn_fn = sageattn
+        assert seq_stride >= 1, "seq_stride must be positive."
+        self.attn_fn = attn_fn
+        self.entry_point = entry_point or getattr(attn_fn, "__name__", type(attn_fn).__name__)
+        self.layers = layers
+        self.steps = steps
+        self.seq_stride = seq_stride
+        self.max_samples = max_samples
+        self.store = ActivationStore(path, mode="w")
+        self._steps: Dict[Hashable, int] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Write the index and close the store.
+        """
+        self.store.close()
+
+    def __call__(self, q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, tensor_layout: str = "HND", layer_tag: Optional[Hashable] = None, **kwargs: Any):
+        if layer_tag is not None:
+            step = self._steps.get(layer_tag, 0)
+            self._steps[layer_tag] = step + 1
+            if self._selected(layer_tag, step):
+                self._write(q, k, v, tensor_layout, layer_tag, step)
+        return self.attn_fn(q, k, v, tensor_layout=tensor_layout, layer_tag=layer_tag, **kwargs)
+
+    def _selected(self, layer_tag, step):
+        if self.max_samples is not None and len(self.store) >= self.max_samples:
+            return False
+        if self.layers is not None and layer_tag not in self.layers:
+            return False
+        return self.steps is None or step in self.steps
+
+    def _write(self, q, k, v, tensor_layout, layer_tag, step):
+        seq_dim = 1 if tensor_layout == "NHD" else 2
+        index = (slice(None),) * seq_dim + (slice(None, None, self.seq_stride),)
+        tensors = {"q": q[index], "k": k[index], "v": v[index]}
+        self.store.write(
+            tensors,
+            entry_point=self.entry_point,
+            layer_tag=layer_tag if isinstance(layer_tag, (str, int)) else str(layer_tag),
+            step=step,
+            tensor_layout=tensor_layout,
+            seq_stride=self.seq_stride,
+        )
@@ -25,6 +25,14 @@ from .triton.attn_qk_int8_block_varlen import forward as attn_false_varlen
 from .triton.attn_qk_int8_per_block_causal_varlen import forward as attn_true_varlen
 
 from .triton.quant_per_thread import per_thread_int8 as per_thread_int8_triton
+from .triton.prologue import mean_prologue
+
+from .packing import should_pack, pack_qkv, unpack_output
+from .mask import pack_bool_mask
+from .prologue import apply_rms_norm, apply_rope
+from .scale_cache import ScaleCache
+from .calibration import StaticScales, is_recording, record_qkv
+from .trace import traced
 
 try:
     from . import sm80_compile
@@ -49,7 +57,7 @@ from .quant import per_warp_int8 as per_warp_int8_cuda
 from .quant import sub_mean
 from .quant import per_channel_fp8
 
-from typing import Any, List, Literal, Optional, Tuple, Union
+from typing import Any, Hashable, List, Literal, Optional, Tuple, Union
 import warnings
 
 
@@ -90,6 +98,46 @@ def pad_qkv(q, k, v):
     return head_dim_og, q, k, v
 
 
+def valid_mean(x, lengths, seq_dim):
+    """
+    The mean of `x` over the first ``lengths[b]`` tokens of each batch element, keeping the sequence dim.
+    The padded tokens are masked out, not multiplied by zero, so that garbage or NaN there does not leak into the mean.
+    """
+    if lengths is None:
+        return x.mean(dim=seq_dim, keepdim=True)
+    seq_len = x.size(seq_dim)
+    # clamped on the device, without reading the lengths on the host
+    lengths = lengths.clamp(1, seq_len)
+    shape = [x.size(0), 1, 1, 1]
+    shape[seq_dim] = seq_len
+    valid = (torch.arange(seq_len, device=x.device) < lengths[:, None]).view(shape)
+    total = x.masked_fill(~valid, 0).sum(dim=seq_dim, keepdim=True, dtype=torch.float32)
+    return (total / lengths.view(-1, 1, 1, 1)).to(x.dtype)
+
+
+def rel_pos_index(rel_pos_bias, q_coords, k_coords):
+    """
+    Flatten a ``[num_heads, 2 * W_0 - 1, ..., 2 * W_{d-1} - 1]`` relative position bias table and turn the ``[len, d]`` token coordinates
+    into linear positions, so that the bias of query ``i`` and key ``j`` is ``table[h, q_pos[i] - k_pos[j] + center]``.
+    """
+    num_heads, *table_shape = rel_pos_bias.shape
+    assert q_coords.dim() == 2 and q_coords.size(1) == len(table_shape), "q_coords must have shape [qo_len, d] matching the d dims of rel_pos_bias."
+    assert k_coords.dim() == 2 and k_coords.size(1) == len(table_shape), "k_coords must have shape [kv_len, d] matching the d dims of rel_pos_bias."
+
+    multipliers = []
+    multiplier = 1
+    for size in reversed(table_shape):
+        multipliers.append(multiplier)
+        multiplier *= size
+    multipliers = torch.tensor(multipliers[::-1], dtype=torch.int32, device=q_coords.device)
+    center = sum((size // 2) * m for size, m in zip(table_shape, multipliers.tolist()))
+
+    q_pos = (q_coords.to(torch.int32) * multipliers).sum(-1, dtype=torch.int32).contiguous()
+    k_pos = (k_coords.to(torch.int32) * multipliers).sum(-1, dtype=torch.int32).contiguous()
+    return rel_pos_bias.reshape(num_heads, -1).contiguous(), q_pos, k_pos, center
+
+
+@traced
 def sageattn(
     q: torch.Tensor,
     k: torch.Tensor,
@@ -98,6 +146,17 @@ def sageattn(
     is_causal: bool = False,
     sm_scale: Optional[float] = None,
     return_lse: bool = False,
+    block_causal: Optional[int] = None,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
+    rope: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    rope_style: str = "interleaved",
+    qk_norm: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    qk_norm_eps: float = 1e-6,
+    scale_cache: Optional[ScaleCache] = None,
+    static_scales: Optional[StaticScales] = None,
+    layer_tag: Optional[Hashable] = None,
+    pack: Union[bool, Literal["auto"]] = False,
     **kwargs: Any,
 ):
     """
@@ -125,7 +184,73 @@ def sageattn(
         Default: "HND".
 
     is_causal : bool
-        Whether to apply causal mask to the attention matrix. Only applicable when qo_len == kv_len.
+        Whether to apply causal mask to the attention matrix. Requires qo_len <= kv_len.
+        When qo_len < kv_len, the mask is aligned to the bottom-right corner, i.e. query ``i`` attends to keys up to ``kv_len - qo_len + i``.
+        Default: False.
+
+    block_causal : Optional[int]
+        The number of tokens per frame for block-causal attention, where tokens attend bidirectionally within a frame and causally across frames.
+        Like `is_causal`, it requires qo_len <= kv_len and is aligned to the bottom-right corner. Cannot be combined with `is_causal`.
+        Frames are counted from the first key: query ``i`` attends to key ``j`` when ``j // block_causal <= (i + kv_len - qo_len) // block_causal``,
+        so the query frames match the key frames only when ``kv_len - qo_len`` is a multiple of `block_causal`.
+        Default: None.
+
+    kv_lengths : Optional[torch.Tensor]
+        The number of valid key and value tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        The remaining tokens are treated as padding: the kernel stops its loop over the keys at the valid length,
+        so padded tiles are never read and no mask tensor is needed. Each length must be at least 1.
+        The padded keys and values must be finite: only the Triton kernels (sm75) ignore them entirely,
+        see :func:`sageattn_qk_int8_pv_fp16_triton`.
+        With `is_causal`, an element with fewer valid keys than valid queries has its mask aligned to the top-left corner.
+        Default: None.
+
+    q_lengths : Optional[torch.Tensor]
+        The number of valid query tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        Padded query tokens are skipped, their output is zero and their lse is undefined.
+        Default: None.
+
+    rope : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(cos, sin)`` tables of rotary position embeddings to apply to `q` and `k`. The rotation is fused into the
+        quantization of `q` and `k`, so the rotated tensors are never written to memory. Each table has ``rope_dim <= head_dim``
+        entries per position and at least ``max(qo_len, kv_len)`` positions shared by all batch elements and heads,
+        e.g. of shape ``[seq_len, rope_dim]`` or ``[1, seq_len, 1, rope_dim]``. Only the first ``rope_dim`` channels are rotated.
+        Default: None.
+
+    rope_style : str
+        How channels are paired for the rotation, either "interleaved" (channels ``2i`` and ``2i + 1``, as in Wan)
+        or "half" (channels ``i`` and ``i + rope_dim / 2``, as in HunyuanVideo). See :func:`sageattention.prologue.apply_rope`.
+        Default: "interleaved".
+
+    qk_norm : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(q_weight, k_weight)`` weights of an RMSNorm over the head dim of each head of `q` and `k`, applied before `rope`,
+        such as ``attn.norm_q.weight`` and ``attn.norm_k.weight`` of per-head QK-norm. Like `rope`, it is fused into the quantization.
+        Each weight has shape ``[head_dim]`` (shared by all heads) or ``[num_heads * head_dim]``.
+        Default: None.
+
+    qk_norm_eps : float
+        The epsilon of the RMSNorm in `qk_norm`.
+        Default: 1e-6.
+
+    scale_cache : Optional[ScaleCache]
+        Reuse the Q and K quantization scales of earlier calls with the same `layer_tag`, see :class:`sageattention.ScaleCache`.
+        Default: None.
+
+    static_scales : Optional[StaticScales]
+        Quantize Q and K with the fixed scales of an offline calibration and smooth K with the recorded mean,
+        see :class:`sageattention.StaticScales`. Requires `layer_tag`.
+        Default: None.
+
+    layer_tag : Optional[Hashable]
+        The key of this call in `scale_cache` and `static_scales`, e.g. the name of the attention layer.
+        Calls with a `layer_tag` are recorded by an active :class:`sageattention.CalibrationRecorder`.
+        Default: None.
+
+    pack : Union[bool, Literal["auto"]]
+        With `kv_lengths`, whether to pack the valid tokens and compute the batch with :func:`sageattn_padded`,
+        so that the attention work scales with the number of valid tokens. ``"auto"`` packs when
+        :func:`sageattention.packing.should_pack` finds enough padding. Both read the lengths on the host,
+        which synchronizes with the device and cannot be captured in a cuda graph.
+        Ignored for calls the varlen kernels do not support, see the Note.
         Default: False.
 
     sm_scale : Optional[float]
@@ -150,36 +275,61 @@ def sageattn(
     Note
     ----
     - ``num_qo_heads`` must be divisible by ``num_kv_heads``.
-    - The tensors `q`, `k`, and `v` must have the dtype ``torch.float16`` or ``torch.bfloat16``
+    - The tensors `q`, `k`, and `v` must have the dtype ``torch.float16`` or ``torch.bfloat16``. ``torch.float32`` is also accepted
+      where the call runs on the Triton kernels (sm75, or packed with `pack`), which read V in its input dtype.
     - All tensors must be on the same cuda device.
+    - Calls with `return_lse`, `rope`, `qk_norm`, `scale_cache` or `static_scales`, or recorded by a :class:`CalibrationRecorder`,
+      are never packed.
     """
         
     arch = _cuda_archs[q.device.index]
+    # the varlen kernels are implemented in triton, which is not usable on sm120 yet
+    # they have no scale cache or static scales and are not recorded for calibration
+    if (pack and kv_lengths is not None and not return_lse and rope is None and qk_norm is None
+            and scale_cache is None and static_scales is None and not is_recording(layer_tag) and arch not in {"sm100", "sm120", "sm121"}):
+        seq_dim = 1 if tensor_layout == "NHD" else 2
+        totals = None
+        if pack == "auto":
+            pack, totals = should_pack(kv_lengths, k.size(seq_dim), q_lengths=q_lengths, qo_len=q.size(seq_dim), return_totals=True)
+        if pack:
+            return sageattn_padded(q, k, v, kv_lengths, q_lengths=q_lengths, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale,
+                                   block_causal=block_causal, totals=totals)
+
     if arch == "sm75":
-        return sageattn_qk_int8_pv_fp16_triton(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse)
+        return sageattn_qk_int8_pv_fp16_triton(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse, block_causal=block_causal, kv_lengths=kv_lengths, q_lengths=q_lengths, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag)
     elif arch in {"sm80", "sm86", "sm87"}:
-        return sageattn_qk_int8_pv_fp16_cuda(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse, pv_accum_dtype="fp32")
+        return sageattn_qk_int8_pv_fp16_cuda(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse, pv_accum_dtype="fp32", block_causal=block_causal, kv_lengths=kv_lengths, q_lengths=q_lengths, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag)
     elif arch == "sm89":
         if get_cuda_version() < (12, 8):
             pv_accum_dtype = "fp32+fp32"
         else:
             # SageAttention2++
             pv_accum_dtype = "fp32+fp16"
-        return sageattn_qk_int8_pv_fp8_cuda(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse, pv_accum_dtype=pv_accum_dtype)
+        return sageattn_qk_int8_pv_fp8_cuda(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse, pv_accum_dtype=pv_accum_dtype, block_causal=block_causal, kv_lengths=kv_lengths, q_lengths=q_lengths, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag)
     elif arch == "sm90":
-        return sageattn_qk_int8_pv_fp8_cuda_sm90(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse, pv_accum_dtype="fp32+fp32")
+        return sageattn_qk_int8_pv_fp8_cuda_sm90(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse, pv_accum_dtype="fp32+fp32", block_causal=block_causal, kv_lengths=kv_lengths, q_lengths=q_lengths, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag)
     elif arch in {"sm100", "sm120", "sm121"}:
+        # the per-warp quantization used here has no prologue
+        if qk_norm is not None:
+            q = apply_rms_norm(q, qk_norm[0].reshape(-1, q.size(-1)), qk_norm_eps, tensor_layout=tensor_layout)
+            k = apply_rms_norm(k, qk_norm[1].reshape(-1, k.size(-1)), qk_norm_eps, tensor_layout=tensor_layout)
+            qk_norm = None
+        if rope is not None:
+            q = apply_rope(q, rope, rope_style, tensor_layout=tensor_layout)
+            k = apply_rope(k, rope, rope_style, tensor_layout=tensor_layout)
+            rope = None
         if get_cuda_version() < (12, 8):
             # sm120 has accurate fp32 accumulator for fp8 mma and triton kernel is currently not usable on sm120.
             pv_accum_dtype = "fp32"
         else:
             # SageAttention2++
             pv_accum_dtype = "fp32+fp16"
-        return sageattn_qk_int8_pv_fp8_cuda(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, qk_quant_gran="per_warp", sm_scale=sm_scale, return_lse=return_lse, pv_accum_dtype=pv_accum_dtype)
+        return sageattn_qk_int8_pv_fp8_cuda(q, k, v, tensor_layout=tensor_layout, is_causal=is_causal, qk_quant_gran="per_warp", sm_scale=sm_scale, return_lse=return_lse, pv_accum_dtype=pv_accum_dtype, block_causal=block_causal, kv_lengths=kv_lengths, q_lengths=q_lengths, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag)
     else:
         raise ValueError(f"Unsupported CUDA architecture: {arch}")
 
 
+@traced
 def sageattn_qk_int8_pv_fp16_triton(
     q: torch.Tensor, 
     k: torch.Tensor, 
@@ -191,6 +341,20 @@ def sageattn_qk_int8_pv_fp16_triton(
     sm_scale: Optional[float] = None, 
     smooth_k: bool = True,
     return_lse: bool = False,
+    block_causal: Optional[int] = None,
+    alibi_slopes: Optional[torch.Tensor] = None,
+    rel_pos_bias: Optional[torch.Tensor] = None,
+    q_coords: Optional[torch.Tensor] = None,
+    k_coords: Optional[torch.Tensor] = None,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
+    rope: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    rope_style: str = "interleaved",
+    qk_norm: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    qk_norm_eps: float = 1e-6,
+    scale_cache: Optional[ScaleCache] = None,
+    static_scales: Optional[StaticScales] = None,
+    layer_tag: Optional[Hashable] = None,
     **kwargs: Any,
 ) -> torch.Tensor:
     """
@@ -223,12 +387,72 @@ def sageattn_qk_int8_pv_fp16_triton(
         "cuda" backend offers better performance due to kernel fusion.
 
     is_causal : bool
-        Whether to apply causal mask to the attention matrix. Only applicable when qo_len == kv_len.
+        Whether to apply causal mask to the attention matrix. Requires qo_len <= kv_len.
+        When qo_len < kv_len, the mask is aligned to the bottom-right corner, i.e. query ``i`` attends to keys up to ``kv_len - qo_len + i``.
         Default: False.
 
+    block_causal : Optional[int]
+        The number of tokens per frame for block-causal attention, where tokens attend bidirectionally within a frame and causally across frames.
+        Like `is_causal`, it requires qo_len <= kv_len and is aligned to the bottom-right corner. Cannot be combined with `is_causal`.
+        Frames are counted from the first key: query ``i`` attends to key ``j`` when ``j // block_causal <= (i + kv_len - qo_len) // block_causal``,
+        so the query frames match the key frames only when ``kv_len - qo_len`` is a multiple of `block_causal`.
+        Default: None.
+
+    kv_lengths : Optional[torch.Tensor]
+        The number of valid key and value tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        The remaining tokens are treated as padding: the kernel stops its loop over the keys at the valid length,
+        so padded tiles are never read and no mask tensor is needed. Each length must be at least 1.
+        The mean of K for smoothing and the quantization scales cover the valid tokens only, so the padding may hold anything,
+        except with `rope` or `qk_norm`, where the mean of K covers all tokens and padded keys must be finite.
+        With `is_causal`, an element with fewer valid keys than valid queries has its mask aligned to the top-left corner.
+        Default: None.
+
+    q_lengths : Optional[torch.Tensor]
+        The number of valid query tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        Padded query tokens are skipped, their output is zero and their lse is undefined.
+        Default: None.
+
+    rope : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(cos, sin)`` tables of rotary position embeddings to apply to `q` and `k`. The rotation is fused into the
+        quantization of `q` and `k`, so the rotated tensors are never written to memory. Each table has ``rope_dim <= head_dim``
+        entries per position and at least ``max(qo_len, kv_len)`` positions shared by all batch elements and heads,
+        e.g. of shape ``[seq_len, rope_dim]`` or ``[1, seq_len, 1, rope_dim]``. Only the first ``rope_dim`` channels are rotated.
+        Default: None.
+
+    rope_style : str
+        How channels are paired for the rotation, either "interleaved" (channels ``2i`` and ``2i + 1``, as in Wan)
+        or "half" (channels ``i`` and ``i + rope_dim / 2``, as in HunyuanVideo). See :func:`sageattention.prologue.apply_rope`.
+        Default: "interleaved".
+
+    qk_norm : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(q_weight, k_weight)`` weights of an RMSNorm over the head dim of each head of `q` and `k`, applied before `rope`,
+        such as ``attn.norm_q.weight`` and ``attn.norm_k.weight`` of per-head QK-norm. Like `rope`, it is fused into the quantization.
+        Each weight has shape ``[head_dim]`` (shared by all heads) or ``[num_heads * head_dim]``.
+        Default: None.
+
+    qk_norm_eps : float
+        The epsilon of the RMSNorm in `qk_norm`.
+        Default: 1e-6.
+
+    scale_cache : Optional[ScaleCache]
+        Reuse the Q and K quantization scales of earlier calls with the same `layer_tag`, see :class:`sageattention.ScaleCache`.
+        Default: None.
+
+    static_scales : Optional[StaticScales]
+        Quantize Q and K with the fixed scales of an offline calibration and smooth K with the recorded mean,
+        see :class:`sageattention.StaticScales`. Requires `layer_tag`.
+        Default: None.
+
+    layer_tag : Optional[Hashable]
+        The key of this call in `scale_cache` and `static_scales`, e.g. the name of the attention layer.
+        Calls with a `layer_tag` are recorded by an active :class:`sageattention.CalibrationRecorder`.
+        Default: None.
+
     attn_mask : Optional[torch.Tensor]
         The attention mask tensor, of dtype bool or float32.
         Should be able to broadcast to the shape of the matrix qk^T.
+        A bool mask can also be passed bit-packed as a ``torch.int32`` tensor from :func:`pack_bool_mask`,
+        which should be able to broadcast to ``[batch_size, num_qo_heads, qo_len, (kv_len + 31) // 32]``.
         Default: None.
 
     sm_scale : Optional[float]
@@ -242,6 +466,25 @@ def sageattn_qk_int8_pv_fp16_triton(
         Whether to return the log sum of the exponentiated attention weights. Used for cases like Ring Attention.
         Default: False.
 
+    alibi_slopes : Optional[torch.Tensor]
+        The per-head ALiBi slopes, shape: ``[num_qo_heads]``, dtype ``torch.float32``.
+        The bias ``-slope * |i + kv_len - qo_len - j|`` is computed in the kernel and added to the scaled scores.
+        Default: None.
+
+    rel_pos_bias : Optional[torch.Tensor]
+        The relative position bias table, shape: ``[num_qo_heads, 2 * W_0 - 1, ..., 2 * W_{d-1} - 1]`` for a window of ``W_0 x ... x W_{d-1}`` tokens,
+        as in Swin Transformer. The bias of query ``i`` and key ``j`` is looked up in the kernel at ``q_coords[i] - k_coords[j] + W - 1``
+        and added to the scaled scores. Requires `q_coords`.
+        Default: None.
+
+    q_coords : Optional[torch.Tensor]
+        The integer coordinates of the query tokens in the window, shape: ``[qo_len, d]``, with ``0 <= q_coords[:, t] < W_t``.
+        Default: None.
+
+    k_coords : Optional[torch.Tensor]
+        The integer coordinates of the key tokens in the window, shape: ``[kv_len, d]``.
+        Default: `q_coords`.
+
     Returns
     -------
     torch.Tensor
@@ -260,20 +503,46 @@ def sageattn_qk_int8_pv_fp16_triton(
     - The tensors `q`, `k`, and `v` must have the dtype ``torch.float16``, ``torch.bfloat16`` or ``torch.float32``.
     - All tensors must be on the same cuda device.
     - `smooth_k` will introduce slight overhead but will improve the accuracy under most circumstances.
+    - `alibi_slopes` and `rel_pos_bias` are never materialized as a ``[batch_size, num_qo_heads, qo_len, kv_len]`` mask,
+      and can be combined with each other, with `attn_mask` and with the causal masks.
     """
 
     dtype = q.dtype
     assert q.is_cuda, "Input tensors must be on cuda."
-    assert dtype in [torch.float16, torch.bfloat16], "Input tensors must be in dtype of torch.float16 or torch.bfloat16"
+    assert dtype in [torch.float16, torch.bfloat16, torch.float32], "Input tensors must be in dtype of torch.float16, torch.bfloat16 or torch.float32"
     assert q.device == k.device == v.device, "All tensors must be on the same device."
     assert q.dtype == k.dtype == v.dtype, "All tensors must have the same dtype."
 
+    if kv_lengths is not None:
+        assert kv_lengths.device == q.device, "All tensors must be on the same device."
+        kv_lengths = kv_lengths.to(torch.int32).contiguous()
+    if q_lengths is not None:
+        assert q_lengths.device == q.device, "All tensors must be on the same device."
+        q_lengths = q_lengths.to(torch.int32).contiguous()
+
     if attn_mask is not None:
-        assert attn_mask.dtype == torch.bool or attn_mask.dtype == q.dtype, "attn_mask must be of dtype bool or the same dtype as q."
+        assert attn_mask.dtype in [torch.bool, torch.int32, q.dtype], "attn_mask must be of dtype bool, int32 (bit-packed) or the same dtype as q."
         assert attn_mask.device == q.device, "All tensors must be on the same device."
 
+    if alibi_slopes is not None:
+        assert alibi_slopes.device == q.device, "All tensors must be on the same device."
+        alibi_slopes = alibi_slopes.to(torch.float32).contiguous()
+
+    if rel_pos_bias is not None:
+        assert q_coords is not None, "q_coords must be provided together with rel_pos_bias."
+        assert rel_pos_bias.device == q.device == q_coords.device, "All tensors must be on the same device."
+        rel_pos_table, q_pos, k_pos, rel_pos_center = rel_pos_index(rel_pos_bias, q_coords, k_coords if k_coords is not None else q_coords)
+    else:
+        rel_pos_table, q_pos, k_pos, rel_pos_center = None, None, None, 0
+
+    record_qkv(layer_tag, q, k, v, tensor_layout=tensor_layout, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps)
+
     head_dim_og, q, k, v = pad_qkv(q, k, v)
 
+    if qk_norm is not None:
+        # [head_dim] or [num_heads * head_dim] weights of the unpadded head dim
+        qk_norm = tuple(w.reshape(-1, head_dim_og) for w in qk_norm)
+
     # assert last dim is contiguous
     assert q.stride(-1) == 1 and k.stride(-1) == 1 and v.stride(-1) == 1, "Last dim of qkv must be contiguous."
 
@@ -281,7 +550,12 @@ def sageattn_qk_int8_pv_fp16_triton(
     nh_dim = 2 if tensor_layout == "NHD" else 1
 
     if smooth_k:
-        km = k.mean(dim=seq_dim, keepdim=True)
+        if static_scales is not None:
+            km = static_scales.mean(layer_tag, k, tensor_layout=tensor_layout)
+        elif rope is not None or qk_norm is not None:
+            km = mean_prologue(k, qk_norm[1] if qk_norm is not None else None, qk_norm_eps, rope, rope_style, tensor_layout=tensor_layout).to(k.dtype)
+        else:
+            km = valid_mean(k, kv_lengths, seq_dim)
         nqheads = q.size(nh_dim)
         nkheads = k.size(nh_dim)
         q_per_kv_heads = nqheads // nkheads
@@ -291,28 +565,36 @@ def sageattn_qk_int8_pv_fp16_triton(
         else:
             km_broadcast = km
         if return_lse:
+            # the correction needs the transformed q, which the fused prologue never writes
+            q_rot = q
+            if qk_norm is not None:
+                q_rot = apply_rms_norm(q_rot, qk_norm[0], qk_norm_eps, tensor_layout=tensor_layout)
+            if rope is not None:
+                q_rot = apply_rope(q_rot, rope, rope_style, tensor_layout=tensor_layout)
             if tensor_layout == "NHD":
-                lse_correction = torch.matmul(q.transpose(1, 2), km_broadcast.transpose(1, 2).transpose(2, 3)).squeeze(-1).to(torch.float32)
+                lse_correction = torch.matmul(q_rot.transpose(1, 2), km_broadcast.transpose(1, 2).transpose(2, 3)).squeeze(-1).to(torch.float32)
             else:
-                lse_correction = torch.matmul(q, km_broadcast.transpose(2, 3)).squeeze(-1).to(torch.float32)
+                lse_correction = torch.matmul(q_rot, km_broadcast.transpose(2, 3)).squeeze(-1).to(torch.float32)
     else:
         km = None
 
-    if dtype == torch.bfloat16 or dtype == torch.float32:
-        v = v.to(torch.float16)
-
     if sm_scale is None:
         sm_scale = 1.0 / (head_dim_og ** 0.5)
 
     if quantization_backend == "triton":
-        q_int8, q_scale, k_int8, k_scale = per_block_int8_triton(q, k, km=km, sm_scale=sm_scale, tensor_layout=tensor_layout)
+        q_int8, q_scale, k_int8, k_scale = per_block_int8_triton(q, k, km=km, sm_scale=sm_scale, tensor_layout=tensor_layout, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag, q_lengths=q_lengths, kv_lengths=kv_lengths)
     elif quantization_backend == "cuda":
+        assert rope is None and qk_norm is None, "rope and qk_norm are only supported with the triton quantization backend."
         q_int8, q_scale, k_int8, k_scale = per_block_int8_cuda(q, k, km=km, sm_scale=sm_scale, tensor_layout=tensor_layout)
     else:
         raise ValueError(f"Unsupported quantization backend: {quantization_backend}")
-    if is_causal:
+    if is_causal or block_causal is not None:
         assert attn_mask is None, "Mask should be None for causal attention."
-        o, lse = attn_true(q_int8, k_int8, v, q_scale, k_scale, tensor_layout=tensor_layout, output_dtype=dtype, return_lse=return_lse)
+        assert not (is_causal and block_causal is not None), "is_causal and block_causal cannot be set at the same time."
+        assert block_causal is None or block_causal >= 1, "block_causal must be a positive number of tokens per frame."
+        o, lse = attn_true(q_int8, k_int8, v, q_scale, k_scale, tensor_layout=tensor_layout, output_dtype=dtype, return_lse=return_lse, frame_tokens=block_causal if block_causal is not None else 1,
+                          alibi_slopes=alibi_slopes, rel_pos_table=rel_pos_table, q_pos=q_pos, k_pos=k_pos, rel_pos_center=rel_pos_center,
+                          kv_lengths=kv_lengths, q_lengths=q_lengths)
     else:
         if attn_mask is not None:
             if tensor_layout == "HND":
@@ -321,11 +603,16 @@ def sageattn_qk_int8_pv_fp16_triton(
                 target_shape = (q.shape[0], q.shape[2], q.shape[1], k.shape[1])
             else:
                 raise ValueError(f"tensor_layout {tensor_layout} not supported")
+            if attn_mask.dtype == torch.int32:
+                # bit-packed mask, 32 keys per word
+                target_shape = target_shape[:3] + ((target_shape[3] + 31) // 32,)
             try:
                 attn_mask = attn_mask.expand(target_shape)
             except Exception:
                 raise AssertionError(f"attn_mask shape {attn_mask.shape} cannot be broadcast to {target_shape}")
-        o, lse = attn_false(q_int8, k_int8, v, q_scale, k_scale, tensor_layout=tensor_layout, output_dtype=dtype, attn_mask=attn_mask, return_lse=return_lse)
+        o, lse = attn_false(q_int8, k_int8, v, q_scale, k_scale, tensor_layout=tensor_layout, output_dtype=dtype, attn_mask=attn_mask, return_lse=return_lse,
+                           alibi_slopes=alibi_slopes, rel_pos_table=rel_pos_table, q_pos=q_pos, k_pos=k_pos, rel_pos_center=rel_pos_center,
+                           kv_lengths=kv_lengths, q_lengths=q_lengths)
 
     o = o[..., :head_dim_og]
 
@@ -335,6 +622,7 @@ def sageattn_qk_int8_pv_fp16_triton(
         return o
 
 
+@traced
 def sageattn_varlen(
     q: torch.Tensor, 
     k: torch.Tensor, 
@@ -346,6 +634,7 @@ def sageattn_varlen(
     is_causal: bool = False,
     sm_scale: Optional[float] = None, 
     smooth_k: bool = True,
+    block_causal: Optional[int] = None,
     **kwargs: Any,
 ) -> torch.Tensor:
     """
@@ -376,8 +665,16 @@ def sageattn_varlen(
         The maximum sequence length for the key and value tensors in the batch.
 
     is_causal : bool
-        Whether to apply causal mask to the attention matrix. Only applicable when qo_len == kv_len for each sequence.
+        Whether to apply causal mask to the attention matrix. Requires qo_len <= kv_len for each sequence.
+        When qo_len < kv_len, the mask is aligned to the bottom-right corner, i.e. query ``i`` attends to keys up to ``kv_len - qo_len + i``.
         Default: False.
+
+    block_causal : Optional[int]
+        The number of tokens per frame for block-causal attention, where tokens attend bidirectionally within a frame and causally across frames.
+        Like `is_causal`, it requires qo_len <= kv_len and is aligned to the bottom-right corner. Cannot be combined with `is_causal`.
+        Frames are counted from the first key: query ``i`` attends to key ``j`` when ``j // block_causal <= (i + kv_len - qo_len) // block_causal``,
+        so the query frames match the key frames only when ``kv_len - qo_len`` is a multiple of `block_causal`.
+        Default: None.
     
     sm_scale : Optional[float]
         The scale used in softmax, if not provided, will be set to ``1.0 / sqrt(head_dim)``.
@@ -402,7 +699,7 @@ def sageattn_varlen(
     
     dtype = q.dtype
     assert q.is_cuda, "Input tensors must be on cuda."
-    assert dtype in [torch.float16, torch.bfloat16], "Input tensors must be in dtype of torch.float16 or torch.bfloat16"
+    assert dtype in [torch.float16, torch.bfloat16, torch.float32], "Input tensors must be in dtype of torch.float16, torch.bfloat16 or torch.float32"
     assert q.device == k.device == v.device, "All tensors must be on the same device."
     assert q.dtype == k.dtype == v.dtype, "All tensors must have the same dtype."
 
@@ -411,9 +708,6 @@ def sageattn_varlen(
     assert q.stride(-1) == 1 and k.stride(-1) == 1 and v.stride(-1) == 1, "Last dim of qkv must be contiguous."
     assert cu_seqlens_q.is_contiguous() and cu_seqlens_k.is_contiguous(), "cu_seqlens_q and cu_seqlens_k must be contiguous."
 
-    if dtype == torch.bfloat16 or dtype == torch.float32:
-        v = v.to(torch.float16)
-
     if smooth_k:
         km = k.mean(dim=0, keepdim=True) # ! km is calculated on the all the batches. Calculate over each individual sequence requires dedicated kernel.
         k = k - km
@@ -423,8 +717,10 @@ def sageattn_varlen(
 
     q_int8, q_scale, k_int8, k_scale, cu_seqlens_q_scale, cu_seqlens_k_scale = per_block_int8_varlen_triton(q, k, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, max_seqlen_k, sm_scale=sm_scale)
 
-    if is_causal:
-        o = attn_true_varlen(q_int8, k_int8, v, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, q_scale, k_scale, cu_seqlens_q_scale, cu_seqlens_k_scale, output_dtype=dtype)
+    if is_causal or block_causal is not None:
+        assert not (is_causal and block_causal is not None), "is_causal and block_causal cannot be set at the same time."
+        assert block_causal is None or block_causal >= 1, "block_causal must be a positive number of tokens per frame."
+        o = attn_true_varlen(q_int8, k_int8, v, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, q_scale, k_scale, cu_seqlens_q_scale, cu_seqlens_k_scale, output_dtype=dtype, frame_tokens=block_causal if block_causal is not None else 1)
     else:
         o = attn_false_varlen(q_int8, k_int8, v, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, q_scale, k_scale, cu_seqlens_q_scale, cu_seqlens_k_scale, output_dtype=dtype)
 
@@ -433,6 +729,214 @@ def sageattn_varlen(
     return o
 
 
+@traced
+def sageattn_padded(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    kv_lengths: torch.Tensor,
+    q_lengths: Optional[torch.Tensor] = None,
+    tensor_layout: str = "HND",
+    is_causal: bool = False,
+    sm_scale: Optional[float] = None,
+    smooth_k: bool = True,
+    block_causal: Optional[int] = None,
+    totals: Optional[Tuple[int, int]] = None,
+    **kwargs: Any,
+) -> torch.Tensor:
+    """
+    SageAttention of a padded batch computed with the varlen kernels: the valid tokens are packed,
+    processed by :func:`sageattn_varlen`, and the output is scattered back to the padded layout.
+    The attention work scales with the number of valid tokens instead of the padded length.
+
+    Parameters
+    ----------
+    q : torch.Tensor
+        The query tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_qo_heads, qo_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, qo_len, num_qo_heads, head_dim]``.
+
+    k : torch.Tensor
+        The key tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_kv_heads, kv_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, kv_len, num_kv_heads, head_dim]``.
+
+    v : torch.Tensor
+        The value tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_kv_heads, kv_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, kv_len, num_kv_heads, head_dim]``.
+
+    kv_lengths : torch.Tensor
+        The number of valid key and value tokens of each batch element, shape: ``[batch_size]``.
+
+    q_lengths : Optional[torch.Tensor]
+        The number of valid query tokens of each batch element, shape: ``[batch_size]``.
+        Default: all ``qo_len`` tokens are valid.
+
+    tensor_layout : str
+        The tensor layout, either "HND" or "NHD".
+        Default: "HND".
+
+    is_causal : bool
+        Whether to apply causal mask to each sequence, aligned to the bottom-right corner of its valid tokens.
+        Default: False.
+
+    sm_scale : Optional[float]
+        The scale used in softmax, if not provided, will be set to ``1.0 / sqrt(head_dim)``.
+
+    smooth_k : bool
+        Whether to smooth the key tensor by subtracting the mean of the valid tokens.
+        Default: True.
+
+    block_causal : Optional[int]
+        The number of tokens per frame for block-causal attention within each sequence, see :func:`sageattn`.
+        Default: None.
+
+    totals : Optional[Tuple[int, int]]
+        The total numbers of valid query and key tokens, if already known, e.g. from :func:`sageattention.packing.should_pack`.
+        Default: None (read from the lengths).
+
+    Returns
+    -------
+    torch.Tensor
+        The output tensor with the same shape as `q`. The output of padded query tokens is zero.
+
+    Note
+    ----
+    - Without `totals`, packing reads the total number of valid tokens on the host, which synchronizes with the device.
+    """
+
+    q_packed, k_packed, v_packed, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, max_seqlen_k = pack_qkv(
+        q, k, v, kv_lengths, q_lengths=q_lengths, tensor_layout=tensor_layout, totals=totals
+    )
+    o = sageattn_varlen(q_packed, k_packed, v_packed, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, max_seqlen_k,
+                        is_causal=is_causal, sm_scale=sm_scale, smooth_k=smooth_k, block_causal=block_causal)
+    return unpack_output(o, cu_seqlens_q, max_seqlen_q, tensor_layout=tensor_layout)
+
+
+@traced
+def sageattn_packed_qkv(
+    qkv: torch.Tensor,
+    is_causal: bool = False,
+    sm_scale: Optional[float] = None,
+    return_lse: bool = False,
+    **kwargs: Any,
+):
+    """
+    SageAttention over the output of a fused QKV projection, without splitting it into contiguous tensors.
+
+    Parameters
+    ----------
+    qkv : torch.Tensor
+        The packed query, key and value tensor, shape: ``[batch_size, seq_len, 3, num_heads, head_dim]``,
+        e.g. ``to_qkv(x).unflatten(-1, (3, num_heads, head_dim))``.
+
+    is_causal : bool
+        Whether to apply causal mask to the attention matrix.
+        Default: False.
+
+    sm_scale : Optional[float]
+        The scale used in softmax, if not provided, will be set to ``1.0 / sqrt(head_dim)``.
+
+    return_lse : bool
+        Whether to return the log sum of the exponentiated attention weights.
+        Default: False.
+
+    Returns
+    -------
+    torch.Tensor
+        The output tensor, shape: ``[batch_size, seq_len, num_heads, head_dim]``.
+
+    Note
+    ----
+    - The query, key and value are read as "NHD" views of `qkv` through their batch, head and sequence strides.
+      Other keyword arguments are passed to :func:`sageattn`.
+    """
+    assert qkv.dim() == 5 and qkv.size(2) == 3, "qkv must have shape [batch_size, seq_len, 3, num_heads, head_dim]."
+    q, k, v = qkv.unbind(2)
+    return sageattn(q, k, v, tensor_layout="NHD", is_causal=is_causal, sm_scale=sm_scale, return_lse=return_lse, **kwargs)
+
+
+@traced
+def sageattn_spatial(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    num_heads: int = 1,
+    sm_scale: Optional[float] = None,
+    smooth_k: bool = True,
+    **kwargs: Any,
+) -> torch.Tensor:
+    """
+    SageAttention over channel-first feature maps, as in the spatial self-attention of UNets and VAEs,
+    without permuting them to a token-major layout. Every spatial position is a token.
+    Implemented using Triton, which reads the inputs and writes the output through their strides.
+
+    Parameters
+    ----------
+    q : torch.Tensor
+        The query feature map, shape: ``[batch_size, channels, *spatial]``, e.g. ``[batch_size, channels, height, width]``.
+
+    k : torch.Tensor
+        The key feature map, shape: ``[batch_size, channels, *spatial_kv]``.
+
+    v : torch.Tensor
+        The value feature map, shape: ``[batch_size, channels, *spatial_kv]``.
+
+    num_heads : int
+        The number of heads, each taking ``channels // num_heads`` consecutive channels.
+        Default: 1.
+
+    sm_scale : Optional[float]
+        The scale used in softmax, if not provided, will be set to ``1.0 / sqrt(head_dim)``.
+
+    smooth_k : bool
+        Whether to smooth the key tensor by subtracting the mean along the sequence dimension.
+        Default: True.
+
+    Returns
+    -------
+    torch.Tensor
+        The output feature map with the same shape as `q`, in the channel-first layout.
+
+    Note
+    ----
+    - ``channels // num_heads`` must be 64 or 128.
+    - The tensors `q`, `k`, and `v` must have the dtype ``torch.float16``, ``torch.bfloat16`` or ``torch.float32``.
+    - All tensors must be on the same cuda device.
+    """
+
+    dtype = q.dtype
+    assert q.is_cuda, "Input tensors must be on cuda."
+    assert dtype in [torch.float16, torch.bfloat16, torch.float32], "Input tensors must be in dtype of torch.float16, torch.bfloat16 or torch.float32"
+    assert q.device == k.device == v.device, "All tensors must be on the same device."
+    assert q.dtype == k.dtype == v.dtype, "All tensors must have the same dtype."
+    assert q.size(1) == k.size(1) == v.size(1), "q, k and v must have the same number of channels."
+    assert q.size(1) % num_heads == 0, "channels must be divisible by num_heads."
+
+    head_dim = q.size(1) // num_heads
+    if head_dim not in [64, 128]:
+        raise ValueError(f"Unsupported head_dim: {head_dim}")
+
+    # [batch_size, channels, *spatial] -> a [batch_size, num_heads, seq_len, head_dim] view with a strided head dim
+    def to_hnd(x):
+        return x.unflatten(1, (num_heads, head_dim)).flatten(3).transpose(2, 3)
+
+    o = torch.empty(q.shape, dtype=dtype, device=q.device)
+    q_hnd, k_hnd, v_hnd, o_hnd = to_hnd(q), to_hnd(k), to_hnd(v), to_hnd(o)
+
+    km = k_hnd.mean(dim=2, keepdim=True) if smooth_k else None
+
+    if sm_scale is None:
+        sm_scale = 1.0 / (head_dim ** 0.5)
+
+    q_int8, q_scale, k_int8, k_scale = per_block_int8_triton(q_hnd, k_hnd, km=km, sm_scale=sm_scale, tensor_layout="HND")
+    attn_false(q_int8, k_int8, v_hnd, q_scale, k_scale, tensor_layout="HND", output_dtype=dtype, out=o_hnd)
+
+    return o
+
+
+@traced
 def sageattn_qk_int8_pv_fp16_cuda(
     q: torch.Tensor, 
     k: torch.Tensor, 
@@ -445,6 +949,16 @@ def sageattn_qk_int8_pv_fp16_cuda(
     smooth_k: bool = True,
     smooth_v: bool = False,
     return_lse: bool = False,
+    block_causal: Optional[int] = None,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
+    rope: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    rope_style: str = "interleaved",
+    qk_norm: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    qk_norm_eps: float = 1e-6,
+    scale_cache: Optional[ScaleCache] = None,
+    static_scales: Optional[StaticScales] = None,
+    layer_tag: Optional[Hashable] = None,
     **kwargs: Any,
 ) -> torch.Tensor:
     """
@@ -472,9 +986,67 @@ def sageattn_qk_int8_pv_fp16_cuda(
         Default: "HND".
 
     is_causal : bool
-        Whether to apply causal mask to the attention matrix. Only applicable when qo_len == kv_len.
+        Whether to apply causal mask to the attention matrix. Requires qo_len <= kv_len.
+        When qo_len < kv_len, the mask is aligned to the bottom-right corner, i.e. query ``i`` attends to keys up to ``kv_len - qo_len + i``.
         Default: False.
 
+    block_causal : Optional[int]
+        The number of tokens per frame for block-causal attention, where tokens attend bidirectionally within a frame and causally across frames.
+        Like `is_causal`, it requires qo_len <= kv_len and is aligned to the bottom-right corner. Cannot be combined with `is_causal`.
+        Frames are counted from the first key: query ``i`` attends to key ``j`` when ``j // block_causal <= (i + kv_len - qo_len) // block_causal``,
+        so the query frames match the key frames only when ``kv_len - qo_len`` is a multiple of `block_causal`.
+        Default: None.
+
+    kv_lengths : Optional[torch.Tensor]
+        The number of valid key and value tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        The remaining tokens are treated as padding: the kernel stops its loop over the keys at the valid length,
+        so padded tiles are never read and no mask tensor is needed. Each length must be at least 1.
+        The mean of K for smoothing covers the valid tokens only, but the quantization of V, and of K unless per thread,
+        covers all tokens, so padded keys and values must be finite.
+        With `is_causal`, an element with fewer valid keys than valid queries has its mask aligned to the top-left corner.
+        Default: None.
+
+    q_lengths : Optional[torch.Tensor]
+        The number of valid query tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        Padded query tokens are skipped, their output is zero and their lse is undefined.
+        Default: None.
+
+    rope : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(cos, sin)`` tables of rotary position embeddings to apply to `q` and `k`. The rotation is fused into the
+        quantization of `q` and `k`, so the rotated tensors are never written to memory. Each table has ``rope_dim <= head_dim``
+        entries per position and at least ``max(qo_len, kv_len)`` positions shared by all batch elements and heads,
+        e.g. of shape ``[seq_len, rope_dim]`` or ``[1, seq_len, 1, rope_dim]``. Only the first ``rope_dim`` channels are rotated.
+        Default: None.
+
+    rope_style : str
+        How channels are paired for the rotation, either "interleaved" (channels ``2i`` and ``2i + 1``, as in Wan)
+        or "half" (channels ``i`` and ``i + rope_dim / 2``, as in HunyuanVideo). See :func:`sageattention.prologue.apply_rope`.
+        Default: "interleaved".
+
+    qk_norm : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(q_weight, k_weight)`` weights of an RMSNorm over the head dim of each head of `q` and `k`, applied before `rope`,
+        such as ``attn.norm_q.weight`` and ``attn.norm_k.weight`` of per-head QK-norm. Like `rope`, it is fused into the quantization.
+        Each weight has shape ``[head_dim]`` (shared by all heads) or ``[num_heads * head_dim]``.
+        Default: None.
+
+    qk_norm_eps : float
+        The epsilon of the RMSNorm in `qk_norm`.
+        Default: 1e-6.
+
+    scale_cache : Optional[ScaleCache]
+        Reuse the Q and K quantization scales of earlier calls with the same `layer_tag`, see :class:`sageattention.ScaleCache`.
+        Default: None.
+
+    static_scales : Optional[StaticScales]
+        Quantize Q and K with the fixed scales of an offline calibration and smooth K with the recorded mean,
+        see :class:`sageattention.StaticScales`. Requires `layer_tag`.
+        Default: None.
+
+    layer_tag : Optional[Hashable]
+        The key of this call in `scale_cache` and `static_scales`, e.g. the name of the attention layer.
+        Calls with a `layer_tag` are recorded by an active :class:`sageattention.CalibrationRecorder`.
+        Default: None.
+
     qk_quant_gran : str
         The granularity of quantization for Q and K, either "per_warp" or "per_thread".
         Default: "per_thread".
@@ -519,6 +1091,7 @@ def sageattn_qk_int8_pv_fp16_cuda(
     - ``num_qo_heads`` must be divisible by ``num_kv_heads``. 
     - The tensors `q`, `k`, and `v` must have the dtype ``torch.float16`` or ``torch.bfloat16``
     - All tensors must be on the same cuda device.
+    - With `rope` or `qk_norm`, Q and K always use the per-thread quantization, as it is implemented in Triton.
     - `smooth_k` will introduce slight overhead but will improve the accuracy under most circumstances.
     """
 
@@ -530,13 +1103,32 @@ def sageattn_qk_int8_pv_fp16_cuda(
     assert q.device == k.device == v.device, "All tensors must be on the same device."
     assert q.dtype == k.dtype == v.dtype, "All tensors must have the same dtype."
 
+    if kv_lengths is not None:
+        assert kv_lengths.device == q.device, "All tensors must be on the same device."
+        kv_lengths = kv_lengths.to(torch.int32).contiguous()
+    if q_lengths is not None:
+        assert q_lengths.device == q.device, "All tensors must be on the same device."
+        q_lengths = q_lengths.to(torch.int32).contiguous()
+
     _tensor_layout = 0 if tensor_layout == "NHD" else 1
-    _is_caual = 1 if is_causal else 0
+    assert not (is_causal and block_causal is not None), "is_causal and block_causal cannot be set at the same time."
+    assert block_causal is None or block_causal >= 1, "block_causal must be a positive number of tokens per frame."
+    # the kernels take the number of tokens per frame, where 1 is the usual causal mask
+    _is_caual = block_causal if block_causal is not None else (1 if is_causal else 0)
+    if rope is not None or qk_norm is not None:
+        # only the triton quantization kernels have the prologue
+        qk_quant_gran = "per_thread"
     _qk_quant_gran = 3 if qk_quant_gran == "per_thread" else 2
     _return_lse = 1 if return_lse else 0
 
+    record_qkv(layer_tag, q, k, v, tensor_layout=tensor_layout, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps)
+
     head_dim_og, q, k, v = pad_qkv(q, k, v)
 
+    if qk_norm is not None:
+        # [head_dim] or [num_heads * head_dim] weights of the unpadded head dim
+        qk_norm = tuple(w.reshape(-1, head_dim_og) for w in qk_norm)
+
     # assert last dim is contiguous
     assert q.stride(-1) == 1 and k.stride(-1) == 1 and v.stride(-1) == 1, "Last dim of qkv must be contiguous."
 
@@ -546,8 +1138,16 @@ def sageattn_qk_int8_pv_fp16_cuda(
     seq_dim = 1 if _tensor_layout == 0 else 2
     nh_dim = 2 if _tensor_layout == 0 else 1
 
+    if _is_caual:
+        assert q.size(seq_dim) <= k.size(seq_dim), "qo_len must not be larger than kv_len for causal attention."
+
     if smooth_k:
-        km = k.mean(dim=seq_dim, keepdim=True)
+        if static_scales is not None:
+            km = static_scales.mean(layer_tag, k, tensor_layout=tensor_layout)
+        elif rope is not None or qk_norm is not None:
+            km = mean_prologue(k, qk_norm[1] if qk_norm is not None else None, qk_norm_eps, rope, rope_style, tensor_layout=tensor_layout).to(k.dtype)
+        else:
+            km = valid_mean(k, kv_lengths, seq_dim)
         nqheads = q.size(nh_dim)
         nkheads = k.size(nh_dim)
         q_per_kv_heads = nqheads // nkheads
@@ -557,10 +1157,16 @@ def sageattn_qk_int8_pv_fp16_cuda(
         else:
             km_broadcast = km
         if return_lse:
+            # the correction needs the transformed q, which the fused prologue never writes
+            q_rot = q
+            if qk_norm is not None:
+                q_rot = apply_rms_norm(q_rot, qk_norm[0], qk_norm_eps, tensor_layout=tensor_layout)
+            if rope is not None:
+                q_rot = apply_rope(q_rot, rope, rope_style, tensor_layout=tensor_layout)
             if tensor_layout == "NHD":
-                lse_correction = torch.matmul(q.transpose(1, 2), km_broadcast.transpose(1, 2).transpose(2, 3)).squeeze(-1).to(torch.float32)
+                lse_correction = torch.matmul(q_rot.transpose(1, 2), km_broadcast.transpose(1, 2).transpose(2, 3)).squeeze(-1).to(torch.float32)
             else:
-                lse_correction = torch.matmul(q, km_broadcast.transpose(2, 3)).squeeze(-1).to(torch.float32)
+                lse_correction = torch.matmul(q_rot, km_broadcast.transpose(2, 3)).squeeze(-1).to(torch.float32)
     else:
         km = None
 
@@ -569,7 +1175,7 @@ def sageattn_qk_int8_pv_fp16_cuda(
     if pv_accum_dtype in ["fp16", "fp32"] and head_dim == 256:
         warp_q = 16
     elif pv_accum_dtype == "fp16+fp32":
-        if head_dim == 128 and not is_causal:
+        if head_dim == 128 and not _is_caual:
             blk_k, warp_q, warp_k = 32, 32, 32
         elif head_dim > 64:
             warp_q = 16
@@ -577,9 +1183,13 @@ def sageattn_qk_int8_pv_fp16_cuda(
     if qk_quant_gran == "per_warp":
         q_int8, q_scale, k_int8, k_scale = per_warp_int8_cuda(q, k, km, tensor_layout=tensor_layout, BLKQ=blk_q, WARPQ=warp_q, BLKK=blk_k)
     elif qk_quant_gran == "per_thread":
-        q_int8, q_scale, k_int8, k_scale = per_thread_int8_triton(q, k, km, tensor_layout=tensor_layout, BLKQ=blk_q, WARPQ=warp_q, BLKK=blk_k, WARPK=warp_k)
+        q_int8, q_scale, k_int8, k_scale = per_thread_int8_triton(q, k, km, tensor_layout=tensor_layout, BLKQ=blk_q, WARPQ=warp_q, BLKK=blk_k, WARPK=warp_k, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag, q_lengths=q_lengths, kv_lengths=kv_lengths)
 
-    o = torch.empty(q.size(), dtype=dtype, device=q.device)
+    if q_lengths is not None:
+        # padded query tokens are skipped and keep a zero output
+        o = torch.zeros(q.size(), dtype=dtype, device=q.device)
+    else:
+        o = torch.empty(q.size(), dtype=dtype, device=q.device)
 
     if pv_accum_dtype in ["fp32", "fp16+fp32"] and smooth_v:
         warnings.warn(f"pv_accum_dtype is {pv_accum_dtype}, smooth_v will be ignored.")
@@ -587,17 +1197,17 @@ def sageattn_qk_int8_pv_fp16_cuda(
 
     if pv_accum_dtype == 'fp32':
         v = v.to(torch.float16)
-        lse = sm80_compile.qk_int8_sv_f16_accum_f32_attn(q_int8, k_int8, v, o, q_scale, k_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+        lse = sm80_compile.qk_int8_sv_f16_accum_f32_attn(q_int8, k_int8, v, o, q_scale, k_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
     elif pv_accum_dtype == "fp16":
         if smooth_v:
             smoothed_v, vm = sub_mean(v, tensor_layout=tensor_layout)
-            lse = sm80_compile.qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(q_int8, k_int8, smoothed_v, o, q_scale, k_scale, vm, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+            lse = sm80_compile.qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(q_int8, k_int8, smoothed_v, o, q_scale, k_scale, vm, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
         else:
             v = v.to(torch.float16)
-            lse = sm80_compile.qk_int8_sv_f16_accum_f16_attn(q_int8, k_int8, v, o, q_scale, k_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+            lse = sm80_compile.qk_int8_sv_f16_accum_f16_attn(q_int8, k_int8, v, o, q_scale, k_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
     elif pv_accum_dtype == "fp16+fp32":
         v = v.to(torch.float16)
-        lse = sm80_compile.qk_int8_sv_f16_accum_f16_attn_inst_buf(q_int8, k_int8, v, o, q_scale, k_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+        lse = sm80_compile.qk_int8_sv_f16_accum_f16_attn_inst_buf(q_int8, k_int8, v, o, q_scale, k_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
     else:
         raise ValueError(f"Unsupported pv_accum_dtype: {pv_accum_dtype}")
 
@@ -609,6 +1219,7 @@ def sageattn_qk_int8_pv_fp16_cuda(
         return o
 
 
+@traced
 def sageattn_qk_int8_pv_fp8_cuda(
     q: torch.Tensor, 
     k: torch.Tensor, 
@@ -621,6 +1232,16 @@ def sageattn_qk_int8_pv_fp8_cuda(
     smooth_k: bool = True,
     smooth_v: bool = False,
     return_lse: bool = False,
+    block_causal: Optional[int] = None,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
+    rope: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    rope_style: str = "interleaved",
+    qk_norm: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    qk_norm_eps: float = 1e-6,
+    scale_cache: Optional[ScaleCache] = None,
+    static_scales: Optional[StaticScales] = None,
+    layer_tag: Optional[Hashable] = None,
     **kwargs: Any,
 ) -> torch.Tensor:
     """
@@ -648,9 +1269,67 @@ def sageattn_qk_int8_pv_fp8_cuda(
         Default: "HND".
 
     is_causal : bool
-        Whether to apply causal mask to the attention matrix. Only applicable when qo_len == kv_len.
+        Whether to apply causal mask to the attention matrix. Requires qo_len <= kv_len.
+        When qo_len < kv_len, the mask is aligned to the bottom-right corner, i.e. query ``i`` attends to keys up to ``kv_len - qo_len + i``.
         Default: False.
 
+    block_causal : Optional[int]
+        The number of tokens per frame for block-causal attention, where tokens attend bidirectionally within a frame and causally across frames.
+        Like `is_causal`, it requires qo_len <= kv_len and is aligned to the bottom-right corner. Cannot be combined with `is_causal`.
+        Frames are counted from the first key: query ``i`` attends to key ``j`` when ``j // block_causal <= (i + kv_len - qo_len) // block_causal``,
+        so the query frames match the key frames only when ``kv_len - qo_len`` is a multiple of `block_causal`.
+        Default: None.
+
+    kv_lengths : Optional[torch.Tensor]
+        The number of valid key and value tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        The remaining tokens are treated as padding: the kernel stops its loop over the keys at the valid length,
+        so padded tiles are never read and no mask tensor is needed. Each length must be at least 1.
+        The mean of K for smoothing covers the valid tokens only, but the quantization of V, and of K unless per thread,
+        covers all tokens, so padded keys and values must be finite.
+        With `is_causal`, an element with fewer valid keys than valid queries has its mask aligned to the top-left corner.
+        Default: None.
+
+    q_lengths : Optional[torch.Tensor]
+        The number of valid query tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        Padded query tokens are skipped, their output is zero and their lse is undefined.
+        Default: None.
+
+    rope : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(cos, sin)`` tables of rotary position embeddings to apply to `q` and `k`. The rotation is fused into the
+        quantization of `q` and `k`, so the rotated tensors are never written to memory. Each table has ``rope_dim <= head_dim``
+        entries per position and at least ``max(qo_len, kv_len)`` positions shared by all batch elements and heads,
+        e.g. of shape ``[seq_len, rope_dim]`` or ``[1, seq_len, 1, rope_dim]``. Only the first ``rope_dim`` channels are rotated.
+        Default: None.
+
+    rope_style : str
+        How channels are paired for the rotation, either "interleaved" (channels ``2i`` and ``2i + 1``, as in Wan)
+        or "half" (channels ``i`` and ``i + rope_dim / 2``, as in HunyuanVideo). See :func:`sageattention.prologue.apply_rope`.
+        Default: "interleaved".
+
+    qk_norm : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(q_weight, k_weight)`` weights of an RMSNorm over the head dim of each head of `q` and `k`, applied before `rope`,
+        such as ``attn.norm_q.weight`` and ``attn.norm_k.weight`` of per-head QK-norm. Like `rope`, it is fused into the quantization.
+        Each weight has shape ``[head_dim]`` (shared by all heads) or ``[num_heads * head_dim]``.
+        Default: None.
+
+    qk_norm_eps : float
+        The epsilon of the RMSNorm in `qk_norm`.
+        Default: 1e-6.
+
+    scale_cache : Optional[ScaleCache]
+        Reuse the Q and K quantization scales of earlier calls with the same `layer_tag`, see :class:`sageattention.ScaleCache`.
+        Default: None.
+
+    static_scales : Optional[StaticScales]
+        Quantize Q and K with the fixed scales of an offline calibration and smooth K with the recorded mean,
+        see :class:`sageattention.StaticScales`. Requires `layer_tag`.
+        Default: None.
+
+    layer_tag : Optional[Hashable]
+        The key of this call in `scale_cache` and `static_scales`, e.g. the name of the attention layer.
+        Calls with a `layer_tag` are recorded by an active :class:`sageattention.CalibrationRecorder`.
+        Default: None.
+
     qk_quant_gran : str
         The granularity of quantization for Q and K, either "per_warp" or "per_thread".
         Default: "per_thread".
@@ -694,6 +1373,7 @@ def sageattn_qk_int8_pv_fp8_cuda(
     - ``num_qo_heads`` must be divisible by ``num_kv_heads``. 
     - The tensors `q`, `k`, and `v` must have the dtype ``torch.float16`` or ``torch.bfloat16``
     - All tensors must be on the same cuda device.
+    - With `rope` or `qk_norm`, Q and K always use the per-thread quantization, as it is implemented in Triton.
     - `smooth_k` will introduce slight overhead but will improve the accuracy under most circumstances.
     """
 
@@ -705,13 +1385,32 @@ def sageattn_qk_int8_pv_fp8_cuda(
     assert q.device == k.device == v.device, "All tensors must be on the same device."
     assert q.dtype == k.dtype == v.dtype, "All tensors must have the same dtype."
 
+    if kv_lengths is not None:
+        assert kv_lengths.device == q.device, "All tensors must be on the same device."
+        kv_lengths = kv_lengths.to(torch.int32).contiguous()
+    if q_lengths is not None:
+        assert q_lengths.device == q.device, "All tensors must be on the same device."
+        q_lengths = q_lengths.to(torch.int32).contiguous()
+
     _tensor_layout = 0 if tensor_layout == "NHD" else 1
-    _is_caual = 1 if is_causal else 0
+    assert not (is_causal and block_causal is not None), "is_causal and block_causal cannot be set at the same time."
+    assert block_causal is None or block_causal >= 1, "block_causal must be a positive number of tokens per frame."
+    # the kernels take the number of tokens per frame, where 1 is the usual causal mask
+    _is_caual = block_causal if block_causal is not None else (1 if is_causal else 0)
+    if rope is not None or qk_norm is not None:
+        # only the triton quantization kernels have the prologue
+        qk_quant_gran = "per_thread"
     _qk_quant_gran = 3 if qk_quant_gran == "per_thread" else 2
     _return_lse = 1 if return_lse else 0
 
+    record_qkv(layer_tag, q, k, v, tensor_layout=tensor_layout, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps)
+
     head_dim_og, q, k, v = pad_qkv(q, k, v)
 
+    if qk_norm is not None:
+        # [head_dim] or [num_heads * head_dim] weights of the unpadded head dim
+        qk_norm = tuple(w.reshape(-1, head_dim_og) for w in qk_norm)
+
     # assert last dim is contiguous
     assert q.stride(-1) == 1 and k.stride(-1) == 1 and v.stride(-1) == 1, "Last dim of qkv must be contiguous."
 
@@ -721,8 +1420,16 @@ def sageattn_qk_int8_pv_fp8_cuda(
     seq_dim = 1 if _tensor_layout == 0 else 2
     nh_dim = 2 if _tensor_layout == 0 else 1    
 
+    if _is_caual:
+        assert q.size(seq_dim) <= k.size(seq_dim), "qo_len must not be larger than kv_len for causal attention."
+
     if smooth_k:
-        km = k.mean(dim=seq_dim, keepdim=True)
+        if static_scales is not None:
+            km = static_scales.mean(layer_tag, k, tensor_layout=tensor_layout)
+        elif rope is not None or qk_norm is not None:
+            km = mean_prologue(k, qk_norm[1] if qk_norm is not None else None, qk_norm_eps, rope, rope_style, tensor_layout=tensor_layout).to(k.dtype)
+        else:
+            km = valid_mean(k, kv_lengths, seq_dim)
         nqheads = q.size(nh_dim)
         nkheads = k.size(nh_dim)
         q_per_kv_heads = nqheads // nkheads
@@ -732,10 +1439,16 @@ def sageattn_qk_int8_pv_fp8_cuda(
         else:
             km_broadcast = km
         if return_lse:
+            # the correction needs the transformed q, which the fused prologue never writes
+            q_rot = q
+            if qk_norm is not None:
+                q_rot = apply_rms_norm(q_rot, qk_norm[0], qk_norm_eps, tensor_layout=tensor_layout)
+            if rope is not None:
+                q_rot = apply_rope(q_rot, rope, rope_style, tensor_layout=tensor_layout)
             if tensor_layout == "NHD":
-                lse_correction = torch.matmul(q.transpose(1, 2), km_broadcast.transpose(1, 2).transpose(2, 3)).squeeze(-1).to(torch.float32)
+                lse_correction = torch.matmul(q_rot.transpose(1, 2), km_broadcast.transpose(1, 2).transpose(2, 3)).squeeze(-1).to(torch.float32)
             else:
-                lse_correction = torch.matmul(q, km_broadcast.transpose(2, 3)).squeeze(-1).to(torch.float32)
+                lse_correction = torch.matmul(q_rot, km_broadcast.transpose(2, 3)).squeeze(-1).to(torch.float32)
     else:
         km = None
 
@@ -744,9 +1457,13 @@ def sageattn_qk_int8_pv_fp8_cuda(
     if qk_quant_gran == "per_warp":
         q_int8, q_scale, k_int8, k_scale = per_warp_int8_cuda(q, k, km, tensor_layout=tensor_layout, BLKQ=128, WARPQ=warp_q, BLKK=64)
     elif qk_quant_gran == "per_thread":
-        q_int8, q_scale, k_int8, k_scale = per_thread_int8_triton(q, k, km, tensor_layout=tensor_layout, BLKQ=128, WARPQ=warp_q, BLKK=64, WARPK=64)
+        q_int8, q_scale, k_int8, k_scale = per_thread_int8_triton(q, k, km, tensor_layout=tensor_layout, BLKQ=128, WARPQ=warp_q, BLKK=64, WARPK=64, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag, q_lengths=q_lengths, kv_lengths=kv_lengths)
 
-    o = torch.empty(q.size(), dtype=dtype, device=q.device)
+    if q_lengths is not None:
+        # padded query tokens are skipped and keep a zero output
+        o = torch.zeros(q.size(), dtype=dtype, device=q.device)
+    else:
+        o = torch.empty(q.size(), dtype=dtype, device=q.device)
 
     if pv_accum_dtype == 'fp32+fp32' and smooth_v:
         warnings.warn("pv_accum_dtype is 'fp32+fp32', smooth_v will be ignored.")
@@ -764,13 +1481,13 @@ def sageattn_qk_int8_pv_fp8_cuda(
 
     if pv_accum_dtype == "fp32":
         if smooth_v:
-            lse = sm89_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_fuse_v_mean_attn(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, vm, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+            lse = sm89_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_fuse_v_mean_attn(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, vm, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
         else:
-            lse = sm89_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+            lse = sm89_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
     elif pv_accum_dtype == "fp32+fp32":
-        lse = sm89_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+        lse = sm89_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
     elif pv_accum_dtype == "fp32+fp16":
-        lse = sm89_compile.qk_int8_sv_f8_accum_f16_fuse_v_scale_attn_inst_buf(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+        lse = sm89_compile.qk_int8_sv_f8_accum_f16_fuse_v_scale_attn_inst_buf(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
 
     o = o[..., :head_dim_og]
 
@@ -780,6 +1497,7 @@ def sageattn_qk_int8_pv_fp8_cuda(
         return o
 
 
+@traced
 def sageattn_qk_int8_pv_fp8_cuda_sm90(
     q: torch.Tensor, 
     k: torch.Tensor, 
@@ -791,6 +1509,16 @@ def sageattn_qk_int8_pv_fp8_cuda_sm90(
     pv_accum_dtype: str = "fp32+fp32",
     smooth_k: bool = True,
     return_lse: bool = False,
+    block_causal: Optional[int] = None,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
+    rope: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    rope_style: str = "interleaved",
+    qk_norm: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    qk_norm_eps: float = 1e-6,
+    scale_cache: Optional[ScaleCache] = None,
+    static_scales: Optional[StaticScales] = None,
+    layer_tag: Optional[Hashable] = None,
     **kwargs: Any,
 ) -> torch.Tensor:
     """
@@ -818,9 +1546,67 @@ def sageattn_qk_int8_pv_fp8_cuda_sm90(
         Default: "HND".
 
     is_causal : bool
-        Whether to apply causal mask to the attention matrix. Only applicable when qo_len == kv_len.
+        Whether to apply causal mask to the attention matrix. Requires qo_len <= kv_len.
+        When qo_len < kv_len, the mask is aligned to the bottom-right corner, i.e. query ``i`` attends to keys up to ``kv_len - qo_len + i``.
         Default: False.
 
+    block_causal : Optional[int]
+        The number of tokens per frame for block-causal attention, where tokens attend bidirectionally within a frame and causally across frames.
+        Like `is_causal`, it requires qo_len <= kv_len and is aligned to the bottom-right corner. Cannot be combined with `is_causal`.
+        Frames are counted from the first key: query ``i`` attends to key ``j`` when ``j // block_causal <= (i + kv_len - qo_len) // block_causal``,
+        so the query frames match the key frames only when ``kv_len - qo_len`` is a multiple of `block_causal`.
+        Default: None.
+
+    kv_lengths : Optional[torch.Tensor]
+        The number of valid key and value tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        The remaining tokens are treated as padding: the kernel stops its loop over the keys at the valid length,
+        so padded tiles are never read and no mask tensor is needed. Each length must be at least 1.
+        The mean of K for smoothing covers the valid tokens only, but the quantization of V, and of K unless per thread,
+        covers all tokens, so padded keys and values must be finite.
+        With `is_causal`, an element with fewer valid keys than valid queries has its mask aligned to the top-left corner.
+        Default: None.
+
+    q_lengths : Optional[torch.Tensor]
+        The number of valid query tokens of each batch element, shape: ``[batch_size]``, dtype ``torch.int32``.
+        Padded query tokens are skipped, their output is zero and their lse is undefined.
+        Default: None.
+
+    rope : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(cos, sin)`` tables of rotary position embeddings to apply to `q` and `k`. The rotation is fused into the
+        quantization of `q` and `k`, so the rotated tensors are never written to memory. Each table has ``rope_dim <= head_dim``
+        entries per position and at least ``max(qo_len, kv_len)`` positions shared by all batch elements and heads,
+        e.g. of shape ``[seq_len, rope_dim]`` or ``[1, seq_len, 1, rope_dim]``. Only the first ``rope_dim`` channels are rotated.
+        Default: None.
+
+    rope_style : str
+        How channels are paired for the rotation, either "interleaved" (channels ``2i`` and ``2i + 1``, as in Wan)
+        or "half" (channels ``i`` and ``i + rope_dim / 2``, as in HunyuanVideo). See :func:`sageattention.prologue.apply_rope`.
+        Default: "interleaved".
+
+    qk_norm : Optional[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(q_weight, k_weight)`` weights of an RMSNorm over the head dim of each head of `q` and `k`, applied before `rope`,
+        such as ``attn.norm_q.weight`` and ``attn.norm_k.weight`` of per-head QK-norm. Like `rope`, it is fused into the quantization.
+        Each weight has shape ``[head_dim]`` (shared by all heads) or ``[num_heads * head_dim]``.
+        Default: None.
+
+    qk_norm_eps : float
+        The epsilon of the RMSNorm in `qk_norm`.
+        Default: 1e-6.
+
+    scale_cache : Optional[ScaleCache]
+        Reuse the Q and K quantization scales of earlier calls with the same `layer_tag`, see :class:`sageattention.ScaleCache`.
+        Default: None.
+
+    static_scales : Optional[StaticScales]
+        Quantize Q and K with the fixed scales of an offline calibration and smooth K with the recorded mean,
+        see :class:`sageattention.StaticScales`. Requires `layer_tag`.
+        Default: None.
+
+    layer_tag : Optional[Hashable]
+        The key of this call in `scale_cache` and `static_scales`, e.g. the name of the attention layer.
+        Calls with a `layer_tag` are recorded by an active :class:`sageattention.CalibrationRecorder`.
+        Default: None.
+
     qk_quant_gran : str
         The granularity of quantization for Q and K, either "per_warp" or "per_thread".
         Default: "per_thread".
@@ -859,6 +1645,7 @@ def sageattn_qk_int8_pv_fp8_cuda_sm90(
     - ``num_qo_heads`` must be divisible by ``num_kv_heads``. 
     - The tensors `q`, `k`, and `v` must have the dtype ``torch.float16`` or ``torch.bfloat16``
     - All tensors must be on the same cuda device.
+    - With `rope` or `qk_norm`, Q and K always use the per-thread quantization, as it is implemented in Triton.
     - `smooth_k` will introduce slight overhead but will improve the accuracy under most circumstances.
     """
 
@@ -870,13 +1657,32 @@ def sageattn_qk_int8_pv_fp8_cuda_sm90(
     assert q.device == k.device == v.device, "All tensors must be on the same device."
     assert q.dtype == k.dtype == v.dtype, "All tensors must have the same dtype."
 
+    if kv_lengths is not None:
+        assert kv_lengths.device == q.device, "All tensors must be on the same device."
+        kv_lengths = kv_lengths.to(torch.int32).contiguous()
+    if q_lengths is not None:
+        assert q_lengths.device == q.device, "All tensors must be on the same device."
+        q_lengths = q_lengths.to(torch.int32).contiguous()
+
     _tensor_layout = 0 if tensor_layout == "NHD" else 1
-    _is_caual = 1 if is_causal else 0
+    assert not (is_causal and block_causal is not None), "is_causal and block_causal cannot be set at the same time."
+    assert block_causal is None or block_causal >= 1, "block_causal must be a positive number of tokens per frame."
+    # the kernels take the number of tokens per frame, where 1 is the usual causal mask
+    _is_caual = block_causal if block_causal is not None else (1 if is_causal else 0)
+    if rope is not None or qk_norm is not None:
+        # only the triton quantization kernels have the prologue
+        qk_quant_gran = "per_thread"
     _qk_quant_gran = 3 if qk_quant_gran == "per_thread" else 2
     _return_lse = 1 if return_lse else 0
 
+    record_qkv(layer_tag, q, k, v, tensor_layout=tensor_layout, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps)
+
     head_dim_og, q, k, v = pad_qkv(q, k, v)
 
+    if qk_norm is not None:
+        # [head_dim] or [num_heads * head_dim] weights of the unpadded head dim
+        qk_norm = tuple(w.reshape(-1, head_dim_og) for w in qk_norm)
+
     # assert last dim is contiguous
     assert q.stride(-1) == 1 and k.stride(-1) == 1 and v.stride(-1) == 1, "Last dim of qkv must be contiguous."
 
@@ -886,8 +1692,16 @@ def sageattn_qk_int8_pv_fp8_cuda_sm90(
     seq_dim = 1 if _tensor_layout == 0 else 2
     nh_dim = 2 if _tensor_layout == 0 else 1
 
+    if _is_caual:
+        assert q.size(seq_dim) <= k.size(seq_dim), "qo_len must not be larger than kv_len for causal attention."
+
     if smooth_k:
-        km = k.mean(dim=seq_dim, keepdim=True)
+        if static_scales is not None:
+            km = static_scales.mean(layer_tag, k, tensor_layout=tensor_layout)
+        elif rope is not None or qk_norm is not None:
+            km = mean_prologue(k, qk_norm[1] if qk_norm is not None else None, qk_norm_eps, rope, rope_style, tensor_layout=tensor_layout).to(k.dtype)
+        else:
+            km = valid_mean(k, kv_lengths, seq_dim)
         nqheads = q.size(nh_dim)
         nkheads = k.size(nh_dim)
         q_per_kv_heads = nqheads // nkheads
@@ -897,37 +1711,38 @@ def sageattn_qk_int8_pv_fp8_cuda_sm90(
         else:
             km_broadcast = km
         if return_lse:
+            # the correction needs the transformed q, which the fused prologue never writes
+            q_rot = q
+            if qk_norm is not None:
+                q_rot = apply_rms_norm(q_rot, qk_norm[0], qk_norm_eps, tensor_layout=tensor_layout)
+            if rope is not None:
+                q_rot = apply_rope(q_rot, rope, rope_style, tensor_layout=tensor_layout)
             if tensor_layout == "NHD":
-                lse_correction = torch.matmul(q.transpose(1, 2), km_broadcast.transpose(1, 2).transpose(2, 3)).squeeze(-1).to(torch.float32)
+                lse_correction = torch.matmul(q_rot.transpose(1, 2), km_broadcast.transpose(1, 2).transpose(2, 3)).squeeze(-1).to(torch.float32)
             else:
-                lse_correction = torch.matmul(q, km_broadcast.transpose(2, 3)).squeeze(-1).to(torch.float32)
+                lse_correction = torch.matmul(q_rot, km_broadcast.transpose(2, 3)).squeeze(-1).to(torch.float32)
     else:
         km = None
 
     if qk_quant_gran == "per_warp":
         q_int8, q_scale, k_int8, k_scale = per_warp_int8_cuda(q, k, km, tensor_layout=tensor_layout, BLKQ=64, WARPQ=16, BLKK=128)
     elif qk_quant_gran == "per_thread":
-        q_int8, q_scale, k_int8, k_scale = per_thread_int8_triton(q, k, km, tensor_layout=tensor_layout, BLKQ=64, WARPQ=16, BLKK=128, WARPK=128)
-
-    o = torch.empty(q.size(), dtype=dtype, device=q.device)
+        q_int8, q_scale, k_int8, k_scale = per_thread_int8_triton(q, k, km, tensor_layout=tensor_layout, BLKQ=64, WARPQ=16, BLKK=128, WARPK=128, rope=rope, rope_style=rope_style, qk_norm=qk_norm, qk_norm_eps=qk_norm_eps, scale_cache=scale_cache, static_scales=static_scales, layer_tag=layer_tag, q_lengths=q_lengths, kv_lengths=kv_lengths)
 
-    # pad v to multiple of 128
-    # TODO: modify per_channel_fp8 kernel to handle this
-    kv_len = k.size(seq_dim)
-    v_pad_len = 128 - (kv_len % 128) if kv_len % 128 != 0 else 0
-    if v_pad_len > 0:
-        if tensor_layout == "HND":
-            v = torch.cat([v, torch.zeros(v.size(0), v.size(1), v_pad_len, v.size(3), dtype=v.dtype, device=v.device)], dim=2)
-        else:
-            v = torch.cat([v, torch.zeros(v.size(0), v_pad_len, v.size(2), v.size(3), dtype=v.dtype, device=v.device)], dim=1)
+    if q_lengths is not None:
+        # padded query tokens are skipped and keep a zero output
+        o = torch.zeros(q.size(), dtype=dtype, device=q.device)
+    else:
+        o = torch.empty(q.size(), dtype=dtype, device=q.device)
 
-    v_fp8, v_scale, _ = per_channel_fp8(v, tensor_layout=tensor_layout, smooth_v=False)
+    # the sm90 kernel reads v in blocks of 128 tokens, the quantization zero-fills the tail
+    v_fp8, v_scale, _ = per_channel_fp8(v, tensor_layout=tensor_layout, smooth_v=False, pad_to=128)
 
     if pv_accum_dtype == "fp32":
         raise NotImplementedError("Please use pv_accum_dtype='fp32+fp32' for sm90.")
-        lse = sm90_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+        lse = sm90_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
     elif pv_accum_dtype == "fp32+fp32":
-        lse = sm90_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse)
+        lse = sm90_compile.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(q_int8, k_int8, v_fp8, o, q_scale, k_scale, v_scale, _tensor_layout, _is_caual, _qk_quant_gran, sm_scale, _return_lse, kv_lengths, q_lengths)
 
     o = o[..., :head_dim_og]
 
@@ -0,0 +1,269 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+import torch.nn.functional as F
+
+from .core import pad_qkv
+from .triton.quant_per_block import quant_per_block_int8
+from .triton.attn_qk_int8_joint import forward as attn_joint
+
+from typing import Any, List, Optional, Sequence, Tuple
+
+BLKQ = 128
+BLKK = 64
+
+
+def _quant_segments(xs, BLK, sm_scale, kms, tensor_layout):
+    """
+    Quantize the segments `xs` to INT8 with per-block scales into one ``[b, h, padded_len, head_dim]`` buffer,
+    each segment starting on a block boundary so that no block straddles two segments.
+    Returns the buffer, the scales and the ``[num_segments, 2]`` (start, length) table of the segments.
+    """
+    if tensor_layout == "HND":
+        b, h, _, head_dim = xs[0].shape
+        seq_dim = 2
+        strides = lambda x: (x.stride(0), x.stride(1), x.stride(2))
+    else:
+        b, _, h, head_dim = xs[0].shape
+        seq_dim = 1
+        strides = lambda x: (x.stride(0), x.stride(2), x.stride(1))
+
+    lens = [x.size(seq_dim) for x in xs]
+    starts = [0]
+    for seq_len in lens:
+        starts.append(starts[-1] + (seq_len + BLK - 1) // BLK * BLK)
+
+    x_int8 = torch.empty((b, h, starts[-1], head_dim), dtype=torch.int8, device=xs[0].device)
+    x_scale = torch.empty((b, h, starts[-1] // BLK), dtype=torch.float32, device=xs[0].device)
+
+    for i, x in enumerate(xs):
+        x_slot = x_int8[:, :, starts[i]:starts[i] + lens[i]]
+        x_scale_slot = x_scale[:, :, starts[i] // BLK:]
+        km = kms[i] if kms is not None else None
+        km_strides = strides(km)[:2] if km is not None else (0, 0)
+        quant_per_block_int8(x, x_slot, x_scale_slot, lens[i], strides(x) + (x.stride(3),), x_slot.stride()[:3], BLK,
+                             sm_scale=sm_scale, km=km, km_strides=km_strides)
+
+    seg = torch.tensor(list(zip(starts[:-1], lens)), dtype=torch.int64).to(xs[0].device, non_blocking=True)
+    return x_int8, x_scale, seg
+
+
+def sageattn_joint(
+    segments: Sequence[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]],
+    tensor_layout: str = "HND",
+    sm_scale: Optional[float] = None,
+    smooth_k: bool = True,
+    **kwargs: Any,
+) -> List[torch.Tensor]:
+    """
+    SageAttention over the concatenation of several token segments, as in the joint attention of MM-DiT models,
+    without concatenating the segments.
+
+    Every query of every segment attends to the keys of all segments. The queries and keys of each segment are quantized
+    into their own block-aligned slot of one INT8 buffer, the values are read in place from each segment,
+    and the output of each segment is written to its own tensor.
+
+    Parameters
+    ----------
+    segments : Sequence[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]]
+        The ``(q, k, v)`` tensors of each segment, e.g. ``[(q_txt, k_txt, v_txt), (q_img, k_img, v_img)]``. Shape of each tensor:
+        - If `tensor_layout` is "HND": ``[batch_size, num_heads, seq_len_i, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, seq_len_i, num_heads, head_dim]``.
+        Each segment has its own ``seq_len_i``; the other dims are shared.
+
+    tensor_layout : str
+        The tensor layout, either "HND" or "NHD".
+        Default: "HND".
+
+    sm_scale : Optional[float]
+        The scale used in softmax, if not provided, will be set to ``1.0 / sqrt(head_dim)``.
+
+    smooth_k : bool
+        Whether to smooth the key tensor by subtracting the mean of the keys of all segments along the sequence dimension.
+        Default: True.
+
+    Returns
+    -------
+    List[torch.Tensor]
+        The output of each segment, with the same shape as its `q`.
+        Concatenating them along the sequence dimension gives the output of :func:`sageattn` on the concatenated segments.
+
+    Note
+    ----
+    - ``num_qo_heads`` must be divisible by ``num_kv_heads``.
+    - All tensors must have the same dtype, either ``torch.float16`` or ``torch.bfloat16``, and be on the same device.
+    - There is no causal mask, joint attention is bidirectional.
+    - The last dimension of each tensor must be contiguous. Head dims other than 64 and 128 are padded, which copies the segments.
+    """
+
+    assert len(segments) > 0, "At least one segment is required."
+    q0, k0, v0 = segments[0]
+    dtype = q0.dtype
+    assert q0.is_cuda, "Input tensors must be on cuda."
+    assert dtype in [torch.float16, torch.bfloat16], "Input tensors must be in dtype of torch.float16 or torch.bfloat16"
+
+    if tensor_layout == "HND":
+        seq_dim = 2
+    elif tensor_layout == "NHD":
+        seq_dim = 1
+    else:
+        raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+    qs, ks, vs = [], [], []
+    for q, k, v in segments:
+        assert q.device == k.device == v.device == q0.device, "All tensors must be on the same device."
+        assert q.dtype == k.dtype == v.dtype == dtype, "All tensors must have the same dtype."
+        assert q.size(-1) == k.size(-1) == v.size(-1) == q0.size(-1), "All tensors must have the same head_dim."
+        assert k.size(seq_dim) == v.size(seq_dim), "k and v of a segment must have the same sequence length."
+        head_dim_og, q, k, v = pad_qkv(q, k, v)
+        assert q.stride(-1) == 1 and k.stride(-1) == 1 and v.stride(-1) == 1, "Last dim of qkv must be contiguous."
+        qs.append(q)
+        ks.append(k)
+        vs.append(v)
+
+    h_qo, h_kv = qs[0].size(3 - seq_dim), ks[0].size(3 - seq_dim)
+    assert h_qo % h_kv == 0, "num_qo_heads must be divisible by num_kv_heads."
+
+    if sm_scale is None:
+        sm_scale = 1.0 / (head_dim_og ** 0.5)
+
+    if smooth_k:
+        # the mean over the keys of all segments, as if they were concatenated
+        km = sum(k.sum(dim=seq_dim, keepdim=True, dtype=torch.float32) for k in ks) / sum(k.size(seq_dim) for k in ks)
+        kms = [km] * len(ks)
+    else:
+        kms = None
+
+    q_int8, q_scale, seg_q = _quant_segments(qs, BLKQ, sm_scale * 1.44269504, None, tensor_layout)
+    k_int8, k_scale, seg_k = _quant_segments(ks, BLKK, 1.0, kms, tensor_layout)
+
+    outs = [torch.empty(q.shape, dtype=dtype, device=q.device) for q in qs]
+    attn_joint(q_int8, k_int8, vs, q_scale, k_scale, seg_q, seg_k, outs, tensor_layout=tensor_layout)
+
+    return [o[..., :head_dim_og] for o in outs]
+
+
+def sageattn_multi_kv(
+    q: torch.Tensor,
+    kv_sets: Sequence[Tuple[torch.Tensor, torch.Tensor]],
+    reduce: str = "sum",
+    tensor_layout: str = "HND",
+    sm_scale: Optional[float] = None,
+    smooth_k: bool = True,
+    **kwargs: Any,
+) -> torch.Tensor:
+    """
+    SageAttention of one query tensor over several key and value sets, with `q` quantized once and a single kernel launch.
+
+    Parameters
+    ----------
+    q : torch.Tensor
+        The query tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_qo_heads, qo_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, qo_len, num_qo_heads, head_dim]``.
+
+    kv_sets : Sequence[Tuple[torch.Tensor, torch.Tensor]]
+        The ``(k, v)`` tensors of each set, e.g. ``[(k_img, v_img), (k_txt, v_txt)]``. Shape of each tensor:
+        - If `tensor_layout` is "HND": ``[batch_size, num_kv_heads, kv_len_i, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, kv_len_i, num_kv_heads, head_dim]``.
+
+    reduce : str
+        How the sets are combined, either "sum" or "concat_softmax".
+        - "sum": ``sum(sageattn(q, k_i, v_i))``, each set with its own softmax, as in decoupled image and text cross-attention.
+        - "concat_softmax": ``sageattn(q, cat(k_i), cat(v_i))``, one softmax over the keys of all sets.
+        Default: "sum".
+
+    tensor_layout : str
+        The tensor layout, either "HND" or "NHD".
+        Default: "HND".
+
+    sm_scale : Optional[float]
+        The scale used in softmax, if not provided, will be set to ``1.0 / sqrt(head_dim)``.
+
+    smooth_k : bool
+        Whether to smooth the key tensors by subtracting their mean along the sequence dimension.
+        With "sum" each set is smoothed with its own mean, with "concat_softmax" with the mean over all sets.
+        Default: True.
+
+    Returns
+    -------
+    torch.Tensor
+        The output tensor, with the same shape as `q`.
+
+    Note
+    ----
+    - All key and value sets must have the same ``num_kv_heads``, and ``num_qo_heads`` must be divisible by it.
+    - All tensors must have the same dtype, either ``torch.float16`` or ``torch.bfloat16``, and be on the same device.
+    - There is no causal mask.
+    - The last dimension of each tensor must be contiguous.
+    """
+
+    if reduce not in ["sum", "concat_softmax"]:
+        raise ValueError(f"Unsupported reduce: {reduce}")
+    assert len(kv_sets) > 0, "At least one key and value set is required."
+
+    dtype = q.dtype
+    assert q.is_cuda, "Input tensors must be on cuda."
+    assert dtype in [torch.float16, torch.bfloat16], "Input tensors must be in dtype of torch.float16 or torch.bfloat16"
+
+    if tensor_layout == "HND":
+        seq_dim = 2
+    elif tensor_layout == "NHD":
+        seq_dim = 1
+    else:
+        raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+    ks, vs = [], []
+    for k, v in kv_sets:
+        assert k.device == v.device == q.device, "All tensors must be on the same device."
+        assert k.dtype == v.dtype == dtype, "All tensors must have the same dtype."
+        assert k.size(-1) == v.size(-1) == q.size(-1), "All tensors must have the same head_dim."
+        assert k.size(seq_dim) == v.size(seq_dim), "k and v of a set must have the same sequence length."
+        assert k.size(3 - seq_dim) == kv_sets[0][0].size(3 - seq_dim), "All key and value sets must have the same num_kv_heads."
+        ks.append(k)
+        vs.append(v)
+
+    # pad q once, and k and v of each set to the head_dim padded by pad_qkv
+    head_dim_og, q, ks[0], vs[0] = pad_qkv(q, ks[0], vs[0])
+    head_dim = q.size(-1)
+    if head_dim != head_dim_og:
+        ks[1:] = [F.pad(k, (0, head_dim - head_dim_og)) for k in ks[1:]]
+        vs[1:] = [F.pad(v, (0, head_dim - head_dim_og)) for v in vs[1:]]
+    assert q.stride(-1) == 1 and all(k.stride(-1) == 1 and v.stride(-1) == 1 for k, v in zip(ks, vs)), "Last dim of qkv must be contiguous."
+
+    h_qo, h_kv = q.size(3 - seq_dim), ks[0].size(3 - seq_dim)
+    assert h_qo % h_kv == 0, "num_qo_heads must be divisible by num_kv_heads."
+
+    if sm_scale is None:
+        sm_scale = 1.0 / (head_dim_og ** 0.5)
+
+    if smooth_k and reduce == "sum":
+        # the softmax of each set is invariant to its own shift
+        kms = [k.mean(dim=seq_dim, keepdim=True, dtype=torch.float32) for k in ks]
+    elif smooth_k:
+        km = sum(k.sum(dim=seq_dim, keepdim=True, dtype=torch.float32) for k in ks) / sum(k.size(seq_dim) for k in ks)
+        kms = [km] * len(ks)
+    else:
+        kms = None
+
+    q_int8, q_scale, seg_q = _quant_segments([q], BLKQ, sm_scale * 1.44269504, None, tensor_layout)
+    k_int8, k_scale, seg_k = _quant_segments(ks, BLKK, 1.0, kms, tensor_layout)
+
+    o = torch.empty(q.shape, dtype=dtype, device=q.device)
+    attn_joint(q_int8, k_int8, vs, q_scale, k_scale, seg_q, seg_k, [o], tensor_layout=tensor_layout, sum_segments=(reduce == "sum"))
+
+    return o[..., :head_dim_og]
@@ -0,0 +1,295 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+import torch.nn.functional as F
+
+from .triton.quant_per_block import quant_per_block_int8, quant_per_block_fp8_kernel
+from .triton.attn_qk_int8_kv_cache import forward as attn_kv_cache
+
+from typing import Any, Optional
+
+BLKQ = 128
+BLKK = 64
+
+
+class QuantizedKVCache:
+    """
+    A ring buffer holding the quantized keys and values of the last `max_frames` frames, for streaming generation with a sliding window.
+
+    Each frame is quantized once when it is appended: the key is smoothed with a fixed mean and quantized to INT8 with per-block scales,
+    and the value is quantized to FP8 (e4m3) with per-block scales. Appending to a full cache evicts the oldest frame by overwriting its slot,
+    so both appending and evicting only touch the frame itself.
+
+    Parameters
+    ----------
+    batch_size : int
+        The batch size.
+
+    num_kv_heads : int
+        The number of key and value heads.
+
+    head_dim : int
+        The head dimension, at most 128.
+
+    frame_tokens : int
+        The number of tokens per frame. Every appended frame must have exactly this length.
+
+    max_frames : int
+        The number of frames kept in the window.
+
+    km : Optional[torch.Tensor]
+        The fixed mean subtracted from the keys before quantization. Shape: ``[batch_size, num_kv_heads, head_dim]``.
+        If not provided, the mean of the first appended frame along the sequence dimension is used.
+        Default: None.
+
+    device : Optional[torch.device]
+        The device of the cache. Default: the current cuda device.
+
+    Note
+    ----
+    - The smoothing mean does not change the attention output, so a mean that drifts away from the recent frames only costs quantization accuracy.
+    - Call :meth:`reset` to start a new rollout with a new smoothing mean.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        num_kv_heads: int,
+        head_dim: int,
+        frame_tokens: int,
+        max_frames: int,
+        km: Optional[torch.Tensor] = None,
+        device: Optional[torch.device] = None,
+    ):
+        if head_dim > 128:
+            raise ValueError(f"Unsupported head_dim: {head_dim}")
+        assert frame_tokens > 0 and max_frames > 0, "frame_tokens and max_frames must be positive."
+
+        if device is None:
+            device = torch.device("cuda")
+
+        self.batch_size = batch_size
+        self.num_kv_heads = num_kv_heads
+        self.head_dim = head_dim
+        self.head_dim_padded = 64 if head_dim <= 64 else 128
+        self.frame_tokens = frame_tokens
+        self.max_frames = max_frames
+
+        # every frame occupies a slot padded to a whole number of key blocks, so that blocks never straddle two frames
+        self.blocks_per_slot = (frame_tokens + BLKK - 1) // BLKK
+        self.slot_tokens = self.blocks_per_slot * BLKK
+
+        capacity = max_frames * self.slot_tokens
+        self.k_int8 = torch.zeros((batch_size, num_kv_heads, capacity, self.head_dim_padded), dtype=torch.int8, device=device)
+        self.k_scale = torch.zeros((batch_size, num_kv_heads, max_frames * self.blocks_per_slot), dtype=torch.float32, device=device)
+        self.v_fp8 = torch.zeros((batch_size, num_kv_heads, capacity, self.head_dim_padded), dtype=torch.float8_e4m3fn, device=device)
+        self.v_scale = torch.zeros((batch_size, num_kv_heads, max_frames * self.blocks_per_slot), dtype=torch.float32, device=device)
+
+        self.km = None
+        if km is not None:
+            self.km = F.pad(km, (0, self.head_dim_padded - head_dim)).unsqueeze(2)
+
+        # slot of the oldest frame and number of frames in the window
+        self.first_slot = 0
+        self.num_frames = 0
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    def reset(self, km: Optional[torch.Tensor] = None):
+        """
+        Drop all frames and the smoothing mean. The storage is kept.
+        """
+        self.first_slot = 0
+        self.num_frames = 0
+        self.km = None
+        if km is not None:
+            self.km = F.pad(km, (0, self.head_dim_padded - self.head_dim)).unsqueeze(2)
+
+    def evict(self, num_frames: int = 1):
+        """
+        Drop the `num_frames` oldest frames from the window.
+        """
+        num_frames = min(num_frames, self.num_frames)
+        self.first_slot = (self.first_slot + num_frames) % self.max_frames
+        self.num_frames -= num_frames
+
+    def append(self, k: torch.Tensor, v: torch.Tensor, tensor_layout: str = "HND"):
+        """
+        Quantize one frame and append it to the window, evicting the oldest frame if the window is full.
+
+        Parameters
+        ----------
+        k : torch.Tensor
+            The key tensor of the frame. Shape:
+            - If `tensor_layout` is "HND": ``[batch_size, num_kv_heads, frame_tokens, head_dim]``.
+            - If `tensor_layout` is "NHD": ``[batch_size, frame_tokens, num_kv_heads, head_dim]``.
+
+        v : torch.Tensor
+            The value tensor of the frame, with the same shape as `k`.
+
+        tensor_layout : str
+            The tensor layout, either "HND" or "NHD".
+            Default: "HND".
+        """
+        assert k.dtype in [torch.float16, torch.bfloat16], "Input tensors must be in dtype of torch.float16 or torch.bfloat16"
+        assert k.device == v.device == self.k_int8.device, "All tensors must be on the same device as the cache."
+        assert k.shape == v.shape, "k and v must have the same shape."
+
+        if tensor_layout == "HND":
+            pass
+        elif tensor_layout == "NHD":
+            k = k.transpose(1, 2)
+            v = v.transpose(1, 2)
+        else:
+            raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+        assert tuple(k.shape) == (self.batch_size, self.num_kv_heads, self.frame_tokens, self.head_dim), \
+            f"Expected a frame of shape {(self.batch_size, self.num_kv_heads, self.frame_tokens, self.head_dim)} in HND layout, got {tuple(k.shape)}."
+
+        if self.head_dim_padded != self.head_dim:
+            k = F.pad(k, (0, self.head_dim_padded - self.head_dim))
+            v = F.pad(v, (0, self.head_dim_padded - self.head_dim))
+
+        if self.km is None:
+            self.km = k.mean(dim=2, keepdim=True)
+        k = k - self.km.to(k.dtype)
+
+        if self.num_frames == self.max_frames:
+            self.evict(1)
+        slot = (self.first_slot + self.num_frames) % self.max_frames
+
+        k_slot = self.k_int8[:, :, slot * self.slot_tokens:(slot + 1) * self.slot_tokens]
+        k_scale_slot = self.k_scale[:, :, slot * self.blocks_per_slot:(slot + 1) * self.blocks_per_slot]
+        v_slot = self.v_fp8[:, :, slot * self.slot_tokens:(slot + 1) * self.slot_tokens]
+        v_scale_slot = self.v_scale[:, :, slot * self.blocks_per_slot:(slot + 1) * self.blocks_per_slot]
+
+        quant_per_block_int8(k, k_slot, k_scale_slot, self.frame_tokens, k.stride(), k_slot.stride()[:3], BLKK)
+        grid = (self.blocks_per_slot, self.num_kv_heads, self.batch_size)
+        quant_per_block_fp8_kernel[grid](
+            v, v_slot, v_scale_slot, self.frame_tokens,
+            v.stride(0), v.stride(1), v.stride(2),
+            v_slot.stride(0), v_slot.stride(1), v_slot.stride(2),
+            v_scale_slot.stride(0), v_scale_slot.stride(1),
+            C=self.head_dim_padded, BLK=BLKK
+        )
+
+        self.num_frames += 1
+
+
+def sageattn_kv_cache(
+    q: torch.Tensor,
+    kv_cache: QuantizedKVCache,
+    tensor_layout: str = "HND",
+    sm_scale: Optional[float] = None,
+    return_lse: bool = False,
+    **kwargs: Any,
+) -> torch.Tensor:
+    """
+    SageAttention of `q` over all frames in a :class:`QuantizedKVCache`, reading the ring in place from the oldest to the newest frame.
+
+    Parameters
+    ----------
+    q : torch.Tensor
+        The query tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_qo_heads, qo_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, qo_len, num_qo_heads, head_dim]``.
+
+    kv_cache : QuantizedKVCache
+        The cache holding the keys and values. Must contain at least one frame.
+
+    tensor_layout : str
+        The tensor layout of `q` and the output, either "HND" or "NHD".
+        Default: "HND".
+
+    sm_scale : Optional[float]
+        The scale used in softmax, if not provided, will be set to ``1.0 / sqrt(head_dim)``.
+
+    return_lse : bool
+        Whether to return the log sum of the exponentiated attention weights. Used for cases like Ring Attention.
+        Default: False.
+
+    Returns
+    -------
+    torch.Tensor or Tuple[torch.Tensor, torch.Tensor]
+        - The output tensor with the same shape as `q`.
+        - If `return_lse` is True, also returns the log sum of the exponentiated attention weights. Shape: ``[batch_size, num_qo_heads, qo_len]``.
+
+    Note
+    ----
+    - ``num_qo_heads`` must be divisible by ``num_kv_heads`` of the cache.
+    - The tensor `q` must have the dtype ``torch.float16`` or ``torch.bfloat16``.
+    - There is no mask: every query attends to every cached token, so append the current frame before attending to it.
+    """
+
+    dtype = q.dtype
+    assert q.is_cuda, "Input tensors must be on cuda."
+    assert dtype in [torch.float16, torch.bfloat16], "Input tensors must be in dtype of torch.float16 or torch.bfloat16"
+    assert q.device == kv_cache.k_int8.device, "All tensors must be on the same device."
+    assert q.size(-1) == kv_cache.head_dim, "q must have the same head_dim as the cache."
+    assert len(kv_cache) > 0, "The cache is empty."
+
+    head_dim_og = q.size(-1)
+    if kv_cache.head_dim_padded != head_dim_og:
+        q = F.pad(q, (0, kv_cache.head_dim_padded - head_dim_og))
+
+    assert q.stride(-1) == 1, "Last dim of q must be contiguous."
+
+    if tensor_layout == "HND":
+        b, h_qo, qo_len, head_dim = q.shape
+        stride_bz_q, stride_h_q, stride_seq_q = q.stride(0), q.stride(1), q.stride(2)
+    elif tensor_layout == "NHD":
+        b, qo_len, h_qo, head_dim = q.shape
+        stride_bz_q, stride_h_q, stride_seq_q = q.stride(0), q.stride(2), q.stride(1)
+    else:
+        raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+    assert h_qo % kv_cache.num_kv_heads == 0, "num_qo_heads must be divisible by num_kv_heads."
+
+    if sm_scale is None:
+        sm_scale = 1.0 / (head_dim_og ** 0.5)
+
+    q_int8 = torch.empty(q.shape, dtype=torch.int8, device=q.device)
+    q_scale = torch.empty((b, h_qo, (qo_len + BLKQ - 1) // BLKQ), device=q.device, dtype=torch.float32)
+    if tensor_layout == "HND":
+        stride_bz_qo, stride_h_qo, stride_seq_qo = q_int8.stride(0), q_int8.stride(1), q_int8.stride(2)
+    else:
+        stride_bz_qo, stride_h_qo, stride_seq_qo = q_int8.stride(0), q_int8.stride(2), q_int8.stride(1)
+
+    quant_per_block_int8(q, q_int8, q_scale, qo_len, (stride_bz_q, stride_h_q, stride_seq_q, q.stride(3)),
+                         (stride_bz_qo, stride_h_qo, stride_seq_qo), BLKQ, sm_scale=sm_scale * 1.44269504)
+
+    o, lse = attn_kv_cache(
+        q_int8, kv_cache.k_int8, kv_cache.v_fp8, q_scale, kv_cache.k_scale, kv_cache.v_scale,
+        kv_cache.frame_tokens, kv_cache.first_slot, kv_cache.num_frames,
+        tensor_layout=tensor_layout, output_dtype=dtype, return_lse=return_lse
+    )
+
+    o = o[..., :head_dim_og]
+
+    if return_lse:
+        # undo the smoothing of the keys: q @ (k - km) differs from q @ k by q @ km for every key
+        km = kv_cache.km.squeeze(2)
+        if h_qo != kv_cache.num_kv_heads:
+            km = torch.repeat_interleave(km, h_qo // kv_cache.num_kv_heads, dim=1)
+        if tensor_layout == "NHD":
+            lse_correction = torch.einsum("bnhd,bhd->bhn", q.float(), km.float())
+        else:
+            lse_correction = torch.einsum("bhnd,bhd->bhn", q.float(), km.float())
+        return o, lse / 1.44269504 + lse_correction * sm_scale
+    else:
+        return o
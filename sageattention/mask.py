@@ -0,0 +1,50 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+
+
+def pack_bool_mask(mask: torch.Tensor) -> torch.Tensor:
+    """
+    Pack a boolean attention mask into 32-bit words along the key dimension, 1 bit per element.
+
+    Parameters
+    ----------
+    mask : torch.Tensor
+        The boolean mask, where True means the key is attended to. Shape: ``[..., kv_len]``.
+
+    Returns
+    -------
+    torch.Tensor
+        The packed mask, shape: ``[..., (kv_len + 31) // 32]``, dtype ``torch.int32``.
+        Bit ``j % 32`` of word ``j // 32`` holds key ``j``. The padding bits of the last word are zero.
+
+    Note
+    ----
+    - The packed mask takes 8x less memory than the boolean mask and can be passed as `attn_mask` to
+      :func:`sageattention.sageattn_qk_int8_pv_fp16_triton`, which unpacks it in registers.
+    - Broadcast dimensions of size 1 are kept, so pack the mask before expanding it.
+    """
+    assert mask.dtype == torch.bool, "mask must be of dtype bool."
+
+    kv_len = mask.size(-1)
+    words = torch.zeros(mask.shape[:-1] + ((kv_len + 31) // 32,), dtype=torch.int32, device=mask.device)
+    # one bit position at a time, so that the temporaries are 1/8 of the boolean mask
+    for bit in range(min(32, kv_len)):
+        keys = mask[..., bit::32]
+        # bit 31 wraps around to the sign bit of the int32 word
+        words[..., :keys.size(-1)] |= keys.to(torch.int32) << bit
+    return words
@@ -0,0 +1,188 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+import torch.nn.functional as F
+
+from .triton.pack_varlen import pack, unpack
+
+from typing import Optional, Tuple
+
+
+def build_cu_seqlens(
+    lengths: Optional[torch.Tensor],
+    batch_size: int,
+    seq_len: int,
+    device: Optional[torch.device] = None,
+) -> torch.Tensor:
+    """
+    Build the cumulative sequence lengths used by the varlen kernels from per-batch valid lengths.
+
+    Parameters
+    ----------
+    lengths : Optional[torch.Tensor]
+        The number of valid tokens of each batch element, shape: ``[batch_size]``.
+        If None, all ``seq_len`` tokens of every batch element are valid.
+
+    batch_size : int
+        The batch size.
+
+    seq_len : int
+        The padded sequence length. Lengths larger than it are clamped.
+
+    device : Optional[torch.device]
+        The device of the result when `lengths` is None.
+
+    Returns
+    -------
+    torch.Tensor
+        The cumulative sequence lengths, shape: ``[batch_size + 1]``, dtype ``torch.int32``.
+    """
+    if lengths is None:
+        return torch.arange(0, (batch_size + 1) * seq_len, seq_len, dtype=torch.int32, device=device)
+    assert lengths.shape == (batch_size,), f"lengths must have shape ({batch_size},), got {tuple(lengths.shape)}"
+    lengths = lengths.to(torch.int32).clamp(max=seq_len)
+    return F.pad(torch.cumsum(lengths, dim=0, dtype=torch.int32), (1, 0), value=0)
+
+
+def should_pack(
+    kv_lengths: torch.Tensor,
+    kv_len: int,
+    q_lengths: Optional[torch.Tensor] = None,
+    qo_len: Optional[int] = None,
+    min_padding_ratio: float = 0.25,
+    min_tokens: int = 4096,
+    return_totals: bool = False,
+):
+    """
+    Decide whether running a padded batch through the varlen kernels is expected to be faster.
+
+    Packing costs one gather per input and one scatter of the output, which is linear in the number of tokens,
+    and saves the attention work on padded tokens, which is quadratic. It pays off once a sizeable fraction
+    of the padded attention matrix is padding and the sequences are long enough for attention to dominate.
+
+    Parameters
+    ----------
+    kv_lengths : torch.Tensor
+        The number of valid key and value tokens of each batch element, shape: ``[batch_size]``.
+
+    kv_len : int
+        The padded key and value length.
+
+    q_lengths : Optional[torch.Tensor]
+        The number of valid query tokens of each batch element, shape: ``[batch_size]``.
+        Default: all ``qo_len`` tokens are valid.
+
+    qo_len : Optional[int]
+        The padded query length. Default: `kv_len`.
+
+    min_padding_ratio : float
+        The minimum fraction of the padded attention matrix that must be padding.
+        Default: 0.25.
+
+    min_tokens : int
+        The minimum number of valid key tokens in the batch.
+        Default: 4096.
+
+    return_totals : bool
+        Whether to also return the total numbers of valid query and key tokens, to pass to :func:`pack_qkv`.
+        Default: False.
+
+    Returns
+    -------
+    bool
+        Whether packing is expected to pay off.
+
+    Tuple[int, int]
+        The total numbers of valid query and key tokens.
+        Only returned if `return_totals` is True.
+
+    Note
+    ----
+    - This reads the lengths on the host, which synchronizes with the device.
+    """
+    if qo_len is None:
+        qo_len = kv_len
+    batch_size = kv_lengths.size(0)
+
+    kv_lengths = kv_lengths.clamp(max=kv_len).to(torch.float64)
+    if q_lengths is None:
+        q_lengths = torch.full_like(kv_lengths, qo_len)
+    else:
+        q_lengths = q_lengths.clamp(max=qo_len).to(torch.float64)
+
+    valid_work, total_q, total_k = torch.stack([(q_lengths * kv_lengths).sum(), q_lengths.sum(), kv_lengths.sum()]).tolist()
+    padded_work = float(batch_size * qo_len * kv_len)
+
+    decision = total_k >= min_tokens and 1.0 - valid_work / padded_work >= min_padding_ratio
+    if return_totals:
+        return decision, (int(total_q), int(total_k))
+    return decision
+
+
+def pack_qkv(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    kv_lengths: torch.Tensor,
+    q_lengths: Optional[torch.Tensor] = None,
+    tensor_layout: str = "HND",
+    totals: Optional[Tuple[int, int]] = None,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, int, int]:
+    """
+    Gather the valid tokens of padded `q`, `k` and `v` into the packed layout of :func:`sageattention.sageattn_varlen`.
+
+    The total numbers of valid query and key tokens are read on the host, which synchronizes with the device,
+    unless they are given as `totals`, e.g. by :func:`should_pack`.
+
+    Returns
+    -------
+    Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, int, int]
+        The packed ``q``, ``k``, ``v``, ``cu_seqlens_q``, ``cu_seqlens_k``, and the padded lengths used as ``max_seqlen_q`` and ``max_seqlen_k``.
+    """
+    if tensor_layout == "HND":
+        b, _, qo_len, _ = q.shape
+        kv_len = k.size(2)
+    elif tensor_layout == "NHD":
+        b, qo_len, _, _ = q.shape
+        kv_len = k.size(1)
+    else:
+        raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+    cu_seqlens_q = build_cu_seqlens(q_lengths, b, qo_len, device=q.device)
+    cu_seqlens_k = build_cu_seqlens(kv_lengths, b, kv_len, device=k.device)
+    if totals is None:
+        totals = torch.stack([cu_seqlens_q[-1], cu_seqlens_k[-1]]).tolist()
+    total_q, total_k = totals
+
+    q_packed = pack(q, cu_seqlens_q, total_q, tensor_layout=tensor_layout)
+    k_packed = pack(k, cu_seqlens_k, total_k, tensor_layout=tensor_layout)
+    v_packed = pack(v, cu_seqlens_k, total_k, tensor_layout=tensor_layout)
+
+    # the padded lengths bound the valid ones, so they can serve as the max lengths without another sync
+    return q_packed, k_packed, v_packed, cu_seqlens_q, cu_seqlens_k, qo_len, kv_len
+
+
+def unpack_output(
+    o: torch.Tensor,
+    cu_seqlens_q: torch.Tensor,
+    qo_len: int,
+    tensor_layout: str = "HND",
+) -> torch.Tensor:
+    """
+    Scatter the packed output of :func:`sageattention.sageattn_varlen` back to the padded layout, with zeros at the padded query tokens.
+    """
+    return unpack(o, cu_seqlens_q, qo_len, tensor_layout=tensor_layout)
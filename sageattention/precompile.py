@@ -0,0 +1,166 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Ahead-of-time compilation of the Triton kernels for the expected calls.
+
+Usage::
+
+    # build a Triton cache directory from the calls recorded by CallTracer.save, to ship with a container
+    python -m sageattention.precompile calls.json --cache-dir /opt/triton-cache --workers 8
+
+    # and point the deployed processes to it
+    TRITON_CACHE_DIR=/opt/triton-cache python serve.py
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+_TENSOR_ARGUMENTS = {"q", "k", "v", "qkv"}
+
+
+def _as_call(spec: Dict[str, Any]) -> Dict[str, Any]:
+    if "arguments" in spec:
+        # a record of CallTracer
+        return spec
+    spec = dict(spec)
+    entry_point = spec.pop("entry_point", "sageattn")
+    dtype = spec.pop("dtype", "float16")
+    if "q" in spec:
+        spec.setdefault("k", spec["q"])
+        spec.setdefault("v", spec["k"])
+    arguments = {}
+    for name, value in spec.items():
+        if name in _TENSOR_ARGUMENTS:
+            value = {"shape": list(value), "dtype": dtype}
+        arguments[name] = value
+    return {"entry_point": entry_point, "arguments": arguments}
+
+
+def _run(calls: List[Dict[str, Any]], device: Optional[str]) -> List[str]:
+    import torch
+    from . import core
+    from .trace import _synthesizable, _synthesize
+
+    device = torch.device(device or "cuda")
+    generator = torch.Generator(device="cpu").manual_seed(0)
+    errors = []
+    for call in calls:
+        try:
+            fn = getattr(core, call["entry_point"])
+            fn(**{name: _synthesize(value, device, generator) for name, value in _synthesizable(call["arguments"]).items()})
+        except Exception as e:
+            errors.append(f"{call['entry_point']}: {type(e).__name__}: {e}")
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    return errors
+
+
+def _worker(calls, device, cache_dir):
+    if cache_dir is not None:
+        # read by triton when it compiles the first kernel of the process
+        os.environ["TRITON_CACHE_DIR"] = cache_dir
+    return _run(calls, device)
+
+
+def warmup(
+    shapes: Sequence[Dict[str, Any]],
+    num_workers: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    device: Optional[str] = None,
+    load: bool = True,
+) -> List[str]:
+    """
+    Compile the Triton kernels needed by the given calls ahead of time, in parallel processes, into the Triton cache.
+
+    Parameters
+    ----------
+    shapes : Sequence[Dict[str, Any]]
+        The expected calls, either records of :class:`sageattention.CallTracer`, or keyword arguments of the entry point
+        with the shapes of the tensors, e.g. ``{"q": (2, 24, 4096, 64), "k": (2, 24, 4096, 64), "tensor_layout": "HND",
+        "is_causal": False, "dtype": "bfloat16"}``. The ``"entry_point"`` key selects a function of :mod:`sageattention.core`,
+        default: ``"sageattn"``; `k` and `v` default to the shape of `q`.
+
+    num_workers : Optional[int]
+        The number of processes compiling in parallel. 0 compiles in the current process only.
+        Default: None (one per call, at most the number of CPUs).
+
+    cache_dir : Optional[str]
+        The Triton cache directory to populate. Default: None (``TRITON_CACHE_DIR`` or the default cache of Triton).
+
+    device : Optional[str]
+        The device of the synthetic inputs. Default: None (the current cuda device).
+
+    load : bool
+        Also run the calls in the current process once the cache is populated, loading the compiled kernels.
+        Default: True.
+
+    Returns
+    -------
+    List[str]
+        The errors of the calls that failed, empty if all kernels were compiled.
+
+    Note
+    ----
+    - The calls run once on random inputs of the given shapes. The sequence lengths do not select kernel variants;
+      the head dim, the layout, the dtype and the causal and mask flags do, so give one call for each combination that will be served.
+    - The workers are spawned processes, each with its own cuda context.
+    - A `cache_dir` only applies to the workers. For the current process to use it, set ``TRITON_CACHE_DIR`` before importing sageattention.
+    """
+    calls = [_as_call(spec) for spec in shapes]
+    if not calls:
+        return []
+    if num_workers is None:
+        num_workers = min(len(calls), os.cpu_count() or 1)
+
+    errors = []
+    if num_workers > 0:
+        chunks = [calls[i::num_workers] for i in range(num_workers)]
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for chunk_errors in pool.map(_worker, chunks, [device] * num_workers, [cache_dir] * num_workers):
+                errors.extend(chunk_errors)
+    if load or num_workers == 0:
+        errors = _run(calls, device)
+    return errors
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sageattention.precompile", description="Compile the Triton kernels for recorded calls ahead of time.")
+    parser.add_argument("shapes", help="A JSON file: the output of CallTracer.save, or a list of keyword arguments with tensor shapes.")
+    parser.add_argument("--cache-dir", default=None, help="The Triton cache directory to populate. Default: TRITON_CACHE_DIR or the default cache.")
+    parser.add_argument("--workers", type=int, default=None, help="The number of compiling processes. Default: one per call, at most the number of CPUs.")
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args(argv)
+
+    with open(args.shapes) as f:
+        shapes = json.load(f)
+    if isinstance(shapes, dict):
+        shapes = shapes["calls"]
+    if args.cache_dir is not None:
+        os.makedirs(args.cache_dir, exist_ok=True)
+    errors = warmup(shapes, num_workers=args.workers, cache_dir=args.cache_dir, device=args.device, load=False)
+    for error in errors:
+        print(error, file=sys.stderr)
+    print(f"{len(shapes) - len(errors)} of {len(shapes)} calls compiled", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
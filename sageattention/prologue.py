@@ -0,0 +1,122 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+
+from typing import Tuple
+
+
+def apply_rms_norm(
+    x: torch.Tensor,
+    weight: torch.Tensor,
+    eps: float = 1e-6,
+    tensor_layout: str = "HND",
+) -> torch.Tensor:
+    """
+    Apply RMSNorm over the head dim of each head of `x` in PyTorch, with the same conventions as the fused `qk_norm` argument of :func:`sageattention.sageattn`.
+
+    Parameters
+    ----------
+    x : torch.Tensor
+        The query or key tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_heads, seq_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, seq_len, num_heads, head_dim]``.
+
+    weight : torch.Tensor
+        The RMSNorm weight, of shape ``[norm_dim]`` shared by all heads or ``[num_heads, norm_dim]``.
+        Only the first ``norm_dim`` channels are normalized, the remaining (padded) channels must be zero.
+
+    eps : float
+        The epsilon added to the mean square.
+        Default: 1e-6.
+
+    tensor_layout : str
+        The tensor layout, either "HND" or "NHD".
+        Default: "HND".
+
+    Returns
+    -------
+    torch.Tensor
+        The normalized tensor with the same shape and dtype as `x`.
+    """
+    weight = weight.to(torch.float32).reshape(-1, weight.size(-1))
+    norm_dim = weight.size(1)
+    weight = torch.nn.functional.pad(weight, (0, x.size(-1) - norm_dim))
+    if tensor_layout == "HND":
+        weight = weight.unsqueeze(1)
+
+    x_fp32 = x.to(torch.float32)
+    out = x_fp32 * torch.rsqrt(x_fp32.pow(2).sum(dim=-1, keepdim=True) / norm_dim + eps) * weight
+    return out.to(x.dtype)
+
+
+def apply_rope(
+    x: torch.Tensor,
+    rope: Tuple[torch.Tensor, torch.Tensor],
+    rope_style: str = "interleaved",
+    tensor_layout: str = "HND",
+) -> torch.Tensor:
+    """
+    Apply rotary position embeddings to `x` in PyTorch, with the same conventions as the fused `rope` argument of :func:`sageattention.sageattn`.
+
+    Parameters
+    ----------
+    x : torch.Tensor
+        The query or key tensor. Shape:
+        - If `tensor_layout` is "HND": ``[batch_size, num_heads, seq_len, head_dim]``.
+        - If `tensor_layout` is "NHD": ``[batch_size, seq_len, num_heads, head_dim]``.
+
+    rope : Tuple[torch.Tensor, torch.Tensor]
+        The ``(cos, sin)`` tables, each with ``rope_dim`` entries per position and at least ``seq_len`` positions,
+        e.g. of shape ``[seq_len, rope_dim]`` or ``[1, seq_len, 1, rope_dim]``. Only the first ``rope_dim`` channels are rotated.
+
+    rope_style : str
+        How channels are paired for the rotation, either "interleaved" or "half".
+        - "interleaved": channels ``2i`` and ``2i + 1`` are rotated together, as in Wan and Flux.
+        - "half": channels ``i`` and ``i + rope_dim / 2`` are rotated together (``rotate_half``), as in HunyuanVideo and Llama.
+        Default: "interleaved".
+
+    tensor_layout : str
+        The tensor layout, either "HND" or "NHD".
+        Default: "HND".
+
+    Returns
+    -------
+    torch.Tensor
+        The rotated tensor with the same shape and dtype as `x`.
+    """
+    cos, sin = rope
+    rope_dim = cos.size(-1)
+    seq_dim = 1 if tensor_layout == "NHD" else 2
+    seq_len = x.size(seq_dim)
+
+    cos = cos.reshape(-1, rope_dim)[:seq_len].to(torch.float32)
+    sin = sin.reshape(-1, rope_dim)[:seq_len].to(torch.float32)
+    if tensor_layout == "NHD":
+        cos, sin = cos[:, None, :], sin[:, None, :]
+
+    x_rope = x[..., :rope_dim].to(torch.float32)
+    if rope_style == "interleaved":
+        x1, x2 = x_rope.unflatten(-1, (-1, 2)).unbind(-1)
+        x_rot = torch.stack([-x2, x1], dim=-1).flatten(-2)
+    elif rope_style == "half":
+        x1, x2 = x_rope.chunk(2, dim=-1)
+        x_rot = torch.cat([-x2, x1], dim=-1)
+    else:
+        raise ValueError(f"Unsupported rope_style: {rope_style}")
+
+    out = (x_rope * cos + x_rot * sin).to(x.dtype)
+    return torch.cat([out, x[..., rope_dim:]], dim=-1)
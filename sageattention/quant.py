@@ -225,11 +225,12 @@ def per_channel_fp8(
     v: torch.Tensor,
     tensor_layout: str ="HND",
     scale_max: float = 448.0,
-    smooth_v: bool = True
+    smooth_v: bool = True,
+    pad_to: int = 64,
 ):
     """
     Transpose, pad and permute the tensor `v` and quantize it to fp8 with per channel quantization.
-    `v` is first transposed along the head dimension and the sequence length dimension, then padded to a multiple of 64.
+    `v` is first transposed along the head dimension and the sequence length dimension, then padded with zeros to a multiple of `pad_to`.
     After that, the tensor is permuted along the sequence length dimension by ``[0, 1, 8, 9, 2, 3, 10, 11, 4, 5, 12, 13, 6, 7, 14, 15]``.
     The quantization is done per channel, with the scale value and smooth factor calculated per channel.
 
@@ -250,13 +251,18 @@ def per_channel_fp8(
     smooth_v : bool
         Whether to smooth the quantized tensor. Default is True.
 
+    pad_to : int
+        The granularity the sequence length of the output is padded to, a multiple of 64.
+        Kernels that consume `v` in larger blocks (e.g. 128 on sm90) can read the zero-filled tail without padding `v` first.
+        Default: 64.
+
     Returns
     -------
     Tuple[torch.Tensor, torch.Tensor, Optional[torch.Tensor]]
         A tuple containing:
         - The quantized tensor `v_fp8`. Shape:
-            - If `tensor_layout` is "HND": ``[batch_size, num_kv_heads, head_dim, (kv_len + 63) // 64 * 64]``, with `float8_e4m3fn` dtype.
-            - If `tensor_layout` is "NHD": ``[batch_size, head_dim, num_kv_heads, (kv_len + 63) // 64 * 64]``, with `float8_e4m3fn` dtype.
+            - If `tensor_layout` is "HND": ``[batch_size, num_kv_heads, head_dim, (kv_len + pad_to - 1) // pad_to * pad_to]``, with `float8_e4m3fn` dtype.
+            - If `tensor_layout` is "NHD": ``[batch_size, head_dim, num_kv_heads, (kv_len + pad_to - 1) // pad_to * pad_to]``, with `float8_e4m3fn` dtype.
         - The scale tensor of `v`. Shape: ``[batch_size, num_kv_heads, head_dim]`` with `float32` dtype.
         - The mean tensor of `v` along the sequence length dimension. Shape: ``[batch_size, num_kv_heads, head_dim]`` with `float32` dtype.
 
@@ -266,16 +272,18 @@ def per_channel_fp8(
     - The returned mean tensor will be None if `smooth_v` is False. Otherwise it will have dtype ``torch.float32``.
     """
 
+    assert pad_to % 64 == 0, "pad_to must be a multiple of 64."
+
     _tensor_layout = 0 if tensor_layout == "NHD" else 1
 
     if tensor_layout == "HND":
         b, h_kv, kv_len, head_dim = v.shape
-        padded_len = (kv_len + 63) // 64 * 64
+        padded_len = (kv_len + pad_to - 1) // pad_to * pad_to
         v_transposed_permutted = torch.empty((b, h_kv, head_dim, padded_len), dtype=v.dtype, device=v.device)
 
     elif tensor_layout == "NHD":
         b, kv_len, h_kv, head_dim = v.shape
-        padded_len = (kv_len + 63) // 64 * 64
+        padded_len = (kv_len + pad_to - 1) // pad_to * pad_to
         v_transposed_permutted = torch.empty((b, head_dim, h_kv, padded_len), dtype=v.dtype, device=v.device)
     
     _fused.transpose_pad_permute_cuda(v, v_transposed_permutted, _tensor_layout)
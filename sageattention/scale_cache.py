@@ -0,0 +1,92 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+
+from typing import Dict, Hashable, Tuple
+
+
+class ScaleCache:
+    """
+    Quantization scales of Q and K kept across calls, for diffusion models whose adjacent denoising steps have nearly identical statistics.
+
+    Each call with a given `layer_tag` counts as one step of that layer. Every `max_steps` steps the Triton quantization kernels compute
+    the scales as usual, enlarged by `headroom`, and store them in the cache. On the other steps they reuse the cached scales,
+    so the quantization is a single scale-and-cast pass without the max reductions, and values beyond the cached range are clipped.
+    The kernels count the clipped values on the device; when more than a `max_saturation` fraction of a tensor was clipped,
+    the next step recomputes the scales. The decision is taken on the device, so the cache never synchronizes with the host.
+
+    Parameters
+    ----------
+    max_steps : int
+        The number of steps a computed scale is reused for, including the step that computed it. Default: 8.
+
+    headroom : float
+        The factor the computed scales are enlarged by, so that slightly larger values on the next steps are not clipped.
+        Default: 1.1.
+
+    max_saturation : float
+        The fraction of clipped values of a tensor above which the scales of that tensor are recomputed on the next step.
+        Default: 1e-4.
+
+    Note
+    ----
+    - Only the Triton quantization kernels use the cache: the per-block quantization of :func:`sageattn_qk_int8_pv_fp16_triton`
+      and the per-thread quantization of the CUDA backends. The per-warp CUDA quantization and the per-channel FP8 quantization of V ignore it.
+    - A change of shape, e.g. a new resolution, starts a new entry for the layer.
+    - Call :meth:`reset` between generations.
+    """
+
+    def __init__(self, max_steps: int = 8, headroom: float = 1.1, max_saturation: float = 1e-4):
+        assert max_steps > 0, "max_steps must be positive."
+        assert headroom >= 1.0, "headroom must be at least 1."
+        self.max_steps = max_steps
+        self.headroom = headroom
+        self.max_saturation = max_saturation
+        # (layer_tag, name) -> [scale, saturation counters, step]
+        self._entries: Dict[Tuple[Hashable, str], list] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def reset(self):
+        """
+        Drop all cached scales.
+        """
+        self._entries.clear()
+
+    def lookup(self, layer_tag: Hashable, name: str, shape: Tuple[int, ...], x: torch.Tensor, x_scale: float = 1.0):
+        """
+        Advance the entry of `name` ("q" or "k") of `layer_tag` by one step, and return its scale tensor of `shape`,
+        its saturation counters, the parity of the step and the number of clipped values of `x` that triggers a refresh,
+        negative when the scales must be recomputed on this step.
+        The factor `x_scale` the kernel multiplies `x` by is already part of the cached scales.
+        """
+        assert layer_tag is not None, "layer_tag must be provided together with scale_cache."
+        key = (layer_tag, name)
+        entry = self._entries.get(key)
+        if entry is None or entry[0].shape != shape or entry[0].device != x.device:
+            # the counters alternate between steps: one is read while the other counts the current step
+            entry = [torch.empty(shape, dtype=torch.float32, device=x.device), torch.zeros(2, dtype=torch.int32, device=x.device), 0]
+            self._entries[key] = entry
+
+        scale, saturation, step = entry
+        step_parity = step % 2
+        saturation[step_parity].zero_()
+        max_saturated = -1 if step % self.max_steps == 0 else int(self.max_saturation * x.numel())
+        entry[2] = step + 1
+
+        return scale, saturation, step_parity, max_saturated
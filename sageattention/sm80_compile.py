@@ -1,5 +1,6 @@
 from . import _qattn_sm80
 import torch
+from typing import Optional
 
 
 @torch.library.custom_op("sageattention::qk_int8_sv_f16_accum_f16_attn", mutates_args=("output",), device_types="cuda")
@@ -15,13 +16,15 @@ def qk_int8_sv_f16_accum_f16_attn(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     """
     Custom CUDA kernel for SageAttention with INT8 quantization for Q and K, FP16 PV with FP16 accumulation.
     """
     return _qattn_sm80.qk_int8_sv_f16_accum_f16_attn(
         query, key, value, output, query_scale, key_scale, tensor_layout,
-        is_causal, qk_quant_gran, sm_scale, return_lse
+        is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -38,13 +41,15 @@ def qk_int8_sv_f16_accum_f32_attn(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     """
     Custom CUDA kernel for SageAttention with INT8 quantization for Q and K, FP16 PV with FP32 accumulation.
     """
     return _qattn_sm80.qk_int8_sv_f16_accum_f32_attn(
         query, key, value, output, query_scale, key_scale, tensor_layout,
-        is_causal, qk_quant_gran, sm_scale, return_lse
+        is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -61,13 +66,15 @@ def qk_int8_sv_f16_accum_f16_attn_inst_buf(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     """
     Custom CUDA kernel for SageAttention with INT8 quantization for Q and K, FP16 PV with FP16 accumulation.
     """
     return _qattn_sm80.qk_int8_sv_f16_accum_f16_attn_inst_buf(
         query, key, value, output, query_scale, key_scale, tensor_layout,
-        is_causal, qk_quant_gran, sm_scale, return_lse
+        is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -85,13 +92,15 @@ def qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     """
     Custom CUDA kernel for SageAttention with INT8 quantization for Q and K, FP16 PV with FP16 accumulation.
     """
     return _qattn_sm80.qk_int8_sv_f16_accum_f16_fuse_v_mean_attn(
         query, key, value, output, query_scale, key_scale, value_mean,
-        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse
+        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -107,6 +116,8 @@ def sm80_qk_fake_impl(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     batch_size = query.size(0)
 
@@ -142,8 +153,10 @@ def qk_int8_sv_f16_accum_f16_fuse_v_mean_attn_fake_impl(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return sm80_qk_fake_impl(
         query, key, value, output, query_scale, key_scale, tensor_layout,
-        is_causal, qk_quant_gran, sm_scale, return_lse
+        is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
\ No newline at end of file
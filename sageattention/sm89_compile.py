@@ -1,5 +1,6 @@
 from . import _qattn_sm89
 import torch
+from typing import Optional
 
 
 @torch.library.custom_op("sageattention_sm89::qk_int8_sv_f8_accum_f32_fuse_v_scale_attn", mutates_args=("output",), device_types="cuda")
@@ -16,10 +17,12 @@ def qk_int8_sv_f8_accum_f32_fuse_v_scale_attn(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return _qattn_sm89.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn(
         query, key, value, output, query_scale, key_scale, value_scale,
-        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse
+        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -38,10 +41,12 @@ def qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return _qattn_sm89.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
         query, key, value, output, query_scale, key_scale, value_scale,
-        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse
+        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -59,10 +64,12 @@ def qk_int8_sv_f8_accum_f16_fuse_v_scale_attn_inst_buf(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return _qattn_sm89.qk_int8_sv_f8_accum_f16_fuse_v_scale_attn_inst_buf(
         query, key, value, output, query_scale, key_scale, value_scale,
-        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse
+        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -79,6 +86,8 @@ def sm89_qk_with_key_value(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     batch_size = query.size(0)
 
@@ -116,11 +125,13 @@ def qk_int8_sv_f8_accum_f32_fuse_v_scale_fuse_v_mean_attn(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return _qattn_sm89.qk_int8_sv_f8_accum_f32_fuse_v_scale_fuse_v_mean_attn(
         query, key, value, output, query_scale, key_scale, value_scale,
         value_mean, tensor_layout, is_causal, qk_quant_gran, sm_scale,
-        return_lse
+        return_lse, kv_lengths, q_lengths
     )
 
 
@@ -139,8 +150,10 @@ def sm89_qk_with_key_value_mean(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return sm89_qk_with_key_value(
         query, key, value, output, query_scale, key_scale, value_scale,
-        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse
+        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
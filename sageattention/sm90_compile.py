@@ -1,5 +1,6 @@
 from . import _qattn_sm90
 import torch
+from typing import Optional
 
 
 @torch.library.custom_op("sageattention_sm90::qk_int8_sv_f8_accum_f32_attn_inst_buf", mutates_args=("output",), device_types="cuda")
@@ -15,10 +16,12 @@ def qk_int8_sv_f8_accum_f32_attn_inst_buf(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return _qattn_sm90.qk_int8_sv_f8_accum_f32_attn_inst_buf(
         query, key, value, output, query_scale, key_scale, tensor_layout,
-        is_causal, qk_quant_gran, sm_scale, return_lse
+        is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -35,6 +38,8 @@ def qk_int8_sv_f8_accum_f32_attn_inst_buf_fake_impl(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     batch_size = query.size(0)
 
@@ -66,10 +71,12 @@ def qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return _qattn_sm90.qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf(
         query, key, value, output, query_scale, key_scale, value_scale,
-        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse
+        tensor_layout, is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
 
 
@@ -87,8 +94,10 @@ def qk_int8_sv_f8_accum_f32_fuse_v_scale_attn_inst_buf_fake_impl(
     qk_quant_gran: int, 
     sm_scale: float,
     return_lse: int,
+    kv_lengths: Optional[torch.Tensor] = None,
+    q_lengths: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
     return qk_int8_sv_f8_accum_f32_attn_inst_buf_fake_impl(
         query, key, value, output, query_scale, key_scale, tensor_layout,
-        is_causal, qk_quant_gran, sm_scale, return_lse
+        is_causal, qk_quant_gran, sm_scale, return_lse, kv_lengths, q_lengths
     )
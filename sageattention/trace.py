@@ -0,0 +1,327 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Call tracing of the attention entry points, and replay of a trace with synthetic tensors.
+
+Usage::
+
+    # record the calls of a run
+    >>> with CallTracer() as tracer:
+    ...     pipeline(prompt)
+    >>> tracer.save("calls.json")
+    >>> tracer.save_chrome_trace("calls.trace.json")  # open in chrome://tracing or Perfetto
+
+    # run the same call mix without the model, with another entry point or other arguments
+    python -m sageattention.trace replay calls.json --entry-point sageattn_qk_int8_pv_fp16_triton --set pv_accum_dtype=fp32
+"""
+
+import argparse
+import collections
+import functools
+import inspect
+import json
+import sys
+import time
+
+import torch
+
+from typing import Any, Callable, Dict, List, Optional
+
+# the tracer of the innermost active `with CallTracer()` block
+_active_tracer = None
+
+# integer tensors up to this size, e.g. sequence lengths, are recorded with their values
+_MAX_RECORDED_VALUES = 4096
+
+
+def traced(fn: Callable) -> Callable:
+    """
+    Record the calls of the entry point `fn` with the active :class:`CallTracer`, if any.
+    """
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        tracer = _active_tracer
+        if tracer is None:
+            return fn(*args, **kwargs)
+        return tracer._call(fn, signature, args, kwargs)
+
+    return wrapper
+
+
+def _describe(value):
+    if isinstance(value, torch.Tensor):
+        desc = {"shape": list(value.shape), "dtype": str(value.dtype).replace("torch.", "")}
+        if not value.is_floating_point() and value.numel() <= _MAX_RECORDED_VALUES:
+            # kept by reference and read when the trace is exported, never on the hot path
+            desc["values"] = value
+        return desc
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (tuple, list)):
+        return [_describe(x) for x in value]
+    # e.g. a ScaleCache or StaticScales, which cannot be synthesized and are dropped on replay
+    return {"object": type(value).__name__}
+
+
+def _synthesizable(arguments):
+    return {name: value for name, value in arguments.items() if not (isinstance(value, dict) and "object" in value)}
+
+
+def _resolve(value):
+    if isinstance(value, dict):
+        return {key: value["values"].tolist() if key == "values" else _resolve(x) for key, x in value.items()}
+    if isinstance(value, list):
+        return [_resolve(x) for x in value]
+    return value
+
+
+class CallTracer:
+    """
+    Record every call of the attention entry points inside a ``with`` block into a ring buffer.
+
+    A record holds the entry point, the arguments (tensors by shape and dtype, small integer tensors with their values,
+    other objects like a :class:`sageattention.ScaleCache` by their type name),
+    the backend the call ended in (e.g. the kernel family :func:`sageattention.sageattn` dispatched to) and the duration.
+    Calls made by another entry point, like the backend of :func:`sageattention.sageattn`, are part of the outer record.
+
+    Parameters
+    ----------
+    capacity : int
+        The number of most recent calls kept. Default: 4096.
+
+    Note
+    ----
+    - On cuda the duration is measured with cuda events, read when the trace is exported, so tracing never synchronizes.
+      On other devices it is the host time of the call.
+    - Integer tensors are read when the trace is exported; do not modify them in place before that.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.records = collections.deque(maxlen=capacity)
+        self._outer = None
+        self._depth = 0
+        self._backend = None
+        self._origin = time.perf_counter()
+
+    def __enter__(self):
+        global _active_tracer
+        self._outer, _active_tracer = _active_tracer, self
+        return self
+
+    def __exit__(self, *exc):
+        global _active_tracer
+        _active_tracer, self._outer = self._outer, None
+        return False
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def clear(self):
+        """
+        Drop all records.
+        """
+        self.records.clear()
+
+    def _call(self, fn, signature, args, kwargs):
+        # the innermost entry point reached is the backend of the outer call
+        self._backend = fn.__name__
+        if self._depth > 0:
+            return fn(*args, **kwargs)
+
+        bound = signature.bind_partial(*args, **kwargs)
+        arguments = dict(bound.arguments)
+        arguments.update(arguments.pop("kwargs", {}))
+        device = next((x.device for x in arguments.values() if isinstance(x, torch.Tensor)), None)
+
+        record = {
+            "entry_point": fn.__name__,
+            "arguments": {name: _describe(value) for name, value in arguments.items()},
+            "start_us": (time.perf_counter() - self._origin) * 1e6,
+        }
+        if device is not None and device.type == "cuda":
+            start, end = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+            start.record()
+        self._depth += 1
+        try:
+            out = fn(*args, **kwargs)
+        finally:
+            self._depth -= 1
+        if device is not None and device.type == "cuda":
+            end.record()
+            record["events"] = (start, end)
+        else:
+            record["duration_us"] = (time.perf_counter() - self._origin) * 1e6 - record["start_us"]
+        record["backend"] = self._backend
+        self.records.append(record)
+        return out
+
+    def calls(self) -> List[Dict[str, Any]]:
+        """
+        The records as JSON-serializable dicts, oldest first. Synchronizes with the device if any call ran on cuda.
+        """
+        calls = []
+        for record in self.records:
+            record = dict(record)
+            events = record.pop("events", None)
+            if events is not None:
+                events[1].synchronize()
+                record["duration_us"] = events[0].elapsed_time(events[1]) * 1e3
+            record["arguments"] = _resolve(record["arguments"])
+            calls.append(record)
+        return calls
+
+    def save(self, path: str):
+        """
+        Write the records to `path` as JSON, the input of ``python -m sageattention.trace replay``.
+        """
+        with open(path, "w") as f:
+            json.dump({"calls": self.calls()}, f)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """
+        The records as Chrome trace events, for chrome://tracing or Perfetto.
+        """
+        events = []
+        for call in self.calls():
+            events.append({
+                "name": call["entry_point"],
+                "cat": "attention",
+                "ph": "X",
+                "ts": call["start_us"],
+                "dur": call["duration_us"],
+                "pid": 0,
+                "tid": 0,
+                "args": {"backend": call["backend"], **call["arguments"]},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path: str):
+        """
+        Write the records to `path` as Chrome trace events.
+        """
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def _synthesize(desc, device, generator):
+    if isinstance(desc, list):
+        return [_synthesize(x, device, generator) for x in desc]
+    if not isinstance(desc, dict):
+        return desc
+    dtype = getattr(torch, desc["dtype"])
+    if "values" in desc:
+        return torch.tensor(desc["values"], dtype=dtype, device=device)
+    if dtype == torch.bool:
+        # keep every key, so that no row is fully masked
+        return torch.ones(desc["shape"], dtype=dtype, device=device)
+    return torch.randn(desc["shape"], generator=generator).to(device=device, dtype=dtype)
+
+
+def replay(calls: List[Dict[str, Any]], device=None, entry_point: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None,
+           warmups: int = 1, repeats: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """
+    Run the recorded `calls` in order on synthetic tensors of the recorded shapes, and time the whole mix.
+
+    `entry_point` replaces the recorded entry point of every call with another function of :mod:`sageattention.core`,
+    and `overrides` replaces or adds keyword arguments; arguments the entry point does not take are dropped,
+    as are the objects recorded by their type name.
+    Returns the median time of the mix and the time per entry point and shape, in milliseconds.
+    """
+    from . import core
+    from .bench import measure, percentile
+    device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+
+    # the tensors of calls with the same arguments are shared
+    inputs = {}
+    prepared = []
+    for call in calls:
+        fn = getattr(core, entry_point or call["entry_point"])
+        arguments = dict(_synthesizable(call["arguments"]), **(overrides or {}))
+        parameters = inspect.signature(fn).parameters
+        if not any(p.kind == p.VAR_KEYWORD for p in parameters.values()):
+            arguments = {name: value for name, value in arguments.items() if name in parameters}
+        key = json.dumps(arguments, sort_keys=True)
+        if key not in inputs:
+            inputs[key] = {name: _synthesize(value, device, generator) for name, value in arguments.items()}
+        prepared.append((fn, key))
+
+    def run_all():
+        for fn, key in prepared:
+            fn(**inputs[key])
+
+    times = measure(run_all, device, warmups=warmups, repeats=repeats)
+
+    # the time of every distinct call, once
+    per_call = []
+    for key in dict.fromkeys(key for _, key in prepared):
+        fn = next(fn for fn, k in prepared if k == key)
+        count = sum(k == key for _, k in prepared)
+        call_times = measure(lambda: fn(**inputs[key]), device, warmups=warmups, repeats=repeats)
+        per_call.append({"entry_point": fn.__name__, "arguments": json.loads(key), "count": count, "median_ms": percentile(call_times, 50)})
+
+    return {"calls": len(calls), "median_ms": percentile(times, 50), "min_ms": min(times), "per_call": per_call}
+
+
+def _parse_override(text):
+    name, _, value = text.partition("=")
+    try:
+        return name, json.loads(value)
+    except json.JSONDecodeError:
+        return name, value
+
+
+def cmd_replay(args):
+    with open(args.trace) as f:
+        calls = json.load(f)["calls"]
+    overrides = dict(_parse_override(text) for text in args.set)
+    result = replay(calls, device=args.device, entry_point=args.entry_point, overrides=overrides,
+                    warmups=args.warmups, repeats=args.repeats, seed=args.seed)
+    for row in result["per_call"]:
+        shapes = " ".join(f"{name}={value['shape']}" for name, value in row["arguments"].items() if isinstance(value, dict))
+        print(f"{row['entry_point']} {shapes}: {row['count']} x {row['median_ms']:.4f} ms", file=sys.stderr)
+    print(f"{result['calls']} calls: median {result['median_ms']:.4f} ms", file=sys.stderr)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sageattention.trace", description="Replay recorded attention calls.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rep = subparsers.add_parser("replay", help="Time the call mix of a trace written by CallTracer.save.")
+    rep.add_argument("trace")
+    rep.add_argument("--entry-point", default=None, help="Run every call with this function of sageattention.core instead.")
+    rep.add_argument("--set", nargs="*", default=[], metavar="NAME=VALUE", help="Replace or add a keyword argument, the value parsed as JSON if possible.")
+    rep.add_argument("--warmups", type=int, default=1)
+    rep.add_argument("--repeats", type=int, default=5)
+    rep.add_argument("--seed", type=int, default=0)
+    rep.add_argument("--device", default=None, help="Default: cuda if available, else cpu.")
+    rep.add_argument("--out", default=None, help="The JSON report. Default: stdout.")
+    rep.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
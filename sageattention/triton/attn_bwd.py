@@ -0,0 +1,231 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+import triton
+import triton.language as tl
+
+@triton.jit(do_not_specialize=["qo_len"])
+def _attn_bwd_preprocess(O, DO, Delta,
+                         stride_oz, stride_oh, stride_on,
+                         stride_doz, stride_doh, stride_don,
+                         qo_len, H: tl.constexpr,
+                         HEAD_DIM: tl.constexpr,
+                         BLOCK_M: tl.constexpr,
+                         ):
+    start_m = tl.program_id(0)
+    off_h = tl.program_id(1).to(tl.int64)
+    off_z = tl.program_id(2).to(tl.int64)
+
+    offs_m = start_m * BLOCK_M + tl.arange(0, BLOCK_M)
+    offs_k = tl.arange(0, HEAD_DIM)
+
+    o = tl.load(O + off_z * stride_oz + off_h * stride_oh + offs_m[:, None] * stride_on + offs_k[None, :], mask=offs_m[:, None] < qo_len, other=0.0)
+    do = tl.load(DO + off_z * stride_doz + off_h * stride_doh + offs_m[:, None] * stride_don + offs_k[None, :], mask=offs_m[:, None] < qo_len, other=0.0)
+    delta = tl.sum(o.to(tl.float32) * do.to(tl.float32), axis=1)
+    tl.store(Delta + (off_z * H + off_h) * qo_len + offs_m, delta, mask=offs_m < qo_len)
+
+@triton.jit(do_not_specialize=["qo_len", "kv_len"])
+def _attn_bwd_dkdv(Q, K, V, DO, DK, DV, Lse, Delta,
+                   stride_qz, stride_qh, stride_qn,
+                   stride_kz, stride_kh, stride_kn,
+                   stride_vz, stride_vh, stride_vn,
+                   stride_doz, stride_doh, stride_don,
+                   stride_dkz, stride_dkh, stride_dkn,
+                   stride_dvz, stride_dvh, stride_dvn,
+                   qo_len, kv_len, sm_scale,
+                   H: tl.constexpr, num_kv_groups: tl.constexpr,
+                   HEAD_DIM: tl.constexpr,
+                   BLOCK_M: tl.constexpr,
+                   BLOCK_N: tl.constexpr,
+                   IS_CAUSAL: tl.constexpr,
+                   ):
+    start_n = tl.program_id(0)
+    off_h = tl.program_id(1).to(tl.int64)
+    off_z = tl.program_id(2).to(tl.int64)
+
+    offs_n = start_n * BLOCK_N + tl.arange(0, BLOCK_N)
+    offs_m = tl.arange(0, BLOCK_M)
+    offs_k = tl.arange(0, HEAD_DIM)
+
+    Q_ptrs = Q + off_z * stride_qz + off_h * stride_qh + offs_m[:, None] * stride_qn + offs_k[None, :]
+    DO_ptrs = DO + off_z * stride_doz + off_h * stride_doh + offs_m[:, None] * stride_don + offs_k[None, :]
+    K_ptrs = K + off_z * stride_kz + (off_h // num_kv_groups) * stride_kh + offs_n[:, None] * stride_kn + offs_k[None, :]
+    V_ptrs = V + off_z * stride_vz + (off_h // num_kv_groups) * stride_vh + offs_n[:, None] * stride_vn + offs_k[None, :]
+    Lse_ptr = Lse + (off_z * H + off_h) * qo_len
+    Delta_ptr = Delta + (off_z * H + off_h) * qo_len
+
+    k = tl.load(K_ptrs, mask=offs_n[:, None] < kv_len, other=0.0)
+    v = tl.load(V_ptrs, mask=offs_n[:, None] < kv_len, other=0.0)
+
+    dk = tl.zeros([BLOCK_N, HEAD_DIM], dtype=tl.float32)
+    dv = tl.zeros([BLOCK_N, HEAD_DIM], dtype=tl.float32)
+
+    # lse is in log2 units, same as the forward kernels
+    qk_scale = sm_scale * 1.44269504
+    causal_offset = kv_len - qo_len
+
+    lo = 0
+    if IS_CAUSAL:
+        # query blocks above the diagonal do not attend to this key block
+        lo = tl.maximum(start_n * BLOCK_N - causal_offset, 0) // BLOCK_M * BLOCK_M
+    for start_m in range(lo, qo_len, BLOCK_M):
+        start_m = tl.multiple_of(start_m, BLOCK_M)
+        q_mask = (start_m + offs_m) < qo_len
+        q = tl.load(Q_ptrs + start_m * stride_qn, mask=q_mask[:, None], other=0.0)
+        do = tl.load(DO_ptrs + start_m * stride_don, mask=q_mask[:, None], other=0.0)
+        lse = tl.load(Lse_ptr + start_m + offs_m, mask=q_mask, other=0.0)
+        delta = tl.load(Delta_ptr + start_m + offs_m, mask=q_mask, other=0.0)
+
+        qkT = tl.dot(k, tl.trans(q)).to(tl.float32) * qk_scale
+        mask = q_mask[None, :] & (offs_n[:, None] < kv_len)
+        if IS_CAUSAL:
+            mask &= (start_m + offs_m[None, :] + causal_offset) >= offs_n[:, None]
+        pT = tl.where(mask, tl.math.exp2(qkT - lse[None, :]), 0.0)
+
+        dv += tl.dot(pT.to(do.dtype), do)
+        dpT = tl.dot(v, tl.trans(do)).to(tl.float32)
+        dsT = pT * (dpT - delta[None, :])
+        dk += tl.dot(dsT.to(q.dtype), q)
+
+    dk *= sm_scale
+
+    DK_ptrs = DK + off_z * stride_dkz + off_h * stride_dkh + offs_n[:, None] * stride_dkn + offs_k[None, :]
+    DV_ptrs = DV + off_z * stride_dvz + off_h * stride_dvh + offs_n[:, None] * stride_dvn + offs_k[None, :]
+    tl.store(DK_ptrs, dk.to(DK.type.element_ty), mask=offs_n[:, None] < kv_len)
+    tl.store(DV_ptrs, dv.to(DV.type.element_ty), mask=offs_n[:, None] < kv_len)
+
+@triton.jit(do_not_specialize=["qo_len", "kv_len"])
+def _attn_bwd_dq(Q, K, V, DO, DQ, Lse, Delta,
+                 stride_qz, stride_qh, stride_qn,
+                 stride_kz, stride_kh, stride_kn,
+                 stride_vz, stride_vh, stride_vn,
+                 stride_doz, stride_doh, stride_don,
+                 stride_dqz, stride_dqh, stride_dqn,
+                 qo_len, kv_len, sm_scale,
+                 H: tl.constexpr, num_kv_groups: tl.constexpr,
+                 HEAD_DIM: tl.constexpr,
+                 BLOCK_M: tl.constexpr,
+                 BLOCK_N: tl.constexpr,
+                 IS_CAUSAL: tl.constexpr,
+                 ):
+    start_m = tl.program_id(0)
+    off_h = tl.program_id(1).to(tl.int64)
+    off_z = tl.program_id(2).to(tl.int64)
+
+    offs_m = start_m * BLOCK_M + tl.arange(0, BLOCK_M)
+    offs_n = tl.arange(0, BLOCK_N)
+    offs_k = tl.arange(0, HEAD_DIM)
+    q_mask = offs_m < qo_len
+
+    q = tl.load(Q + off_z * stride_qz + off_h * stride_qh + offs_m[:, None] * stride_qn + offs_k[None, :], mask=q_mask[:, None], other=0.0)
+    do = tl.load(DO + off_z * stride_doz + off_h * stride_doh + offs_m[:, None] * stride_don + offs_k[None, :], mask=q_mask[:, None], other=0.0)
+    lse = tl.load(Lse + (off_z * H + off_h) * qo_len + offs_m, mask=q_mask, other=0.0)
+    delta = tl.load(Delta + (off_z * H + off_h) * qo_len + offs_m, mask=q_mask, other=0.0)
+
+    K_ptrs = K + off_z * stride_kz + (off_h // num_kv_groups) * stride_kh + offs_n[:, None] * stride_kn + offs_k[None, :]
+    V_ptrs = V + off_z * stride_vz + (off_h // num_kv_groups) * stride_vh + offs_n[:, None] * stride_vn + offs_k[None, :]
+
+    dq = tl.zeros([BLOCK_M, HEAD_DIM], dtype=tl.float32)
+
+    qk_scale = sm_scale * 1.44269504
+    causal_offset = kv_len - qo_len
+
+    hi = kv_len
+    if IS_CAUSAL:
+        hi = tl.minimum(kv_len, (start_m + 1) * BLOCK_M + causal_offset)
+    for start_n in range(0, hi, BLOCK_N):
+        start_n = tl.multiple_of(start_n, BLOCK_N)
+        k_mask = (start_n + offs_n) < kv_len
+        k = tl.load(K_ptrs + start_n * stride_kn, mask=k_mask[:, None], other=0.0)
+        v = tl.load(V_ptrs + start_n * stride_vn, mask=k_mask[:, None], other=0.0)
+
+        qk = tl.dot(q, tl.trans(k)).to(tl.float32) * qk_scale
+        mask = q_mask[:, None] & k_mask[None, :]
+        if IS_CAUSAL:
+            mask &= (offs_m[:, None] + causal_offset) >= (start_n + offs_n[None, :])
+        p = tl.where(mask, tl.math.exp2(qk - lse[:, None]), 0.0)
+
+        dp = tl.dot(do, tl.trans(v)).to(tl.float32)
+        ds = p * (dp - delta[:, None])
+        dq += tl.dot(ds.to(k.dtype), k)
+
+    dq *= sm_scale
+    tl.store(DQ + off_z * stride_dqz + off_h * stride_dqh + offs_m[:, None] * stride_dqn + offs_k[None, :], dq.to(DQ.type.element_ty), mask=q_mask[:, None])
+
+def backward(do, q, k, v, o, lse, sm_scale, is_causal=False):
+    """
+    Gradients of attention with respect to `q`, `k` and `v`, all in "HND" layout, recomputing the attention
+    probabilities from `lse` (in log2 units, as returned by the forward kernels) in the FlashAttention-2 way.
+    """
+    BLOCK_M = 64
+    BLOCK_N = 64
+
+    b, h_qo, qo_len, head_dim = q.shape
+    _, h_kv, kv_len, _ = k.shape
+    num_kv_groups = h_qo // h_kv
+
+    delta = torch.empty((b, h_qo, qo_len), dtype=torch.float32, device=q.device)
+    dq = torch.empty(q.shape, dtype=q.dtype, device=q.device)
+    # every query head writes its own key and value gradients, which are summed over the group afterwards
+    dk = torch.empty((b, h_qo, kv_len, head_dim), dtype=torch.float32 if num_kv_groups > 1 else k.dtype, device=k.device)
+    dv = torch.empty((b, h_qo, kv_len, head_dim), dtype=torch.float32 if num_kv_groups > 1 else v.dtype, device=v.device)
+
+    grid = (triton.cdiv(qo_len, BLOCK_M), h_qo, b)
+    _attn_bwd_preprocess[grid](
+        o, do, delta,
+        o.stride(0), o.stride(1), o.stride(2),
+        do.stride(0), do.stride(1), do.stride(2),
+        qo_len, h_qo,
+        HEAD_DIM=head_dim, BLOCK_M=BLOCK_M,
+    )
+
+    grid = (triton.cdiv(kv_len, BLOCK_N), h_qo, b)
+    _attn_bwd_dkdv[grid](
+        q, k, v, do, dk, dv, lse, delta,
+        q.stride(0), q.stride(1), q.stride(2),
+        k.stride(0), k.stride(1), k.stride(2),
+        v.stride(0), v.stride(1), v.stride(2),
+        do.stride(0), do.stride(1), do.stride(2),
+        dk.stride(0), dk.stride(1), dk.stride(2),
+        dv.stride(0), dv.stride(1), dv.stride(2),
+        qo_len, kv_len, sm_scale,
+        h_qo, num_kv_groups,
+        HEAD_DIM=head_dim, BLOCK_M=BLOCK_M, BLOCK_N=BLOCK_N,
+        IS_CAUSAL=is_causal,
+        num_warps=4, num_stages=2,
+    )
+
+    grid = (triton.cdiv(qo_len, BLOCK_M), h_qo, b)
+    _attn_bwd_dq[grid](
+        q, k, v, do, dq, lse, delta,
+        q.stride(0), q.stride(1), q.stride(2),
+        k.stride(0), k.stride(1), k.stride(2),
+        v.stride(0), v.stride(1), v.stride(2),
+        do.stride(0), do.stride(1), do.stride(2),
+        dq.stride(0), dq.stride(1), dq.stride(2),
+        qo_len, kv_len, sm_scale,
+        h_qo, num_kv_groups,
+        HEAD_DIM=head_dim, BLOCK_M=BLOCK_M, BLOCK_N=BLOCK_N,
+        IS_CAUSAL=is_causal,
+        num_warps=4, num_stages=2,
+    )
+
+    if num_kv_groups > 1:
+        dk = dk.view(b, h_kv, num_kv_groups, kv_len, head_dim).sum(2).to(k.dtype)
+        dv = dv.view(b, h_kv, num_kv_groups, kv_len, head_dim).sum(2).to(v.dtype)
+
+    return dq, dk, dv
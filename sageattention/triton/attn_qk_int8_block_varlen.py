@@ -46,7 +46,7 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
         
         acc = acc * alpha[:, None]
         
-        v = tl.load(V_ptrs, mask = offs_n[:, None] < (kv_len - start_n))
+        v = tl.load(V_ptrs, mask = offs_n[:, None] < (kv_len - start_n)).to(tl.float16)
         p = p.to(tl.float16)
         
         acc += tl.dot(p, v, out_dtype=tl.float16)   
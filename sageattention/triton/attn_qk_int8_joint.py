@@ -0,0 +1,180 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+import triton
+import triton.language as tl
+
+@triton.jit
+def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
+                    K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
+                    BLOCK_M: tl.constexpr, HEAD_DIM: tl.constexpr, BLOCK_N: tl.constexpr,
+                    offs_n: tl.constexpr,
+                    ):
+    # the keys of a segment are stored padded to a multiple of BLOCK_N
+    for start_n in range(0, kv_len, BLOCK_N):
+        start_n = tl.multiple_of(start_n, BLOCK_N)
+        k_mask = offs_n[None, :] < (kv_len - start_n)
+        k = tl.load(K_ptrs, mask=k_mask)
+        k_scale = tl.load(K_scale_ptr)
+
+        qk = tl.dot(q, k).to(tl.float32) * (q_scale * k_scale)
+        qk += tl.where(k_mask, 0, -1.0e6)
+
+        m_ij = tl.maximum(m_i, tl.max(qk, 1))
+        qk = qk - m_ij[:, None]
+        p = tl.math.exp2(qk)
+        l_ij = tl.sum(p, 1)
+
+        alpha = tl.math.exp2(m_i - m_ij)
+        l_i = l_i * alpha + l_ij
+
+        acc = acc * alpha[:, None]
+
+        v = tl.load(V_ptrs, mask=offs_n[:, None] < (kv_len - start_n), other=0.0).to(tl.float16)
+        p = p.to(tl.float16)
+
+        acc += tl.dot(p, v, out_dtype=tl.float16)
+        m_i = m_ij
+        K_ptrs += BLOCK_N * stride_kn
+        K_scale_ptr += 1
+        V_ptrs += BLOCK_N * stride_vn
+    return acc, l_i, m_i
+
+@triton.jit(do_not_specialize=["num_q_blocks", "num_k_blocks", "num_q_segments", "num_segments"])
+def _attn_fwd(Q, K, V, Q_scale, K_scale, Out,
+              Seg_q, Seg_k, Seg_v, Seg_o,
+              stride_qz, stride_qh, stride_qn,
+              stride_kz, stride_kh, stride_kn,
+              num_q_blocks, num_k_blocks, num_q_segments, num_segments,
+              H: tl.constexpr, num_kv_groups: tl.constexpr,
+              HEAD_DIM: tl.constexpr,
+              BLOCK_M: tl.constexpr,
+              BLOCK_N: tl.constexpr,
+              SUM_SEGMENTS: tl.constexpr,
+              ):
+    start_m = tl.program_id(0)
+
+    off_z = tl.program_id(2).to(tl.int64)
+    off_h = tl.program_id(1).to(tl.int64)
+
+    # Seg_q and Seg_k hold the padded start and the length of each segment in the quantized buffers,
+    # Seg_v and Seg_o hold the element offset from V and Out and the batch, head and sequence strides of each segment
+    seg = 0
+    for s in range(1, num_q_segments):
+        seg += (tl.load(Seg_q + s * 2) <= start_m * BLOCK_M).to(tl.int32)
+    q_start = tl.load(Seg_q + seg * 2)
+    qo_len = tl.load(Seg_q + seg * 2 + 1)
+
+    offs_m = start_m * BLOCK_M + tl.arange(0, BLOCK_M)
+    offs_m_seg = offs_m - q_start
+    offs_n = tl.arange(0, BLOCK_N)
+    offs_k = tl.arange(0, HEAD_DIM)
+
+    m_i = tl.zeros([BLOCK_M], dtype=tl.float32) - float("inf")
+    l_i = tl.zeros([BLOCK_M], dtype=tl.float32) + 1.0
+    acc = tl.zeros([BLOCK_M, HEAD_DIM], dtype=tl.float32)
+    if SUM_SEGMENTS:
+        o_acc = tl.zeros([BLOCK_M, HEAD_DIM], dtype=tl.float32)
+
+    Q_ptrs = Q + (off_z * stride_qz + off_h * stride_qh) + offs_m[:, None] * stride_qn + offs_k[None, :]
+    q = tl.load(Q_ptrs, mask = offs_m_seg[:, None] < qo_len)
+    q_scale = tl.load(Q_scale + (off_z * H + off_h) * num_q_blocks + start_m)
+
+    off_h_kv = off_h // num_kv_groups
+    # all segments form one sequence of keys, or with SUM_SEGMENTS each has its own softmax and the outputs are summed
+    for s in range(0, num_segments):
+        k_start = tl.load(Seg_k + s * 2)
+        kv_len = tl.load(Seg_k + s * 2 + 1)
+        v_offset = tl.load(Seg_v + s * 4)
+        stride_vz = tl.load(Seg_v + s * 4 + 1)
+        stride_vh = tl.load(Seg_v + s * 4 + 2)
+        stride_vn = tl.load(Seg_v + s * 4 + 3)
+
+        K_ptrs = K + (off_z * stride_kz + off_h_kv * stride_kh) + (k_start + offs_n[None, :]) * stride_kn + offs_k[:, None]
+        K_scale_ptr = K_scale + (off_z * (H // num_kv_groups) + off_h_kv) * num_k_blocks + k_start // BLOCK_N
+        V_ptrs = V + v_offset + (off_z * stride_vz + off_h_kv * stride_vh) + offs_n[:, None] * stride_vn + offs_k[None, :]
+        acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
+                                        K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
+                                        BLOCK_M, HEAD_DIM, BLOCK_N,
+                                        offs_n
+                                        )
+        if SUM_SEGMENTS:
+            o_acc += acc / l_i[:, None]
+            m_i = tl.zeros([BLOCK_M], dtype=tl.float32) - float("inf")
+            l_i = tl.zeros([BLOCK_M], dtype=tl.float32) + 1.0
+            acc = tl.zeros([BLOCK_M, HEAD_DIM], dtype=tl.float32)
+    if SUM_SEGMENTS:
+        acc = o_acc
+    else:
+        acc = acc / l_i[:, None]
+
+    o_offset = tl.load(Seg_o + seg * 4)
+    stride_oz = tl.load(Seg_o + seg * 4 + 1)
+    stride_oh = tl.load(Seg_o + seg * 4 + 2)
+    stride_on = tl.load(Seg_o + seg * 4 + 3)
+    O_block_ptr = Out + o_offset + (off_z * stride_oz + off_h * stride_oh) + offs_m_seg[:, None] * stride_on + offs_k[None, :]
+    tl.store(O_block_ptr, acc.to(Out.type.element_ty), mask = (offs_m_seg[:, None] < qo_len))
+
+def forward(q, k, vs, q_scale, k_scale, seg_q, seg_k, outs, tensor_layout="HND", sum_segments=False):
+    """
+    `q` and `k` are the quantized segments in "HND" layout, each segment starting at a multiple of ``BLOCK_M`` or ``BLOCK_N`` tokens,
+    as described by the ``[num_q_segments, 2]`` and ``[num_segments, 2]`` (start, length) tables `seg_q` and `seg_k`.
+    The values `vs` are read from, and the outputs `outs` written to, the separate tensors of each segment in `tensor_layout`.
+    With `sum_segments`, the queries attend to each key segment separately and the outputs are summed.
+    """
+    BLOCK_M = 128
+    BLOCK_N = 64
+
+    b, h_qo, _, head_dim = q.shape
+    _, h_kv, _, _ = k.shape
+    num_segments = len(vs)
+    num_q_segments = len(outs)
+
+    def segment_table(tensors):
+        # element offsets from the first tensor, so that a single base pointer reaches every segment
+        base = tensors[0]
+        rows = []
+        for t in tensors:
+            offset = (t.data_ptr() - base.data_ptr()) // t.element_size()
+            if tensor_layout == "HND":
+                rows.append([offset, t.stride(0), t.stride(1), t.stride(2)])
+            elif tensor_layout == "NHD":
+                rows.append([offset, t.stride(0), t.stride(2), t.stride(1)])
+            else:
+                raise ValueError(f"tensor_layout {tensor_layout} not supported")
+        return torch.tensor(rows, dtype=torch.int64).to(base.device, non_blocking=True)
+
+    seg_v = segment_table(vs)
+    seg_o = segment_table(outs)
+
+    HEAD_DIM_K = head_dim
+    num_kv_groups = h_qo // h_kv
+
+    grid = (q.size(2) // BLOCK_M, h_qo, b)
+    _attn_fwd[grid](
+        q, k, vs[0], q_scale, k_scale, outs[0],
+        seg_q, seg_k, seg_v, seg_o,
+        q.stride(0), q.stride(1), q.stride(2),
+        k.stride(0), k.stride(1), k.stride(2),
+        q_scale.size(2), k_scale.size(2), num_q_segments, num_segments,
+        h_qo, num_kv_groups,
+        BLOCK_M=BLOCK_M, BLOCK_N=BLOCK_N, HEAD_DIM=HEAD_DIM_K,
+        SUM_SEGMENTS=sum_segments,
+        num_warps=4 if head_dim == 64 else 8,
+        num_stages=3 if head_dim == 64 else 4)
+
+    return outs
@@ -0,0 +1,168 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch, math
+import triton
+import triton.language as tl
+
+@triton.jit
+def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, frame_tokens,
+                    K_ptrs, K_scale_ptr, V_ptrs, V_scale_ptr, stride_kn, stride_vn,
+                    BLOCK_M: tl.constexpr, HEAD_DIM: tl.constexpr, BLOCK_N: tl.constexpr,
+                    offs_n: tl.constexpr,
+                    ):
+    # tokens of a frame are stored in a slot padded to a multiple of BLOCK_N
+    for start_n in range(0, frame_tokens, BLOCK_N):
+        start_n = tl.multiple_of(start_n, BLOCK_N)
+        k_mask = offs_n[None, :] < (frame_tokens - start_n)
+        k = tl.load(K_ptrs, mask=k_mask)
+        k_scale = tl.load(K_scale_ptr)
+
+        qk = tl.dot(q, k).to(tl.float32) * (q_scale * k_scale)
+        qk += tl.where(k_mask, 0, -1.0e6)
+
+        m_ij = tl.maximum(m_i, tl.max(qk, 1))
+        qk = qk - m_ij[:, None]
+        p = tl.math.exp2(qk)
+        l_ij = tl.sum(p, 1)
+
+        alpha = tl.math.exp2(m_i - m_ij)
+        l_i = l_i * alpha + l_ij
+
+        acc = acc * alpha[:, None]
+
+        v = tl.load(V_ptrs, mask=offs_n[:, None] < (frame_tokens - start_n), other=0.0).to(tl.float16)
+        v_scale = tl.load(V_scale_ptr)
+        p = p.to(tl.float16)
+
+        acc += tl.dot(p, v) * v_scale
+        m_i = m_ij
+        K_ptrs += BLOCK_N * stride_kn
+        K_scale_ptr += 1
+        V_ptrs += BLOCK_N * stride_vn
+        V_scale_ptr += 1
+    return acc, l_i, m_i
+
+@triton.jit(do_not_specialize=["stride_ksz", "stride_ksh", "stride_vsz", "stride_vsh", "qo_len", "frame_tokens", "first_slot", "num_frames", "num_slots"])
+def _attn_fwd(Q, K, V, Q_scale, K_scale, V_scale, Out, Lse,
+              stride_qz, stride_qh, stride_qn,
+              stride_kz, stride_kh, stride_kn,
+              stride_vz, stride_vh, stride_vn,
+              stride_oz, stride_oh, stride_on,
+              stride_ksz, stride_ksh,
+              stride_vsz, stride_vsh,
+              qo_len, frame_tokens, first_slot, num_frames, num_slots,
+              H: tl.constexpr, num_kv_groups: tl.constexpr,
+              HEAD_DIM: tl.constexpr,
+              BLOCK_M: tl.constexpr,
+              BLOCK_N: tl.constexpr,
+              RETURN_LSE: tl.constexpr,
+              ):
+    start_m = tl.program_id(0)
+
+    off_z = tl.program_id(2).to(tl.int64)
+    off_h = tl.program_id(1).to(tl.int64)
+
+    q_scale_offset = (off_z * H + off_h) * tl.cdiv(qo_len, BLOCK_M)
+    blocks_per_slot = tl.cdiv(frame_tokens, BLOCK_N)
+    slot_tokens = blocks_per_slot * BLOCK_N
+
+    offs_m = start_m * BLOCK_M + tl.arange(0, BLOCK_M)
+    offs_n = tl.arange(0, BLOCK_N)
+    offs_k = tl.arange(0, HEAD_DIM)
+    Q_ptrs = Q + (off_z * stride_qz + off_h * stride_qh) + offs_m[:, None] * stride_qn + offs_k[None, :]
+    Q_scale_ptr = Q_scale + q_scale_offset + start_m
+    K_base = K + (off_z * stride_kz + (off_h // num_kv_groups) * stride_kh) + offs_n[None, :] * stride_kn + offs_k[:, None]
+    K_scale_base = K_scale + off_z * stride_ksz + (off_h // num_kv_groups) * stride_ksh
+    V_base = V + (off_z * stride_vz + (off_h // num_kv_groups) * stride_vh) + offs_n[:, None] * stride_vn + offs_k[None, :]
+    V_scale_base = V_scale + off_z * stride_vsz + (off_h // num_kv_groups) * stride_vsh
+    O_block_ptr = Out + (off_z * stride_oz + off_h * stride_oh) + offs_m[:, None] * stride_on + offs_k[None, :]
+
+    m_i = tl.zeros([BLOCK_M], dtype=tl.float32) - float("inf")
+    l_i = tl.zeros([BLOCK_M], dtype=tl.float32) + 1.0
+    acc = tl.zeros([BLOCK_M, HEAD_DIM], dtype=tl.float32)
+
+    q = tl.load(Q_ptrs, mask = offs_m[:, None] < qo_len)
+    q_scale = tl.load(Q_scale_ptr)
+    # visit the frames from the oldest to the newest, wrapping around the end of the ring
+    for i in range(0, num_frames):
+        slot = (first_slot + i) % num_slots
+        acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, frame_tokens,
+                                        K_base + slot * slot_tokens * stride_kn, K_scale_base + slot * blocks_per_slot,
+                                        V_base + slot * slot_tokens * stride_vn, V_scale_base + slot * blocks_per_slot,
+                                        stride_kn, stride_vn,
+                                        BLOCK_M, HEAD_DIM, BLOCK_N,
+                                        offs_n
+                                        )
+    acc = acc / l_i[:, None]
+    tl.store(O_block_ptr, acc.to(Out.type.element_ty), mask = (offs_m[:, None] < qo_len))
+
+    if RETURN_LSE:
+        lse_ptrs = Lse + (off_z * qo_len * H + off_h * qo_len) + offs_m
+        l_i = tl.log2(l_i) + m_i
+        tl.store(lse_ptrs, l_i, mask = (offs_m < qo_len))
+
+def forward(q, k, v, q_scale, k_scale, v_scale, frame_tokens, first_slot, num_frames, tensor_layout="HND", output_dtype=torch.float16, return_lse=False):
+    """
+    `k`, `v` are the ring storage in "HND" layout with one slot of ``cdiv(frame_tokens, BLOCK_N) * BLOCK_N`` tokens per frame.
+    `k_scale` and `v_scale` hold one scale per ``BLOCK_N`` tokens of each slot.
+    """
+    BLOCK_M = 128
+    BLOCK_N = 64
+
+    o = torch.empty(q.shape, dtype=output_dtype, device=q.device)
+
+    if tensor_layout == "HND":
+        b, h_qo, qo_len, head_dim = q.shape
+
+        stride_bz_q, stride_h_q, stride_seq_q = q.stride(0), q.stride(1), q.stride(2)
+        stride_bz_o, stride_h_o, stride_seq_o = o.stride(0), o.stride(1), o.stride(2)
+    elif tensor_layout == "NHD":
+        b, qo_len, h_qo, head_dim = q.shape
+
+        stride_bz_q, stride_h_q, stride_seq_q = q.stride(0), q.stride(2), q.stride(1)
+        stride_bz_o, stride_h_o, stride_seq_o = o.stride(0), o.stride(2), o.stride(1)
+    else:
+        raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+    _, h_kv, kv_capacity, _ = k.shape
+    num_slots = kv_capacity // (triton.cdiv(frame_tokens, BLOCK_N) * BLOCK_N)
+
+    HEAD_DIM_K = head_dim
+    num_kv_groups = h_qo // h_kv
+
+    if return_lse:
+        lse = torch.empty([b, h_qo, qo_len], dtype=torch.float32, device=q.device)
+    else:
+        lse = torch.empty([0], dtype=torch.float32, device='cpu')
+
+    grid = (triton.cdiv(qo_len, BLOCK_M), h_qo, b)
+    _attn_fwd[grid](
+        q, k, v, q_scale, k_scale, v_scale, o, lse,
+        stride_bz_q, stride_h_q, stride_seq_q,
+        k.stride(0), k.stride(1), k.stride(2),
+        v.stride(0), v.stride(1), v.stride(2),
+        stride_bz_o, stride_h_o, stride_seq_o,
+        k_scale.stride(0), k_scale.stride(1),
+        v_scale.stride(0), v_scale.stride(1),
+        qo_len, frame_tokens, first_slot, num_frames, num_slots,
+        h_qo, num_kv_groups,
+        BLOCK_M=BLOCK_M, BLOCK_N=BLOCK_N, HEAD_DIM=HEAD_DIM_K,
+        RETURN_LSE=return_lse,
+        num_warps=4 if head_dim == 64 else 8,
+        num_stages=3 if head_dim == 64 else 4)
+
+    return o, lse
@@ -22,6 +22,7 @@ import triton.language as tl
 def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, qo_len, kv_len,
                     K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn, 
                     start_m, mask_ptrs, stride_maskn,
+                    alibi_slope, q_pos, K_pos, Rel_table_ptr, rel_table_len, rel_center,
                     BLOCK_M: tl.constexpr, HEAD_DIM: tl.constexpr, BLOCK_N: tl.constexpr,  
                     STAGE: tl.constexpr, offs_m: tl.constexpr, offs_n: tl.constexpr,  
                     ):
@@ -31,7 +32,14 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, qo_len, kv_len,
         mask_block = None
         skip = False
         if mask_ptrs is not None:
-            if mask_ptrs.dtype.element_ty == tl.int1:
+            if mask_ptrs.dtype.element_ty == tl.int32:
+                # bit-packed mask, bit i % 32 of word i // 32 holds key i
+                key_idx = start_n + offs_n[None, :]
+                mask_words = tl.load(mask_ptrs + (key_idx // 32) * stride_maskn, mask=(offs_m[:, None] < qo_len) & (offs_n[None, :] < kv_len - start_n), other=0)
+                mask_block = ((mask_words >> (key_idx % 32)) & 1) != 0
+                if tl.max(mask_block) == 0:
+                    skip = True
+            elif mask_ptrs.dtype.element_ty == tl.int1:
                 mask_block = tl.load(mask_ptrs + start_n * stride_maskn, mask=(offs_m[:, None] < qo_len) & (offs_n[None, :] < kv_len - start_n), other=False)
                 if tl.max(mask_block) == 0:
                     skip = True
@@ -43,6 +51,15 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, qo_len, kv_len,
             k_scale = tl.load(K_scale_ptr)
 
             qk = tl.dot(q, k).to(tl.float32) * (q_scale * k_scale)
+
+            # the bias is in natural log units while qk is scaled by log2(e)
+            if alibi_slope is not None:
+                # the distance is measured from the bottom-right corner, same as the causal mask
+                qk -= alibi_slope * tl.abs(offs_m[:, None] + (kv_len - qo_len) - (start_n + offs_n[None, :])).to(tl.float32)
+            if q_pos is not None:
+                k_pos = tl.load(K_pos + start_n + offs_n, mask=offs_n < (kv_len - start_n), other=0)
+                rel_idx = tl.minimum(tl.maximum(q_pos[:, None] - k_pos[None, :] + rel_center, 0), rel_table_len - 1)
+                qk += tl.load(Rel_table_ptr + rel_idx).to(tl.float32) * 1.44269504
             
             if mask_block is not None:
                 if mask_block.dtype == tl.int1:
@@ -62,7 +79,7 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, qo_len, kv_len,
             
             acc = acc * alpha[:, None]
             
-            v = tl.load(V_ptrs, mask = offs_n[:, None] < (kv_len - start_n))
+            v = tl.load(V_ptrs, mask = offs_n[:, None] < (kv_len - start_n)).to(tl.float16)
             p = p.to(tl.float16)
             
             acc += tl.dot(p, v, out_dtype=tl.float16)   
@@ -72,13 +89,15 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, qo_len, kv_len,
         V_ptrs += BLOCK_N * stride_vn
     return acc, l_i, m_i
 
-@triton.jit
-def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, mask, Lse, 
+# the sequence lengths change with the resolution, specializing on them would compile a variant per shape
+@triton.jit(do_not_specialize=["stride_maskz", "stride_maskh", "stride_maskm", "rel_table_len", "rel_center", "qo_len", "kv_len"])
+def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, mask, Lse, Alibi_slopes, Rel_table, Q_pos, K_pos, Q_lengths, KV_lengths,
               stride_qz, stride_qh, stride_qn,
               stride_kz, stride_kh, stride_kn,  
-              stride_vz, stride_vh, stride_vn,  
-              stride_oz, stride_oh, stride_on, 
+              stride_vz, stride_vh, stride_vn, stride_vd,
+              stride_oz, stride_oh, stride_on, stride_od,
               stride_maskz, stride_maskh, stride_maskm, stride_maskn,
+              rel_table_len, rel_center,
               qo_len, kv_len, H: tl.constexpr, num_kv_groups: tl.constexpr,
               HEAD_DIM: tl.constexpr,  
               BLOCK_M: tl.constexpr,  
@@ -93,6 +112,15 @@ def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, mask, Lse,
 
     q_scale_offset = (off_z * H + off_h) * tl.cdiv(qo_len, BLOCK_M)
     k_scale_offset = (off_z * (H // num_kv_groups) + off_h // num_kv_groups) * tl.cdiv(kv_len, BLOCK_N)  
+
+    # tokens beyond the per-batch lengths are padding and are skipped
+    lse_offset = off_z * qo_len * H + off_h * qo_len
+    if Q_lengths is not None:
+        qo_len = tl.minimum(tl.load(Q_lengths + off_z), qo_len)
+        if (start_m * BLOCK_M) >= qo_len:
+            return
+    if KV_lengths is not None:
+        kv_len = tl.minimum(tl.load(KV_lengths + off_z), kv_len)
     
     offs_m = start_m * BLOCK_M + tl.arange(0, BLOCK_M)
     offs_n = tl.arange(0, BLOCK_N)
@@ -101,10 +129,12 @@ def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, mask, Lse,
     Q_scale_ptr = Q_scale + q_scale_offset + start_m
     K_ptrs = K + (off_z * stride_kz + (off_h // num_kv_groups) * stride_kh) + offs_n[None, :] * stride_kn + offs_k[:, None] 
     K_scale_ptr = K_scale + k_scale_offset
-    V_ptrs = V + (off_z * stride_vz + (off_h // num_kv_groups) * stride_vh) + offs_n[:, None] * stride_vn + offs_k[None, :]
-    O_block_ptr = Out + (off_z * stride_oz + off_h * stride_oh) + offs_m[:, None] * stride_on + offs_k[None, :]
+    V_ptrs = V + (off_z * stride_vz + (off_h // num_kv_groups) * stride_vh) + offs_n[:, None] * stride_vn + offs_k[None, :] * stride_vd
+    O_block_ptr = Out + (off_z * stride_oz + off_h * stride_oh) + offs_m[:, None] * stride_on + offs_k[None, :] * stride_od
     if mask is None:
         mask_ptrs = None
+    elif mask.dtype.element_ty == tl.int32:
+        mask_ptrs = mask + (off_z * stride_maskz + off_h * stride_maskh) + offs_m[:, None] * stride_maskm
     else:
         mask_ptrs = mask + (off_z * stride_maskz + off_h * stride_maskh) + offs_m[:, None] * stride_maskm + offs_n[None, :] * stride_maskn
 
@@ -114,8 +144,21 @@ def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, mask, Lse,
     
     q = tl.load(Q_ptrs, mask = offs_m[:, None] < qo_len)
     q_scale = tl.load(Q_scale_ptr)
+
+    if Alibi_slopes is None:
+        alibi_slope = None
+    else:
+        alibi_slope = tl.load(Alibi_slopes + off_h).to(tl.float32) * 1.44269504
+    if Rel_table is None:
+        q_pos = None
+        Rel_table_ptr = None
+    else:
+        q_pos = tl.load(Q_pos + offs_m, mask=offs_m < qo_len, other=0)
+        Rel_table_ptr = Rel_table + off_h * rel_table_len
+
     acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, qo_len, kv_len, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
                                     start_m, mask_ptrs, stride_maskn,
+                                    alibi_slope, q_pos, K_pos, Rel_table_ptr, rel_table_len, rel_center,
                                     BLOCK_M, HEAD_DIM, BLOCK_N,  
                                     4 - STAGE, offs_m, offs_n 
                                     )
@@ -123,16 +166,25 @@ def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, mask, Lse,
     tl.store(O_block_ptr, acc.to(Out.type.element_ty), mask = (offs_m[:, None] < qo_len))
 
     if RETURN_LSE:
-        lse_ptrs = Lse + (off_z * qo_len * H + off_h * qo_len) + offs_m
+        lse_ptrs = Lse + lse_offset + offs_m
         l_i = tl.log2(l_i) + m_i
         tl.store(lse_ptrs, l_i, mask = (offs_m < qo_len))
 
-def forward(q, k, v, q_scale, k_scale, tensor_layout="HND", attn_mask=None, output_dtype=torch.float16, return_lse=False):
+def forward(q, k, v, q_scale, k_scale, tensor_layout="HND", attn_mask=None, output_dtype=torch.float16, return_lse=False,
+            alibi_slopes=None, rel_pos_table=None, q_pos=None, k_pos=None, rel_pos_center=0,
+            kv_lengths=None, q_lengths=None, out=None):
     BLOCK_M = 128
     BLOCK_N = 64
     stage = 1
 
-    o = torch.empty(q.shape, dtype=output_dtype, device=q.device)
+    if out is not None:
+        # a strided view of the caller's output buffer, e.g. in a channel-first layout
+        o = out
+    elif q_lengths is not None:
+        # padded query tokens are skipped and keep a zero output
+        o = torch.zeros(q.shape, dtype=output_dtype, device=q.device)
+    else:
+        o = torch.empty(q.shape, dtype=output_dtype, device=q.device)
 
     if tensor_layout == "HND":
         b, h_qo, qo_len, head_dim = q.shape
@@ -168,12 +220,13 @@ def forward(q, k, v, q_scale, k_scale, tensor_layout="HND", attn_mask=None, outp
 
     grid = (triton.cdiv(qo_len, BLOCK_M), h_qo, b)
     _attn_fwd[grid](
-        q, k, v, q_scale, k_scale, o, attn_mask, lse,
+        q, k, v, q_scale, k_scale, o, attn_mask, lse, alibi_slopes, rel_pos_table, q_pos, k_pos, q_lengths, kv_lengths,
         stride_bz_q, stride_h_q, stride_seq_q, 
         stride_bz_k, stride_h_k, stride_seq_k,  
-        stride_bz_v, stride_h_v, stride_seq_v,  
-        stride_bz_o, stride_h_o, stride_seq_o,
+        stride_bz_v, stride_h_v, stride_seq_v, v.stride(3),
+        stride_bz_o, stride_h_o, stride_seq_o, o.stride(3),
         stride_bz_mask, stride_h_mask, stride_m_mask, stride_n_mask,
+        rel_pos_table.size(-1) if rel_pos_table is not None else 0, rel_pos_center,
         qo_len, kv_len,
         h_qo, num_kv_groups,
         BLOCK_M=BLOCK_M, BLOCK_N=BLOCK_N, HEAD_DIM=HEAD_DIM_K,  
@@ -19,17 +19,24 @@ import triton
 import triton.language as tl
 
 @triton.jit
-def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
+def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, causal_offset, frame_tokens,
                     K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn, 
                     start_m,  
+                    alibi_slope, q_pos, K_pos, Rel_table_ptr, rel_table_len, rel_center,
                     BLOCK_M: tl.constexpr, HEAD_DIM: tl.constexpr, BLOCK_N: tl.constexpr,  
                     STAGE: tl.constexpr, offs_m: tl.constexpr, offs_n: tl.constexpr,  
                     ):
+    # query i attends to all keys up to the end of the frame containing i + causal_offset, i.e. the mask is aligned to the bottom-right corner
+    # frame_tokens == 1 is the usual causal mask
+    # key blocks that lie fully below the diagonal of this query block need no mask
+    diag_lo = ((start_m * BLOCK_M + causal_offset) // frame_tokens + 1) * frame_tokens // BLOCK_N * BLOCK_N
+    # a frame may end past the last key, the unmasked scale loads of STAGE 1 must stop at the last key block
+    diag_lo = tl.minimum(diag_lo, tl.cdiv(kv_len, BLOCK_N) * BLOCK_N)
     if STAGE == 1:
-        lo, hi = 0, start_m * BLOCK_M
+        lo, hi = 0, diag_lo
     elif STAGE == 2:
-        lo, hi = start_m * BLOCK_M, (start_m + 1) * BLOCK_M
-        lo = tl.multiple_of(lo, BLOCK_M)
+        lo, hi = diag_lo, tl.minimum(((start_m + 1) * BLOCK_M - 1 + causal_offset) // frame_tokens * frame_tokens + frame_tokens, kv_len)
+        lo = tl.multiple_of(lo, BLOCK_N)
         K_scale_ptr += lo // BLOCK_N
         K_ptrs += stride_kn * lo
         V_ptrs += stride_vn * lo
@@ -40,9 +47,17 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
         k_scale = tl.load(K_scale_ptr)
         qk = tl.dot(q, k).to(tl.float32) * (q_scale * k_scale)
 
+        # the bias is in natural log units while qk is scaled by log2(e)
+        if alibi_slope is not None:
+            qk -= alibi_slope * tl.abs(offs_m[:, None] + causal_offset - (start_n + offs_n[None, :])).to(tl.float32)
+        if q_pos is not None:
+            k_pos = tl.load(K_pos + start_n + offs_n, mask=offs_n < (kv_len - start_n), other=0)
+            rel_idx = tl.minimum(tl.maximum(q_pos[:, None] - k_pos[None, :] + rel_center, 0), rel_table_len - 1)
+            qk += tl.load(Rel_table_ptr + rel_idx).to(tl.float32) * 1.44269504
+
         mask = k_mask
         if STAGE == 2:
-            mask &= offs_m[:, None] >= (start_n + offs_n[None, :])
+            mask &= ((offs_m[:, None] + causal_offset) // frame_tokens) >= ((start_n + offs_n[None, :]) // frame_tokens)
         qk += tl.where(mask, 0, float('-inf'))
         m_ij = tl.maximum(m_i, tl.max(qk, 1))
         qk -= m_ij[:, None]
@@ -55,7 +70,7 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
         
         acc = acc * alpha[:, None]
         
-        v = tl.load(V_ptrs, mask = offs_n[:, None] < (kv_len - start_n))
+        v = tl.load(V_ptrs, mask = offs_n[:, None] < (kv_len - start_n)).to(tl.float16)
         p = p.to(tl.float16)
         
         acc += tl.dot(p, v, out_dtype=tl.float16)   
@@ -65,13 +80,15 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
         V_ptrs += BLOCK_N * stride_vn
     return acc, l_i, m_i
 
-@triton.jit
-def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, Lse,
+# the sequence lengths change with the resolution, specializing on them would compile a variant per shape
+@triton.jit(do_not_specialize=["rel_table_len", "rel_center", "qo_len", "kv_len", "frame_tokens"])
+def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, Lse, Alibi_slopes, Rel_table, Q_pos, K_pos, Q_lengths, KV_lengths,
               stride_qz, stride_qh, stride_qn,
               stride_kz, stride_kh, stride_kn,  
               stride_vz, stride_vh, stride_vn,  
               stride_oz, stride_oh, stride_on,  
-              qo_len, kv_len, H:tl.constexpr, num_kv_groups:tl.constexpr, 
+              rel_table_len, rel_center,
+              qo_len, kv_len, frame_tokens, H:tl.constexpr, num_kv_groups:tl.constexpr, 
               HEAD_DIM: tl.constexpr,  
               BLOCK_M: tl.constexpr,  
               BLOCK_N: tl.constexpr,  
@@ -85,6 +102,15 @@ def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, Lse,
 
     q_scale_offset = (off_z * H + off_h) * tl.cdiv(qo_len, BLOCK_M)
     k_scale_offset = (off_z * (H // num_kv_groups) + off_h // num_kv_groups) * tl.cdiv(kv_len, BLOCK_N)  
+
+    # tokens beyond the per-batch lengths are padding and are skipped
+    lse_offset = off_z * qo_len * H + off_h * qo_len
+    if Q_lengths is not None:
+        qo_len = tl.minimum(tl.load(Q_lengths + off_z), qo_len)
+        if (start_m * BLOCK_M) >= qo_len:
+            return
+    if KV_lengths is not None:
+        kv_len = tl.minimum(tl.load(KV_lengths + off_z), kv_len)
     
     offs_m = start_m * BLOCK_M + tl.arange(0, BLOCK_M)
     offs_n = tl.arange(0, BLOCK_N)
@@ -102,14 +128,30 @@ def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, Lse,
     
     q = tl.load(Q_ptrs, mask = offs_m[:, None] < qo_len)
     q_scale = tl.load(Q_scale_ptr)
-    acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
+    # aligned to the top-left corner when the valid keys are fewer than the valid queries, as in the cuda kernels
+    causal_offset = tl.maximum(kv_len - qo_len, 0)
+
+    if Alibi_slopes is None:
+        alibi_slope = None
+    else:
+        alibi_slope = tl.load(Alibi_slopes + off_h).to(tl.float32) * 1.44269504
+    if Rel_table is None:
+        q_pos = None
+        Rel_table_ptr = None
+    else:
+        q_pos = tl.load(Q_pos + offs_m, mask=offs_m < qo_len, other=0)
+        Rel_table_ptr = Rel_table + off_h * rel_table_len
+
+    acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, causal_offset, frame_tokens, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
                                     start_m,  
+                                    alibi_slope, q_pos, K_pos, Rel_table_ptr, rel_table_len, rel_center,
                                     BLOCK_M, HEAD_DIM, BLOCK_N,  
                                     4 - STAGE, offs_m, offs_n 
                                     )
 
-    acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
+    acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, causal_offset, frame_tokens, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
                                     start_m,  
+                                    alibi_slope, q_pos, K_pos, Rel_table_ptr, rel_table_len, rel_center,
                                     BLOCK_M, HEAD_DIM, BLOCK_N,  
                                     2, offs_m, offs_n 
                                     )
@@ -117,16 +159,22 @@ def _attn_fwd(Q, K, V, Q_scale, K_scale, Out, Lse,
     tl.store(O_block_ptr, acc.to(Out.type.element_ty), mask = (offs_m[:, None] < qo_len))
 
     if RETURN_LSE:
-        lse_ptrs = Lse + (off_z * qo_len * H + off_h * qo_len) + offs_m
+        lse_ptrs = Lse + lse_offset + offs_m
         l_i = tl.log2(l_i) + m_i
         tl.store(lse_ptrs, l_i, mask = (offs_m < qo_len))
 
-def forward(q, k, v, q_scale, k_scale, tensor_layout="HND", output_dtype=torch.float16, return_lse=False):
+def forward(q, k, v, q_scale, k_scale, tensor_layout="HND", output_dtype=torch.float16, return_lse=False, frame_tokens=1,
+            alibi_slopes=None, rel_pos_table=None, q_pos=None, k_pos=None, rel_pos_center=0,
+            kv_lengths=None, q_lengths=None):
     BLOCK_M = 128
     BLOCK_N = 64
     stage = 3
 
-    o = torch.empty(q.shape, dtype=output_dtype, device=q.device)
+    if q_lengths is not None:
+        # padded query tokens are skipped and keep a zero output
+        o = torch.zeros(q.shape, dtype=output_dtype, device=q.device)
+    else:
+        o = torch.empty(q.shape, dtype=output_dtype, device=q.device)
 
     if tensor_layout == "HND":
         b, h_qo, qo_len, head_dim = q.shape
@@ -147,7 +195,7 @@ def forward(q, k, v, q_scale, k_scale, tensor_layout="HND", output_dtype=torch.f
     else:
         raise ValueError(f"tensor_layout {tensor_layout} not supported")
     
-    assert qo_len == kv_len, "qo_len and kv_len must be equal for causal attention"
+    assert qo_len <= kv_len, "qo_len must not be larger than kv_len for causal attention"
 
     HEAD_DIM_K = head_dim
     num_kv_groups = h_qo // h_kv
@@ -159,12 +207,13 @@ def forward(q, k, v, q_scale, k_scale, tensor_layout="HND", output_dtype=torch.f
 
     grid = (triton.cdiv(qo_len, BLOCK_M), h_qo, b   )
     _attn_fwd[grid](
-        q, k, v, q_scale, k_scale, o, lse,
+        q, k, v, q_scale, k_scale, o, lse, alibi_slopes, rel_pos_table, q_pos, k_pos, q_lengths, kv_lengths,
         stride_bz_q, stride_h_q, stride_seq_q, 
         stride_bz_k, stride_h_k, stride_seq_k,  
         stride_bz_v, stride_h_v, stride_seq_v,  
         stride_bz_o, stride_h_o, stride_seq_o,
-        qo_len, kv_len,
+        rel_pos_table.size(-1) if rel_pos_table is not None else 0, rel_pos_center,
+        qo_len, kv_len, frame_tokens,
         h_qo, num_kv_groups,
         BLOCK_M=BLOCK_M, BLOCK_N=BLOCK_N, HEAD_DIM=HEAD_DIM_K,  
         STAGE=stage,  
@@ -19,18 +19,24 @@ import triton
 import triton.language as tl
 
 @triton.jit
-def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
+def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, causal_offset, frame_tokens,
                     K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn, 
                     start_m,
                     H: tl.constexpr,
                     BLOCK_M: tl.constexpr, HEAD_DIM: tl.constexpr, BLOCK_N: tl.constexpr,  
                     STAGE: tl.constexpr, offs_m: tl.constexpr, offs_n: tl.constexpr,  
                     ):
+    # query i attends to all keys up to the end of the frame containing i + causal_offset, i.e. the mask is aligned to the bottom-right corner
+    # frame_tokens == 1 is the usual causal mask
+    # key blocks that lie fully below the diagonal of this query block need no mask
+    diag_lo = ((start_m * BLOCK_M + causal_offset) // frame_tokens + 1) * frame_tokens // BLOCK_N * BLOCK_N
+    # a frame may end past the last key, the unmasked scale loads of STAGE 1 must stop at the last key block
+    diag_lo = tl.minimum(diag_lo, tl.cdiv(kv_len, BLOCK_N) * BLOCK_N)
     if STAGE == 1:
-        lo, hi = 0, start_m * BLOCK_M
+        lo, hi = 0, diag_lo
     elif STAGE == 2:
-        lo, hi = start_m * BLOCK_M, (start_m + 1) * BLOCK_M
-        lo = tl.multiple_of(lo, BLOCK_M)
+        lo, hi = diag_lo, tl.minimum(((start_m + 1) * BLOCK_M - 1 + causal_offset) // frame_tokens * frame_tokens + frame_tokens, kv_len)
+        lo = tl.multiple_of(lo, BLOCK_N)
         K_scale_ptr += (lo // BLOCK_N) * H
         K_ptrs += stride_kn * lo
         V_ptrs += stride_vn * lo
@@ -43,7 +49,7 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
 
         mask = k_mask
         if STAGE == 2:
-            mask &= offs_m[:, None] >= (start_n + offs_n[None, :])
+            mask &= ((offs_m[:, None] + causal_offset) // frame_tokens) >= ((start_n + offs_n[None, :]) // frame_tokens)
         qk += tl.where(mask, 0, float('-inf'))
         m_ij = tl.maximum(m_i, tl.max(qk, 1))
         qk -= m_ij[:, None]
@@ -56,7 +62,7 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
         
         acc = acc * alpha[:, None]
         
-        v = tl.load(V_ptrs, mask = offs_n[:, None] < (kv_len - start_n))
+        v = tl.load(V_ptrs, mask = offs_n[:, None] < (kv_len - start_n)).to(tl.float16)
         p = p.to(tl.float16)
         
         acc += tl.dot(p, v, out_dtype=tl.float16)   
@@ -66,11 +72,11 @@ def _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len,
         V_ptrs += BLOCK_N * stride_vn
     return acc, l_i, m_i
 
-@triton.jit
+@triton.jit(do_not_specialize=["frame_tokens"])
 def _attn_fwd(Q, K, V, 
               cu_seqlens_q, cu_seqlens_k,
               Q_scale, K_scale, cu_seqlens_q_scale, cu_seqlens_k_scale,
-              Out,  
+              Out, frame_tokens,
               stride_qh, stride_qn,
               stride_kh, stride_kn,  
               stride_vh, stride_vn,  
@@ -121,13 +127,15 @@ def _attn_fwd(Q, K, V,
     
     q = tl.load(Q_ptrs, mask = offs_m[:, None] < qo_len)
     q_scale = tl.load(Q_scale_ptr)
-    acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
+    # aligned to the top-left corner when the valid keys are fewer than the valid queries, as in the cuda kernels
+    causal_offset = tl.maximum(kv_len - qo_len, 0)
+    acc, l_i, m_i = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, causal_offset, frame_tokens, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
                                     start_m, H // num_kv_groups,
                                     BLOCK_M, HEAD_DIM, BLOCK_N,  
                                     4 - STAGE, offs_m, offs_n 
                                     )
 
-    acc, l_i, _ = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
+    acc, l_i, _ = _attn_fwd_inner(acc, l_i, m_i, q, q_scale, kv_len, causal_offset, frame_tokens, K_ptrs, K_scale_ptr, V_ptrs, stride_kn, stride_vn,
                                     start_m, H // num_kv_groups,
                                     BLOCK_M, HEAD_DIM, BLOCK_N,  
                                     2, offs_m, offs_n 
@@ -135,7 +143,7 @@ def _attn_fwd(Q, K, V,
     acc = acc / l_i[:, None]
     tl.store(O_block_ptr, acc.to(Out.type.element_ty), mask = (offs_m[:, None] < qo_len))
 
-def forward(q, k, v, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, q_scale, k_scale, cu_seqlens_q_scale, cu_seqlens_k_scale, output_dtype=torch.float16):
+def forward(q, k, v, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, q_scale, k_scale, cu_seqlens_q_scale, cu_seqlens_k_scale, output_dtype=torch.float16, frame_tokens=1):
     BLOCK_M = 128
     BLOCK_N = 64
     stage = 3
@@ -153,7 +161,7 @@ def forward(q, k, v, cu_seqlens_q, cu_seqlens_k, max_seqlen_q, q_scale, k_scale,
     _attn_fwd[grid](
         q, k, v, cu_seqlens_q, cu_seqlens_k,
         q_scale, k_scale, cu_seqlens_q_scale, cu_seqlens_k_scale,
-        o,  
+        o, frame_tokens,
         q.stride(1), q.stride(0), 
         k.stride(1), k.stride(0),  
         v.stride(1), v.stride(0), 
@@ -0,0 +1,121 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+import triton
+import triton.language as tl
+
+@triton.jit
+def pack_kernel(Input, Output, cu_seqlens,
+                stride_iz, stride_ih, stride_in,
+                stride_oh, stride_on,
+                C: tl.constexpr, BLOCK_C: tl.constexpr, BLK: tl.constexpr):
+    off_blk = tl.program_id(0)
+    off_h = tl.program_id(1)
+    off_b = tl.program_id(2)
+
+    cu_seqlens_start = tl.load(cu_seqlens + off_b)
+    L = tl.load(cu_seqlens + off_b + 1) - cu_seqlens_start
+
+    if (off_blk * BLK) >= L:
+        return
+
+    offs_n = off_blk * BLK + tl.arange(0, BLK)
+    offs_k = tl.arange(0, BLOCK_C)
+    mask = (offs_n[:, None] < L) & (offs_k[None, :] < C)
+
+    input_ptrs = Input + off_b.to(tl.int64) * stride_iz + off_h * stride_ih + offs_n[:, None] * stride_in + offs_k[None, :]
+    output_ptrs = Output + (cu_seqlens_start + offs_n[:, None]).to(tl.int64) * stride_on + off_h * stride_oh + offs_k[None, :]
+
+    x = tl.load(input_ptrs, mask=mask)
+    tl.store(output_ptrs, x, mask=mask)
+
+@triton.jit(do_not_specialize=["seq_len"])
+def unpack_kernel(Input, Output, cu_seqlens, seq_len,
+                  stride_ih, stride_in,
+                  stride_oz, stride_oh, stride_on,
+                  C: tl.constexpr, BLOCK_C: tl.constexpr, BLK: tl.constexpr):
+    off_blk = tl.program_id(0)
+    off_h = tl.program_id(1)
+    off_b = tl.program_id(2)
+
+    cu_seqlens_start = tl.load(cu_seqlens + off_b)
+    L = tl.load(cu_seqlens + off_b + 1) - cu_seqlens_start
+
+    offs_n = off_blk * BLK + tl.arange(0, BLK)
+    offs_k = tl.arange(0, BLOCK_C)
+
+    input_ptrs = Input + (cu_seqlens_start + offs_n[:, None]).to(tl.int64) * stride_in + off_h * stride_ih + offs_k[None, :]
+    output_ptrs = Output + off_b.to(tl.int64) * stride_oz + off_h * stride_oh + offs_n[:, None] * stride_on + offs_k[None, :]
+
+    # padded tokens are filled with zeros
+    x = tl.load(input_ptrs, mask=(offs_n[:, None] < L) & (offs_k[None, :] < C), other=0.0)
+    tl.store(output_ptrs, x, mask=(offs_n[:, None] < seq_len) & (offs_k[None, :] < C))
+
+def pack(x, cu_seqlens, total_len, tensor_layout="HND", BLK=64):
+    """
+    Gather the valid tokens of a padded tensor into the packed ``[total_len, num_heads, head_dim]`` varlen layout.
+    """
+    if tensor_layout == "HND":
+        b, h, seq_len, head_dim = x.shape
+        stride_bz, stride_h, stride_seq = x.stride(0), x.stride(1), x.stride(2)
+    elif tensor_layout == "NHD":
+        b, seq_len, h, head_dim = x.shape
+        stride_bz, stride_h, stride_seq = x.stride(0), x.stride(2), x.stride(1)
+    else:
+        raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+    assert x.stride(-1) == 1, "Last dim of x must be contiguous."
+
+    out = torch.empty((total_len, h, head_dim), dtype=x.dtype, device=x.device)
+
+    grid = ((seq_len + BLK - 1) // BLK, h, b)
+    pack_kernel[grid](
+        x, out, cu_seqlens,
+        stride_bz, stride_h, stride_seq,
+        out.stride(1), out.stride(0),
+        C=head_dim, BLOCK_C=triton.next_power_of_2(head_dim), BLK=BLK
+    )
+
+    return out
+
+def unpack(x, cu_seqlens, seq_len, tensor_layout="HND", BLK=64):
+    """
+    Scatter a packed ``[total_len, num_heads, head_dim]`` tensor back to the padded layout, with zeros at the padded tokens.
+    """
+    _, h, head_dim = x.shape
+    b = cu_seqlens.shape[0] - 1
+
+    assert x.stride(-1) == 1, "Last dim of x must be contiguous."
+
+    if tensor_layout == "HND":
+        out = torch.empty((b, h, seq_len, head_dim), dtype=x.dtype, device=x.device)
+        stride_bz, stride_h, stride_seq = out.stride(0), out.stride(1), out.stride(2)
+    elif tensor_layout == "NHD":
+        out = torch.empty((b, seq_len, h, head_dim), dtype=x.dtype, device=x.device)
+        stride_bz, stride_h, stride_seq = out.stride(0), out.stride(2), out.stride(1)
+    else:
+        raise ValueError(f"tensor_layout {tensor_layout} not supported")
+
+    grid = ((seq_len + BLK - 1) // BLK, h, b)
+    unpack_kernel[grid](
+        x, out, cu_seqlens, seq_len,
+        x.stride(1), x.stride(0),
+        stride_bz, stride_h, stride_seq,
+        C=head_dim, BLOCK_C=triton.next_power_of_2(head_dim), BLK=BLK
+    )
+
+    return out
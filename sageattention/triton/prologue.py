@@ -0,0 +1,143 @@
+"""
+Copyright (c) 2024 by SageAttention team.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import torch
+import triton
+import triton.language as tl
+
+@triton.jit
+def load_prologue(row_ptrs, stride_ik, offs_n, offs_k, L, off_h,
+                  Norm_weight, stride_wh, norm_dim, eps,
+                  Cos, Sin, stride_cn, rope_dim,
+                  ROPE_HALF: tl.constexpr):
+    # row_ptrs points to the first channel of each token, the rotation partner is loaded again from L1
+    x = tl.load(row_ptrs + offs_k[None, :] * stride_ik, mask=offs_n[:, None] < L)
+    x = x.to(tl.float32)
+    if Norm_weight is not None:
+        # RMSNorm over the head dim, the padded channels are zero
+        rstd = tl.rsqrt(tl.sum(x * x, axis=1) / norm_dim + eps)
+        w = tl.load(Norm_weight + off_h * stride_wh + offs_k, mask=offs_k < norm_dim, other=0.0).to(tl.float32)
+        x = x * rstd[:, None] * w[None, :]
+    if Cos is not None:
+        if ROPE_HALF:
+            # rotate_half: (x1, x2) -> (-x2, x1)
+            half = rope_dim // 2
+            offs_r = tl.where(offs_k < half, offs_k + half, offs_k - half)
+            sign = tl.where(offs_k < half, -1.0, 1.0)
+        else:
+            # adjacent pairs: (x0, x1) -> (-x1, x0)
+            offs_r = offs_k ^ 1
+            sign = tl.where(offs_k % 2 == 0, -1.0, 1.0)
+        rope_mask = (offs_n[:, None] < L) & (offs_k[None, :] < rope_dim)
+        x_r = tl.load(row_ptrs + offs_r[None, :] * stride_ik, mask=rope_mask, other=0.0).to(tl.float32)
+        if Norm_weight is not None:
+            w_r = tl.load(Norm_weight + off_h * stride_wh + offs_r, mask=offs_r < norm_dim, other=0.0).to(tl.float32)
+            x_r = x_r * rstd[:, None] * w_r[None, :]
+        # channels beyond rope_dim are passed through
+        cos = tl.load(Cos + offs_n[:, None] * stride_cn + offs_k[None, :], mask=rope_mask, other=1.0).to(tl.float32)
+        sin = tl.load(Sin + offs_n[:, None] * stride_cn + offs_k[None, :], mask=rope_mask, other=0.0).to(tl.float32)
+        x = x * cos + sign[None, :] * x_r * sin
+    return x
+
+@triton.jit(do_not_specialize=["L"])
+def mean_prologue_kernel(Input, Output, L,
+                         stride_iz, stride_ih, stride_in, stride_ik,
+                         stride_oz, stride_oh,
+                         Norm_weight, stride_wh, norm_dim, eps,
+                         Cos, Sin, stride_cn, rope_dim,
+                         C: tl.constexpr, BLK: tl.constexpr,
+                         ROPE_HALF: tl.constexpr):
+    off_blk = tl.program_id(0)
+    off_h = tl.program_id(1)
+    off_b = tl.program_id(2)
+
+    offs_n = off_blk * BLK + tl.arange(0, BLK)
+    offs_k = tl.arange(0, C)
+
+    row_ptrs = Input + off_b * stride_iz + off_h * stride_ih + offs_n[:, None] * stride_in
+    x = load_prologue(row_ptrs, stride_ik, offs_n, offs_k, L, off_h,
+                      Norm_weight, stride_wh, norm_dim, eps,
+                      Cos, Sin, stride_cn, rope_dim,
+                      ROPE_HALF)
+    x = tl.where(offs_n[:, None] < L, x, 0.0)
+
+    tl.atomic_add(Output + off_b * stride_oz + off_h * stride_oh + offs_k, tl.sum(x, axis=0) / L)
+
+def prepare_rope(rope, rope_style, seq_len, head_dim):
+    """
+    Flatten the ``(cos, sin)`` pair of rotary embeddings to ``[seq_len, rope_dim]`` for the kernels.
+    """
+    if rope is None:
+        return None, None, False
+    if rope_style not in ["interleaved", "half"]:
+        raise ValueError(f"Unsupported rope_style: {rope_style}")
+
+    cos, sin = rope
+    assert cos.shape == sin.shape, "cos and sin must have the same shape."
+    rope_dim = cos.size(-1)
+    assert rope_dim % 2 == 0 and rope_dim <= head_dim, "The last dim of cos and sin must be even and not larger than head_dim."
+
+    # a shared [1, seq_len, 1, rope_dim] or [seq_len, rope_dim] table
+    cos = cos.reshape(-1, rope_dim).contiguous()
+    sin = sin.reshape(-1, rope_dim).contiguous()
+    assert cos.size(0) >= seq_len, "cos and sin must cover every position of q and k."
+
+    return cos, sin, rope_style == "half"
+
+def prepare_norm(weight):
+    """
+    Make an RMSNorm weight of shape ``[norm_dim]`` or ``[1 or num_heads, norm_dim]`` contiguous for the kernels,
+    and return it with its head stride and ``norm_dim``.
+    """
+    if weight is None:
+        return None, 0, 0
+    weight = weight.reshape(-1, weight.size(-1)).contiguous()
+    return weight, weight.stride(0) if weight.size(0) > 1 else 0, weight.size(1)
+
+def mean_prologue(k, norm_weight=None, eps=1e-6, rope=None, rope_style="interleaved", tensor_layout="HND", BLK=128):
+    """
+    Mean over the sequence of `k` after the RMSNorm and rotation of the quantization prologue, without writing the transformed `k`.
+    The result has the shape of ``k.mean(dim=seq_dim, keepdim=True)`` and dtype ``torch.float32``.
+    """
+    if tensor_layout == "HND":
+        b, h, seq_len, head_dim = k.shape
+        stride_bz, stride_h, stride_seq = k.stride(0), k.stride(1), k.stride(2)
+        km = torch.zeros((b, h, 1, head_dim), dtype=torch.float32, device=k.device)
+        stride_bz_o, stride_h_o = km.stride(0), km.stride(1)
+    elif tensor_layout == "NHD":
+        b, seq_len, h, head_dim = k.shape
+        stride_bz, stride_h, stride_seq = k.stride(0), k.stride(2), k.stride(1)
+        km = torch.zeros((b, 1, h, head_dim), dtype=torch.float32, device=k.device)
+        stride_bz_o, stride_h_o = km.stride(0), km.stride(2)
+    else:
+        raise ValueError(f"Unknown tensor layout: {tensor_layout}")
+
+    norm_weight, stride_wh, norm_dim = prepare_norm(norm_weight)
+    cos, sin, rope_half = prepare_rope(rope, rope_style, seq_len, head_dim)
+    stride_cn, rope_dim = (cos.stride(0), cos.size(1)) if cos is not None else (0, 0)
+
+    grid = ((seq_len + BLK - 1) // BLK, h, b)
+    mean_prologue_kernel[grid](
+        k, km, seq_len,
+        stride_bz, stride_h, stride_seq, k.stride(3),
+        stride_bz_o, stride_h_o,
+        norm_weight, stride_wh, norm_dim, eps,
+        cos, sin, stride_cn, rope_dim,
+        C=head_dim, BLK=BLK,
+        ROPE_HALF=rope_half
+    )
+
+    return km
@@ -18,13 +18,33 @@ import torch
 import triton
 import triton.language as tl
 
+from .prologue import load_prologue, prepare_norm, prepare_rope
+
+@triton.jit
+def scale_is_stale(Saturation, step_parity, max_saturated):
+    # a scale cached by an earlier step is recomputed when the step asks for it (max_saturated < 0)
+    # or when more than max_saturated values were clipped on the previous step
+    return tl.load(Saturation + 1 - step_parity) > max_saturated
+
 @triton.jit
-def quant_per_block_int8_kernel(Input, Output, Scale, L,
-                                stride_iz, stride_ih, stride_in,
+def saturate(x, Saturation, step_parity):
+    # count the values a cached scale clips, for the next step to decide whether to refresh
+    tl.atomic_add(Saturation + step_parity, tl.sum((tl.abs(x) > 127.).to(tl.int32)))
+    return tl.minimum(tl.maximum(x, -127.), 127.)
+
+# the sequence lengths and the strides of the scales change with the resolution, specializing on them would compile a variant per shape
+@triton.jit(do_not_specialize=["L", "stride_sz", "stride_sh", "step_parity", "max_saturated"])
+def quant_per_block_int8_kernel(Input, Output, Scale, L, Lengths,
+                                stride_iz, stride_ih, stride_in, stride_ik,
                                 stride_oz, stride_oh, stride_on,
                                 stride_sz, stride_sh,
                                 sm_scale,
-                                C: tl.constexpr, BLK: tl.constexpr):
+                                Km, stride_kmz, stride_kmh,
+                                Norm_weight, stride_wh, norm_dim, eps,
+                                Cos, Sin, stride_cn, rope_dim,
+                                Saturation, step_parity, max_saturated, headroom,
+                                C: tl.constexpr, BLK: tl.constexpr,
+                                ROPE_HALF: tl.constexpr):
     off_blk = tl.program_id(0)
     off_h = tl.program_id(1)
     off_b = tl.program_id(2)
@@ -32,27 +52,38 @@ def quant_per_block_int8_kernel(Input, Output, Scale, L,
     offs_n = off_blk * BLK + tl.arange(0, BLK)
     offs_k = tl.arange(0, C)
 
-    input_ptrs = Input + off_b * stride_iz + off_h * stride_ih + offs_n[:, None] * stride_in + offs_k[None, :]
+    row_ptrs = Input + off_b * stride_iz + off_h * stride_ih + offs_n[:, None] * stride_in
     output_ptrs = Output + off_b * stride_oz + off_h * stride_oh + offs_n[:, None] * stride_on + offs_k[None, :]
     scale_ptrs = Scale + off_b * stride_sz + off_h * stride_sh + off_blk
 
-    x = tl.load(input_ptrs, mask=offs_n[:, None] < L)
-    x = x.to(tl.float32)
+    if Lengths is not None:
+        # the padding of a shorter batch element is never attended to and must not set the scales
+        L = tl.minimum(L, tl.load(Lengths + off_b))
+    x = load_prologue(row_ptrs, stride_ik, offs_n, offs_k, L, off_h, Norm_weight, stride_wh, norm_dim, eps, Cos, Sin, stride_cn, rope_dim, ROPE_HALF)
+    if Km is not None:
+        x -= tl.load(Km + off_b * stride_kmz + off_h * stride_kmh + offs_k)[None, :].to(tl.float32)
+        # the rows past L would hold -km and inflate the scale of the last block
+        x = tl.where(offs_n[:, None] < L, x, 0.)
     x *= sm_scale
-    scale = tl.max(tl.abs(x)) / 127.
+    if Saturation is not None:
+        if scale_is_stale(Saturation, step_parity, max_saturated):
+            scale = tl.max(tl.abs(x)) / 127. * headroom
+        else:
+            scale = tl.load(scale_ptrs)
+    else:
+        scale = tl.max(tl.abs(x)) / 127.
     x_int8 = x / scale
+    if Saturation is not None:
+        x_int8 = saturate(x_int8, Saturation, step_parity)
     x_int8 += 0.5 * tl.where(x_int8 >= 0, 1, -1)
     x_int8 = x_int8.to(tl.int8)
     tl.store(output_ptrs, x_int8, mask=offs_n[:, None] < L)
     tl.store(scale_ptrs, scale)
 
-def per_block_int8(q, k, km=None, BLKQ=128, BLKK=64, sm_scale=None, tensor_layout="HND"):
+def per_block_int8(q, k, km=None, BLKQ=128, BLKK=64, sm_scale=None, tensor_layout="HND", rope=None, rope_style="interleaved", qk_norm=None, qk_norm_eps=1e-6, scale_cache=None, static_scales=None, layer_tag=None, q_lengths=None, kv_lengths=None):
     q_int8 = torch.empty(q.shape, dtype=torch.int8, device=q.device)
     k_int8 = torch.empty(k.shape, dtype=torch.int8, device=k.device)
 
-    if km is not None:
-        k = k - km
-
     if tensor_layout == "HND":
         b, h_qo, qo_len, head_dim = q.shape
         _, h_kv, kv_len, _ = k.shape
@@ -61,6 +92,7 @@ def per_block_int8(q, k, km=None, BLKQ=128, BLKK=64, sm_scale=None, tensor_layou
         stride_bz_qo, stride_h_qo, stride_seq_qo = q_int8.stride(0), q_int8.stride(1), q_int8.stride(2)
         stride_bz_k, stride_h_k, stride_seq_k = k.stride(0), k.stride(1), k.stride(2)
         stride_bz_ko, stride_h_ko, stride_seq_ko = k_int8.stride(0), k_int8.stride(1), k_int8.stride(2)
+        stride_bz_km, stride_h_km = (km.stride(0), km.stride(1)) if km is not None else (0, 0)
     elif tensor_layout == "NHD":
         b, qo_len, h_qo, head_dim = q.shape
         _, kv_len, h_kv, _ = k.shape
@@ -69,33 +101,107 @@ def per_block_int8(q, k, km=None, BLKQ=128, BLKK=64, sm_scale=None, tensor_layou
         stride_bz_qo, stride_h_qo, stride_seq_qo = q_int8.stride(0), q_int8.stride(2), q_int8.stride(1)
         stride_bz_k, stride_h_k, stride_seq_k = k.stride(0), k.stride(2), k.stride(1)
         stride_bz_ko, stride_h_ko, stride_seq_ko = k_int8.stride(0), k_int8.stride(2), k_int8.stride(1)
+        stride_bz_km, stride_h_km = (km.stride(0), km.stride(2)) if km is not None else (0, 0)
     else:
         raise ValueError(f"Unknown tensor layout: {tensor_layout}")
 
-    q_scale = torch.empty((b, h_qo, (qo_len + BLKQ - 1) // BLKQ), device=q.device, dtype=torch.float32)
-    k_scale = torch.empty((b, h_kv, (kv_len + BLKK - 1) // BLKK), device=q.device, dtype=torch.float32)
+    # the RMSNorm, the rotation and the mean subtraction of k are applied in registers
+    q_norm_weight, k_norm_weight = qk_norm if qk_norm is not None else (None, None)
+    q_norm_weight, stride_wh_q, norm_dim_q = prepare_norm(q_norm_weight)
+    k_norm_weight, stride_wh_k, norm_dim_k = prepare_norm(k_norm_weight)
+    cos, sin, rope_half = prepare_rope(rope, rope_style, max(qo_len, kv_len), head_dim)
+    stride_cn, rope_dim = (cos.stride(0), cos.size(1)) if cos is not None else (0, 0)
 
     if sm_scale is None:
         sm_scale = head_dim**-0.5
 
+    scales = scale_cache if scale_cache is not None else static_scales
+    if scales is not None:
+        # the scales come from the cache or the calibration and are only recomputed when stale
+        q_scale, q_saturation, q_parity, q_max_saturated = scales.lookup(layer_tag, "q", (b, h_qo, (qo_len + BLKQ - 1) // BLKQ), q, sm_scale * 1.44269504)
+        k_scale, k_saturation, k_parity, k_max_saturated = scales.lookup(layer_tag, "k", (b, h_kv, (kv_len + BLKK - 1) // BLKK), k)
+        headroom = scales.headroom
+    else:
+        q_scale = torch.empty((b, h_qo, (qo_len + BLKQ - 1) // BLKQ), device=q.device, dtype=torch.float32)
+        k_scale = torch.empty((b, h_kv, (kv_len + BLKK - 1) // BLKK), device=q.device, dtype=torch.float32)
+        q_saturation, q_parity, q_max_saturated = None, 0, 0
+        k_saturation, k_parity, k_max_saturated = None, 0, 0
+        headroom = 1.0
+
     grid = ((qo_len + BLKQ - 1) // BLKQ, h_qo, b)
     quant_per_block_int8_kernel[grid](
-        q, q_int8, q_scale, qo_len,
-        stride_bz_q, stride_h_q, stride_seq_q,
+        q, q_int8, q_scale, qo_len, q_lengths,
+        stride_bz_q, stride_h_q, stride_seq_q, q.stride(3),
         stride_bz_qo, stride_h_qo, stride_seq_qo,
         q_scale.stride(0), q_scale.stride(1),
-        sm_scale=(sm_scale * 1.44269504),
-        C=head_dim, BLK=BLKQ
+        (sm_scale * 1.44269504),
+        None, 0, 0,
+        q_norm_weight, stride_wh_q, norm_dim_q, qk_norm_eps,
+        cos, sin, stride_cn, rope_dim,
+        q_saturation, q_parity, q_max_saturated, headroom,
+        C=head_dim, BLK=BLKQ,
+        ROPE_HALF=rope_half
     )
 
     grid = ((kv_len + BLKK - 1) // BLKK, h_kv, b)
     quant_per_block_int8_kernel[grid](
-        k, k_int8, k_scale, kv_len,
-        stride_bz_k, stride_h_k, stride_seq_k,
+        k, k_int8, k_scale, kv_len, kv_lengths,
+        stride_bz_k, stride_h_k, stride_seq_k, k.stride(3),
         stride_bz_ko, stride_h_ko, stride_seq_ko,
         k_scale.stride(0), k_scale.stride(1),
-        sm_scale=1.0,
-        C=head_dim, BLK=BLKK
+        1.0,
+        km, stride_bz_km, stride_h_km,
+        k_norm_weight, stride_wh_k, norm_dim_k, qk_norm_eps,
+        cos, sin, stride_cn, rope_dim,
+        k_saturation, k_parity, k_max_saturated, headroom,
+        C=head_dim, BLK=BLKK,
+        ROPE_HALF=rope_half
     )
 
     return q_int8, q_scale, k_int8, k_scale
+
+def quant_per_block_int8(x, x_int8, x_scale, seq_len, x_strides, out_strides, BLK, sm_scale=1.0, km=None, km_strides=(0, 0)):
+    """
+    Quantize `seq_len` tokens of `x` per block of `BLK` tokens into `x_int8` and `x_scale`, without a prologue or a scale cache.
+    `x_strides` are the batch, head, token and channel strides of `x`, `out_strides` the batch, head and token strides of `x_int8`.
+    """
+    # the scales are [batch_size, num_heads, num_blocks]
+    b, h = x_scale.size(0), x_scale.size(1)
+    grid = ((seq_len + BLK - 1) // BLK, h, b)
+    quant_per_block_int8_kernel[grid](
+        x, x_int8, x_scale, seq_len, None,
+        *x_strides,
+        *out_strides,
+        x_scale.stride(0), x_scale.stride(1),
+        sm_scale,
+        km, *km_strides,
+        None, 0, 0, 0.0,
+        None, None, 0, 0,
+        None, 0, 0, 1.0,
+        C=x_int8.size(-1), BLK=BLK,
+        ROPE_HALF=False
+    )
+
+@triton.jit(do_not_specialize=["L", "stride_sz", "stride_sh"])
+def quant_per_block_fp8_kernel(Input, Output, Scale, L,
+                               stride_iz, stride_ih, stride_in,
+                               stride_oz, stride_oh, stride_on,
+                               stride_sz, stride_sh,
+                               C: tl.constexpr, BLK: tl.constexpr):
+    off_blk = tl.program_id(0)
+    off_h = tl.program_id(1)
+    off_b = tl.program_id(2)
+
+    offs_n = off_blk * BLK + tl.arange(0, BLK)
+    offs_k = tl.arange(0, C)
+
+    input_ptrs = Input + off_b * stride_iz + off_h * stride_ih + offs_n[:, None] * stride_in + offs_k[None, :]
+    output_ptrs = Output + off_b * stride_oz + off_h * stride_oh + offs_n[:, None] * stride_on + offs_k[None, :]
+    scale_ptrs = Scale + off_b * stride_sz + off_h * stride_sh + off_blk
+
+    x = tl.load(input_ptrs, mask=offs_n[:, None] < L, other=0.0)
+    x = x.to(tl.float32)
+    scale = tl.maximum(tl.max(tl.abs(x)), 1e-6) / 448.
+    x_fp8 = (x / scale).to(Output.dtype.element_ty)
+    tl.store(output_ptrs, x_fp8, mask=offs_n[:, None] < L)
+    tl.store(scale_ptrs, scale)
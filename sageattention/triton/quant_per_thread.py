@@ -18,12 +18,20 @@ import torch
 import triton
 import triton.language as tl
 
-@triton.jit
-def quant_query_per_thread_int8_kernel(Input, Output, Scale, L,
+from .prologue import load_prologue, prepare_norm, prepare_rope
+from .quant_per_block import scale_is_stale, saturate
+
+# the sequence lengths and the strides of the scales change with the resolution, specializing on them would compile a variant per shape
+@triton.jit(do_not_specialize=["L", "stride_sz", "stride_sh", "step_parity", "max_saturated"])
+def quant_query_per_thread_int8_kernel(Input, Output, Scale, L, Lengths,
                                         stride_iz, stride_ih, stride_in,
                                         stride_oz, stride_oh, stride_on,
                                         stride_sz, stride_sh,
-                                        C: tl.constexpr, BLK: tl.constexpr):
+                                        Norm_weight, stride_wh, norm_dim, eps,
+                                        Cos, Sin, stride_cn, rope_dim,
+                                        Saturation, step_parity, max_saturated, headroom,
+                                        C: tl.constexpr, BLK: tl.constexpr,
+                                        ROPE_HALF: tl.constexpr):
     off_blk = tl.program_id(0) // 8
     off_tld = tl.program_id(0) % 8
     off_h = tl.program_id(1)
@@ -32,25 +40,41 @@ def quant_query_per_thread_int8_kernel(Input, Output, Scale, L,
     offs_n = off_blk * BLK + tl.arange(0, BLK // 8) * 8 + off_tld
     offs_k = tl.arange(0, C)
 
-    input_ptrs = Input + off_b * stride_iz + off_h * stride_ih + offs_n[:, None] * stride_in + offs_k[None, :]
+    row_ptrs = Input + off_b * stride_iz + off_h * stride_ih + offs_n[:, None] * stride_in
     output_ptrs = Output + off_b * stride_oz + off_h * stride_oh + offs_n[:, None] * stride_on + offs_k[None, :]
     scale_ptrs = Scale + off_b * stride_sz + off_h * stride_sh + off_blk * 8 + off_tld
 
-    x = tl.load(input_ptrs, mask=offs_n[:, None] < L)
-    x = x.to(tl.float32)
-    scale = tl.max(tl.abs(x)) / 127. + 0.0000001
+    if Lengths is not None:
+        # the padding of a shorter batch element is never attended to and must not set the scales
+        L = tl.minimum(L, tl.load(Lengths + off_b))
+
+    x = load_prologue(row_ptrs, 1, offs_n, offs_k, L, off_h, Norm_weight, stride_wh, norm_dim, eps, Cos, Sin, stride_cn, rope_dim, ROPE_HALF)
+    if Saturation is not None:
+        if scale_is_stale(Saturation, step_parity, max_saturated):
+            scale = tl.max(tl.abs(x)) / 127. * headroom + 0.0000001
+        else:
+            scale = tl.load(scale_ptrs)
+    else:
+        scale = tl.max(tl.abs(x)) / 127. + 0.0000001
     x_int8 = x / scale
+    if Saturation is not None:
+        x_int8 = saturate(x_int8, Saturation, step_parity)
     x_int8 += 0.5 * tl.where(x_int8 >= 0, 1, -1)
     x_int8 = x_int8.to(tl.int8)
     tl.store(output_ptrs, x_int8, mask=offs_n[:, None] < L)
     tl.store(scale_ptrs, scale)
 
-@triton.jit
-def quant_key_per_thread_int8_kernel(Input, Output, Scale, L,
+@triton.jit(do_not_specialize=["L", "stride_sz", "stride_sh", "step_parity", "max_saturated"])
+def quant_key_per_thread_int8_kernel(Input, Output, Scale, L, Lengths,
                                         stride_iz, stride_ih, stride_in,
                                         stride_oz, stride_oh, stride_on,
                                         stride_sz, stride_sh,
-                                        C: tl.constexpr, BLK: tl.constexpr):      
+                                        Km, stride_kmz, stride_kmh,
+                                        Norm_weight, stride_wh, norm_dim, eps,
+                                        Cos, Sin, stride_cn, rope_dim,
+                                        Saturation, step_parity, max_saturated, headroom,
+                                        C: tl.constexpr, BLK: tl.constexpr,
+                                        ROPE_HALF: tl.constexpr):
     off_blk = tl.program_id(0) // 4
     off_tld = tl.program_id(0) % 4
     off_h = tl.program_id(1)
@@ -76,19 +100,34 @@ def quant_key_per_thread_int8_kernel(Input, Output, Scale, L,
     offs_n1 = off_blk * BLK + tl.arange(0, BLK // 8) * 8 + off_tld * 2 + 1
     offs_k = tl.arange(0, C)
 
-    input_ptrs0 = Input + off_b * stride_iz + off_h * stride_ih + offs_n0[:, None] * stride_in + offs_k[None, :]
-    input_ptrs1 = Input + off_b * stride_iz + off_h * stride_ih + offs_n1[:, None] * stride_in + offs_k[None, :]
+    row_ptrs0 = Input + off_b * stride_iz + off_h * stride_ih + offs_n0[:, None] * stride_in
+    row_ptrs1 = Input + off_b * stride_iz + off_h * stride_ih + offs_n1[:, None] * stride_in
     output_ptrs0 = Output + off_b * stride_oz + off_h * stride_oh + offs_n0[:, None] * stride_on + offs_k[None, :]
     output_ptrs1 = Output + off_b * stride_oz + off_h * stride_oh + offs_n1[:, None] * stride_on + offs_k[None, :]
     scale_ptrs = Scale + off_b * stride_sz + off_h * stride_sh + off_blk * 4 + off_tld
 
-    x0 = tl.load(input_ptrs0, mask=offs_n0[:, None] < L)
-    x1 = tl.load(input_ptrs1, mask=offs_n1[:, None] < L)
-    x0 = x0.to(tl.float32)
-    x1 = x1.to(tl.float32)
-    scale = max(tl.max(tl.abs(x0)), tl.max(tl.abs(x1))) / 127. + 0.0000001
+    if Lengths is not None:
+        L = tl.minimum(L, tl.load(Lengths + off_b))
+
+    x0 = load_prologue(row_ptrs0, 1, offs_n0, offs_k, L, off_h, Norm_weight, stride_wh, norm_dim, eps, Cos, Sin, stride_cn, rope_dim, ROPE_HALF)
+    x1 = load_prologue(row_ptrs1, 1, offs_n1, offs_k, L, off_h, Norm_weight, stride_wh, norm_dim, eps, Cos, Sin, stride_cn, rope_dim, ROPE_HALF)
+    if Km is not None:
+        km = tl.load(Km + off_b * stride_kmz + off_h * stride_kmh + offs_k)[None, :].to(tl.float32)
+        # the rows past L would hold -km and inflate the scale of the last block
+        x0 = tl.where(offs_n0[:, None] < L, x0 - km, 0.)
+        x1 = tl.where(offs_n1[:, None] < L, x1 - km, 0.)
+    if Saturation is not None:
+        if scale_is_stale(Saturation, step_parity, max_saturated):
+            scale = max(tl.max(tl.abs(x0)), tl.max(tl.abs(x1))) / 127. * headroom + 0.0000001
+        else:
+            scale = tl.load(scale_ptrs)
+    else:
+        scale = max(tl.max(tl.abs(x0)), tl.max(tl.abs(x1))) / 127. + 0.0000001
     x0_int8 = x0 / scale
     x1_int8 = x1 / scale
+    if Saturation is not None:
+        x0_int8 = saturate(x0_int8, Saturation, step_parity)
+        x1_int8 = saturate(x1_int8, Saturation, step_parity)
     x0_int8 += 0.5 * tl.where(x0_int8 >= 0, 1, -1)
     x1_int8 += 0.5 * tl.where(x1_int8 >= 0, 1, -1)
     x0_int8 = x0_int8.to(tl.int8)
@@ -97,7 +136,7 @@ def quant_key_per_thread_int8_kernel(Input, Output, Scale, L,
     tl.store(output_ptrs1, x1_int8, mask=offs_n1[:, None] < L)
     tl.store(scale_ptrs, scale)
 
-@triton.jit
+@triton.jit(do_not_specialize=["L", "stride_sz", "stride_sh"])
 def quant_query_per_thread_int4_kernel(Input, Output, Scale, L,
                                         stride_iz, stride_ih, stride_in,
                                         stride_oz, stride_oh, stride_on,
@@ -124,7 +163,7 @@ def quant_query_per_thread_int4_kernel(Input, Output, Scale, L,
     tl.store(output_ptrs, x_int8, mask=offs_n[:, None] < L)
     tl.store(scale_ptrs, scale)
 
-@triton.jit
+@triton.jit(do_not_specialize=["L", "stride_sz", "stride_sh"])
 def quant_key_per_thread_int4_kernel(Input, Output, Scale, L,
                                         stride_iz, stride_ih, stride_in,
                                         stride_oz, stride_oh, stride_on,
@@ -151,13 +190,10 @@ def quant_key_per_thread_int4_kernel(Input, Output, Scale, L,
     tl.store(output_ptrs, x_int8, mask=offs_n[:, None] < L)
     tl.store(scale_ptrs, scale)
 
-def per_thread_int8(q, k, km=None, BLKQ=128, WARPQ=32, BLKK=64, WARPK=64, sm_scale=None, tensor_layout="HND"):
+def per_thread_int8(q, k, km=None, BLKQ=128, WARPQ=32, BLKK=64, WARPK=64, sm_scale=None, tensor_layout="HND", rope=None, rope_style="interleaved", qk_norm=None, qk_norm_eps=1e-6, scale_cache=None, static_scales=None, layer_tag=None, q_lengths=None, kv_lengths=None):
     q_int8 = torch.empty(q.shape, dtype=torch.int8, device=q.device)
     k_int8 = torch.empty(k.shape, dtype=torch.int8, device=k.device)
 
-    if km is not None:
-        k = k - km
-
     if tensor_layout == "HND":
         b, h_qo, qo_len, head_dim = q.shape
         _, h_kv, kv_len, _ = k.shape
@@ -166,6 +202,7 @@ def per_thread_int8(q, k, km=None, BLKQ=128, WARPQ=32, BLKK=64, WARPK=64, sm_sca
         stride_bz_qo, stride_h_qo, stride_seq_qo = q_int8.stride(0), q_int8.stride(1), q_int8.stride(2)
         stride_bz_k, stride_h_k, stride_seq_k = k.stride(0), k.stride(1), k.stride(2)
         stride_bz_ko, stride_h_ko, stride_seq_ko = k_int8.stride(0), k_int8.stride(1), k_int8.stride(2)
+        stride_bz_km, stride_h_km = (km.stride(0), km.stride(1)) if km is not None else (0, 0)
     elif tensor_layout == "NHD":
         b, qo_len, h_qo, head_dim = q.shape
         _, kv_len, h_kv, _ = k.shape
@@ -174,31 +211,58 @@ def per_thread_int8(q, k, km=None, BLKQ=128, WARPQ=32, BLKK=64, WARPK=64, sm_sca
         stride_bz_qo, stride_h_qo, stride_seq_qo = q_int8.stride(0), q_int8.stride(2), q_int8.stride(1)
         stride_bz_k, stride_h_k, stride_seq_k = k.stride(0), k.stride(2), k.stride(1)
         stride_bz_ko, stride_h_ko, stride_seq_ko = k_int8.stride(0), k_int8.stride(2), k_int8.stride(1)
+        stride_bz_km, stride_h_km = (km.stride(0), km.stride(2)) if km is not None else (0, 0)
     else:
         raise ValueError(f"Unknown tensor layout: {tensor_layout}")
 
-    q_scale = torch.empty((b, h_qo, (qo_len + BLKQ - 1) // BLKQ * (BLKQ // WARPQ) * 8), device=q.device, dtype=torch.float32)
-    k_scale = torch.empty((b, h_kv, (kv_len + BLKK - 1) // BLKK * (BLKK // WARPK) * 4), device=q.device, dtype=torch.float32)
+    # the RMSNorm, the rotation and the mean subtraction of k are applied in registers
+    q_norm_weight, k_norm_weight = qk_norm if qk_norm is not None else (None, None)
+    q_norm_weight, stride_wh_q, norm_dim_q = prepare_norm(q_norm_weight)
+    k_norm_weight, stride_wh_k, norm_dim_k = prepare_norm(k_norm_weight)
+    cos, sin, rope_half = prepare_rope(rope, rope_style, max(qo_len, kv_len), head_dim)
+    stride_cn, rope_dim = (cos.stride(0), cos.size(1)) if cos is not None else (0, 0)
+
+    scales = scale_cache if scale_cache is not None else static_scales
+    if scales is not None:
+        # the scales come from the cache or the calibration and are only recomputed when stale
+        q_scale, q_saturation, q_parity, q_max_saturated = scales.lookup(layer_tag, "q", (b, h_qo, (qo_len + BLKQ - 1) // BLKQ * (BLKQ // WARPQ) * 8), q)
+        k_scale, k_saturation, k_parity, k_max_saturated = scales.lookup(layer_tag, "k", (b, h_kv, (kv_len + BLKK - 1) // BLKK * (BLKK // WARPK) * 4), k)
+        headroom = scales.headroom
+    else:
+        q_scale = torch.empty((b, h_qo, (qo_len + BLKQ - 1) // BLKQ * (BLKQ // WARPQ) * 8), device=q.device, dtype=torch.float32)
+        k_scale = torch.empty((b, h_kv, (kv_len + BLKK - 1) // BLKK * (BLKK // WARPK) * 4), device=q.device, dtype=torch.float32)
+        q_saturation, q_parity, q_max_saturated = None, 0, 0
+        k_saturation, k_parity, k_max_saturated = None, 0, 0
+        headroom = 1.0
 
     if sm_scale is None:
         sm_scale = head_dim**-0.5
 
     grid = ((qo_len + BLKQ - 1) // BLKQ * (BLKQ // WARPQ) * 8, h_qo, b)
     quant_query_per_thread_int8_kernel[grid](
-        q, q_int8, q_scale, qo_len,
+        q, q_int8, q_scale, qo_len, q_lengths,
         stride_bz_q, stride_h_q, stride_seq_q,
         stride_bz_qo, stride_h_qo, stride_seq_qo,
         q_scale.stride(0), q_scale.stride(1),
-        C=head_dim, BLK=WARPQ
+        q_norm_weight, stride_wh_q, norm_dim_q, qk_norm_eps,
+        cos, sin, stride_cn, rope_dim,
+        q_saturation, q_parity, q_max_saturated, headroom,
+        C=head_dim, BLK=WARPQ,
+        ROPE_HALF=rope_half
     )
 
     grid = ((kv_len + BLKK - 1) // BLKK * (BLKK // WARPK) * 4, h_kv, b)
     quant_key_per_thread_int8_kernel[grid](
-        k, k_int8, k_scale, kv_len,
+        k, k_int8, k_scale, kv_len, kv_lengths,
         stride_bz_k, stride_h_k, stride_seq_k,
         stride_bz_ko, stride_h_ko, stride_seq_ko,
         k_scale.stride(0), k_scale.stride(1),
-        C=head_dim, BLK=WARPK
+        km, stride_bz_km, stride_h_km,
+        k_norm_weight, stride_wh_k, norm_dim_k, qk_norm_eps,
+        cos, sin, stride_cn, rope_dim,
+        k_saturation, k_parity, k_max_saturated, headroom,
+        C=head_dim, BLK=WARPK,
+        ROPE_HALF=rope_half
     )
 
-    return q_int8, q_scale, k_int8, k_scale
\ No newline at end of file
+    return q_int8, q_scale, k_int8, k_scale
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+from sageattention import accuracy, bench
+
+
+def main():
+    small = ["--batch-sizes", "1", "--num-heads", "2", "--num-kv-heads", "2", "--seq-lens", "128",
+             "--head-dims", "64", "--causal", "0"]
+    with tempfile.TemporaryDirectory() as tmp:
+        acc_path = os.path.join(tmp, "accuracy.json")
+        speed_path = os.path.join(tmp, "speed.json")
+
+        # a recorded layer next to the synthetic distributions
+        act_path = os.path.join(tmp, "layer.pt")
+        torch.save({name: torch.randn(1, 2, 128, 64, dtype=torch.float16) for name in ("q", "k", "v")}, act_path)
+
+        assert accuracy.main(["run", "--backends", "sdpa", "triton", "--activations", act_path, "--out", acc_path] + small) == 0
+        assert bench.main(["run", "--backends", "sdpa", "triton", "--dtypes", "fp16", "--warmups", "1", "--repeats", "3",
+                           "--out", speed_path] + small) == 0
+
+        with open(acc_path) as f:
+            report = json.load(f)
+        assert not any("error" in r for r in report["results"]), [r["error"] for r in report["results"] if "error" in r]
+        measured = [r for r in report["results"] if "cos_sim" in r]
+        distributions = {r["distribution"] for r in measured}
+        print(f"{len(report['results'])} cases, {len(measured)} measured, distributions {sorted(distributions)}")
+        assert set(accuracy.DISTRIBUTIONS) | {"file:layer.pt"} == distributions
+        for r in measured:
+            print(f"{r['backend']} {r['distribution']}: cos_sim {r['cos_sim']:.6f} rel_l1 {r['rel_l1']:.4g} rmse {r['rmse']:.4g}")
+            assert r["cos_sim"] > 0.99 and r["rel_l1"] < 0.1, r
+
+        with open(speed_path) as f:
+            speed = json.load(f)
+        rows = accuracy.pareto(report, speed)
+        assert rows and any(row["pareto"] for row in rows)
+        assert accuracy.main(["pareto", acc_path, speed_path]) == 0
+
+
+if __name__ == "__main__":
+    main()
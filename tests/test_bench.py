@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+from sageattention import bench
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        base_path = os.path.join(tmp, "base.json")
+        small = ["--batch-sizes", "2", "--num-heads", "2", "--num-kv-heads", "1", "2", "--seq-lens", "128",
+                 "--head-dims", "64", "--warmups", "1", "--repeats", "3"]
+        assert bench.main(["run", "--backends", "sdpa", "triton", "--dtypes", "fp32", "--causal", "0", "1",
+                           "--varlen", "0", "1", "--masks", "none", "bool", "--out", base_path] + small) == 0
+
+        with open(base_path) as f:
+            report = json.load(f)
+        results = report["results"]
+        assert not any("error" in r for r in results), [r["error"] for r in results if "error" in r]
+        measured = [r for r in results if "median_ms" in r]
+        print(f"{len(results)} cases, {len(measured)} measured")
+        assert measured, "no case was measured"
+        for r in measured:
+            assert r["p10_ms"] <= r["median_ms"] <= r["p90_ms"] and r["tflops"] > 0, r
+
+        # the same report compared with a copy twice as slow flags every case
+        slower = json.loads(json.dumps(report))
+        for r in slower["results"]:
+            if "median_ms" in r:
+                r["median_ms"] *= 2
+        rows = bench.compare(report, slower, threshold=0.05)
+        assert len(rows) == len(measured) and all(row["regression"] for row in rows)
+        rows = bench.compare(report, report, threshold=0.05)
+        assert not any(row["regression"] for row in rows)
+
+        # a case measured in the base but missing or failed in the new report is flagged
+        broken = json.loads(json.dumps(report))
+        dropped = broken["results"].index(measured[0])
+        del broken["results"][dropped]
+        failed = next(r for r in broken["results"] if "median_ms" in r)
+        del failed["median_ms"]
+        failed["error"] = "RuntimeError: boom"
+        rows = bench.compare(report, broken, threshold=0.05)
+        missing = [row for row in rows if "missing" in row]
+        assert len(rows) == len(measured) and len(missing) == 2 and all(row["regression"] for row in missing), missing
+        new_path = os.path.join(tmp, "new.json")
+        with open(new_path, "w") as f:
+            json.dump(broken, f)
+        assert bench.main(["compare", base_path, new_path]) == 1
+        print("compare ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import os
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+import torch.nn.functional as F
+from sageattention.core import rel_pos_index
+from sageattention.triton.quant_per_block import per_block_int8
+from sageattention.triton.attn_qk_int8_per_block import forward as attn_false
+from sageattention.triton.attn_qk_int8_per_block_causal import forward as attn_true
+
+
+def check(name, actual, expect, min_cos_sim=0.99, max_rel_l1=0.1):
+    actual, expect = actual.float().flatten(), expect.float().flatten()
+    assert torch.isfinite(actual).all(), f"{name}: non-finite output"
+    cos_sim = F.cosine_similarity(actual, expect, dim=0).item()
+    rel_l1 = ((actual - expect).abs().sum() / expect.abs().sum()).item()
+    print(f"  {name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}")
+    assert cos_sim > min_cos_sim and rel_l1 < max_rel_l1, f"{name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}"
+
+
+def reference(q, k, v, bias, is_causal):
+    # `bias` is added to the scaled scores, query i sits at key position i + kv_len - qo_len
+    qo_len, kv_len = q.size(2), k.size(2)
+    offset = kv_len - qo_len
+    if is_causal:
+        causal = torch.arange(kv_len, device=q.device)[None, :] <= torch.arange(qo_len, device=q.device)[:, None] + offset
+        bias = bias.masked_fill(~causal, float("-inf"))
+    return F.scaled_dot_product_attention(q.float(), k.float(), v.float(), attn_mask=bias[None], enable_gqa=True)
+
+
+def main():
+    torch.manual_seed(0)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = torch.float16 if device == "cuda" else torch.float32
+    batch_size, head_num, kv_head_num, head_dim = 2, 4, 2, 64
+    alibi_slopes = torch.tensor([2 ** (-8 * (i + 1) / head_num) for i in range(head_num)], dtype=torch.float32, device=device)
+
+    for qo_len, kv_len in [(150, 150), (100, 237)]:
+        q = torch.randn(batch_size, head_num, qo_len, head_dim, device=device, dtype=dtype)
+        k = torch.randn(batch_size, kv_head_num, kv_len, head_dim, device=device, dtype=dtype)
+        v = torch.randn(batch_size, kv_head_num, kv_len, head_dim, device=device, dtype=dtype)
+        q_int8, q_scale, k_int8, k_scale = per_block_int8(q, k, km=k.mean(dim=2, keepdim=True))
+
+        distance = (torch.arange(qo_len, device=device)[:, None] + kv_len - qo_len - torch.arange(kv_len, device=device)[None, :]).abs()
+        alibi_bias = -alibi_slopes[:, None, None] * distance
+
+        print(f"alibi qo_len={qo_len} kv_len={kv_len}")
+        for is_causal in [False, True]:
+            attn = attn_true if is_causal else attn_false
+            o, _ = attn(q_int8, k_int8, v, q_scale, k_scale, output_dtype=dtype, alibi_slopes=alibi_slopes)
+            check(f"is_causal={is_causal}", o, reference(q, k, v, alibi_bias, is_causal))
+
+    # a 2D relative position bias table over a 10 x 15 grid of tokens
+    height, width = 10, 15
+    seq_len = height * width
+    rel_pos_bias = torch.randn(head_num, 2 * height - 1, 2 * width - 1, device=device)
+    coords = torch.stack(torch.meshgrid(torch.arange(height, device=device), torch.arange(width, device=device), indexing="ij"), dim=-1).reshape(-1, 2)
+    rel_pos_table, q_pos, k_pos, rel_pos_center = rel_pos_index(rel_pos_bias, coords, coords)
+    delta = coords[:, None, :] - coords[None, :, :]
+    rel_bias = rel_pos_bias[:, delta[..., 0] + height - 1, delta[..., 1] + width - 1]
+
+    q = torch.randn(batch_size, head_num, seq_len, head_dim, device=device, dtype=dtype)
+    k = torch.randn(batch_size, kv_head_num, seq_len, head_dim, device=device, dtype=dtype)
+    v = torch.randn(batch_size, kv_head_num, seq_len, head_dim, device=device, dtype=dtype)
+    q_int8, q_scale, k_int8, k_scale = per_block_int8(q, k, km=k.mean(dim=2, keepdim=True))
+
+    print(f"rel_pos_bias {height}x{width}")
+    for is_causal in [False, True]:
+        attn = attn_true if is_causal else attn_false
+        o, _ = attn(q_int8, k_int8, v, q_scale, k_scale, output_dtype=dtype,
+                    rel_pos_table=rel_pos_table, q_pos=q_pos, k_pos=k_pos, rel_pos_center=rel_pos_center)
+        check(f"is_causal={is_causal}", o, reference(q, k, v, rel_bias, is_causal))
+
+        # both biases at once
+        o, _ = attn(q_int8, k_int8, v, q_scale, k_scale, output_dtype=dtype, alibi_slopes=alibi_slopes,
+                    rel_pos_table=rel_pos_table, q_pos=q_pos, k_pos=k_pos, rel_pos_center=rel_pos_center)
+        distance = (torch.arange(seq_len, device=device)[:, None] - torch.arange(seq_len, device=device)[None, :]).abs()
+        check(f"is_causal={is_causal} with alibi", o, reference(q, k, v, rel_bias - alibi_slopes[:, None, None] * distance, is_causal))
+
+
+if __name__ == "__main__":
+    main()
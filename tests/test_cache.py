@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import torch
+
+from sageattention import StepCache
+
+
+class StubAttention:
+    """
+    Returns `q` as the output and counts the calls.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, q, k, v, tensor_layout="HND", **kwargs):
+        self.calls += 1
+        return q.clone()
+
+
+def run(cache, value, layer_tag="layer", shape=(1, 2, 16, 8)):
+    q = torch.full(shape, float(value))
+    return cache(q, q, q, layer_tag=layer_tag)
+
+
+def main():
+    # an unchanged input is reused for at most max_skip consecutive steps
+    attn = StubAttention()
+    cache = StepCache(attn, threshold=0.05, max_skip=3)
+    for _ in range(5):
+        run(cache, 1.0)
+    assert (attn.calls, cache.hits, cache.misses) == (2, 3, 2), (attn.calls, cache.hits, cache.misses)
+    # calls without a layer tag are never cached
+    q = torch.ones(1, 2, 16, 8)
+    cache(q, q, q)
+    cache(q, q, q)
+    assert attn.calls == 4 and cache.hits == 3
+
+    # a drift of 2% per step is accumulated step to step: two steps are skipped, the third is computed
+    attn = StubAttention()
+    cache = StepCache(attn, threshold=0.05, max_skip=10)
+    for i in range(4):
+        run(cache, 1.0 + 0.02 * i)
+    assert (cache.hits, cache.misses) == (2, 2), (cache.hits, cache.misses)
+
+    # extrapolation continues the trend of the last two computed steps
+    attn = StubAttention()
+    cache = StepCache(attn, threshold=0.05, max_skip=3, extrapolate=True)
+    run(cache, 1.0)
+    run(cache, 2.0)
+    o = run(cache, 2.0)
+    assert attn.calls == 2 and torch.allclose(o, torch.full_like(o, 3.0)), o.flatten()[:4]
+    o = run(cache, 2.0)
+    assert attn.calls == 2 and torch.allclose(o, torch.full_like(o, 4.0)), o.flatten()[:4]
+
+    # the slope is per step when the two computed outputs are apart by skipped steps
+    attn = StubAttention()
+    cache = StepCache(attn, threshold=0.05, max_skip=3, extrapolate=True)
+    run(cache, 1.0)
+    run(cache, 1.0)
+    run(cache, 3.0)
+    o = run(cache, 3.0)
+    assert attn.calls == 2 and torch.allclose(o, torch.full_like(o, 4.0)), o.flatten()[:4]
+
+    # the least recently used layer is evicted to stay within max_bytes
+    attn = StubAttention()
+    one = 1 * 2 * 16 * 8 * 4
+    cache = StepCache(attn, threshold=0.05, max_skip=3, max_bytes=2 * one)
+    run(cache, 1.0, layer_tag="a")
+    run(cache, 1.0, layer_tag="b")
+    run(cache, 1.0, layer_tag="a")
+    run(cache, 1.0, layer_tag="c")
+    assert len(cache) == 2 and cache.nbytes() == 2 * one
+    assert (cache.hits, cache.misses) == (1, 3)
+    run(cache, 1.0, layer_tag="a")
+    assert cache.hits == 2
+    run(cache, 1.0, layer_tag="b")
+    assert cache.misses == 4
+    print("StepCache ok")
+
+
+if __name__ == "__main__":
+    main()
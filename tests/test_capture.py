@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import tempfile
+
+import torch
+import torch.nn.functional as F
+
+from sageattention import ActivationCapture, ActivationStore
+
+
+def sdpa(q, k, v, tensor_layout="HND", layer_tag=None):
+    return F.scaled_dot_product_attention(q, k, v)
+
+
+def main():
+    steps, layers = 6, ["blocks.0", "blocks.1"]
+    inputs = {(tag, step): tuple(torch.randn(1, 2, 64, 32, dtype=torch.float16) for _ in range(3)) for tag in layers for step in range(steps)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with ActivationCapture(tmp, attn_fn=sdpa, layers={"blocks.1"}, steps=range(0, steps, 2), seq_stride=2) as capture:
+            for step in range(steps):
+                for tag in layers:
+                    capture(*inputs[tag, step], layer_tag=tag)
+            # calls without a layer tag pass through
+            capture(*inputs["blocks.0", 0])
+
+        store = ActivationStore(tmp)
+        print(f"{len(store)} samples captured")
+        assert len(store) == 3
+        for sample in store.samples():
+            assert sample["layer_tag"] == "blocks.1" and sample["entry_point"] == "sdpa"
+            q, k, v = inputs["blocks.1", sample["step"]]
+            assert sample["q"].shape == (1, 2, 32, 32)
+            assert torch.equal(sample["q"], q[:, :, ::2]) and torch.equal(sample["v"], v[:, :, ::2])
+        assert [s["step"] for s in store.samples(step=4)] == [4]
+
+        # small chunks split the samples over several files, and appending keeps the earlier ones
+        with ActivationStore(tmp, mode="w", chunk_bytes=4096) as writer:
+            for step in range(steps):
+                writer.write({"k": inputs["blocks.0", step][1]}, step=step)
+        with ActivationStore(tmp, mode="a", chunk_bytes=4096) as writer:
+            writer.write({"k": inputs["blocks.0", 0][1]}, step=steps)
+        store = ActivationStore(tmp)
+        assert len(store) == steps + 1
+        assert len({s["tensors"]["k"]["chunk"] for s in store.entries}) > 1
+        for i in range(steps + 1):
+            assert torch.equal(store.load(i)["k"], inputs["blocks.0", i % steps][1])
+    print("capture ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import os
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+import torch.nn.functional as F
+from sageattention.triton.quant_per_block import per_block_int8
+from sageattention.triton.attn_qk_int8_per_block_causal import forward as attn_true
+
+
+def check(name, actual, expect, min_cos_sim=0.99, max_rel_l1=0.1):
+    actual, expect = actual.float().flatten(), expect.float().flatten()
+    assert torch.isfinite(actual).all(), f"{name}: non-finite output"
+    cos_sim = F.cosine_similarity(actual, expect, dim=0).item()
+    rel_l1 = ((actual - expect).abs().sum() / expect.abs().sum()).item()
+    print(f"  {name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}")
+    assert cos_sim > min_cos_sim and rel_l1 < max_rel_l1, f"{name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}"
+
+
+def reference(q, k, v, frame_tokens=1):
+    # query i attends to key j when j // frame_tokens <= (i + kv_len - qo_len) // frame_tokens
+    qo_len, kv_len = q.size(2), k.size(2)
+    offset = max(kv_len - qo_len, 0)
+    q_frame = (torch.arange(qo_len, device=q.device) + offset) // frame_tokens
+    k_frame = torch.arange(kv_len, device=q.device) // frame_tokens
+    attn_mask = k_frame[None, :] <= q_frame[:, None]
+    return F.scaled_dot_product_attention(q.float(), k.float(), v.float(), attn_mask=attn_mask, enable_gqa=True)
+
+
+def main():
+    torch.manual_seed(0)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = torch.float16 if device == "cuda" else torch.float32
+    batch_size, head_num, kv_head_num, head_dim = 2, 4, 2, 64
+
+    # kv_len - qo_len is not a multiple of the 128 query or 64 key tokens of a block
+    for qo_len, kv_len in [(100, 237), (200, 331), (150, 150)]:
+        q = torch.randn(batch_size, head_num, qo_len, head_dim, device=device, dtype=dtype)
+        k = torch.randn(batch_size, kv_head_num, kv_len, head_dim, device=device, dtype=dtype)
+        v = torch.randn(batch_size, kv_head_num, kv_len, head_dim, device=device, dtype=dtype)
+
+        km = k.mean(dim=2, keepdim=True)
+        q_int8, q_scale, k_int8, k_scale = per_block_int8(q, k, km=km)
+        o, _ = attn_true(q_int8, k_int8, v, q_scale, k_scale, output_dtype=dtype)
+
+        print(f"qo_len={qo_len} kv_len={kv_len}")
+        check("causal", o, reference(q, k, v))
+
+        # frames that straddle the blocks, counted from the first key
+        for frame_tokens in [48, 50, 128]:
+            o, _ = attn_true(q_int8, k_int8, v, q_scale, k_scale, output_dtype=dtype, frame_tokens=frame_tokens)
+            check(f"block_causal={frame_tokens}", o, reference(q, k, v, frame_tokens))
+
+
+if __name__ == "__main__":
+    main()
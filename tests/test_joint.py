@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+import torch.nn.functional as F
+from sageattention.joint import _quant_segments, BLKQ, BLKK
+from sageattention.triton.attn_qk_int8_joint import forward as attn_joint
+
+
+def check(name, actual, expect, min_cos_sim=0.99, max_rel_l1=0.1):
+    actual, expect = actual.float().flatten(), expect.float().flatten()
+    assert torch.isfinite(actual).all(), f"{name}: non-finite output"
+    cos_sim = F.cosine_similarity(actual, expect, dim=0).item()
+    rel_l1 = ((actual - expect).abs().sum() / expect.abs().sum()).item()
+    print(f"  {name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}")
+    assert cos_sim > min_cos_sim and rel_l1 < max_rel_l1, f"{name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}"
+
+
+def joint(segments):
+    # the steps of sageattn_joint in "HND" layout, which only accepts cuda tensors
+    qs, ks, vs = zip(*segments)
+    sm_scale = qs[0].size(-1) ** -0.5
+    km = sum(k.sum(dim=2, keepdim=True, dtype=torch.float32) for k in ks) / sum(k.size(2) for k in ks)
+    q_int8, q_scale, seg_q = _quant_segments(qs, BLKQ, sm_scale * 1.44269504, None, "HND")
+    k_int8, k_scale, seg_k = _quant_segments(ks, BLKK, 1.0, [km] * len(ks), "HND")
+    outs = [torch.empty_like(q) for q in qs]
+    attn_joint(q_int8, k_int8, list(vs), q_scale, k_scale, seg_q, seg_k, outs)
+    return outs
+
+
+def multi_kv(q, kv_sets, reduce):
+    # the steps of sageattn_multi_kv in "HND" layout, which only accepts cuda tensors
+    ks, vs = zip(*kv_sets)
+    sm_scale = q.size(-1) ** -0.5
+    if reduce == "sum":
+        kms = [k.mean(dim=2, keepdim=True, dtype=torch.float32) for k in ks]
+    else:
+        km = sum(k.sum(dim=2, keepdim=True, dtype=torch.float32) for k in ks) / sum(k.size(2) for k in ks)
+        kms = [km] * len(ks)
+    q_int8, q_scale, seg_q = _quant_segments([q], BLKQ, sm_scale * 1.44269504, None, "HND")
+    k_int8, k_scale, seg_k = _quant_segments(ks, BLKK, 1.0, kms, "HND")
+    o = torch.empty_like(q)
+    attn_joint(q_int8, k_int8, list(vs), q_scale, k_scale, seg_q, seg_k, [o], sum_segments=(reduce == "sum"))
+    return o
+
+
+def main():
+    torch.manual_seed(0)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = torch.float16
+    batch_size, head_num, kv_head_num, head_dim = 2, 4, 2, 64
+
+    # segment lengths that are not multiples of the blocks, so that every segment but the first starts after padding
+    seq_lens = [77, 200, 30]
+    segments = []
+    for seq_len in seq_lens:
+        q = torch.randn(batch_size, head_num, seq_len, head_dim, device=device, dtype=dtype)
+        k = torch.randn(batch_size, kv_head_num, seq_len, head_dim, device=device, dtype=dtype)
+        v = torch.randn(batch_size, kv_head_num, seq_len, head_dim, device=device, dtype=dtype)
+        segments.append((q, k, v))
+
+    q, k, v = (torch.cat(xs, dim=2).float() for xs in zip(*segments))
+    o_ref = F.scaled_dot_product_attention(q, k, v, enable_gqa=True).split(seq_lens, dim=2)
+
+    print(f"joint seq_lens={seq_lens}")
+    for i, o in enumerate(joint(segments)):
+        check(f"segment {i}", o, o_ref[i])
+
+    # one query tensor over key and value sets with different lengths and channel biases
+    q = torch.randn(batch_size, head_num, 150, head_dim, device=device, dtype=dtype)
+    kv_sets = []
+    for kv_len, bias in [(77, 3.0), (130, -2.0)]:
+        k = torch.randn(batch_size, kv_head_num, kv_len, head_dim, device=device, dtype=dtype) + bias
+        v = torch.randn(batch_size, kv_head_num, kv_len, head_dim, device=device, dtype=dtype)
+        kv_sets.append((k, v))
+
+    print("multi_kv kv_lens=[77, 130]")
+    o_ref = sum(F.scaled_dot_product_attention(q.float(), k.float(), v.float(), enable_gqa=True) for k, v in kv_sets)
+    check("sum", multi_kv(q, kv_sets, "sum"), o_ref)
+    k, v = (torch.cat(xs, dim=2).float() for xs in zip(*kv_sets))
+    o_ref = F.scaled_dot_product_attention(q.float(), k, v, enable_gqa=True)
+    check("concat_softmax", multi_kv(q, kv_sets, "concat_softmax"), o_ref)
+
+
+if __name__ == "__main__":
+    main()
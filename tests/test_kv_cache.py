@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import os
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+import torch.nn.functional as F
+from sageattention.kv_cache import QuantizedKVCache, BLKQ
+from sageattention.triton.quant_per_block import quant_per_block_int8
+from sageattention.triton.attn_qk_int8_kv_cache import forward as attn_kv_cache
+
+
+def check(name, actual, expect, min_cos_sim=0.99, max_rel_l1=0.1):
+    actual, expect = actual.float().flatten(), expect.float().flatten()
+    assert torch.isfinite(actual).all(), f"{name}: non-finite output"
+    cos_sim = F.cosine_similarity(actual, expect, dim=0).item()
+    rel_l1 = ((actual - expect).abs().sum() / expect.abs().sum()).item()
+    print(f"  {name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}")
+    assert cos_sim > min_cos_sim and rel_l1 < max_rel_l1, f"{name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}"
+
+
+def attend(q, kv_cache):
+    # the steps of sageattn_kv_cache in "HND" layout, which only accepts cuda tensors
+    b, h_qo, qo_len, head_dim = q.shape
+    q_int8 = torch.empty(q.shape, dtype=torch.int8, device=q.device)
+    q_scale = torch.empty((b, h_qo, (qo_len + BLKQ - 1) // BLKQ), device=q.device, dtype=torch.float32)
+    quant_per_block_int8(q, q_int8, q_scale, qo_len, q.stride(), q_int8.stride()[:3], BLKQ, sm_scale=head_dim ** -0.5 * 1.44269504)
+    o, _ = attn_kv_cache(q_int8, kv_cache.k_int8, kv_cache.v_fp8, q_scale, kv_cache.k_scale, kv_cache.v_scale,
+                         kv_cache.frame_tokens, kv_cache.first_slot, kv_cache.num_frames, output_dtype=q.dtype)
+    return o
+
+
+def main():
+    torch.manual_seed(0)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = torch.float16
+    batch_size, head_num, kv_head_num, head_dim = 2, 4, 2, 64
+    frame_tokens, max_frames, qo_len = 50, 3, 100
+
+    kv_cache = QuantizedKVCache(batch_size, kv_head_num, head_dim, frame_tokens, max_frames, device=device)
+    q = torch.randn(batch_size, head_num, qo_len, head_dim, device=device, dtype=dtype)
+    # a channel bias shared by the frames, removed by the smoothing mean of the first frame
+    k_bias = 2 * torch.randn(1, kv_head_num, 1, head_dim, device=device, dtype=dtype)
+    frames = []
+
+    def step(name):
+        # the window holds the last num_frames frames, from the oldest to the newest
+        k = torch.cat([k for k, _ in frames[len(frames) - kv_cache.num_frames:]], dim=2)
+        v = torch.cat([v for _, v in frames[len(frames) - kv_cache.num_frames:]], dim=2)
+        o_ref = F.scaled_dot_product_attention(q.float(), k.float(), v.float(), enable_gqa=True)
+        print(f"{name}: first_slot={kv_cache.first_slot} num_frames={kv_cache.num_frames}")
+        check("o", attend(q, kv_cache), o_ref)
+
+    for i in range(4):
+        k = torch.randn(batch_size, kv_head_num, frame_tokens, head_dim, device=device, dtype=dtype) + k_bias
+        v = torch.randn(batch_size, kv_head_num, frame_tokens, head_dim, device=device, dtype=dtype)
+        kv_cache.append(k, v)
+        frames.append((k, v))
+        step(f"append {i}")
+
+    # the fourth frame overwrote the slot of the first one, so the window wraps around the end of the ring
+    assert kv_cache.first_slot == 1 and kv_cache.num_frames == max_frames
+
+    kv_cache.evict(1)
+    assert kv_cache.first_slot == 2
+    step("evict")
+
+    k = torch.randn(batch_size, kv_head_num, frame_tokens, head_dim, device=device, dtype=dtype) + k_bias
+    v = torch.randn(batch_size, kv_head_num, frame_tokens, head_dim, device=device, dtype=dtype)
+    kv_cache.append(k, v)
+    frames.append((k, v))
+    step("append after evict")
+
+
+if __name__ == "__main__":
+    main()
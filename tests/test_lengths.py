@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+import torch.nn.functional as F
+from sageattention.core import valid_mean
+from sageattention.triton.quant_per_block import per_block_int8
+from sageattention.triton.attn_qk_int8_per_block import forward as attn_false
+from sageattention.triton.attn_qk_int8_per_block_causal import forward as attn_true
+
+
+def check(name, actual, expect, min_cos_sim=0.99, max_rel_l1=0.1):
+    actual, expect = actual.float().flatten(), expect.float().flatten()
+    assert torch.isfinite(actual).all(), f"{name}: non-finite output"
+    cos_sim = F.cosine_similarity(actual, expect, dim=0).item()
+    rel_l1 = ((actual - expect).abs().sum() / expect.abs().sum()).item()
+    print(f"  {name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}")
+    assert cos_sim > min_cos_sim and rel_l1 < max_rel_l1, f"{name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}"
+
+
+def reference(q, k, v, is_causal):
+    # the causal mask is aligned to the bottom-right corner, or to the top-left one with fewer keys than queries
+    qo_len, kv_len = q.size(2), k.size(2)
+    attn_mask = None
+    if is_causal:
+        offset = max(kv_len - qo_len, 0)
+        attn_mask = torch.arange(kv_len, device=q.device)[None, :] <= torch.arange(qo_len, device=q.device)[:, None] + offset
+    return F.scaled_dot_product_attention(q.float(), k.float(), v.float(), attn_mask=attn_mask, enable_gqa=True)
+
+
+def main():
+    torch.manual_seed(0)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = torch.float16 if device == "cuda" else torch.float32
+    batch_size, head_num, kv_head_num, seq_len, head_dim = 2, 4, 2, 200, 64
+
+    q = torch.randn(batch_size, head_num, seq_len, head_dim, device=device, dtype=dtype)
+    # a channel bias, removed by smoothing
+    k = torch.randn(batch_size, kv_head_num, seq_len, head_dim, device=device, dtype=dtype) + 4 * torch.randn(1, kv_head_num, 1, head_dim, device=device, dtype=dtype)
+    v = torch.randn(batch_size, kv_head_num, seq_len, head_dim, device=device, dtype=dtype)
+
+    for is_causal, kv_lens, q_lens in [(False, [150, 77], [200, 130]), (True, [150, 77], [120, 100]), (True, [200, 131], [67, 131])]:
+        kv_lengths = torch.tensor(kv_lens, dtype=torch.int32, device=device)
+        q_lengths = torch.tensor(q_lens, dtype=torch.int32, device=device)
+
+        # garbage in the padding, which the mean, the scales and the kernels must ignore
+        q_pad, k_pad, v_pad = q.clone(), k.clone(), v.clone()
+        for b in range(batch_size):
+            q_pad[b, :, q_lens[b]:] = float("nan")
+            k_pad[b, :, kv_lens[b]:] = 1e4
+            k_pad[b, :, kv_lens[b] + 1:] = float("nan")
+            v_pad[b, :, kv_lens[b]:] = float("nan")
+
+        km = valid_mean(k_pad, kv_lengths, 2)
+        assert torch.isfinite(km).all()
+        for b in range(batch_size):
+            assert torch.allclose(km[b].float(), k[b, :, :kv_lens[b]].float().mean(dim=1, keepdim=True), atol=1e-2)
+
+        q_int8, q_scale, k_int8, k_scale = per_block_int8(q_pad, k_pad, km=km, q_lengths=q_lengths, kv_lengths=kv_lengths)
+        attn = attn_true if is_causal else attn_false
+        o, _ = attn(q_int8, k_int8, v_pad, q_scale, k_scale, output_dtype=dtype, kv_lengths=kv_lengths, q_lengths=q_lengths)
+
+        print(f"is_causal={is_causal} kv_lengths={kv_lens} q_lengths={q_lens}")
+        for b in range(batch_size):
+            o_ref = reference(q[b:b + 1, :, :q_lens[b]], k[b:b + 1, :, :kv_lens[b]], v[b:b + 1, :, :kv_lens[b]], is_causal)
+            check(f"batch {b}", o[b:b + 1, :, :q_lens[b]], o_ref)
+            assert (o[b, :, q_lens[b]:] == 0).all(), "padded query tokens must have a zero output"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import torch
+
+from sageattention import pack_bool_mask
+
+
+def unpack(words, kv_len):
+    bits = torch.arange(32, dtype=torch.int32)
+    mask = ((words.unsqueeze(-1) >> bits) & 1).bool()
+    return mask.flatten(-2)[..., :kv_len]
+
+
+def main():
+    torch.manual_seed(0)
+    for shape in [(1, 1, 5, 1), (2, 1, 7, 31), (1, 3, 4, 32), (2, 2, 3, 33), (1, 1, 2, 100), (4, 130)]:
+        mask = torch.rand(shape) < 0.5
+        words = pack_bool_mask(mask)
+        assert words.dtype == torch.int32 and words.shape == shape[:-1] + ((shape[-1] + 31) // 32,)
+        assert torch.equal(unpack(words, shape[-1]), mask), shape
+
+    # every bit set, including the sign bit, and the padding bits stay zero
+    words = pack_bool_mask(torch.ones(1, 40, dtype=torch.bool))
+    assert words.tolist() == [[-1, 0xFF]]
+    # a broadcast mask is packed without being expanded
+    words = pack_bool_mask((torch.rand(1, 1, 8, 64) < 0.5).expand(1, 1, 8, 64))
+    assert words.shape == (1, 1, 8, 2)
+    print("pack_bool_mask ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+
+from sageattention import bench
+
+
+def main():
+    # the kernels are stubbed and the inputs live on the meta device, no gpu is needed
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "overhead.json")
+        status = bench.main(["overhead", "--out", path])
+        with open(path) as f:
+            report = json.load(f)
+    for r in report["results"]:
+        print(f"{r['entry_point']}: {r['median_us']:.1f} us per call (budget {report['budget_us']:.0f} us)")
+    assert {r["entry_point"] for r in report["results"]} == set(bench.OVERHEAD_ENTRY_POINTS)
+    # the budget is absolute, a slower host raises it with SAGEATTN_OVERHEAD_BUDGET_US
+    assert status == 0, f"host overhead above the budget of {report['budget_us']:.0f} us per call, see SAGEATTN_OVERHEAD_BUDGET_US"
+
+    # the stubs are removed afterwards
+    import torch
+    assert not torch.empty(1).is_cuda
+    print("overhead ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import time
+
+import torch
+
+from sageattention import warmup
+
+
+def main():
+    shapes = [
+        {"q": (1, 8, 1024, 64), "tensor_layout": "HND", "is_causal": False},
+        {"q": (1, 8, 1024, 128), "tensor_layout": "HND", "is_causal": True},
+        {"q": (2, 333, 8, 128), "tensor_layout": "NHD", "is_causal": False, "dtype": "bfloat16"},
+        {"entry_point": "sageattn_qk_int8_pv_fp16_triton", "q": (1, 8, 1024, 64), "tensor_layout": "HND"},
+    ]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        errors = warmup(shapes, num_workers=2, cache_dir=cache_dir, load=False)
+        print(f"compiled {len(shapes)} calls in {time.perf_counter() - start:.1f} s")
+        assert not errors, errors
+        entries = [name for _, _, names in os.walk(cache_dir) for name in names]
+        print(f"{len(entries)} files in the cache")
+        assert entries, "the cache directory was not populated"
+
+    # compiling in the current process makes the next call fast
+    assert not warmup(shapes[:1], num_workers=0)
+    q = torch.randn(1, 8, 1024, 64, dtype=torch.float16, device="cuda")
+    torch.cuda.synchronize()
+    start = time.perf_counter()
+    from sageattention import sageattn
+    sageattn(q, q, q)
+    torch.cuda.synchronize()
+    print(f"first call after warmup: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
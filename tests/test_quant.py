@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import os
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+from sageattention.triton.quant_per_block import per_block_int8
+
+
+def main():
+    torch.manual_seed(0)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = torch.float16 if device == "cuda" else torch.float32
+    BLKK = 64
+
+    # a large channel bias, removed by smoothing, and a partial last block
+    for kv_len in [100, 129, 64]:
+        q = torch.randn(1, 2, kv_len, 64, device=device, dtype=dtype)
+        k = torch.randn(1, 2, kv_len, 64, device=device, dtype=dtype) + 50 * torch.randn(1, 1, 1, 64, device=device, dtype=dtype)
+        km = k.mean(dim=2, keepdim=True)
+        _, _, k_int8, k_scale = per_block_int8(q, k, km=km, BLKK=BLKK)
+
+        k_smooth = (k - km).float()
+        for blk in range(k_scale.size(2)):
+            tokens = slice(blk * BLKK, min((blk + 1) * BLKK, kv_len))
+            expected_scale = k_smooth[:, :, tokens].abs().amax(dim=(2, 3)) / 127
+            scale = k_scale[:, :, blk].float()
+            assert torch.allclose(scale, expected_scale, rtol=1e-3), f"kv_len={kv_len} block {blk}: scale {scale.tolist()}, expected {expected_scale.tolist()}"
+            dequant = k_int8[:, :, tokens].float() * scale[:, :, None, None]
+            err = (dequant - k_smooth[:, :, tokens]).abs().max().item()
+            assert err <= scale.max().item() * 0.51, f"kv_len={kv_len} block {blk}: max error {err}"
+        print(f"kv_len={kv_len}: smoothed K scales ok")
+
+
+if __name__ == "__main__":
+    main()
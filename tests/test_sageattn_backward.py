@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+
+import torch
+
+if not torch.cuda.is_available():
+    # run the Triton kernels on CPU
+    os.environ["TRITON_INTERPRET"] = "1"
+
+import torch.nn.functional as F
+from sageattention import sageattn_trainable
+from torch.nn.attention import SDPBackend, sdpa_kernel
+
+
+def get_rtol_atol(actual, expect):
+    actual = actual.float()
+    expect = expect.float()
+    diff = (actual - expect).abs()
+    eps = torch.tensor(torch.finfo(actual.dtype).eps, device=actual.device, dtype=actual.dtype)
+    rdiff = diff / torch.maximum(torch.maximum(actual.abs(), expect.abs()), eps)
+    return (
+        f"mean_rtol={rdiff.mean().item():.3g} "
+        f"max_rtol={rdiff.max().item():.3g} "
+        f"mean_atol={diff.mean().item():.3g} "
+        f"max_atol={diff.max().item():.3g}"
+    )
+
+
+def check(name, actual, expect, min_cos_sim, max_rel_l1):
+    actual, expect = actual.float().flatten(), expect.float().flatten()
+    cos_sim = F.cosine_similarity(actual, expect, dim=0).item()
+    rel_l1 = ((actual - expect).abs().sum() / expect.abs().sum()).item()
+    assert cos_sim > min_cos_sim and rel_l1 < max_rel_l1, f"{name}: cos_sim={cos_sim:.6f} rel_l1={rel_l1:.4g}"
+
+
+def main():
+    torch.manual_seed(0)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    batch_size = 2
+    head_num = 4
+    kv_head_num = 2
+    seq_len = 200
+    head_dim = 64
+    dtype = torch.float16 if device == "cuda" else torch.float32
+
+    q = torch.randn(batch_size, head_num, seq_len, head_dim, device=device, dtype=dtype)
+    k = torch.randn(batch_size, kv_head_num, seq_len, head_dim, device=device, dtype=dtype)
+    v = torch.randn_like(k)
+    do = torch.randn_like(q)
+    print("q", tuple(q.shape), q.device, q.dtype)
+
+    for is_causal in [False, True]:
+        q_ref, k_ref, v_ref = (x.detach().clone().requires_grad_() for x in (q, k, v))
+        with sdpa_kernel(SDPBackend.MATH):
+            out_math = F.scaled_dot_product_attention(q_ref, k_ref, v_ref, is_causal=is_causal, enable_gqa=True)
+        out_math.backward(do)
+
+        for save_quantized in [False, True]:
+            q_sage, k_sage, v_sage = (x.detach().clone().requires_grad_() for x in (q, k, v))
+            out_sage = sageattn_trainable(q_sage, k_sage, v_sage, is_causal=is_causal, save_quantized=save_quantized)
+            out_sage.backward(do)
+
+            print(f"is_causal={is_causal} save_quantized={save_quantized}")
+            print("  o ", get_rtol_atol(out_sage, out_math))
+            print("  dq", get_rtol_atol(q_sage.grad, q_ref.grad))
+            print("  dk", get_rtol_atol(k_sage.grad, k_ref.grad))
+            print("  dv", get_rtol_atol(v_sage.grad, v_ref.grad))
+            check("o", out_sage, out_math, 0.99, 0.1)
+            for name, grad, grad_ref in [("dq", q_sage.grad, q_ref.grad), ("dk", k_sage.grad, k_ref.grad), ("dv", v_sage.grad, v_ref.grad)]:
+                check(name, grad, grad_ref, 0.98, 0.2)
+
+    # causal attention needs at least as many keys as queries
+    try:
+        sageattn_trainable(q, k[:, :, :seq_len // 2], v[:, :, :seq_len // 2], is_causal=True)
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError("causal attention with qo_len > kv_len was not rejected")
+
+
+if __name__ == "__main__":
+    main()
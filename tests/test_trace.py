@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+
+import torch
+
+from sageattention import CallTracer, ScaleCache, sageattn, sageattn_qk_int8_pv_fp16_triton
+from sageattention import bench, trace
+
+
+def main():
+    # the kernels are stubbed, only the recording and the replay are tested
+    shapes = [(1, 4, 128, 64), (2, 4, 256, 64), (1, 4, 128, 64)]
+    with bench.stub_kernels("sm89"), tempfile.TemporaryDirectory() as tmp:
+        with CallTracer(capacity=8) as tracer:
+            for i, shape in enumerate(shapes * 4):
+                q, k, v = (torch.randn(shape, dtype=torch.float16) for _ in range(3))
+                sageattn(q, k, v, is_causal=i % 2 == 1)
+            sageattn_qk_int8_pv_fp16_triton(q, k, v, tensor_layout="HND")
+        # outside the block nothing is recorded
+        sageattn(q, k, v)
+
+        calls = tracer.calls()
+        print(f"{len(calls)} calls recorded")
+        assert len(calls) == 8, "the ring buffer keeps the most recent calls"
+        assert calls[-1]["entry_point"] == calls[-1]["backend"] == "sageattn_qk_int8_pv_fp16_triton"
+        for call in calls[:-1]:
+            assert call["entry_point"] == "sageattn" and call["backend"] == "sageattn_qk_int8_pv_fp8_cuda", call
+            assert call["arguments"]["q"]["dtype"] == "float16" and call["duration_us"] >= 0
+        assert [c["start_us"] for c in calls] == sorted(c["start_us"] for c in calls)
+
+        path = os.path.join(tmp, "calls.json")
+        tracer.save(path)
+        chrome_path = os.path.join(tmp, "calls.trace.json")
+        tracer.save_chrome_trace(chrome_path)
+        with open(chrome_path) as f:
+            events = json.load(f)["traceEvents"]
+        assert len(events) == 8 and all(e["ph"] == "X" for e in events)
+
+        # objects are recorded by their type name and dropped on replay
+        assert trace._describe(ScaleCache()) == {"object": "ScaleCache"}
+        with open(path) as f:
+            recorded = json.load(f)["calls"]
+        recorded[0]["arguments"]["scale_cache"] = {"object": "ScaleCache"}
+        with open(path, "w") as f:
+            json.dump({"calls": recorded}, f)
+
+        # the same mix with another entry point and arguments
+        with open(path) as f:
+            result = trace.replay(json.load(f)["calls"], device="cpu", entry_point="sageattn_qk_int8_pv_fp16_triton",
+                                  overrides={"smooth_k": False}, repeats=3)
+        assert result["calls"] == 8 and result["median_ms"] > 0
+        assert sum(row["count"] for row in result["per_call"]) == 8
+        assert trace.main(["replay", path, "--device", "cpu", "--repeats", "2", "--out", os.path.join(tmp, "replay.json")]) == 0
+    print("trace ok")
+
+
+if __name__ == "__main__":
+    main()
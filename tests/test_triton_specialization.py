@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import torch
+
+from sageattention import sageattn_qk_int8_pv_fp16_triton
+from sageattention.triton import attn_qk_int8_per_block, attn_qk_int8_per_block_causal, quant_per_block
+
+
+def num_variants(kernel):
+    # the compiled variants of a triton.jit function, for every device
+    if hasattr(kernel, "device_caches"):
+        return sum(len(caches[0]) for caches in kernel.device_caches.values())
+    return sum(len(cache) for cache in kernel.cache.values())
+
+
+def main():
+    kernels = {
+        "quant": quant_per_block.quant_per_block_int8_kernel,
+        "attn": attn_qk_int8_per_block._attn_fwd,
+        "attn_causal": attn_qk_int8_per_block_causal._attn_fwd,
+    }
+    before = {name: num_variants(kernel) for name, kernel in kernels.items()}
+
+    # lengths of every divisibility, including shorter than one block of scales
+    seq_lens = [1, 17, 64, 100, 128, 1000, 1024, 1031, 2048, 4077, 4096]
+    for layout in ["HND", "NHD"]:
+        for seq_len in seq_lens:
+            shape = (2, 8, seq_len, 64) if layout == "HND" else (2, seq_len, 8, 64)
+            q, k, v = (torch.randn(shape, dtype=torch.float16, device="cuda") for _ in range(3))
+            for is_causal in [False, True]:
+                sageattn_qk_int8_pv_fp16_triton(q, k, v, tensor_layout=layout, is_causal=is_causal)
+    torch.cuda.synchronize()
+
+    compiled = {name: num_variants(kernel) - before[name] for name, kernel in kernels.items()}
+    print(f"{len(seq_lens)} sequence lengths x 2 layouts, compiled variants: {compiled}")
+    # whatever the sequence length and the layout, one variant per kernel, two for the quantization of q and of k with its mean
+    assert compiled == {"quant": 2, "attn": 1, "attn_causal": 1}, compiled
+
+
+if __name__ == "__main__":
+    main()